@@ -0,0 +1,75 @@
+"""
+Benchmark: re-pricing a revised BOQ, full vs incremental by row fingerprints
+
+Prices a generated BOQ once to seed its lineage, then re-prices a revision
+with a given share of changed rows, both in full and through
+BOQRevisionStore. Pricing is rate-book matching plus a simulated per-item
+LLM cost, and the report gives wall time and the number of rows priced.
+
+Usage (from the ai_service directory):
+    python benchmarks/boq_revisions.py --rows 20000 --changed 0.02
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+# Make the ai_service package importable
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from ai_service.services.boq_revisions import BOQRevisionStore
+from ai_service.services.sor_matcher import SORMatcher
+
+def build_items(rows: int, changed: float, revision: int):
+    every = max(1, round(1 / changed)) if changed else rows + 1
+    return [
+        {
+            "item_no": str(index + 1),
+            "description": f"Cement plastering to walls, 15mm type {index % 500}",
+            "unit": "m2",
+            # Revisions change the quantity of every n-th row
+            "quantity": str(index % 50 + 1 + (revision if index % every == 0 else 0))
+        }
+        for index in range(rows)
+    ]
+
+def price(matcher: SORMatcher, items, llm_ms: float):
+    priced = matcher.match_items(items)
+    time.sleep(len(items) * llm_ms / 1000)
+    return priced
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=20000, help="number of BOQ rows")
+    parser.add_argument("--changed", type=float, default=0.02, help="share of rows changed in the revision")
+    parser.add_argument("--llm-ms", type=float, default=0.2, help="simulated LLM cost per priced row")
+    args = parser.parse_args()
+
+    matcher = SORMatcher()
+    first = build_items(args.rows, args.changed, 0)
+    second = build_items(args.rows, args.changed, 1)
+
+    with tempfile.TemporaryDirectory() as directory:
+        store = BOQRevisionStore(os.path.join(directory, "revisions.sqlite3"))
+        plan = store.plan("bench", "match", first)
+        store.commit(plan, store.merge(plan, price(matcher, first, args.llm_ms)))
+
+        start = time.perf_counter()
+        price(matcher, second, args.llm_ms)
+        full = time.perf_counter() - start
+
+        start = time.perf_counter()
+        plan = store.plan("bench", "match", second)
+        pending = [second[index] for index in plan["pending"]]
+        summary = store.commit(plan, store.merge(plan, price(matcher, pending, args.llm_ms)))
+        incremental = time.perf_counter() - start
+        store.close()
+
+    print(f"{'mode':<14}{'rows priced':>12}{'seconds':>9}")
+    print(f"{'full':<14}{len(second):>12,}{full:>9.2f}")
+    print(f"{'incremental':<14}{summary['priced_rows']:>12,}{incremental:>9.2f}")
+    print(f"diff: {summary['counts']}")
+
+if __name__ == "__main__":
+    main()
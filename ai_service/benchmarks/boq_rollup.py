@@ -0,0 +1,76 @@
+"""
+Benchmark: BOQ line amounts and rollup, per-row Decimal vs vectorized
+
+Prices a generated BOQ with a per-row decimal.Decimal loop and with
+BOQPricer, checks that both give the same grand total, and reports the
+time each takes. Some rows have blank quantities or rates with currency
+symbols, as in real BOQs.
+
+Usage (from the ai_service directory):
+    python benchmarks/boq_rollup.py --rows 100000
+"""
+import argparse
+import os
+import sys
+import time
+from collections import defaultdict
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+
+# Make the ai_service package importable
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from ai_service.services.boq_pricer import BOQPricer
+
+def build_items(rows: int, messy: bool):
+    return [
+        {
+            "item_no": f"{index % 40 + 1}.{index + 1}",
+            "description": f"Cement plastering to walls, type {index}",
+            "unit": "m2",
+            "quantity": "" if messy and index % 500 == 0 else f"{index % 50 + 1}.{index % 1000:03d}",
+            "suggested_rate": f"${index % 97},{index % 1000:03d}.{index % 100:02d}" if messy and index % 7 == 0 else f"{index % 97}.{index % 100:02d}",
+            "suggested_category": f"Category {index % 12}"
+        }
+        for index in range(rows)
+    ]
+
+def decimal_rollup(items):
+    """The per-row computation this benchmark compares against"""
+    totals = defaultdict(Decimal)
+    grand_total = Decimal(0)
+    for item in items:
+        try:
+            quantity = Decimal(str(item.get("quantity")).strip())
+            rate = Decimal("".join(char for char in str(item.get("suggested_rate")) if char.isdigit() or char in ".-"))
+        except InvalidOperation:
+            item["amount"] = None
+            continue
+        quantity = quantity.quantize(Decimal("0.001"), ROUND_HALF_UP)
+        rate = rate.quantize(Decimal("0.01"), ROUND_HALF_UP)
+        amount = (quantity * rate).quantize(Decimal("0.01"), ROUND_HALF_UP)
+        item["amount"] = float(amount)
+        totals[item.get("suggested_category")] += amount
+        grand_total += amount
+    return float(grand_total)
+
+def timed(fn, items):
+    start = time.perf_counter()
+    result = fn(items)
+    return result, time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100000, help="number of BOQ rows")
+    args = parser.parse_args()
+
+    pricer = BOQPricer()
+    print(f"{'rates':<8}{'method':<12}{'ms':>9}{'grand total':>18}")
+    for messy in (False, True):
+        label = "messy" if messy else "clean"
+        decimal_total, decimal_seconds = timed(decimal_rollup, build_items(args.rows, messy))
+        (_, rollup), pricer_seconds = timed(pricer.price, build_items(args.rows, messy))
+        print(f"{label:<8}{'Decimal':<12}{decimal_seconds * 1000:>9.1f}{decimal_total:>18,.2f}")
+        print(f"{label:<8}{'BOQPricer':<12}{pricer_seconds * 1000:>9.1f}{rollup['grand_total']:>18,.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Benchmark: SOR CSV ingest throughput, csv.DictReader vs chunked pandas
+
+Parses a generated BOQ CSV with the previous per-row DictReader code and
+with SORIngest, and reports rows per second and peak Python memory
+(tracemalloc) for each. A cp1252 file, as exported by Excel on Windows,
+is included; the previous code could not decode it.
+
+Usage (from the ai_service directory):
+    python benchmarks/csv_ingest.py --rows 100000
+"""
+import argparse
+import csv
+import io
+import os
+import sys
+import time
+import tracemalloc
+
+# Make the ai_service package importable
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from ai_service.services.sor_ingest import SORIngest
+
+def build_csv(rows: int, encoding: str) -> bytes:
+    lines = ["Item No,Description,UOM,Qty,Remarks"]
+    lines += [
+        f"{index + 1},\"Cement plastering to walls, 15mm – type {index}\",m2,{index % 50 + 1},"
+        for index in range(rows)
+    ]
+    return ("\n".join(lines) + "\n").encode(encoding)
+
+def dictreader_items(csv_bytes: bytes):
+    """The per-row ingest this benchmark compares against"""
+    items = []
+    for row in csv.DictReader(io.StringIO(csv_bytes.decode('utf-8'))):
+        item = {}
+        for key, value in row.items():
+            item[key.lower().replace(' ', '_')] = value
+        if "description" not in item:
+            item["description"] = item.get("item", "") or item.get("work_description", "")
+        if "unit" not in item:
+            item["unit"] = item.get("uom", "") or item.get("units", "")
+        if "quantity" not in item:
+            item["quantity"] = item.get("qty", "") or "1"
+        items.append(item)
+    return items
+
+def measure(fn, csv_bytes: bytes):
+    try:
+        start = time.perf_counter()
+        count = len(fn(csv_bytes))
+        elapsed = time.perf_counter() - start
+    except UnicodeDecodeError:
+        return None, 0.0, 0
+    # Memory is traced in a second run, as tracing slows parsing down
+    tracemalloc.start()
+    fn(csv_bytes)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return count, elapsed, peak
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100000, help="number of BOQ rows")
+    args = parser.parse_args()
+
+    ingest = SORIngest()
+    print(f"{'file':<10}{'reader':<14}{'rows/s':>12}{'seconds':>9}{'peak MiB':>10}")
+    for encoding in ("utf-8", "cp1252"):
+        csv_bytes = build_csv(args.rows, encoding)
+        for name, fn in (("DictReader", dictreader_items), ("SORIngest", ingest.read_csv_items)):
+            count, elapsed, peak = measure(fn, csv_bytes)
+            rate = f"{count / elapsed:>12,.0f}" if count is not None else f"{'decode error':>12}"
+            print(f"{encoding:<10}{name:<14}{rate}{elapsed:>9.2f}{peak / 2 ** 20:>10.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Benchmark: duplicate lookup time as the invoice index grows
+
+Fills a DuplicateIndex with synthetic invoices and, at each size, times
+check_and_add for rescans of stored invoices (with OCR-style character
+noise) against a linear scan comparing the new signature with every
+stored signature in memory. Also reports how many rescans were flagged.
+
+Usage (from the ai_service directory):
+    python benchmarks/duplicate_lookup.py --sizes 1000 10000 100000 --lookups 200
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+# Make the ai_service package importable
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from ai_service.services.duplicate_index import DuplicateIndex
+
+MATERIALS = ["cement bags", "rebar 12mm", "plywood sheet", "paint 20l", "ceramic tiles", "pvc pipe", "sand m3",
+             "gravel m3", "door frame", "window glass", "roof sheet", "wire mesh", "bolts m16", "skirting"]
+
+def invoice(number: int):
+    rng = random.Random(number)
+    vendor = f"Vendor {rng.randrange(5000)} Pte Ltd"
+    lines = [
+        f"{rng.choice(MATERIALS)} qty {rng.randrange(1, 500)} rate {rng.randrange(1, 900)}.{rng.randrange(100):02d}"
+        for _ in range(rng.randrange(4, 12))
+    ]
+    total = f"{rng.randrange(100, 99999)}.{rng.randrange(100):02d}"
+    text = f"{vendor}\nInvoice No: INV-{number:08d}\nDate: {rng.randrange(1, 29)}/03/2024\n" + "\n".join(lines) + f"\nTotal: ${total}"
+    return text, {"vendor_name": vendor, "invoice_number": f"INV-{number:08d}", "total_amount": total}
+
+def rescan(text: str, seed: int):
+    """Misread a few characters, as a second scan of the same paper might"""
+    rng = random.Random(seed)
+    chars = list(text)
+    for position in rng.sample(range(len(chars)), 4):
+        chars[position] = {"o": "0", "l": "1", "e": "c", "m": "rn"}.get(chars[position], chars[position])
+    return "".join(chars)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000], help="index sizes to time lookups at")
+    parser.add_argument("--lookups", type=int, default=200, help="rescans looked up at each size")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        index = DuplicateIndex(os.path.join(directory, "duplicates.sqlite3"))
+        signatures = []
+        stored = 0
+        print(f"{'invoices':>10}{'index ms':>10}{'p99 ms':>9}{'scan ms':>9}{'flagged':>9}")
+        for size in sorted(args.sizes):
+            while stored < size:
+                text, fields = invoice(stored)
+                index.check_and_add(text, fields, f"sha-{stored}")
+                signatures.append(index.signature(text))
+                stored += 1
+            matrix = np.vstack(signatures)
+
+            rng = random.Random(size)
+            index_times, scan_times, flagged = [], [], 0
+            for lookup in range(args.lookups):
+                number = rng.randrange(stored)
+                text, fields = invoice(number)
+                # The rescan's invoice number was not read, so only the text can match it
+                noisy = rescan(text, lookup)
+                start = time.perf_counter()
+                result = index.check_and_add(noisy, {**fields, "invoice_number": None}, f"rescan-{size}-{lookup}")
+                index_times.append(time.perf_counter() - start)
+                flagged += result["probable_duplicate"]
+
+                start = time.perf_counter()
+                signature = index.signature(noisy)
+                best = np.argmax((matrix == signature).mean(axis=1))
+                scan_times.append(time.perf_counter() - start)
+                assert best == number
+
+            index_times.sort()
+            print(
+                f"{stored:>10}{np.mean(index_times) * 1000:>10.2f}{index_times[int(len(index_times) * 0.99) - 1] * 1000:>9.2f}"
+                f"{np.mean(scan_times) * 1000:>9.2f}{flagged / args.lookups:>9.1%}"
+            )
+        index.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+Benchmark: SOR Excel and CSV response size and generation time
+
+Compares the old output_format=excel response, which held the items and a
+hex-encoded .xlsx in one JSON body, with the binary .xlsx download
+(output_format=xlsx), the JSON-with-download-link response
+(output_format=excel) and the CSV export (output_format=csv).
+
+Usage (from the ai_service directory):
+    python benchmarks/excel_response.py --items 10000
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+# Make the ai_service package importable
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from ai_service.services.excel_writer import ExcelWriter
+from ai_service.services.tabular_exporter import TabularExporter
+
+def build_items(count: int):
+    return [
+        {
+            "description": f"Cement plastering to internal walls, 15mm thick, type {index}",
+            "unit": "m2",
+            "quantity": str(index % 50 + 1),
+            "suggested_rate": 18.5,
+            "suggested_unit": "m2",
+            "suggested_category": "Plastering",
+            "confidence": 0.82
+        }
+        for index in range(count)
+    ]
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--items", type=int, default=10000, help="number of BOQ items")
+    args = parser.parse_args()
+
+    items = build_items(args.items)
+    excel_bytes, excel_seconds = timed(lambda: ExcelWriter().create_sor_excel(items))
+    print(f"{args.items} items; workbook generation {excel_seconds:.2f}s, {len(excel_bytes) / 1024:.0f} KiB")
+    csv_bytes, csv_seconds = timed(lambda: TabularExporter().export(items, "csv").read())
+    print(f"{args.items} items; CSV export {csv_seconds:.2f}s, {len(csv_bytes) / 1024:.0f} KiB")
+
+    old_body, old_seconds = timed(lambda: json.dumps({
+        "status": "success",
+        "data": items,
+        "excel_data": excel_bytes.hex(),
+        "message": "SOR processed successfully"
+    }).encode())
+    link_body, link_seconds = timed(lambda: json.dumps({
+        "status": "success",
+        "download_id": "x" * 32,
+        "download_url": "/fill_sor/downloads/" + "x" * 32,
+        "download_expires_at": time.time(),
+        "total_items": len(items),
+        "data": items,
+        "message": "SOR processed successfully"
+    }).encode())
+
+    print(f"{'response':<34}{'bytes':>12}{'serialize':>12}")
+    print(f"{'excel, hex in JSON (old)':<34}{len(old_body):>12}{old_seconds * 1000:>10.1f}ms")
+    print(f"{'excel, JSON + download link':<34}{len(link_body):>12}{link_seconds * 1000:>10.1f}ms")
+    print(f"{'xlsx, binary download':<34}{len(excel_bytes):>12}{0:>10.1f}ms")
+    print(f"{'csv, binary download':<34}{len(csv_bytes):>12}{0:>10.1f}ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""
+Benchmark: ExcelWriter peak memory, in-memory vs streaming workbook
+
+Builds SOR workbooks of increasing size with the in-memory openpyxl path
+(EXCEL_STREAMING=false) and the write-only streaming path, and reports
+time and peak Python memory (tracemalloc) for each. Streaming peak memory
+should stay roughly flat as the row count grows.
+
+Usage (from the ai_service directory):
+    python benchmarks/excel_writer_memory.py --rows 10000 50000 100000
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+# Make the ai_service package importable
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from ai_service.services.excel_writer import ExcelWriter
+
+def items(count: int):
+    for index in range(count):
+        yield {
+            "description": f"Cement plastering to internal walls, 15mm thick, type {index}",
+            "unit": "m2",
+            "quantity": index % 50 + 1,
+            "suggested_rate": 18.5,
+            "suggested_category": "Plastering"
+        }
+
+def measure(streaming: bool, rows: int):
+    writer = ExcelWriter(streaming=streaming)
+    tracemalloc.start()
+    start = time.perf_counter()
+    if streaming:
+        # Items are generated lazily, so only the writer's memory is measured
+        with writer.write_sor_excel(items(rows)) as output:
+            size = output.seek(0, os.SEEK_END)
+    else:
+        size = len(writer.create_sor_excel(list(items(rows))))
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak, size
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, nargs="+", default=[10000, 50000], help="row counts to test")
+    args = parser.parse_args()
+
+    print(f"{'rows':>8} {'mode':<10}{'seconds':>9}{'peak MiB':>10}{'file KiB':>10}")
+    for rows in args.rows:
+        for streaming in (False, True):
+            elapsed, peak, size = measure(streaming, rows)
+            mode = "streaming" if streaming else "in-memory"
+            print(f"{rows:>8} {mode:<10}{elapsed:>9.2f}{peak / 2 ** 20:>10.1f}{size / 1024:>10.0f}")
+
+if __name__ == "__main__":
+    main()
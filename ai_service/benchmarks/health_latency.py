@@ -0,0 +1,154 @@
+"""
+Load test: /health latency while large documents are processed
+
+Measures /health latency on an idle service, then again while several
+large invoice PDFs and SOR CSVs are being processed on the same worker.
+With parsing and matching offloaded to the execution layer, the p99 under
+load should stay close to the idle p99.
+
+Usage (from the ai_service directory, so data/rates.csv is found):
+    python benchmarks/health_latency.py --pages 200 --uploads 4
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+from typing import List
+
+import httpx
+
+# Make the ai_service package importable
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
+API_KEY = "benchmark-key"
+
+def build_pdf(pages: int, lines_per_page: int = 60) -> bytes:
+    """
+    Build a text-only invoice PDF without extra dependencies
+
+    Args:
+        pages: Number of pages
+        lines_per_page: Invoice lines per page
+
+    Returns:
+        PDF bytes
+    """
+    page_ids = []
+    font_id = 3
+    next_id = 4
+    page_objects = []
+    for page in range(pages):
+        lines = [f"Invoice No: INV-{page:05d}  Date: 01/02/2024"]
+        lines += [
+            f"{row + 1}. Supply and install item {page}-{row}  10 pcs  12.50  125.00"
+            for row in range(lines_per_page)
+        ]
+        text = "BT /F1 9 Tf 40 800 Td 11 TL " + " ".join(f"({line}) '" for line in lines) + " ET"
+        stream = text.encode("latin-1")
+        content_id, page_id = next_id, next_id + 1
+        next_id += 2
+        page_ids.append(page_id)
+        page_objects.append((content_id, b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream"))
+        page_objects.append((page_id, (
+            "<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+            f"/Resources << /Font << /F1 {font_id} 0 R >> >> /Contents {content_id} 0 R >>"
+        ).encode()))
+
+    kids = " ".join(f"{page_id} 0 R" for page_id in page_ids)
+    objects = [
+        (1, b"<< /Type /Catalog /Pages 2 0 R >>"),
+        (2, f"<< /Type /Pages /Kids [{kids}] /Count {pages} >>".encode()),
+        (font_id, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"),
+    ] + page_objects
+
+    output = bytearray(b"%PDF-1.4\n")
+    offsets = {}
+    for object_id, body in objects:
+        offsets[object_id] = len(output)
+        output += b"%d 0 obj\n" % object_id + body + b"\nendobj\n"
+    xref = len(output)
+    output += b"xref\n0 %d\n0000000000 65535 f \n" % (next_id)
+    for object_id in range(1, next_id):
+        output += b"%010d 00000 n \n" % offsets[object_id]
+    output += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (next_id, xref)
+    return bytes(output)
+
+def build_csv(rows: int, tag: int = 0) -> bytes:
+    """Build a SOR/BOQ CSV with the given number of rows"""
+    lines = ["Description,Unit,Qty"]
+    lines += [f"Cement plastering to walls type {tag}-{row},m2,{row % 50 + 1}" for row in range(rows)]
+    return ("\n".join(lines) + "\n").encode("utf-8")
+
+def summarize(latencies: List[float]) -> str:
+    ordered = sorted(latencies)
+    p99 = ordered[min(len(ordered) - 1, int(round(0.99 * (len(ordered) - 1))))]
+    return (
+        f"n={len(ordered)} p50={statistics.median(ordered) * 1000:.1f}ms "
+        f"p99={p99 * 1000:.1f}ms max={ordered[-1] * 1000:.1f}ms"
+    )
+
+async def sample_health(client: httpx.AsyncClient, stop: asyncio.Event, interval: float) -> List[float]:
+    latencies = []
+    while not stop.is_set():
+        start = time.perf_counter()
+        response = await client.get("/health")
+        response.raise_for_status()
+        latencies.append(time.perf_counter() - start)
+        await asyncio.sleep(interval)
+    return latencies
+
+async def run(pages: int, csv_rows: int, uploads: int, idle_seconds: float, interval: float):
+    os.environ.setdefault("API_KEY", API_KEY)
+    os.environ.setdefault("LLM_CACHE_ENABLED", "false")
+    from ai_service import main
+    main.API_KEY = os.environ["API_KEY"]
+    headers = {"x-api-key": main.API_KEY}
+
+    pdf_bytes = build_pdf(pages)
+    print(f"Invoice PDF: {pages} pages, {len(pdf_bytes) / 1024:.0f} KiB; SOR CSV: {csv_rows} rows")
+
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=None) as client:
+        stop = asyncio.Event()
+        sampler = asyncio.create_task(sample_health(client, stop, interval))
+        await asyncio.sleep(idle_seconds)
+        stop.set()
+        print(f"/health idle:       {summarize(await sampler)}")
+
+        stop = asyncio.Event()
+        sampler = asyncio.create_task(sample_health(client, stop, interval))
+        start = time.perf_counter()
+        # Vary the content so uploads are not coalesced into one run
+        requests = []
+        for upload in range(uploads):
+            requests.append(client.post(
+                "/process_invoice/process", headers=headers,
+                files={"file": (f"invoice-{upload}.pdf", pdf_bytes + b"%" + str(upload).encode(), "application/pdf")}
+            ))
+            requests.append(client.post(
+                "/fill_sor/process", headers=headers,
+                files={"file": (f"boq-{upload}.csv", build_csv(csv_rows, upload), "text/csv")}
+            ))
+        responses = await asyncio.gather(*requests)
+        elapsed = time.perf_counter() - start
+        stop.set()
+        latencies = await sampler
+
+    failed = [response.status_code for response in responses if response.status_code != 200]
+    print(f"Processed {len(responses)} documents in {elapsed:.1f}s ({len(failed)} failed)")
+    print(f"/health under load: {summarize(latencies)}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--pages", type=int, default=200, help="pages per invoice PDF")
+    parser.add_argument("--csv-rows", type=int, default=5000, help="rows per SOR CSV")
+    parser.add_argument("--uploads", type=int, default=4, help="uploads of each document type")
+    parser.add_argument("--idle-seconds", type=float, default=2.0, help="idle sampling period")
+    parser.add_argument("--interval", type=float, default=0.01, help="seconds between /health probes")
+    args = parser.parse_args()
+    asyncio.run(run(args.pages, args.csv_rows, args.uploads, args.idle_seconds, args.interval))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""
+Benchmark: cost of recording and scraping metrics
+
+Times what the hot paths add per call: looking up a labelled histogram and
+recording one observation, and incrementing a labelled counter, from one
+and from several threads. Also times rendering /metrics with every
+processing step populated.
+
+Usage (from the ai_service directory):
+    python benchmarks/metrics_overhead.py --observations 1000000 --threads 4
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+from ai_service.services.metrics import MetricsRegistry
+
+STEPS = ["upload_read", "pdf_parse", "table_extraction", "item_ingest", "ocr", "matching",
+         "rollup", "excel_generation", "serialization", "review", "dedupe"]
+
+def record(histogram, counter, observations):
+    for position in range(observations):
+        histogram.labels(STEPS[position % len(STEPS)]).observe(0.0125)
+        counter.labels("sor_item", "match").inc()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--observations", type=int, default=1000000, help="observations per thread")
+    parser.add_argument("--threads", type=int, default=4, help="threads recording concurrently")
+    args = parser.parse_args()
+
+    registry = MetricsRegistry()
+    histogram = registry.histogram("step_seconds", "Step latency", ["step"])
+    counter = registry.counter("items_total", "Items", ["kind", "mode"])
+
+    start = time.perf_counter()
+    record(histogram, counter, args.observations)
+    single = time.perf_counter() - start
+
+    threads = [threading.Thread(target=record, args=(histogram, counter, args.observations)) for _ in range(args.threads)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    contended = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(100):
+        text = registry.render()
+    render = (time.perf_counter() - start) / 100
+
+    print(f"observe + inc, 1 thread:  {single / args.observations * 1e9:.0f} ns per call")
+    print(f"observe + inc, {args.threads} threads: {contended / (args.observations * args.threads) * 1e9:.0f} ns per call")
+    print(f"render {len(text.splitlines())} lines:    {render * 1000:.2f} ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+Benchmark: durable review write throughput, group commit vs commit per write
+
+Submits reviewed invoices from many concurrent clients to a ReviewStore
+in one process, as one worker would see them at month end, and reports
+acknowledged writes per second and acknowledgement latency percentiles.
+Every write is synced to disk before it is acknowledged in both modes;
+the per-write baseline limits each commit to a single review.
+
+Usage (from the ai_service directory):
+    python benchmarks/review_writes.py --reviews 5000 --clients 64
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+# Make the ai_service package importable
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from ai_service.services.review_store import ReviewStore
+
+def review(number: int):
+    return {
+        "invoice_number": f"INV-{number:06d}",
+        "vendor_name": f"Vendor {number % 200}",
+        "issue_date": f"2024-{number % 12 + 1:02d}-{number % 28 + 1:02d}",
+        "total_amount": number * 1.5,
+        "line_items": [{"description": "Cement bags", "quantity": 4, "unit_price": 10.0, "total": 40.0}] * 5
+    }
+
+async def run(store: ReviewStore, reviews: int, clients: int):
+    latencies = []
+    numbers = iter(range(reviews))
+
+    async def client():
+        for number in numbers:
+            start = time.perf_counter()
+            await store.save(review(number))
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[client() for _ in range(clients)])
+    return time.perf_counter() - start, sorted(latencies)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--reviews", type=int, default=5000, help="number of reviews to write")
+    parser.add_argument("--clients", type=int, default=64, help="concurrent submitters")
+    args = parser.parse_args()
+
+    print(f"{'mode':<18}{'writes/s':>10}{'p50 ms':>9}{'p99 ms':>9}{'mean batch':>12}")
+    for name, batch_max in (("commit per write", 1), ("group commit", 256)):
+        with tempfile.TemporaryDirectory() as directory:
+            store = ReviewStore(os.path.join(directory, "reviews.sqlite3"), batch_max=batch_max)
+            elapsed, latencies = asyncio.run(run(store, args.reviews, args.clients))
+            stats = store.stats()
+            store.close()
+        p50 = latencies[len(latencies) // 2] * 1000
+        p99 = latencies[int(len(latencies) * 0.99)] * 1000
+        print(f"{name:<18}{args.reviews / elapsed:>10,.0f}{p50:>9.1f}{p99:>9.1f}{stats['mean_batch_size']:>12.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Benchmark: per-worker memory with local and shared rate book indexes
+
+Writes a synthetic rate book, starts several worker processes that each
+load it into a SORMatcher and run a match, and reports each worker's RSS,
+PSS and private (USS) memory from /proc/self/smaps_rollup, with and without
+SHARED_INDEXES_ENABLED. RSS counts mapped shared pages in full in every
+worker, so PSS and USS show the saving.
+
+Usage (from the ai_service directory):
+    python benchmarks/shared_index_memory.py --rows 200000 --workers 4
+"""
+import argparse
+import csv
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+
+PACKAGE_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+
+WORDS = ["cement", "concrete", "brick", "masonry", "excavation", "soil", "steel", "reinforcement",
+         "plaster", "mortar", "painting", "enamel", "flooring", "tiles", "granite", "marble",
+         "waterproofing", "membrane", "shuttering", "plywood", "pipe", "fitting", "valve", "cable"]
+UNITS = ["Cum", "Sqm", "Kg", "Rm", "Nos", "Ltr"]
+
+WORKER_SCRIPT = (
+    "import json, sys\n"
+    "from ai_service.services.sor_matcher import SORMatcher\n"
+    "matcher = SORMatcher(sys.argv[1])\n"
+    "matcher.top_matches({'description': 'cement concrete flooring', 'unit': 'sqm'})\n"
+    "memory = {}\n"
+    "with open('/proc/self/smaps_rollup') as f:\n"
+    "    for line in f:\n"
+    "        name, _, value = line.partition(':')\n"
+    "        if name in ('Rss', 'Pss', 'Private_Clean', 'Private_Dirty'):\n"
+    "            memory[name] = int(value.split()[0])\n"
+    "print(json.dumps(memory), flush=True)\n"
+    "sys.stdin.read()\n"
+)
+
+def write_rate_book(path, rows):
+    random.seed(7)
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=["item", "unit", "rate", "category"])
+        writer.writeheader()
+        for row in range(rows):
+            words = random.sample(WORDS, random.randint(3, 7)) + [f"grade{row % 5000}"]
+            writer.writerow({"item": " ".join(words).capitalize(), "unit": random.choice(UNITS),
+                             "rate": f"{random.uniform(10, 9000):.2f}", "category": random.choice(WORDS).capitalize()})
+
+def measure(rates_csv, workers, env):
+    """Start workers together and read each one's memory once it has matched"""
+    processes = [
+        subprocess.Popen([sys.executable, "-c", WORKER_SCRIPT, rates_csv], stdin=subprocess.PIPE,
+                         stdout=subprocess.PIPE, text=True, env=env, cwd=PACKAGE_ROOT)
+        for _ in range(workers)
+    ]
+    try:
+        samples = [json.loads(process.stdout.readline()) for process in processes]
+    finally:
+        for process in processes:
+            process.communicate("")
+    return {
+        "rss": statistics.mean(sample["Rss"] for sample in samples) / 1024,
+        "pss": statistics.mean(sample["Pss"] for sample in samples) / 1024,
+        "uss": statistics.mean(sample["Private_Clean"] + sample["Private_Dirty"] for sample in samples) / 1024
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=200000, help="rate book entries")
+    parser.add_argument("--workers", type=int, default=4, help="worker processes")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        rates_csv = os.path.join(tmp, "rates.csv")
+        write_rate_book(rates_csv, args.rows)
+        base_env = {**os.environ, "PYTHONPATH": PACKAGE_ROOT, "SHARED_INDEX_DIR": os.path.join(tmp, "shared")}
+
+        # Build the shared generation first, so every measured worker attaches to it
+        subprocess.run([sys.executable, "-c", WORKER_SCRIPT, rates_csv], input="", capture_output=True,
+                       env={**base_env, "SHARED_INDEXES_ENABLED": "true"}, cwd=PACKAGE_ROOT, check=True)
+
+        print(f"{args.workers} workers, {args.rows} rate entries (MiB per worker)")
+        print(f"{'mode':<8}{'RSS':>10}{'PSS':>10}{'USS':>10}")
+        for mode in ("local", "shared"):
+            memory = measure(rates_csv, args.workers, {**base_env, "SHARED_INDEXES_ENABLED": str(mode == "shared").lower()})
+            print(f"{mode:<8}{memory['rss']:>10.1f}{memory['pss']:>10.1f}{memory['uss']:>10.1f}")
+
+if __name__ == "__main__":
+    main()
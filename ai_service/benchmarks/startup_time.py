@@ -0,0 +1,63 @@
+"""
+Benchmark: worker import and startup time
+
+Imports the application in fresh interpreters and reports the wall time
+of the import, the slowest ai_service modules by cumulative import time
+(from python -X importtime), and the time to warm up every service, i.e.
+the cost moved from import time to the first request or to an explicit
+SERVICES_WARM_UP startup.
+
+Usage (from the ai_service directory):
+    python benchmarks/startup_time.py --runs 5 --top 10
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+PACKAGE_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+
+IMPORT_SCRIPT = (
+    "import json, time\n"
+    "start = time.perf_counter()\n"
+    "import ai_service.main\n"
+    "imported = time.perf_counter() - start\n"
+    "from ai_service.services.container import get_services\n"
+    "warm_up = get_services().warm_up()\n"
+    "print(json.dumps({'import': imported, 'warm_up': warm_up}))\n"
+)
+
+def run(args, env):
+    return subprocess.run([sys.executable, *args], capture_output=True, text=True, env=env, check=True, cwd=PACKAGE_ROOT)
+
+def module_import_times(env):
+    """Cumulative import microseconds of each module, from one -X importtime run"""
+    times = {}
+    for line in run(["-X", "importtime", "-c", "import ai_service.main"], env).stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        times[name.strip()] = int(cumulative)
+    return times
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5, help="fresh interpreters to time")
+    parser.add_argument("--top", type=int, default=10, help="ai_service modules to list")
+    args = parser.parse_args()
+
+    env = {**os.environ, "PYTHONPATH": PACKAGE_ROOT, "LLM_CACHE_ENABLED": "false"}
+    samples = [json.loads(run(["-c", IMPORT_SCRIPT], env).stdout.strip().splitlines()[-1]) for _ in range(args.runs)]
+    print(f"import ai_service.main: {statistics.median(sample['import'] for sample in samples) * 1000:.0f} ms (median of {args.runs})")
+    print(f"warm up all services:   {statistics.median(sample['warm_up'] for sample in samples) * 1000:.0f} ms")
+
+    times = module_import_times(env)
+    modules = sorted((name for name in times if name.startswith("ai_service.")), key=times.get, reverse=True)
+    print(f"\n{'module':<42}{'cumulative ms':>14}")
+    for name in modules[:args.top]:
+        print(f"{name:<42}{times[name] / 1000:>14.1f}")
+
+if __name__ == "__main__":
+    main()
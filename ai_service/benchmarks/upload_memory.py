@@ -0,0 +1,102 @@
+"""
+Benchmark: peak memory of reading an upload into bytes vs spooling it
+
+Builds a scanned-style PDF (one large image per page) on disk, standing in
+for the multipart temp file, and extracts its text two ways: the old path,
+which read the upload into bytes and pickled them to the process pool, and
+the spooled path, which copies the upload to a temp file in chunks and
+passes only the path. Peak Python memory (tracemalloc) of the old path
+grows with the file size; the spooled path stays roughly constant.
+
+Usage (from the ai_service directory):
+    python benchmarks/upload_memory.py --pages 50 --page-kib 2048
+"""
+import argparse
+import os
+import pickle
+import sys
+import tempfile
+import time
+import tracemalloc
+
+# Make the ai_service package importable
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from ai_service.services.pdf_utils import PDFUtils
+from ai_service.services.uploads import UploadSpooler
+
+def write_scanned_pdf(path: str, pages: int, page_bytes: int):
+    """Write a PDF whose pages each draw one uncompressed greyscale image"""
+    side = int(page_bytes ** 0.5)
+    image = os.urandom(side * side)
+    content = b"q 595 0 0 842 0 0 cm /Im1 Do Q"
+    with open(path, "wb") as output:
+        offsets = {}
+        output.write(b"%PDF-1.4\n")
+
+        def write_object(number: int, body: bytes):
+            offsets[number] = output.tell()
+            output.write(b"%d 0 obj\n" % number + body + b"\nendobj\n")
+
+        kids = " ".join(f"{3 + page * 3} 0 R" for page in range(pages))
+        write_object(1, b"<< /Type /Catalog /Pages 2 0 R >>")
+        write_object(2, f"<< /Type /Pages /Kids [{kids}] /Count {pages} >>".encode())
+        for page in range(pages):
+            page_id, content_id, image_id = 3 + page * 3, 4 + page * 3, 5 + page * 3
+            write_object(page_id, (
+                f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+                f"/Resources << /XObject << /Im1 {image_id} 0 R >> >> /Contents {content_id} 0 R >>"
+            ).encode())
+            write_object(content_id, b"<< /Length %d >>\nstream\n" % len(content) + content + b"\nendstream")
+            write_object(image_id, (
+                b"<< /Type /XObject /Subtype /Image /Width %d /Height %d /ColorSpace /DeviceGray "
+                b"/BitsPerComponent 8 /Length %d >>\nstream\n" % (side, side, len(image))
+            ) + image + b"\nendstream")
+
+        xref = output.tell()
+        count = len(offsets) + 1
+        output.write(b"xref\n0 %d\n0000000000 65535 f \n" % count)
+        for number in range(1, count):
+            output.write(b"%010d 00000 n \n" % offsets[number])
+        output.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (count, xref))
+
+def read_into_bytes(path: str):
+    with open(path, "rb") as upload:
+        content = upload.read()
+    # What the process pool sends to a worker
+    payload = pickle.dumps(content)
+    PDFUtils().extract_text_from_pdf(pickle.loads(payload))
+
+def spool(path: str):
+    with open(path, "rb") as upload:
+        with UploadSpooler(max_bytes=2 ** 40, max_pages=0).spool(upload, "scan.pdf", "application/pdf") as spooled:
+            payload = pickle.dumps(spooled.source)
+            PDFUtils().extract_text_from_pdf(pickle.loads(payload))
+
+def measure(fn, path: str):
+    tracemalloc.start()
+    start = time.perf_counter()
+    fn(path)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--pages", type=int, default=50, help="number of pages")
+    parser.add_argument("--page-kib", type=int, default=2048, help="image size per page in KiB")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "scan.pdf")
+        write_scanned_pdf(path, args.pages, args.page_kib * 1024)
+        size = os.path.getsize(path)
+        print(f"{args.pages}-page PDF, {size / 2 ** 20:.0f} MiB")
+        print(f"{'path':<16}{'seconds':>9}{'peak MiB':>10}")
+        for name, fn in (("bytes (old)", read_into_bytes), ("spooled", spool)):
+            elapsed, peak = measure(fn, path)
+            print(f"{name:<16}{elapsed:>9.2f}{peak / 2 ** 20:>10.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+Benchmark: SOR XLSX ingest time and memory on large multi-sheet workbooks
+
+Writes a BOQ workbook with a summary sheet and several bill sheets, then
+reads it with SORIngest (read-only, streaming) and reports rows per second
+and peak Python memory (tracemalloc). With --compare it also loads the
+workbook the default, fully in-memory way for reference.
+
+Usage (from the ai_service directory):
+    python benchmarks/xlsx_ingest.py --rows 200000 --sheets 4
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from openpyxl import Workbook, load_workbook
+
+# Make the ai_service package importable
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from ai_service.services.sor_ingest import SORIngest
+
+def write_workbook(path: str, rows: int, sheets: int):
+    """Write a workbook with a summary sheet and rows spread over bill sheets"""
+    workbook = Workbook(write_only=True)
+    summary = workbook.create_sheet("Summary")
+    summary.append(["Bill", "Amount"])
+    for bill in range(sheets):
+        sheet = workbook.create_sheet(f"Bill {bill + 1}")
+        sheet.append([f"Bill {bill + 1} - Finishes"])
+        sheet.append([])
+        sheet.append(["Item No", "Description", "Unit", "Qty", "Rate", "Amount"])
+        for index in range(bill, rows, sheets):
+            sheet.append([index + 1, f"Cement plastering to internal walls, 15mm thick, type {index}", "m2", index % 50 + 1, None, None])
+        summary.append([f"Bill {bill + 1}", 0])
+    workbook.save(path)
+
+def streaming_ingest(path: str) -> int:
+    return sum(1 for _ in SORIngest().iter_xlsx_items(path))
+
+def full_load(path: str) -> int:
+    workbook = load_workbook(path)
+    return sum(sheet.max_row for sheet in workbook.worksheets)
+
+def measure(fn, path: str, trace: bool):
+    if trace:
+        tracemalloc.start()
+    start = time.perf_counter()
+    count = fn(path)
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1] if trace else 0
+    if trace:
+        tracemalloc.stop()
+    return count, elapsed, peak
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=200000, help="number of BOQ rows across all bill sheets")
+    parser.add_argument("--sheets", type=int, default=4, help="number of bill sheets")
+    parser.add_argument("--compare", action="store_true", help="also time a full in-memory load")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "boq.xlsx")
+        write_workbook(path, args.rows, args.sheets)
+        print(f"{args.rows} rows over {args.sheets} bill sheets, {os.path.getsize(path) / 2 ** 20:.1f} MiB")
+        print(f"{'reader':<22}{'rows':>9}{'rows/s':>10}{'seconds':>9}{'peak MiB':>10}")
+        readers = [("SORIngest (streaming)", streaming_ingest)]
+        if args.compare:
+            readers.append(("load_workbook (full)", full_load))
+        for name, fn in readers:
+            count, elapsed, _ = measure(fn, path, trace=False)
+            # Memory is traced in a second run, as tracing slows parsing down
+            _, _, peak = measure(fn, path, trace=True)
+            print(f"{name:<22}{count:>9}{count / elapsed:>10,.0f}{elapsed:>9.2f}{peak / 2 ** 20:>10.1f}")
+
+if __name__ == "__main__":
+    main()
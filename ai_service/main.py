@@ -1,5 +1,11 @@
 import os
-from fastapi import FastAPI, Depends, HTTPException, status
+import time
+
+# Time spent importing the application, from here to the end of the module
+_import_started = time.perf_counter()
+
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Depends, HTTPException, status, Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import APIKeyHeader
 from dotenv import load_dotenv
@@ -12,11 +18,49 @@ load_dotenv()
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+from ai_service.services.container import get_services, close_services
+from ai_service.services.llm_cache import get_llm_cache
+from ai_service.services.boq_revisions import get_boq_revision_store
+from ai_service.services.duplicate_index import get_duplicate_index
+from ai_service.services.shared_index import shared_indexes_enabled
+from ai_service.services.metrics import render_metrics, CONTENT_TYPE as METRICS_CONTENT_TYPE
+from ai_service.services.tracing import get_trace_store
+from ai_service.services.review_store import get_review_store, close_review_store
+from ai_service.services.single_flight import single_flight_stats
+from ai_service.services.executors import get_execution_layer, shutdown_execution_layer
+from ai_service.services.job_queue import get_job_queue, close_job_queue, JobAdmissionMiddleware
+from ai_service.services.uploads import UploadLimitMiddleware
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Set up the worker's services on startup and close them on shutdown
+    
+    Services are created on first use unless SERVICES_WARM_UP is true, in
+    which case they are all created before the worker accepts requests.
+    On shutdown the job queue, review store, pooled LLM HTTP sessions and
+    executor pools are closed.
+    """
+    start = time.perf_counter()
+    services = get_services()
+    if os.getenv("SERVICES_WARM_UP", "false").lower() == "true":
+        services.warm_up()
+    app.state.startup_seconds = time.perf_counter() - start
+    logger.info(f"Started in {app.state.startup_seconds * 1000:.0f} ms after {IMPORT_SECONDS * 1000:.0f} ms of imports")
+    
+    yield
+    
+    await close_job_queue()
+    close_review_store()
+    await close_services()
+    shutdown_execution_layer()
+
 # Initialize FastAPI app
 app = FastAPI(
     title="Ampere AI Document Processing Service",
     description="AI service for processing invoices and SOR/BOQ documents",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # Add CORS middleware
@@ -49,6 +93,8 @@ async def verify_api_key(api_key: str = Depends(api_key_header)):
 
 # Include routers
 from ai_service.routers import invoice, sor
+from ai_service.routers.uploads import upload_spooler
+from ai_service.routers.tracing import verify_admin_key
 
 app.include_router(
     invoice.router,
@@ -64,6 +110,20 @@ app.include_router(
     dependencies=[Depends(verify_api_key)]
 )
 
+# Refuse oversized uploads from their Content-Length, before the body is read.
+# The allowance covers multipart framing and form fields.
+UPLOAD_FORM_ALLOWANCE = 1024 * 1024
+app.add_middleware(
+    UploadLimitMiddleware,
+    max_bytes=upload_spooler.max_bytes + UPLOAD_FORM_ALLOWANCE,
+    path_limits={
+        "/process_invoice/batch": invoice.BATCH_MAX_FILES * (invoice.BATCH_MAX_FILE_BYTES + UPLOAD_FORM_ALLOWANCE)
+    }
+)
+
+# Refuse job submissions while the queue is full, before the upload is read
+app.add_middleware(JobAdmissionMiddleware, paths=["/process_invoice/jobs", "/fill_sor/jobs"])
+
 @app.get("/", tags=["health"])
 async def health_check():
     """Health check endpoint"""
@@ -78,6 +138,143 @@ async def health_check_detailed():
         "version": "1.0.0"
     }
 
+@app.get("/metrics", tags=["health"], dependencies=[Depends(verify_api_key)])
+async def metrics():
+    """Per-stage latency histograms and throughput counters in the Prometheus text format"""
+    return Response(content=render_metrics(), media_type=METRICS_CONTENT_TYPE)
+
+@app.get("/llm/cache-stats", tags=["llm"], dependencies=[Depends(verify_api_key)])
+async def llm_cache_stats():
+    """LLM response cache hit-rate metrics"""
+    cache = get_llm_cache()
+    return {
+        "status": "success",
+        "data": cache.stats() if cache else {"enabled": False},
+        "message": "LLM cache statistics retrieved successfully"
+    }
+
+@app.get("/llm/provider-stats", tags=["llm"], dependencies=[Depends(verify_api_key)])
+async def llm_provider_stats():
+    """LLM provider latency and circuit breaker state"""
+    return {
+        "status": "success",
+        "data": get_services().llm_service.provider_stats(),
+        "message": "LLM provider statistics retrieved successfully"
+    }
+
+@app.get("/coalescing-stats", tags=["health"], dependencies=[Depends(verify_api_key)])
+async def coalescing_stats():
+    """How often concurrent identical requests shared one computation"""
+    return {
+        "status": "success",
+        "data": single_flight_stats(),
+        "message": "Coalescing statistics retrieved successfully"
+    }
+
+@app.get("/executor-stats", tags=["health"], dependencies=[Depends(verify_api_key)])
+async def executor_stats():
+    """Thread and process pool settings and per-stage activity"""
+    return {
+        "status": "success",
+        "data": get_execution_layer().stats(),
+        "message": "Executor statistics retrieved successfully"
+    }
+
+@app.get("/job-stats", tags=["health"], dependencies=[Depends(verify_api_key)])
+async def job_stats():
+    """Background job queue depth and job counts"""
+    return {
+        "status": "success",
+        "data": get_job_queue().stats(),
+        "message": "Job statistics retrieved successfully"
+    }
+
+@app.get("/review-stats", tags=["health"], dependencies=[Depends(verify_api_key)])
+async def review_stats():
+    """Reviewed invoice writes, group commit sizes and writer throughput"""
+    return {
+        "status": "success",
+        "data": get_review_store().stats(),
+        "message": "Review statistics retrieved successfully"
+    }
+
+@app.get("/revision-stats", tags=["health"], dependencies=[Depends(verify_api_key)])
+async def revision_stats():
+    """Rows reused and re-priced across BOQ revisions"""
+    store = get_boq_revision_store()
+    return {
+        "status": "success",
+        "data": store.stats() if store else {"enabled": False},
+        "message": "Revision statistics retrieved successfully"
+    }
+
+@app.get("/duplicate-stats", tags=["health"], dependencies=[Depends(verify_api_key)])
+async def duplicate_stats():
+    """Indexed invoices, duplicate lookups and their cost"""
+    index = get_duplicate_index()
+    return {
+        "status": "success",
+        "data": index.stats() if index else {"enabled": False},
+        "message": "Duplicate statistics retrieved successfully"
+    }
+
+@app.get("/startup-stats", tags=["health"], dependencies=[Depends(verify_api_key)])
+async def startup_stats():
+    """Import and startup time of the worker, and the time taken to create each service"""
+    return {
+        "status": "success",
+        "data": {
+            "app_import_ms": IMPORT_SECONDS * 1000,
+            "startup_ms": app.state.startup_seconds * 1000 if hasattr(app.state, "startup_seconds") else None,
+            **get_services().stats()
+        },
+        "message": "Startup statistics retrieved successfully"
+    }
+
+@app.get("/index-stats", tags=["health"], dependencies=[Depends(verify_api_key)])
+async def index_stats():
+    """Rate book and vector index mode and generation of this worker"""
+    services = get_services()
+    created = services.stats()["created"]
+    return {
+        "status": "success",
+        "data": {
+            "shared_indexes_enabled": shared_indexes_enabled(),
+            # Services not created yet are reported as None rather than loaded here
+            "sor_matcher": services.sor_matcher.index_stats() if "sor_matcher" in created else None,
+            "vector_db": services.vector_db.index_stats() if "vector_db" in created else None
+        },
+        "message": "Index statistics retrieved successfully"
+    }
+
+@app.get("/traces", tags=["health"], dependencies=[Depends(verify_api_key), Depends(verify_admin_key)])
+async def list_traces(limit: int = 50):
+    """Newest request traces in the trace store"""
+    # Reads up to limit trace files; keep it off the event loop
+    traces = await get_execution_layer().run_in_thread("trace", get_trace_store().list, limit, step="trace_list")
+    return {
+        "status": "success",
+        "data": traces,
+        "message": "Traces retrieved successfully"
+    }
+
+@app.get("/traces/{trace_id}", tags=["health"], dependencies=[Depends(verify_api_key), Depends(verify_admin_key)])
+async def get_trace(trace_id: str):
+    """A request trace with its spans, profile and peak memory"""
+    trace = await get_execution_layer().run_in_thread("trace", get_trace_store().get, trace_id, step="trace_read")
+    if trace is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Trace {trace_id} not found"
+        )
+    return {
+        "status": "success",
+        "data": trace,
+        "message": "Trace retrieved successfully"
+    }
+
+IMPORT_SECONDS = time.perf_counter() - _import_started
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(
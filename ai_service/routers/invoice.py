@@ -1,26 +1,47 @@
+import os
+import json
+import asyncio
 import logging
-from fastapi import APIRouter, UploadFile, File, Form, HTTPException, status
-from typing import Optional, Dict, Any
+import zipfile
+from fastapi import APIRouter, UploadFile, File, Form, Query, Header, HTTPException, status
+from fastapi.responses import StreamingResponse
+from typing import Optional, Dict, Any, List, Tuple, Callable, Awaitable, Union
 import io
 
-from ai_service.services.ocr import OCRService
-from ai_service.services.pdf_utils import PDFUtils
-from ai_service.services.llm import LLMService
+from ai_service.services.container import get_services
+from ai_service.services.streaming import format_sse
+from ai_service.services.single_flight import get_single_flight, digest_key
+from ai_service.services.executors import get_execution_layer
+from ai_service.services.job_queue import Job, get_job_queue
+from ai_service.services.uploads import SpooledUpload
+from ai_service.services.review_store import get_review_store, ReviewStoreBusyError, ReviewStoreClosedError
+from ai_service.services.duplicate_index import DuplicateIndex, get_duplicate_index
+from ai_service.services.metrics import ITEMS_PROCESSED
+from ai_service.services.tracing import current_trace
+from ai_service.routers.jobs import submit_job, validate_callback_url, check_job_capacity
+from ai_service.routers.uploads import spool_upload, spool_file
+from ai_service.routers.tracing import traced_request
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
-# Initialize services
-ocr_service = OCRService()
-pdf_utils = PDFUtils()
-llm_service = LLMService()
+# Batch upload limits
+BATCH_MAX_FILES = int(os.getenv("BATCH_MAX_FILES", "500"))
+BATCH_MAX_FILE_BYTES = int(os.getenv("BATCH_MAX_FILE_BYTES", str(20 * 1024 * 1024)))
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "4"))
+BATCH_CONTENT_TYPES = {".pdf": "application/pdf", ".jpg": "image/jpeg", ".jpeg": "image/jpeg", ".png": "image/png"}
+ZIP_CONTENT_TYPES = ["application/zip", "application/x-zip-compressed"]
 
 @router.post("/process")
 async def process_invoice(
     file: UploadFile = File(...),
     use_llm: bool = Form(False),
-    llm_provider: str = Form("ollama")
+    llm_provider: str = Form("ollama"),
+    trace: bool = Form(False),
+    trace_profile: bool = Form(False),
+    trace_memory: bool = Form(False),
+    x_admin_key: Optional[str] = Header(None)
 ):
     """
     Process an invoice document (PDF/image) and extract structured data
@@ -29,7 +50,11 @@ async def process_invoice(
         file: Uploaded invoice file (PDF, JPG, PNG)
         use_llm: Whether to use LLM for enhanced extraction
         llm_provider: LLM provider to use (ollama, openai)
-        
+        trace: Return a timing breakdown of the request as "trace" and keep
+            it in the trace store; requires the x-admin-key header
+        trace_profile: Add a sampled CPU profile to the trace
+        trace_memory: Add peak memory from tracemalloc to the trace
+    
     Returns:
         Extracted invoice data in JSON format
     """
@@ -41,37 +66,28 @@ async def process_invoice(
                 detail="Unsupported file type. Please upload PDF, JPG, or PNG files."
             )
         
-        # Read file content
-        content = await file.read()
-        
-        # Extract text based on file type
-        if file.content_type == "application/pdf":
-            text = pdf_utils.extract_text_from_pdf(content)
-        else:  # Image file
-            text = ocr_service.extract_text_from_image(content)
-        
-        # Extract data from text
-        if use_llm:
-            # Use LLM for enhanced extraction
-            extracted_data = llm_service.extract_invoice_data(text)
-        else:
-            # Use basic pattern matching
-            extracted_data = ocr_service.extract_data_from_text(text)
-        
-        # Add file metadata
-        extracted_data["file_name"] = file.filename
-        extracted_data["file_size"] = len(content)
-        extracted_data["content_type"] = file.content_type
-        extracted_data["extraction_method"] = "llm" if use_llm else "pattern_matching"
+        async with traced_request("/process_invoice/process", file.filename, x_admin_key,
+                                  trace, trace_profile, trace_memory) as request_trace:
+            # Spool the upload, rejecting it early if it is over the limits
+            upload = await spool_upload(file)
+            if request_trace is not None:
+                # A traced run is not shared, so its spans are its own
+                with upload:
+                    extracted_data = _add_file_metadata(await _extract_invoice_data(upload, use_llm), upload, use_llm)
+            else:
+                extracted_data = await _process_invoice_content(upload, use_llm)
         
         logger.info(f"Successfully processed invoice: {file.filename}")
         
-        return {
+        response = {
             "status": "success",
             "data": extracted_data,
             "message": "Invoice processed successfully"
         }
-        
+        if request_trace is not None:
+            response["trace"] = request_trace.result
+        return response
+    
     except HTTPException:
         raise
     except Exception as e:
@@ -81,6 +97,361 @@ async def process_invoice(
             detail=f"Error processing invoice: {str(e)}"
         )
 
+@router.post("/batch")
+async def process_invoice_batch(
+    files: List[UploadFile] = File(...),
+    use_llm: bool = Form(False),
+    llm_provider: str = Form("ollama")
+):
+    """
+    Process many invoice documents in one request
+    
+    Accepts any number of PDF, JPG and PNG files, and zip archives of
+    them. Documents are processed concurrently, and one NDJSON line is
+    streamed per document as soon as it finishes. A document that fails
+    gets an error line and does not stop the rest of the batch.
+    
+    Args:
+        files: Uploaded invoice files and/or zip archives
+        use_llm: Whether to use LLM for enhanced extraction
+        llm_provider: LLM provider to use (ollama, openai)
+    
+    Returns:
+        NDJSON stream with one result per document
+    """
+    try:
+        documents = _collect_batch_documents(files)
+    except (zipfile.BadZipFile, ValueError) as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Invalid batch upload: {str(e)}"
+        )
+    
+    semaphore = asyncio.Semaphore(BATCH_MAX_CONCURRENCY)
+    
+    async def process_document(index: int, file_name: str, content_type: Optional[str], spool) -> Dict[str, Any]:
+        result = {"index": index, "file_name": file_name}
+        async with semaphore:
+            try:
+                if content_type is None:
+                    raise ValueError("Unsupported file type. Please upload PDF, JPG, or PNG files.")
+                data = await _process_invoice_content(await spool(), use_llm)
+                result.update({"status": "success", "data": data})
+            except HTTPException as e:
+                logger.error(f"Error processing batch invoice {file_name}: {e.detail}")
+                result.update({"status": "error", "detail": f"Error processing invoice: {e.detail}"})
+            except Exception as e:
+                logger.error(f"Error processing batch invoice {file_name}: {str(e)}")
+                result.update({"status": "error", "detail": f"Error processing invoice: {str(e)}"})
+        return result
+    
+    async def results():
+        tasks = [
+            asyncio.ensure_future(process_document(index, *document))
+            for index, document in enumerate(documents)
+        ]
+        try:
+            for next_result in asyncio.as_completed(tasks):
+                yield json.dumps(await next_result) + "\n"
+        finally:
+            # Stop outstanding work if the client goes away
+            for task in tasks:
+                task.cancel()
+    
+    return StreamingResponse(results(), media_type="application/x-ndjson")
+
+def _collect_batch_documents(files: List[UploadFile]) -> List[Tuple[str, Optional[str], Callable[[], Awaitable[SpooledUpload]]]]:
+    """
+    List the documents in a batch upload, expanding zip archives
+    
+    Documents are spooled lazily so only the ones being processed are
+    copied off the request.
+    
+    Args:
+        files: Uploaded files and zip archives
+    
+    Returns:
+        List of (file name, content type or None if unsupported,
+        coroutine function returning the spooled upload)
+    
+    Raises:
+        ValueError: If the batch has too many documents or an archive
+            member is too large
+    """
+    documents = []
+    for upload in files:
+        if upload.content_type in ZIP_CONTENT_TYPES or (upload.filename or "").lower().endswith(".zip"):
+            archive = zipfile.ZipFile(upload.file)
+            for member in archive.infolist():
+                if member.is_dir() or member.filename.startswith("__MACOSX/"):
+                    continue
+                if member.file_size > BATCH_MAX_FILE_BYTES:
+                    raise ValueError(f"{member.filename} exceeds {BATCH_MAX_FILE_BYTES} bytes")
+                content_type = _guess_content_type(member.filename)
+                documents.append((
+                    member.filename,
+                    content_type,
+                    _zip_member_spooler(archive, member.filename, content_type)
+                ))
+        else:
+            content_type = upload.content_type if upload.content_type in BATCH_CONTENT_TYPES.values() else _guess_content_type(upload.filename)
+            documents.append((upload.filename, content_type, _upload_spooler(upload, content_type)))
+    
+    if len(documents) > BATCH_MAX_FILES:
+        raise ValueError(f"Batch has {len(documents)} documents; the limit is {BATCH_MAX_FILES}")
+    return documents
+
+def _upload_spooler(upload: UploadFile, content_type: Optional[str]) -> Callable[[], Awaitable[SpooledUpload]]:
+    """Build a coroutine function that spools one batch file within the per-file limit"""
+    async def spool() -> SpooledUpload:
+        return await spool_file(upload.file, upload.filename, content_type, BATCH_MAX_FILE_BYTES)
+    return spool
+
+def _zip_member_spooler(archive: zipfile.ZipFile, name: str,
+                        content_type: Optional[str]) -> Callable[[], Awaitable[SpooledUpload]]:
+    """Build a coroutine function that decompresses one archive member into a spooled upload"""
+    async def spool() -> SpooledUpload:
+        with archive.open(name) as member:
+            return await spool_file(member, name, content_type, BATCH_MAX_FILE_BYTES)
+    return spool
+
+def _guess_content_type(file_name: str) -> Optional[str]:
+    """Map an invoice file name to a supported content type"""
+    extension = os.path.splitext(file_name or "")[1].lower()
+    return BATCH_CONTENT_TYPES.get(extension)
+
+async def _process_invoice_content(upload: SpooledUpload, use_llm: bool) -> Dict[str, Any]:
+    """
+    Extract invoice data and add the file metadata
+    
+    Takes ownership of the upload: it is closed once the extraction
+    finishes, which may be after this call if the caller is cancelled.
+    
+    Args:
+        upload: Spooled invoice upload
+        use_llm: Whether to use LLM for enhanced extraction
+    
+    Returns:
+        Extracted invoice data with file metadata
+    """
+    # Identical uploads processed concurrently share one extraction, which owns the first caller's upload
+    key = digest_key(upload.sha256, content_type=upload.content_type, use_llm=use_llm)
+    extracted_data = await get_single_flight("invoice_process").do(
+        key,
+        lambda: _extract_invoice_data(upload, use_llm),
+        copy_result=True,
+        cleanup=upload.close
+    )
+    return _add_file_metadata(extracted_data, upload, use_llm)
+
+def _add_file_metadata(extracted_data: Dict[str, Any], upload: SpooledUpload, use_llm: bool) -> Dict[str, Any]:
+    """Add the upload's file metadata to extracted invoice data"""
+    extracted_data["file_name"] = upload.filename
+    extracted_data["file_size"] = upload.size
+    extracted_data["content_type"] = upload.content_type
+    extracted_data["extraction_method"] = "llm" if use_llm else "pattern_matching"
+    return extracted_data
+
+async def _extract_invoice_data(upload: SpooledUpload, use_llm: bool, job: Optional[Job] = None) -> Dict[str, Any]:
+    """
+    Extract structured data from an invoice document
+    
+    The invoice is then checked against the duplicate index, if enabled.
+    
+    Args:
+        upload: Spooled invoice upload
+        use_llm: Whether to use LLM for enhanced extraction
+        job: Background job to report progress to, if any
+    
+    Returns:
+        Extracted invoice data
+    """
+    # Extract text based on file type
+    if job:
+        job.set_stage("extracting_text", 0.1)
+    text = await _extract_text(upload.source, upload.content_type)
+    
+    # Extract data from text
+    if job:
+        job.set_stage("extracting_fields", 0.5)
+    if use_llm:
+        # Use LLM for enhanced extraction
+        extracted_data = await get_services().llm_service.extract_invoice_data(text)
+    else:
+        # Use basic pattern matching
+        extracted_data = get_services().ocr_service.extract_data_from_text(text)
+    ITEMS_PROCESSED.labels("invoice", "llm" if use_llm else "pattern_matching").inc()
+    
+    duplicate_index = get_duplicate_index()
+    if duplicate_index is not None:
+        if job:
+            job.set_stage("checking_duplicates", 0.9)
+        extracted_data["duplicate_check"] = await _check_duplicates(duplicate_index, text, extracted_data, upload)
+    return extracted_data
+
+async def _check_duplicates(duplicate_index: DuplicateIndex, text: str, extracted_data: Dict[str, Any],
+                            upload: SpooledUpload) -> Optional[Dict[str, Any]]:
+    """
+    Flag probable duplicates of an invoice and add it to the duplicate index
+    
+    A failed check is logged and does not fail the extraction.
+    
+    Returns:
+        Duplicate check result, or None if the check failed
+    """
+    try:
+        return await get_execution_layer().run_in_thread(
+            "dedupe", duplicate_index.check_and_add, text, extracted_data, upload.sha256, upload.filename
+        )
+    except Exception as e:
+        logger.error(f"Error checking invoice for duplicates: {str(e)}")
+        return None
+
+@router.post("/jobs", status_code=status.HTTP_202_ACCEPTED)
+async def submit_invoice_job(
+    file: UploadFile = File(...),
+    use_llm: bool = Form(False),
+    llm_provider: str = Form("ollama"),
+    callback_url: Optional[str] = Form(None)
+):
+    """
+    Queue an invoice document for background processing
+    
+    Args:
+        file: Uploaded invoice file (PDF, JPG, PNG)
+        use_llm: Whether to use LLM for enhanced extraction
+        llm_provider: LLM provider to use (ollama, openai)
+        callback_url: Optional URL that receives the finished job as JSON
+    
+    Returns:
+        Job id and status URL to poll
+    """
+    # Validate file type
+    if file.content_type not in ["application/pdf", "image/jpeg", "image/png"]:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Unsupported file type. Please upload PDF, JPG, or PNG files."
+        )
+    validate_callback_url(callback_url)
+    
+    check_job_capacity()
+    
+    # The job owns the spooled upload and deletes it when it finishes
+    upload = await spool_upload(file)
+    
+    async def work(job: Job) -> Dict[str, Any]:
+        with upload:
+            extracted_data = await _extract_invoice_data(upload, use_llm, job)
+            return _add_file_metadata(extracted_data, upload, use_llm)
+    
+    try:
+        job = submit_job("invoice", work, callback_url, cleanup=upload.close)
+    except HTTPException:
+        upload.close()
+        raise
+    return {
+        "status": "success",
+        "data": {**job.to_dict(include_result=False), "status_url": f"/process_invoice/jobs/{job.id}"},
+        "message": "Invoice job queued"
+    }
+
+@router.get("/jobs/{job_id}")
+async def get_invoice_job(job_id: str):
+    """
+    Get the status, progress and result of an invoice job
+    
+    Args:
+        job_id: Job identifier
+    
+    Returns:
+        Job status, with the extracted invoice data once it has succeeded
+    """
+    job = get_job_queue().get(job_id, kind="invoice")
+    if job is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Job not found"
+        )
+    
+    return {
+        "status": "success",
+        "data": job.to_dict(),
+        "message": f"Job {job.status}"
+    }
+
+@router.post("/process/stream")
+async def process_invoice_stream(
+    file: UploadFile = File(...)
+):
+    """
+    Process an invoice document and stream LLM-extracted fields
+    
+    Each field is sent as a server-sent "field" event as soon as the model
+    finishes it, followed by a "done" event with the file metadata.
+    
+    Args:
+        file: Uploaded invoice file (PDF, JPG, PNG)
+    
+    Returns:
+        Server-sent event stream of extracted fields
+    """
+    # Validate file type
+    if file.content_type not in ["application/pdf", "image/jpeg", "image/png"]:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Unsupported file type. Please upload PDF, JPG, or PNG files."
+        )
+    
+    with await spool_upload(file) as upload:
+        text = await _extract_text(upload.source, file.content_type)
+        file_size = upload.size
+    
+    async def events():
+        try:
+            async for field, value in get_services().llm_service.stream_invoice_data(text):
+                yield format_sse("field", {"field": field, "value": value})
+            yield format_sse("done", {
+                "status": "success",
+                "file_name": file.filename,
+                "file_size": file_size,
+                "content_type": file.content_type,
+                "extraction_method": "llm",
+                "message": "Invoice processed successfully"
+            })
+        except Exception as e:
+            logger.error(f"Error streaming invoice: {str(e)}")
+            yield format_sse("error", {"status": "error", "detail": f"Error processing invoice: {str(e)}"})
+    
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+async def _extract_text(source: Union[bytes, str], content_type: str) -> str:
+    """
+    Extract text from an invoice document based on its content type
+    
+    PDF parsing and OCR run in the process pool so large documents do not
+    stall the event loop. Spooled uploads are passed by path, so large
+    documents are not copied to the worker process.
+    
+    Args:
+        source: File bytes, or the path of a spooled upload
+        content_type: MIME type of the file
+    
+    Returns:
+        Extracted text
+    """
+    execution = get_execution_layer()
+    trace = current_trace()
+    if content_type == "application/pdf" and trace is not None:
+        text, page_seconds = await execution.run_in_process(
+            "parse", get_services().pdf_utils.extract_text_from_pdf_timed, source, step="pdf_parse"
+        )
+        trace.add_pages("pdf_parse", page_seconds)
+        return text
+    if content_type == "application/pdf":
+        return await execution.run_in_process("parse", get_services().pdf_utils.extract_text_from_pdf, source, step="pdf_parse")
+    # Image file
+    return await execution.run_in_process("ocr", get_services().ocr_service.extract_text_from_image, source)
+
 @router.post("/review")
 async def review_invoice_data(
     invoice_data: Dict[str, Any]
@@ -88,26 +459,88 @@ async def review_invoice_data(
     """
     Submit reviewed invoice data (human-in-the-loop step)
     
+    The review is stored before the response is sent; concurrent
+    submissions share one durable commit.
+    
     Args:
         invoice_data: Reviewed invoice data
-        
+    
     Returns:
-        Confirmation of submission
+        Confirmation of submission with the stored review id
     """
     try:
-        # In a real implementation, this would save the reviewed data
-        # For now, we just log it
-        logger.info(f"Received reviewed invoice data: {invoice_data}")
+        review = await get_review_store().save(invoice_data)
+        logger.info(f"Stored reviewed invoice {invoice_data.get('invoice_number')} as review {review['review_id']}")
         
         return {
             "status": "success",
             "message": "Invoice data submitted successfully",
-            "data": invoice_data
+            "data": invoice_data,
+            **review
         }
-        
+    
+    except (ReviewStoreBusyError, ReviewStoreClosedError) as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=str(e),
+            headers={"Retry-After": "1"}
+        )
     except Exception as e:
         logger.error(f"Error submitting reviewed invoice data: {str(e)}")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Error submitting invoice data: {str(e)}"
-        )
\ No newline at end of file
+        )
+
+@router.get("/reviews")
+async def find_reviews(
+    vendor_name: Optional[str] = Query(None),
+    invoice_number: Optional[str] = Query(None),
+    date_from: Optional[str] = Query(None),
+    date_to: Optional[str] = Query(None),
+    limit: int = Query(100, ge=1, le=1000)
+):
+    """
+    Look up reviewed invoices
+    
+    Args:
+        vendor_name: Vendor name, matched ignoring case and spacing
+        invoice_number: Exact invoice number
+        date_from: Earliest invoice date (YYYY-MM-DD), inclusive
+        date_to: Latest invoice date (YYYY-MM-DD), inclusive
+        limit: Maximum number of reviews
+    
+    Returns:
+        Matching reviews, newest invoice date first
+    """
+    reviews = await get_execution_layer().run_in_thread(
+        "review", get_review_store().find, vendor_name, invoice_number, date_from, date_to, limit
+    )
+    return {
+        "status": "success",
+        "data": reviews,
+        "message": f"Found {len(reviews)} reviewed invoices"
+    }
+
+@router.get("/reviews/{review_id}")
+async def get_review(review_id: int):
+    """
+    Get a reviewed invoice
+    
+    Args:
+        review_id: Review id returned by /review
+    
+    Returns:
+        The stored review
+    """
+    review = await get_execution_layer().run_in_thread("review", get_review_store().get, review_id)
+    if review is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Review not found"
+        )
+    return {
+        "status": "success",
+        "data": review,
+        "message": "Reviewed invoice retrieved successfully"
+    }
@@ -0,0 +1,54 @@
+from typing import Any, Awaitable, Callable, Optional
+from fastapi import HTTPException, status
+
+from ai_service.services.job_queue import Job, get_job_queue, QueueFullError, QueueClosedError, CallbackURLError
+
+def validate_callback_url(callback_url: Optional[str]):
+    """Reject callback URLs that are not http(s) or point at private or loopback hosts"""
+    if not callback_url:
+        return
+    try:
+        get_job_queue().check_callback_url(callback_url)
+    except CallbackURLError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+
+def check_job_capacity():
+    """Reject a job while the queue is full or closing, before its upload is spooled"""
+    _raise_unavailable(get_job_queue().check_capacity)
+
+def submit_job(kind: str, work: Callable[[Job], Awaitable[Any]], callback_url: Optional[str],
+               cleanup: Optional[Callable[[], None]] = None) -> Job:
+    """
+    Queue a job, turning a full or closed queue into a fast error response
+    
+    Args:
+        kind: Kind of work
+        work: Coroutine function run with the job
+        callback_url: Optional completion callback URL
+        cleanup: Optional function releasing the job's input if it never runs
+        
+    Returns:
+        The queued job
+    """
+    return _raise_unavailable(get_job_queue().submit, kind, work, callback_url, cleanup)
+
+def _raise_unavailable(fn: Callable[..., Any], *args: Any) -> Any:
+    """Call a job queue method, turning a full or closed queue into 429 or 503"""
+    job_queue = get_job_queue()
+    try:
+        return fn(*args)
+    except QueueFullError as e:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=str(e),
+            headers={"Retry-After": str(job_queue.retry_after)}
+        )
+    except QueueClosedError as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=str(e),
+            headers={"Retry-After": str(job_queue.retry_after)}
+        )
\ No newline at end of file
@@ -1,85 +1,130 @@
+import re
+import asyncio
 import logging
-from fastapi import APIRouter, UploadFile, File, Form, HTTPException, status
-from typing import List, Dict, Any, Optional
-import io
-import csv
+import weakref
+from fastapi import APIRouter, UploadFile, File, Form, Header, HTTPException, status
+from fastapi.responses import StreamingResponse, FileResponse
+from typing import List, Dict, Any, Optional, Union, Iterable, Tuple
 
-from ai_service.services.pdf_utils import PDFUtils
-from ai_service.services.sor_matcher import SORMatcher
-from ai_service.services.excel_writer import ExcelWriter
-from ai_service.services.llm import LLMService
+from ai_service.services.container import get_services
+from ai_service.services.streaming import format_sse
+from ai_service.services.single_flight import get_single_flight, digest_key
+from ai_service.services.executors import get_execution_layer
+from ai_service.services.job_queue import Job, get_job_queue
+from ai_service.services.download_store import get_download_store, XLSX_MEDIA_TYPE
+from ai_service.services.boq_revisions import get_boq_revision_store, BOQRevisionStore, RevisionConflictError
+from ai_service.services.metrics import ITEMS_PROCESSED
+from ai_service.services.tracing import current_trace
+from ai_service.routers.jobs import submit_job, validate_callback_url, check_job_capacity
+from ai_service.routers.uploads import spool_upload
+from ai_service.routers.tracing import traced_request
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
-# Initialize services
-pdf_utils = PDFUtils()
-sor_matcher = SORMatcher()
-excel_writer = ExcelWriter()
-llm_service = LLMService()
+# Accepted SOR/BOQ upload types
+SOR_CONTENT_TYPES = ["application/pdf", "text/csv", XLSX_MEDIA_TYPE]
+
+# Output formats /process can write
+OUTPUT_FORMATS = ("json", "excel", "xlsx", "csv", "parquet")
+
+# Output formats returned as a file rather than as JSON
+FILE_OUTPUT_FORMATS = ("xlsx", "csv", "parquet")
+
+# Client-chosen BOQ lineage names, e.g. a tender reference
+LINEAGE_ID_PATTERN = re.compile(r"^[A-Za-z0-9._:/-]{1,128}$")
+
+# One revision of a lineage is priced at a time in this worker; the store
+# rejects revisions committed concurrently by other workers
+_lineage_locks: "weakref.WeakValueDictionary[Tuple[str, str], asyncio.Lock]" = weakref.WeakValueDictionary()
 
 @router.post("/process")
 async def process_sor(
     file: UploadFile = File(...),
     use_llm: bool = Form(False),
-    output_format: str = Form("json")
+    hybrid: bool = Form(False),
+    output_format: str = Form("json"),
+    lineage_id: Optional[str] = Form(None),
+    trace: bool = Form(False),
+    trace_profile: bool = Form(False),
+    trace_memory: bool = Form(False),
+    x_admin_key: Optional[str] = Header(None)
 ):
     """
     Process a SOR/BOQ document and suggest rates
     
     Args:
-        file: Uploaded SOR/BOQ file (PDF, CSV)
+        file: Uploaded SOR/BOQ file (PDF, CSV, XLSX)
         use_llm: Whether to use LLM for enhanced rate suggestions
-        output_format: Output format (json, excel)
+        hybrid: With use_llm, price from the rate book and past priced items
+            first and only send low-confidence items to the LLM
+        output_format: Output format: json; excel for JSON with a download
+            link to the spreadsheet; xlsx for the spreadsheet itself; csv or
+            parquet for an unstyled export for machine consumers
+        lineage_id: Name of the BOQ's revision series, e.g. the tender
+            reference. Rows unchanged since the previous revision reuse its
+            prices, and the response reports the diff between revisions
+        trace: Return a timing breakdown of the request as "trace" (or its
+            id in the X-Trace-Id header of file outputs) and keep it in the
+            trace store; requires the x-admin-key header
+        trace_profile: Add a sampled CPU profile to the trace
+        trace_memory: Add peak memory from tracemalloc to the trace
         
     Returns:
-        Processed SOR data with rate suggestions
+        Processed SOR data with rate suggestions, or the exported file
     """
     try:
         # Validate file type
-        if file.content_type not in ["application/pdf", "text/csv"]:
+        content_type = _content_type(file)
+        if content_type not in SOR_CONTENT_TYPES:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Unsupported file type. Please upload PDF or CSV files."
+                detail="Unsupported file type. Please upload PDF, CSV or XLSX files."
             )
+        _validate_output_format(output_format)
+        _validate_lineage_id(lineage_id)
         
-        # Read file content
-        content = await file.read()
-        
-        # Extract items based on file type
-        items = []
-        if file.content_type == "application/pdf":
-            items = _extract_items_from_pdf(content)
-        elif file.content_type == "text/csv":
-            items = _extract_items_from_csv(content)
-        
-        # Match items with rate suggestions
-        if use_llm:
-            # Use LLM for enhanced rate suggestions
-            matched_items = llm_service.suggest_sor_rates(items)
-        else:
-            # Use basic matching
-            matched_items = sor_matcher.match_items(items)
-        
-        # Prepare response based on output format
-        if output_format == "excel":
-            # Generate Excel file
-            excel_bytes = excel_writer.create_sor_excel(matched_items)
-            
-            return {
-                "status": "success",
-                "data": matched_items,
-                "excel_data": excel_bytes.hex(),  # Convert to hex for JSON serialization
-                "message": "SOR processed successfully"
-            }
-        else:
-            # Return JSON
-            return {
-                "status": "success",
-                "data": matched_items,
-                "message": "SOR processed successfully"
-            }
+        async with traced_request("/fill_sor/process", file.filename, x_admin_key,
+                                  trace, trace_profile, trace_memory) as request_trace:
+            # Spool the upload, rejecting it early if it is over the limits
+            upload = await spool_upload(file)
+            if request_trace is not None:
+                # A traced run is not shared, so its spans are its own
+                with upload:
+                    response = await _process_sor_content(
+                        upload.source, content_type, use_llm, hybrid, output_format, lineage_id=lineage_id
+                    )
+            else:
+                # Identical uploads processed concurrently share one run. The run
+                # owns the first caller's upload and closes it when it finishes,
+                # since it carries on for the others if that caller goes away
+                key = digest_key(
+                    upload.sha256,
+                    content_type=content_type,
+                    use_llm=use_llm,
+                    hybrid=hybrid,
+                    output_format=output_format,
+                    lineage_id=lineage_id
+                )
+                response = await get_single_flight("sor_process").do(
+                    key,
+                    lambda: _process_sor_content(
+                        upload.source, content_type, use_llm, hybrid, output_format, lineage_id=lineage_id
+                    ),
+                    copy_result=True,
+                    cleanup=upload.close
+                )
+        
+        if output_format in FILE_OUTPUT_FORMATS:
+            # Stream the file from disk instead of embedding it in JSON
+            file_response = _download_response(response["download_id"])
+            if request_trace is not None:
+                file_response.headers["X-Trace-Id"] = request_trace.trace_id
+            return file_response
+        if request_trace is not None:
+            response["trace"] = request_trace.result
+        return response
         
     except HTTPException:
         raise
@@ -90,90 +135,417 @@ async def process_sor(
             detail=f"Error processing SOR: {str(e)}"
         )
 
-def _extract_items_from_pdf(pdf_bytes: bytes) -> List[Dict]:
+async def _process_sor_content(source: Union[bytes, str], content_type: str, use_llm: bool,
+                               hybrid: bool, output_format: str,
+                               job: Optional[Job] = None, lineage_id: Optional[str] = None) -> Dict[str, Any]:
     """
-    Extract items from PDF SOR/BOQ document
+    Extract and price the items of a SOR/BOQ document
     
     Args:
-        pdf_bytes: PDF file bytes
+        source: File bytes, or the path of a spooled upload
+        content_type: MIME type of the file
+        use_llm: Whether to use LLM for enhanced rate suggestions
+        hybrid: Whether to price from the rate book first
+        output_format: Output format (json, excel, xlsx, csv, parquet)
+        job: Background job to report progress to, if any
+        lineage_id: BOQ lineage whose previous revision's prices are reused
         
     Returns:
-        List of item dictionaries
+        Response payload with the priced items
     """
-    try:
-        # Extract tables from PDF
-        tables = pdf_utils.extract_tables_from_pdf(pdf_bytes)
-        
-        items = []
-        for table in tables:
-            # Process each table
-            if len(table) > 1:  # Need at least header and one row
-                header = table[0]
-                for row in table[1:]:
-                    # Create item dictionary
-                    item = {}
-                    for i, cell in enumerate(row):
-                        if i < len(header):
-                            item[header[i].lower().replace(' ', '_')] = cell or ""
-                    
-                    # Ensure required fields exist
-                    if "description" not in item:
-                        item["description"] = item.get("item", "") or item.get("work_description", "")
-                    
-                    if "unit" not in item:
-                        item["unit"] = item.get("uom", "") or item.get("units", "")
-                    
-                    if "quantity" not in item:
-                        item["quantity"] = item.get("qty", "") or "1"
-                    
-                    items.append(item)
+    # Extract items based on file type
+    if job:
+        job.set_stage("extracting", 0.1)
+    items = await _extract_items(source, content_type)
+    
+    if job:
+        job.set_stage("pricing", 0.4)
+    revisions = get_boq_revision_store() if lineage_id else None
+    revision = None
+    if revisions is not None:
+        # Price only the rows that are new or changed since the previous revision
+        execution = get_execution_layer()
+        items = await _materialize_items(items)
+        lineage_key = (lineage_id, _pricing_mode(use_llm, hybrid))
+        lock = _lineage_locks.setdefault(lineage_key, asyncio.Lock())
+        async with lock:
+            plan = await execution.run_in_thread(
+                "match", _plan_revision, revisions, lineage_id, use_llm, hybrid, items, step="revision_diff"
+            )
+            matched_items, pricing_stats = await _price_items([items[index] for index in plan["pending"]], use_llm, hybrid)
+            matched_items = revisions.merge(plan, matched_items)
+            try:
+                revision = await execution.run_in_thread("match", revisions.commit, plan, matched_items, step="revision_commit")
+            except RevisionConflictError as e:
+                raise HTTPException(
+                    status_code=status.HTTP_409_CONFLICT,
+                    detail=str(e)
+                )
+    else:
+        matched_items, pricing_stats = await _price_items(items, use_llm, hybrid)
+    
+    # Line amounts, subtotals and the grand total
+    matched_items, rollup = await get_execution_layer().run_in_thread(
+        "match", get_services().boq_pricer.price, matched_items, step="rollup"
+    )
+    ITEMS_PROCESSED.labels("sor_item", _pricing_mode(use_llm, hybrid)).inc(len(matched_items))
+    
+    # Prepare response based on output format
+    if output_format in ("excel", "xlsx"):
+        # Generate Excel file and keep it behind a download handle
+        if job:
+            job.set_stage("writing_excel", 0.8)
+        download = await get_execution_layer().run_in_thread("excel", _store_sor_excel, matched_items, rollup, step="excel_generation")
+    elif output_format in ("csv", "parquet"):
+        # Vectorized export, skipping the spreadsheet styling work
+        if job:
+            job.set_stage("exporting", 0.8)
+        download = await get_execution_layer().run_in_thread("export", _store_sor_export, matched_items, output_format, step="serialization")
+    
+    if output_format != "json":
+        response = {
+            "status": "success",
+            "download_id": download["download_id"],
+            "download_url": f"/fill_sor/downloads/{download['download_id']}",
+            "download_expires_at": download["expires_at"],
+            "total_items": len(matched_items),
+            "rollup": rollup,
+            "message": "SOR processed successfully"
+        }
+        if output_format == "excel":
+            response["data"] = matched_items
+    else:
+        # Return JSON
+        response = {
+            "status": "success",
+            "data": matched_items,
+            "rollup": rollup,
+            "message": "SOR processed successfully"
+        }
+    
+    if pricing_stats is not None:
+        response["pricing_stats"] = pricing_stats
+    if revision is not None:
+        response["revision"] = revision
+    return response
+
+async def _price_items(items: Iterable[Dict], use_llm: bool, hybrid: bool) -> Tuple[List[Dict], Optional[Dict[str, Any]]]:
+    """
+    Price extracted items with the requested pricing mode
+    
+    Args:
+        items: Extracted items
+        use_llm: Whether to use LLM for enhanced rate suggestions
+        hybrid: Whether to price from the rate book first
         
-        return items
-    except Exception as e:
-        logger.error(f"Error extracting items from PDF: {str(e)}")
-        return []
+    Returns:
+        Tuple of (priced items in input order, hybrid pricing statistics or None)
+    """
+    if use_llm and hybrid:
+        # Use the rate book first and the LLM for the remainder
+        return await get_services().hybrid_pricer.price_items(await _materialize_items(items))
+    if use_llm:
+        # Use LLM for enhanced rate suggestions
+        return await get_services().llm_service.suggest_sor_rates(await _materialize_items(items)), None
+    # Use basic matching, consuming CSV items as they are parsed
+    return await get_execution_layer().run_in_thread("match", get_services().sor_matcher.match_items, items, step="matching"), None
+
+def _plan_revision(revisions: BOQRevisionStore, lineage_id: str, use_llm: bool, hybrid: bool,
+                   items: List[Dict]) -> Dict[str, Any]:
+    """Plan a BOQ revision against the current version of its pricing source"""
+    services = get_services()
+    if not use_llm:
+        source = services.sor_matcher.version()
+    elif hybrid:
+        source = f"{services.hybrid_pricer.version()}|{services.llm_service.version()}"
+    else:
+        source = services.llm_service.version()
+    return revisions.plan(lineage_id, _pricing_mode(use_llm, hybrid), items, source=source)
+
+def _pricing_mode(use_llm: bool, hybrid: bool) -> str:
+    """Name of a pricing mode; BOQ lineages keep separate results per mode"""
+    if use_llm:
+        return "hybrid" if hybrid else "llm"
+    return "match"
+
+def _store_sor_excel(items: List[Dict], rollup: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Write priced items to an Excel file in the download store
+    
+    Args:
+        items: Priced SOR/BOQ items
+        rollup: Subtotals and grand total for the Summary sheet
+        
+    Returns:
+        Dictionary with the download id and expiry time
+    """
+    excel_writer = get_services().excel_writer
+    if not excel_writer.streaming:
+        return get_download_store().put(
+            excel_writer.create_sor_excel(items, rollup=rollup), "sor_output.xlsx", XLSX_MEDIA_TYPE
+        )
+    with excel_writer.write_sor_excel(items, rollup=rollup) as output:
+        return get_download_store().put(output, "sor_output.xlsx", XLSX_MEDIA_TYPE)
+
+def _store_sor_export(items: List[Dict], export_format: str) -> Dict[str, Any]:
+    """
+    Write priced items as CSV or Parquet to the download store
+    
+    Args:
+        items: Priced SOR/BOQ items
+        export_format: "csv" or "parquet"
+        
+    Returns:
+        Dictionary with the download id and expiry time
+    """
+    tabular_exporter = get_services().tabular_exporter
+    with tabular_exporter.export(items, export_format) as output:
+        return get_download_store().put(
+            output,
+            f"sor_output.{export_format}",
+            tabular_exporter.MEDIA_TYPES[export_format]
+        )
+
+def _validate_output_format(output_format: str):
+    """
+    Reject unknown output formats and those this deployment cannot write
+    
+    Args:
+        output_format: Requested output format
+    """
+    if output_format not in OUTPUT_FORMATS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unsupported output format. Choose one of: {', '.join(OUTPUT_FORMATS)}."
+        )
+    if output_format == "parquet" and not get_services().tabular_exporter.supports("parquet"):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Parquet output is not available; install pyarrow to enable it."
+        )
+
+def _validate_lineage_id(lineage_id: Optional[str]):
+    """
+    Reject malformed BOQ lineage names
+    
+    Args:
+        lineage_id: Requested lineage name, if any
+    """
+    if lineage_id is not None and not LINEAGE_ID_PATTERN.match(lineage_id):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="lineage_id must be 1-128 letters, digits or . _ : / - characters."
+        )
+
+def _download_response(download_id: str) -> FileResponse:
+    """
+    Build a streamed file response for a download handle
+    
+    Args:
+        download_id: Download handle
+        
+    Returns:
+        File response with the stored file
+    """
+    download = get_download_store().get(download_id)
+    if download is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Download not found or expired"
+        )
+    return FileResponse(download["path"], media_type=download["media_type"], filename=download["filename"])
+
+@router.get("/downloads/{download_id}")
+async def download_file(download_id: str):
+    """
+    Download a generated file, e.g. an Excel export
+    
+    Args:
+        download_id: Download handle from a processing response
+        
+    Returns:
+        The file as a binary download
+    """
+    return _download_response(download_id)
 
-def _extract_items_from_csv(csv_bytes: bytes) -> List[Dict]:
+@router.post("/jobs", status_code=status.HTTP_202_ACCEPTED)
+async def submit_sor_job(
+    file: UploadFile = File(...),
+    use_llm: bool = Form(False),
+    hybrid: bool = Form(False),
+    output_format: str = Form("json"),
+    callback_url: Optional[str] = Form(None),
+    lineage_id: Optional[str] = Form(None)
+):
     """
-    Extract items from CSV SOR/BOQ document
+    Queue a SOR/BOQ document for background processing
     
     Args:
-        csv_bytes: CSV file bytes
+        file: Uploaded SOR/BOQ file (PDF, CSV, XLSX)
+        use_llm: Whether to use LLM for enhanced rate suggestions
+        hybrid: With use_llm, price from the rate book first
+        output_format: Output format (json, excel, xlsx, csv, parquet)
+        callback_url: Optional URL that receives the finished job as JSON
+        lineage_id: Name of the BOQ's revision series, for incremental
+            re-pricing
         
     Returns:
-        List of item dictionaries
+        Job id and status URL to poll
     """
+    # Validate file type
+    content_type = _content_type(file)
+    if content_type not in SOR_CONTENT_TYPES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Unsupported file type. Please upload PDF, CSV or XLSX files."
+        )
+    _validate_output_format(output_format)
+    validate_callback_url(callback_url)
+    _validate_lineage_id(lineage_id)
+    
+    check_job_capacity()
+    
+    # The job owns the spooled upload and deletes it when it finishes
+    upload = await spool_upload(file)
+    
+    async def work(job: Job) -> Dict[str, Any]:
+        with upload:
+            return await _process_sor_content(
+                upload.source, content_type, use_llm, hybrid, output_format, job, lineage_id
+            )
+    
     try:
-        # Decode bytes to string
-        csv_string = csv_bytes.decode('utf-8')
-        
-        # Parse CSV
-        csv_reader = csv.DictReader(io.StringIO(csv_string))
-        
-        items = []
-        for row in csv_reader:
-            # Normalize field names
-            item = {}
-            for key, value in row.items():
-                normalized_key = key.lower().replace(' ', '_')
-                item[normalized_key] = value
-            
-            # Ensure required fields exist
-            if "description" not in item:
-                item["description"] = item.get("item", "") or item.get("work_description", "")
-            
-            if "unit" not in item:
-                item["unit"] = item.get("uom", "") or item.get("units", "")
-            
-            if "quantity" not in item:
-                item["quantity"] = item.get("qty", "") or "1"
-            
-            items.append(item)
+        job = submit_job("sor", work, callback_url, cleanup=upload.close)
+    except HTTPException:
+        upload.close()
+        raise
+    return {
+        "status": "success",
+        "data": {**job.to_dict(include_result=False), "status_url": f"/fill_sor/jobs/{job.id}"},
+        "message": "SOR job queued"
+    }
+
+@router.get("/jobs/{job_id}")
+async def get_sor_job(job_id: str):
+    """
+    Get the status, progress and result of a SOR/BOQ job
+    
+    Args:
+        job_id: Job identifier
         
+    Returns:
+        Job status, with the processed SOR data once it has succeeded
+    """
+    job = get_job_queue().get(job_id, kind="sor")
+    if job is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Job not found"
+        )
+    
+    return {
+        "status": "success",
+        "data": job.to_dict(),
+        "message": f"Job {job.status}"
+    }
+
+@router.post("/process/stream")
+async def process_sor_stream(
+    file: UploadFile = File(...)
+):
+    """
+    Process a SOR/BOQ document and stream LLM rate suggestions
+    
+    Each priced item is sent as a server-sent "item" event as soon as the
+    model finishes it, followed by a "done" event.
+    
+    Args:
+        file: Uploaded SOR/BOQ file (PDF, CSV, XLSX)
+        
+    Returns:
+        Server-sent event stream of priced items
+    """
+    # Validate file type
+    content_type = _content_type(file)
+    if content_type not in SOR_CONTENT_TYPES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Unsupported file type. Please upload PDF, CSV or XLSX files."
+        )
+    
+    with await spool_upload(file) as upload:
+        items = await _materialize_items(await _extract_items(upload.source, content_type))
+    
+    async def events():
+        count = 0
+        try:
+            async for item in get_services().llm_service.stream_sor_rates(items):
+                count += 1
+                yield format_sse("item", item)
+            yield format_sse("done", {"status": "success", "total_items": count, "message": "SOR processed successfully"})
+        except Exception as e:
+            logger.error(f"Error streaming SOR: {str(e)}")
+            yield format_sse("error", {"status": "error", "detail": f"Error processing SOR: {str(e)}"})
+    
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+async def _extract_items(source: Union[bytes, str], content_type: str) -> Iterable[Dict]:
+    """
+    Extract items from a SOR/BOQ document based on its content type
+    
+    PDF table extraction runs in the process pool. CSV and XLSX items are
+    returned as a lazy iterator that parses the file as it is consumed, so
+    it must be consumed off the event loop while the source exists, e.g.
+    by matching in the thread pool or by _materialize_items. Spooled
+    uploads are passed by path, so large documents are not copied to the
+    worker process.
+    
+    Args:
+        source: File bytes, or the path of a spooled upload
+        content_type: MIME type of the file
+        
+    Returns:
+        Item dictionaries
+    """
+    execution = get_execution_layer()
+    if content_type == "application/pdf":
+        try:
+            trace = current_trace()
+            if trace is not None:
+                tables, page_seconds = await execution.run_in_process(
+                    "parse", get_services().pdf_utils.extract_tables_from_pdf_timed, source, step="table_extraction"
+                )
+                trace.add_pages("table_extraction", page_seconds)
+            else:
+                tables = await execution.run_in_process(
+                    "parse", get_services().pdf_utils.extract_tables_from_pdf, source, step="table_extraction"
+                )
+            return await execution.run_in_thread("parse", get_services().sor_ingest.items_from_tables, tables, step="item_ingest")
+        except Exception as e:
+            logger.error(f"Error extracting items from PDF: {str(e)}")
+            return []
+    elif content_type == "text/csv":
+        return get_services().sor_ingest.iter_csv_items(source)
+    elif content_type == XLSX_MEDIA_TYPE:
+        return get_services().sor_ingest.iter_xlsx_items(source)
+    return []
+
+def _content_type(file: UploadFile) -> Optional[str]:
+    """
+    Content type of a SOR/BOQ upload
+    
+    Clients often send .xlsx files as application/octet-stream, so those
+    are recognized by their extension.
+    """
+    if file.content_type in (None, "", "application/octet-stream") and (file.filename or "").lower().endswith(".xlsx"):
+        return XLSX_MEDIA_TYPE
+    return file.content_type
+
+async def _materialize_items(items: Iterable[Dict]) -> List[Dict]:
+    """Collect extracted items into a list, parsing lazy CSV and XLSX items in the thread pool"""
+    if isinstance(items, list):
         return items
-    except Exception as e:
-        logger.error(f"Error extracting items from CSV: {str(e)}")
-        return []
+    return await get_execution_layer().run_in_thread("parse", list, items, step="item_ingest")
 
 @router.post("/suggest-rates")
 async def suggest_rates(
@@ -189,8 +561,10 @@ async def suggest_rates(
         Items with suggested rates
     """
     try:
-        # Match items with rate suggestions
-        matched_items = sor_matcher.match_items(items)
+        # Match items with rate suggestions, off the event loop
+        matched_items = await get_execution_layer().run_in_thread(
+            "match", get_services().sor_matcher.match_items, items, step="matching"
+        )
         
         return {
             "status": "success",
@@ -205,6 +579,37 @@ async def suggest_rates(
             detail=f"Error suggesting rates: {str(e)}"
         )
 
+@router.post("/priced-items")
+async def record_priced_items(
+    items: List[Dict[str, Any]]
+):
+    """
+    Record reviewed priced items for reuse by hybrid pricing
+    
+    Args:
+        items: Items with description, unit, rate and category
+        
+    Returns:
+        Number of items recorded
+    """
+    try:
+        recorded = await get_execution_layer().run_in_thread(
+            "match", get_services().hybrid_pricer.record_priced_items, items, step="history_index"
+        )
+        
+        return {
+            "status": "success",
+            "data": {"recorded": recorded},
+            "message": "Priced items recorded successfully"
+        }
+        
+    except Exception as e:
+        logger.error(f"Error recording priced items: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error recording priced items: {str(e)}"
+        )
+
 @router.get("/sample-rates")
 async def get_sample_rates():
     """
@@ -216,7 +621,8 @@ async def get_sample_rates():
     try:
         return {
             "status": "success",
-            "data": sor_matcher.rates_data,
+            # A shared rate book is a lazily decoded sequence, not a list
+            "data": list(get_services().sor_matcher.rates_data),
             "message": "Sample rates retrieved successfully"
         }
         
@@ -0,0 +1,72 @@
+import os
+import hmac
+import logging
+import contextlib
+from typing import Any, AsyncIterator, Dict, Optional
+from fastapi import Header, HTTPException, status
+
+from ai_service.services.executors import get_execution_layer
+from ai_service.services.tracing import RequestTrace, MemoryTraceBusyError, trace_request, get_trace_store
+
+logger = logging.getLogger(__name__)
+
+def check_admin_key(admin_key: Optional[str]):
+    """Reject requests without the ADMIN_API_KEY; admin features are off when it is not set"""
+    configured = os.getenv("ADMIN_API_KEY")
+    if not configured:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Admin features are disabled; set ADMIN_API_KEY to enable them"
+        )
+    if not admin_key or not hmac.compare_digest(admin_key, configured):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="A valid x-admin-key header is required"
+        )
+
+async def verify_admin_key(x_admin_key: Optional[str] = Header(None)):
+    """Dependency for admin-only endpoints"""
+    check_admin_key(x_admin_key)
+    return x_admin_key
+
+async def save_trace(trace: Dict[str, Any]):
+    """Write a finished trace to the trace store from the thread pool"""
+    try:
+        await get_execution_layer().run_in_thread("trace", get_trace_store().save, trace, step="trace_save")
+    except Exception as e:
+        logger.error(f"Error storing trace {trace['trace_id']}: {str(e)}")
+
+@contextlib.asynccontextmanager
+async def traced_request(endpoint: str, file_name: Optional[str], admin_key: Optional[str],
+                         trace: bool, trace_profile: bool, trace_memory: bool) -> AsyncIterator[Optional[RequestTrace]]:
+    """
+    Trace a request if it asked for a trace, after checking the admin key
+    
+    The trace is written to the trace store when the block exits, also if
+    the request failed. Only one request per worker traces memory at a
+    time; another is rejected with 409.
+    
+    Args:
+        endpoint: Endpoint being traced
+        file_name: Uploaded file name
+        admin_key: x-admin-key header value
+        trace: Whether to record a timing breakdown
+        trace_profile: Whether to add a sampled CPU profile; implies trace
+        trace_memory: Whether to add peak memory from tracemalloc; implies trace
+    
+    Yields:
+        The RequestTrace, or None if not traced
+    """
+    if not (trace or trace_profile or trace_memory):
+        yield None
+        return
+    check_admin_key(admin_key)
+    request_trace = None
+    try:
+        with trace_request(endpoint, file_name, trace_profile, trace_memory) as request_trace:
+            yield request_trace
+    except MemoryTraceBusyError as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+    finally:
+        if request_trace is not None and request_trace.result is not None:
+            await save_trace(request_trace.result)
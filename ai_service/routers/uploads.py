@@ -0,0 +1,45 @@
+from typing import BinaryIO, Optional
+from fastapi import UploadFile, HTTPException, status
+
+from ai_service.services.executors import get_execution_layer
+from ai_service.services.uploads import UploadSpooler, SpooledUpload, UploadLimitError
+
+# Shared by the routers; limits come from UPLOAD_* settings
+upload_spooler = UploadSpooler()
+
+async def spool_upload(file: UploadFile, max_bytes: Optional[int] = None) -> SpooledUpload:
+    """
+    Copy an uploaded document off the request, rejecting it if over the limits
+    
+    Args:
+        file: Uploaded file
+        max_bytes: Size limit for this upload, if lower than UPLOAD_MAX_BYTES
+        
+    Returns:
+        The spooled upload; the caller must close it
+    """
+    return await spool_file(file.file, file.filename, file.content_type, max_bytes)
+
+async def spool_file(file: BinaryIO, filename: str, content_type: Optional[str],
+                     max_bytes: Optional[int] = None) -> SpooledUpload:
+    """
+    Spool a readable file in the thread pool, turning a limit error into 413
+    
+    Args:
+        file: Readable binary file object
+        filename: File name
+        content_type: MIME type of the file
+        max_bytes: Size limit for this file, if lower than UPLOAD_MAX_BYTES
+        
+    Returns:
+        The spooled upload; the caller must close it
+    """
+    try:
+        return await get_execution_layer().run_in_thread(
+            "upload", upload_spooler.spool, file, filename, content_type, max_bytes, step="upload_read"
+        )
+    except UploadLimitError as e:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=str(e)
+        )
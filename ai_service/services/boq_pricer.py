@@ -0,0 +1,209 @@
+import os
+import re
+import logging
+from typing import List, Dict, Any, Optional, Tuple
+import numpy as np
+import pandas as pd
+
+from ai_service.services.boq_revisions import REFERENCE_FIELDS
+from ai_service.services.number_text import parse_number_text
+
+logger = logging.getLogger(__name__)
+
+# Item fields naming a BOQ section, in order of preference
+SECTION_FIELDS = ["section", "bill", "trade"]
+
+# Section prefix of an item reference, e.g. "2" for "2.3.1" or "A" for "A-4"
+SECTION_PATTERN = re.compile(r"^\s*([^.\-/\s]+)\s*[.\-/]")
+
+# Largest scaled value or line amount kept in int64, with room for rounding and sums
+MAX_PRODUCT = 2 ** 62
+
+class BOQPricer:
+    """
+    Line amounts, subtotals and the grand total of priced SOR/BOQ items
+    
+    Quantities and rates are parsed once into integer arrays of quantity
+    units (thousandths by default) and rate units. Rates keep
+    quantity_decimals more places than the currency, so a rate such as
+    0.335 is not rounded before it is multiplied. Line amounts are exact
+    integer products rounded half up to cents, and subtotals are integer
+    sums of the rounded lines, so totals add up the way a quantity
+    surveyor checks them.
+    """
+    
+    def __init__(self, quantity_decimals: int = None, currency_decimals: int = None):
+        self.quantity_decimals = quantity_decimals if quantity_decimals is not None else int(os.getenv("BOQ_QUANTITY_DECIMALS", "3"))
+        self.currency_decimals = currency_decimals if currency_decimals is not None else int(os.getenv("BOQ_CURRENCY_DECIMALS", "2"))
+        self.rate_decimals = self.currency_decimals + self.quantity_decimals
+    
+    def price(self, items: List[Dict]) -> Tuple[List[Dict], Dict[str, Any]]:
+        """
+        Compute line amounts and roll them up
+        
+        The rate of an item is its suggested rate, or its own rate if none
+        was suggested; a suggested rate of 0 is a rate. Items whose quantity or rate is missing or not a
+        number keep their amount as it was and count as unpriced.
+        
+        Args:
+            items: Priced SOR/BOQ items; "amount" is set in place
+        
+        Returns:
+            Tuple of (the items, rollup with per-category and per-section
+            subtotals and the grand total)
+        """
+        quantity, quantity_valid = self.parse_units([item.get("quantity") for item in items], self.quantity_decimals)
+        rate, rate_valid = self.parse_units(
+            [item["suggested_rate"] if item.get("suggested_rate") is not None else item.get("rate") for item in items],
+            self.rate_decimals
+        )
+        cents, priced = self._line_amounts(quantity, rate, quantity_valid & rate_valid)
+        
+        amounts = (cents / 10 ** self.currency_decimals).round(self.currency_decimals).tolist()
+        for item, amount, is_priced in zip(items, amounts, priced.tolist()):
+            if is_priced:
+                item["amount"] = amount
+            else:
+                item.setdefault("amount", None)
+        
+        rollup = self._rollup(items, cents, priced)
+        logger.info(f"Priced {rollup['priced_items']} of {len(items)} BOQ lines, total {rollup['grand_total']}")
+        return items, rollup
+    
+    @staticmethod
+    def parse_units(values: List[Any], decimals: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Parse numbers into integers of a fixed number of decimal places
+        
+        Numbers and numeric strings are parsed in one vectorized pass.
+        Blank values are not numbers, and other strings, such as '$1,250.00',
+        '(5)' or '12 m3', are parsed with parse_number_text in a second pass.
+        Rounding is half up, away from zero, as in '1.005' to 101 cents.
+        
+        Args:
+            values: Numbers, strings or None
+            decimals: Decimal places kept, e.g. 2 for cents
+        
+        Returns:
+            Tuple of (int64 values in units of 10**-decimals, validity mask)
+        """
+        try:
+            # Fast path for columns that are all numbers or plain numeric strings
+            values = np.array(values, dtype=object).astype(float)
+        except (TypeError, ValueError):
+            series = pd.Series(values, dtype=object)
+            numbers = pd.to_numeric(series, errors="coerce")
+            retry = numbers.isna() & series.notna()
+            if retry.any():
+                numbers[retry] = [parse_number_text(str(value)) for value in series[retry]]
+            values = numbers.to_numpy(dtype=float)
+        
+        valid = np.isfinite(values)
+        values = np.where(valid, values, 0.0)
+        # A relative nudge of about 500 ulps puts binary approximations such as
+        # 1.005 * 100 = 100.49999999999999 back on the decimal half
+        scaled = np.floor(np.abs(values) * 10 ** decimals * (1 + 1e-13) + 0.5)
+        valid &= scaled < MAX_PRODUCT
+        units = (np.sign(values) * np.where(valid, scaled, 0.0)).astype(np.int64)
+        return units, valid
+    
+    def _line_amounts(self, quantity: np.ndarray, rate: np.ndarray, valid: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Multiply scaled quantities and rates into cents, rounding half up once
+        
+        Products too large for int64 are multiplied in Python integers
+        instead, so large lines are still rounded exactly.
+        
+        Returns:
+            Tuple of (int64 amounts in cents, mask of lines with an amount)
+        """
+        in_range = np.abs(quantity.astype(float) * rate.astype(float)) < MAX_PRODUCT
+        vectorized = valid & in_range
+        
+        product = np.where(vectorized, quantity, 0) * np.where(vectorized, rate, 0)
+        divisor = 10 ** (self.quantity_decimals + self.rate_decimals - self.currency_decimals)
+        cents = np.sign(product) * ((np.abs(product) + divisor // 2) // divisor)
+        
+        valid = valid.copy()
+        for index in np.flatnonzero(valid & ~in_range):
+            line_product = int(quantity[index]) * int(rate[index])
+            line_cents = (abs(line_product) + divisor // 2) // divisor
+            if line_cents < MAX_PRODUCT:
+                cents[index] = -line_cents if line_product < 0 else line_cents
+            else:
+                logger.warning(f"BOQ line {index + 1} is too large to price")
+                valid[index] = False
+        return cents, valid
+    
+    def _rollup(self, items: List[Dict], cents: np.ndarray, priced: np.ndarray) -> Dict[str, Any]:
+        """Subtotals per category and per section, in order of first appearance, and the grand total"""
+        cents = np.where(priced, cents, 0)
+        categories = [item.get("suggested_category") or item.get("category") or "Uncategorized" for item in items]
+        sections = self._sections(items)
+        
+        def subtotals(column: str, names: List[Optional[str]]) -> List[Dict[str, Any]]:
+            # Integer sums per group; factorize keeps groups in order of first appearance
+            codes, groups = pd.factorize(np.array(names, dtype=object), use_na_sentinel=False)
+            counts = np.bincount(codes, minlength=len(groups))
+            priced_counts = np.bincount(codes, weights=priced, minlength=len(groups))
+            totals = np.zeros(len(groups), dtype=np.int64)
+            np.add.at(totals, codes, cents)
+            return [
+                {column: None if pd.isna(name) else name, "items": int(count), "priced_items": int(priced_count), "amount": self._money(total)}
+                for name, count, priced_count, total in zip(groups, counts, priced_counts, totals)
+            ]
+        
+        priced_items = int(priced.sum())
+        return {
+            "currency_decimals": self.currency_decimals,
+            "total_items": len(items),
+            "priced_items": priced_items,
+            "unpriced_items": len(items) - priced_items,
+            "grand_total": self._money(cents.sum()),
+            "categories": subtotals("category", categories),
+            "sections": subtotals("section", sections) if any(section is not None for section in sections) else []
+        }
+    
+    @staticmethod
+    def _sections(items: List[Dict]) -> List[Optional[str]]:
+        """
+        Section of each BOQ line, resolved one field at a time
+        
+        A line's section is its first non-empty section or bill field, else
+        the prefix of its first non-empty item reference, such as '2' for
+        '2.3.1', else None. Only fields that occur in the BOQ are read.
+        
+        Args:
+            items: Item dictionaries
+        
+        Returns:
+            Section names in item order
+        """
+        present = set().union(*items)
+        sections: List[Optional[str]] = [None] * len(items)
+        unresolved = range(len(items))
+        match_section = SECTION_PATTERN.match
+        for field in [field for field in SECTION_FIELDS + REFERENCE_FIELDS if field in present]:
+            values = [str(items[index].get(field) or "") for index in unresolved]
+            # "" marks lines left for the next field
+            if field in REFERENCE_FIELDS:
+                found = [
+                    (match[1] if (match := match_section(value)) else None) if value and not value.isspace() else ""
+                    for value in values
+                ]
+            else:
+                found = [value.strip() for value in values]
+            remaining = []
+            for index, section in zip(unresolved, found):
+                if section == "":
+                    remaining.append(index)
+                else:
+                    sections[index] = section
+            unresolved = remaining
+            if not unresolved:
+                break
+        return sections
+    
+    def _money(self, cents: Any) -> float:
+        """Integer cents as a currency amount"""
+        return round(int(cents) / 10 ** self.currency_decimals, self.currency_decimals)
@@ -0,0 +1,399 @@
+import os
+import time
+import json
+import sqlite3
+import hashlib
+import logging
+import threading
+from typing import Dict, Any, Optional, List
+
+from ai_service.services.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+# Item fields that identify a BOQ line across revisions, in order of preference.
+# Lines without any of them are identified by their description.
+REFERENCE_FIELDS = ["item_no", "ref", "code", "no", "no.", "s/no", "sl_no"]
+
+class RevisionConflictError(Exception):
+    """Raised when a lineage gained a revision between planning and committing"""
+    pass
+
+class BOQRevisionStore:
+    """
+    Priced rows of each BOQ lineage, for incremental re-pricing using SQLite
+    
+    A lineage is the series of revisions of one BOQ, named by the client.
+    Every item row is fingerprinted from its normalized fields. When a new
+    revision is submitted, rows whose fingerprint was priced in the previous
+    revision reuse that result, and only new or changed rows are priced.
+    Results are only reused while the pricing source, e.g. the rate book
+    version, is the one they were priced with. Rows are also keyed by their
+    item reference (or description) so the revision can be reported as a
+    diff against the previous one.
+    
+    A revision is committed only if no other revision of the lineage was
+    committed since it was planned, so concurrent submissions cannot
+    silently overwrite each other.
+    """
+    
+    # Run age and count based eviction after this many saved revisions
+    EVICTION_INTERVAL = 20
+    
+    def __init__(self, path: str = None, ttl_seconds: float = None, max_lineages: int = None):
+        self.path = path or os.getenv("BOQ_REVISIONS_PATH", "data/boq_revisions.sqlite3")
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else float(os.getenv("BOQ_REVISIONS_TTL", str(90 * 24 * 3600)))
+        self.max_lineages = max_lineages if max_lineages is not None else int(os.getenv("BOQ_REVISIONS_MAX_LINEAGES", "1000"))
+        
+        self.reused_rows = 0
+        self.priced_rows = 0
+        self._saves_since_eviction = 0
+        self._lock = threading.Lock()
+        
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS boq_lineages ("
+            "lineage_id TEXT NOT NULL, pricing TEXT NOT NULL, revision INTEGER NOT NULL, "
+            "updated_at REAL NOT NULL, source TEXT NOT NULL DEFAULT '', PRIMARY KEY (lineage_id, pricing))"
+        )
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(boq_lineages)")]
+        if "source" not in columns:
+            # Stores created before pricing sources were recorded; their rows are priced again once
+            self._conn.execute("ALTER TABLE boq_lineages ADD COLUMN source TEXT NOT NULL DEFAULT ''")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS boq_rows ("
+            "lineage_id TEXT NOT NULL, pricing TEXT NOT NULL, position INTEGER NOT NULL, "
+            "row_key TEXT NOT NULL, fingerprint TEXT NOT NULL, item TEXT NOT NULL, "
+            "PRIMARY KEY (lineage_id, pricing, position))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_boq_lineages_updated ON boq_lineages (updated_at)")
+        self._conn.commit()
+        logger.info(f"BOQ revision store opened at {self.path}")
+    
+    @staticmethod
+    def fingerprint(item: Dict[str, Any]) -> str:
+        """
+        Fingerprint an item row from its normalized fields
+        
+        Values are compared with whitespace collapsed and case folded, and
+        empty fields are left out, so adding an empty column to the BOQ
+        does not change every row. Item references are left out too, so a
+        renumbered row keeps its price.
+        
+        Args:
+            item: Extracted item dictionary
+        
+        Returns:
+            Hex digest of the row
+        """
+        fields = []
+        for key in sorted(item):
+            if key in REFERENCE_FIELDS:
+                continue
+            value = " ".join(str(item[key]).split()).casefold() if item[key] is not None else ""
+            if value:
+                fields.append(f"{key}\x1f{value}")
+        return hashlib.blake2b("\x1e".join(fields).encode("utf-8"), digest_size=16).hexdigest()
+    
+    @staticmethod
+    def row_key(item: Dict[str, Any]) -> str:
+        """
+        Identify an item row across revisions
+        
+        Args:
+            item: Extracted item dictionary
+        
+        Returns:
+            The item reference, e.g. 'ref:2.1', or the normalized description
+        """
+        for field in REFERENCE_FIELDS:
+            value = " ".join(str(item.get(field) or "").split())
+            if value:
+                return f"ref:{value.casefold()}"
+        return "description:" + " ".join(str(item.get("description") or "").split()).casefold()
+    
+    def plan(self, lineage_id: str, pricing: str, items: List[Dict], source: str = "") -> Dict[str, Any]:
+        """
+        Compare a revision with the previous revision of its lineage
+        
+        Args:
+            lineage_id: Client-chosen name of the BOQ lineage
+            pricing: Pricing mode, e.g. "match", "llm" or "hybrid"; each mode
+                keeps its own results
+            items: Extracted items of the new revision
+            source: Version of what prices are drawn from, e.g. the rate
+                book; previous prices are only reused if it is unchanged
+        
+        Returns:
+            Plan with the reused priced items by index, the indices still to
+            price, and the diff against the previous revision
+        """
+        previous = self._load(lineage_id, pricing)
+        previous_rows = previous["rows"] if previous else []
+        # Prices from an older rate book or history index are not reused, but still diffed
+        reusable = previous is not None and previous["source"] == source
+        
+        # Stored rows stay JSON text until they are reused or reported as removed
+        priced_by_fingerprint: Dict[str, str] = {}
+        fingerprint_by_key: Dict[str, str] = {}
+        removed_by_key: Dict[str, str] = {}
+        for row in previous_rows:
+            if reusable:
+                priced_by_fingerprint.setdefault(row["fingerprint"], row["item"])
+            fingerprint_by_key[row["row_key"]] = row["fingerprint"]
+            removed_by_key[row["row_key"]] = row["item"]
+        decoded: Dict[str, Dict] = {}
+        
+        fingerprints = []
+        keys = []
+        reused: Dict[int, Dict] = {}
+        stored: Dict[int, str] = {}
+        pending = []
+        diff = {"added": [], "changed": [], "removed": [], "unchanged": []}
+        occurrences: Dict[str, int] = {}
+        for index, item in enumerate(items):
+            fingerprint = self.fingerprint(item)
+            key = self.row_key(item)
+            # Repeated keys, e.g. two lines with the same description, are told apart by position
+            occurrences[key] = occurrences.get(key, 0) + 1
+            if occurrences[key] > 1:
+                key = f"{key}#{occurrences[key]}"
+            fingerprints.append(fingerprint)
+            keys.append(key)
+            
+            # Reuse by content, so moved or renumbered rows are not priced again;
+            # the diff is by reference, so a renumbered row is reported as added and removed
+            if fingerprint in priced_by_fingerprint:
+                if fingerprint not in decoded:
+                    decoded[fingerprint] = json.loads(priced_by_fingerprint[fingerprint])
+                previous_item = decoded[fingerprint]
+                reused[index] = {**previous_item, **item}
+                if all(previous_item.get(field) == value for field, value in item.items()):
+                    # Identical text, so the stored row can be saved again as-is
+                    stored[index] = priced_by_fingerprint[fingerprint]
+            else:
+                pending.append(index)
+            
+            if key not in fingerprint_by_key:
+                diff["added"].append(index)
+            elif fingerprint_by_key[key] == fingerprint:
+                diff["unchanged"].append(index)
+            else:
+                diff["changed"].append(index)
+            removed_by_key.pop(key, None)
+        diff["removed"] = [json.loads(item) for item in removed_by_key.values()]
+        
+        return {
+            "lineage_id": lineage_id,
+            "pricing": pricing,
+            "source": source,
+            "previous_revision": previous["revision"] if previous else None,
+            "fingerprints": fingerprints,
+            "keys": keys,
+            "reused": reused,
+            "stored": stored,
+            "pending": pending,
+            "diff": diff
+        }
+    
+    def merge(self, plan: Dict[str, Any], priced_items: List[Dict]) -> List[Dict]:
+        """
+        Combine reused results with newly priced items
+        
+        Args:
+            plan: Plan from plan()
+            priced_items: Priced items for plan["pending"], in that order
+        
+        Returns:
+            Priced items of the whole revision, in input order
+        """
+        matched_items = [None] * (len(plan["reused"]) + len(plan["pending"]))
+        for index, item in plan["reused"].items():
+            matched_items[index] = item
+        for index, item in zip(plan["pending"], priced_items):
+            matched_items[index] = item
+        return matched_items
+    
+    def commit(self, plan: Dict[str, Any], matched_items: List[Dict]) -> Dict[str, Any]:
+        """
+        Save a priced revision as the latest of its lineage
+        
+        Args:
+            plan: Plan from plan()
+            matched_items: Priced items of the whole revision, from merge()
+        
+        Returns:
+            Revision summary with the diff and the reused and priced row counts
+        
+        Raises:
+            RevisionConflictError: If another revision of the lineage was
+                committed after this one was planned
+        """
+        lineage_id, pricing = plan["lineage_id"], plan["pricing"]
+        stored = plan["stored"]
+        rows = [
+            (lineage_id, pricing, position, key, fingerprint, stored.get(position) or json.dumps(item))
+            for position, (key, fingerprint, item) in enumerate(zip(plan["keys"], plan["fingerprints"], matched_items))
+        ]
+        revision = (plan["previous_revision"] or 0) + 1
+        now = time.time()
+        with self._lock:
+            with self._conn:
+                # Take the write lock first, so other workers cannot commit between the check and the write
+                self._conn.execute("BEGIN IMMEDIATE")
+                current = self._conn.execute(
+                    "SELECT revision FROM boq_lineages WHERE lineage_id = ? AND pricing = ?", (lineage_id, pricing)
+                ).fetchone()
+                if (current[0] if current else None) != plan["previous_revision"]:
+                    raise RevisionConflictError(
+                        f"BOQ lineage {lineage_id} is at revision {current[0] if current else None}, "
+                        f"not {plan['previous_revision']}; submit the revision again"
+                    )
+                self._conn.execute("DELETE FROM boq_rows WHERE lineage_id = ? AND pricing = ?", (lineage_id, pricing))
+                self._conn.executemany(
+                    "INSERT INTO boq_rows (lineage_id, pricing, position, row_key, fingerprint, item) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    rows
+                )
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO boq_lineages (lineage_id, pricing, revision, updated_at, source) VALUES (?, ?, ?, ?, ?)",
+                    (lineage_id, pricing, revision, now, plan["source"])
+                )
+            self.reused_rows += len(plan["reused"])
+            self.priced_rows += len(plan["pending"])
+            
+            self._saves_since_eviction += 1
+            if self._saves_since_eviction >= self.EVICTION_INTERVAL:
+                self._evict(now)
+        
+        diff = plan["diff"]
+        logger.info(
+            f"BOQ lineage {lineage_id} revision {revision}: reused {len(plan['reused'])} rows, "
+            f"priced {len(plan['pending'])}"
+        )
+        return {
+            "lineage_id": lineage_id,
+            "revision": revision,
+            "previous_revision": plan["previous_revision"],
+            "reused_rows": len(plan["reused"]),
+            "priced_rows": len(plan["pending"]),
+            "counts": {name: len(entries) for name, entries in diff.items()},
+            "diff": diff
+        }
+    
+    def _load(self, lineage_id: str, pricing: str) -> Optional[Dict[str, Any]]:
+        """Latest saved revision of a lineage with its rows as JSON text, or None if unknown or expired"""
+        with self._lock:
+            lineage = self._conn.execute(
+                "SELECT revision, updated_at, source FROM boq_lineages WHERE lineage_id = ? AND pricing = ?",
+                (lineage_id, pricing)
+            ).fetchone()
+            if lineage is None:
+                return None
+            revision, updated_at, source = lineage
+            if time.time() - updated_at > self.ttl_seconds:
+                self._delete(lineage_id, pricing)
+                return None
+            rows = self._conn.execute(
+                "SELECT row_key, fingerprint, item FROM boq_rows "
+                "WHERE lineage_id = ? AND pricing = ? ORDER BY position",
+                (lineage_id, pricing)
+            ).fetchall()
+        return {
+            "revision": revision,
+            "source": source,
+            "rows": [{"row_key": row_key, "fingerprint": fingerprint, "item": item} for row_key, fingerprint, item in rows]
+        }
+    
+    def _delete(self, lineage_id: str, pricing: str):
+        """Remove a lineage and its rows"""
+        with self._conn:
+            self._conn.execute("DELETE FROM boq_rows WHERE lineage_id = ? AND pricing = ?", (lineage_id, pricing))
+            self._conn.execute("DELETE FROM boq_lineages WHERE lineage_id = ? AND pricing = ?", (lineage_id, pricing))
+    
+    def _evict(self, now: float):
+        """Remove expired lineages and the least recently updated lineages over the limit"""
+        self._saves_since_eviction = 0
+        
+        stale = self._conn.execute(
+            "SELECT lineage_id, pricing FROM boq_lineages WHERE updated_at < ?", (now - self.ttl_seconds,)
+        ).fetchall()
+        (count,) = self._conn.execute("SELECT COUNT(*) FROM boq_lineages").fetchone()
+        if count - len(stale) > self.max_lineages:
+            stale += self._conn.execute(
+                "SELECT lineage_id, pricing FROM boq_lineages WHERE updated_at >= ? ORDER BY updated_at LIMIT ?",
+                (now - self.ttl_seconds, count - len(stale) - self.max_lineages)
+            ).fetchall()
+        
+        for lineage_id, pricing in stale:
+            self._delete(lineage_id, pricing)
+        if stale:
+            logger.info(f"Evicted {len(stale)} BOQ lineages")
+    
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get row reuse metrics
+        
+        Returns:
+            Dictionary with reused and priced row counts and lineage count
+        """
+        with self._lock:
+            (lineages,) = self._conn.execute("SELECT COUNT(*) FROM boq_lineages").fetchone()
+        rows = self.reused_rows + self.priced_rows
+        return {
+            "enabled": True,
+            "path": self.path,
+            "reused_rows": self.reused_rows,
+            "priced_rows": self.priced_rows,
+            "reuse_rate": self.reused_rows / rows if rows else 0.0,
+            "lineages": lineages,
+            "max_lineages": self.max_lineages,
+            "ttl_seconds": self.ttl_seconds
+        }
+    
+    def close(self):
+        """Close the underlying database connection"""
+        with self._lock:
+            self._conn.close()
+
+_stores: Dict[str, BOQRevisionStore] = {}
+_stores_lock = threading.Lock()
+
+def _collect_metrics():
+    """BOQ rows reused and re-priced across revisions, read when metrics are scraped"""
+    with _stores_lock:
+        stores = list(_stores.values())
+    if not stores:
+        return []
+    return [
+        ("ampere_boq_revision_rows_total", "counter", "Rows of revised BOQs reused from the previous revision or priced again",
+         [({"result": "reused"}, sum(store.reused_rows for store in stores)),
+          ({"result": "priced"}, sum(store.priced_rows for store in stores))])
+    ]
+
+REGISTRY.register_collector(_collect_metrics)
+
+def get_boq_revision_store(path: str = None) -> Optional[BOQRevisionStore]:
+    """
+    Get the shared BOQ revision store for a database path
+    
+    Args:
+        path: Store database path, defaults to BOQ_REVISIONS_PATH
+    
+    Returns:
+        Shared BOQRevisionStore, or None if incremental re-pricing is disabled
+    """
+    if os.getenv("BOQ_REVISIONS_ENABLED", "true").lower() != "true":
+        return None
+    
+    path = path or os.getenv("BOQ_REVISIONS_PATH", "data/boq_revisions.sqlite3")
+    with _stores_lock:
+        if path not in _stores:
+            _stores[path] = BOQRevisionStore(path)
+        return _stores[path]
@@ -0,0 +1,161 @@
+import sys
+import time
+import logging
+import importlib
+import threading
+from typing import Dict, Any, Callable, Optional, List
+
+logger = logging.getLogger(__name__)
+
+def _service(module: str, class_name: str, *dependencies: str) -> Callable[["ServiceContainer"], Any]:
+    """
+    Build a factory that imports a service class on first use
+    
+    Args:
+        module: Module defining the service class
+        class_name: Service class name
+        dependencies: Names of the services passed to the constructor
+    
+    Returns:
+        Factory creating the service from a container
+    """
+    def factory(services: "ServiceContainer") -> Any:
+        service_class = getattr(services.import_module(module), class_name)
+        return service_class(*(services.get(name) for name in dependencies))
+    return factory
+
+# Services of the routers, created on first use. Their modules import pandas,
+# sklearn, openpyxl, pdfplumber and the LLM clients, so nothing heavy is
+# imported until a request needs it or the container is warmed up.
+SERVICE_FACTORIES: Dict[str, Callable[["ServiceContainer"], Any]] = {
+    "ocr_service": _service("ai_service.services.ocr", "OCRService"),
+    "pdf_utils": _service("ai_service.services.pdf_utils", "PDFUtils"),
+    "llm_service": _service("ai_service.services.llm", "LLMService"),
+    "sor_matcher": _service("ai_service.services.sor_matcher", "SORMatcher"),
+    "sor_ingest": _service("ai_service.services.sor_ingest", "SORIngest"),
+    "excel_writer": _service("ai_service.services.excel_writer", "ExcelWriter"),
+    "tabular_exporter": _service("ai_service.services.tabular_exporter", "TabularExporter"),
+    "boq_pricer": _service("ai_service.services.boq_pricer", "BOQPricer"),
+    "vector_db": _service("ai_service.services.vector_db", "VectorDB"),
+    "hybrid_pricer": _service("ai_service.services.hybrid_pricer", "HybridPricer", "sor_matcher", "llm_service", "vector_db")
+}
+
+class ServiceContainer:
+    """
+    Shared services of one worker, created on first use
+    
+    Routers get their services from the container instead of building
+    them at import time, so a worker starts without loading the rate book,
+    the vector index or the libraries behind them. Every service exists
+    once per worker. warm_up() creates them all ahead of the first request.
+    The time taken to import each service module and create each service
+    is recorded.
+    """
+    
+    def __init__(self, factories: Dict[str, Callable[["ServiceContainer"], Any]] = None):
+        self.factories = dict(factories if factories is not None else SERVICE_FACTORIES)
+        self.import_seconds: Dict[str, float] = {}
+        self.init_seconds: Dict[str, float] = {}
+        self.warm_up_seconds: Optional[float] = None
+        self._services: Dict[str, Any] = {}
+        # Reentrant, since creating a service can create the services it uses
+        self._lock = threading.RLock()
+    
+    def __getattr__(self, name: str) -> Any:
+        if name.startswith("_") or name not in self.factories:
+            raise AttributeError(f"{type(self).__name__!r} has no service {name!r}")
+        return self.get(name)
+    
+    def get(self, name: str) -> Any:
+        """
+        Get a service, creating it on first use
+        
+        Args:
+            name: Service name, e.g. "sor_matcher"
+        
+        Returns:
+            The worker's instance of the service
+        """
+        service = self._services.get(name)
+        if service is not None:
+            return service
+        with self._lock:
+            if name not in self._services:
+                start = time.perf_counter()
+                self._services[name] = self.factories[name](self)
+                # Includes creating any services it uses for the first time
+                self.init_seconds[name] = time.perf_counter() - start
+                logger.info(f"Created {name} in {self.init_seconds[name] * 1000:.0f} ms")
+            return self._services[name]
+    
+    def import_module(self, module: str):
+        """Import a service module, recording how long its first import took"""
+        if module in sys.modules:
+            return sys.modules[module]
+        start = time.perf_counter()
+        imported = importlib.import_module(module)
+        self.import_seconds[module] = time.perf_counter() - start
+        return imported
+    
+    def warm_up(self, names: List[str] = None) -> float:
+        """
+        Create services ahead of the first request
+        
+        Args:
+            names: Services to create, defaults to all of them
+        
+        Returns:
+            Seconds taken
+        """
+        start = time.perf_counter()
+        for name in names or self.factories:
+            self.get(name)
+        self.warm_up_seconds = time.perf_counter() - start
+        logger.info(f"Warmed up {len(names or self.factories)} services in {self.warm_up_seconds:.2f} s")
+        return self.warm_up_seconds
+    
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get service creation metrics
+        
+        Returns:
+            Dictionary with the services created so far and the milliseconds
+            spent importing each service module and creating each service
+        """
+        return {
+            "created": sorted(self._services),
+            "pending": sorted(set(self.factories) - set(self._services)),
+            "warm_up_ms": self.warm_up_seconds * 1000 if self.warm_up_seconds is not None else None,
+            "import_ms": {module: seconds * 1000 for module, seconds in self.import_seconds.items()},
+            "init_ms": {name: seconds * 1000 for name, seconds in self.init_seconds.items()}
+        }
+    
+    async def aclose(self):
+        """Close services holding connections, such as the LLM HTTP session"""
+        llm_service = self._services.get("llm_service")
+        if llm_service is not None:
+            await llm_service.aclose()
+
+_services: Optional[ServiceContainer] = None
+_services_lock = threading.Lock()
+
+def get_services() -> ServiceContainer:
+    """
+    Get the service container shared by the worker
+    
+    Returns:
+        Shared ServiceContainer
+    """
+    global _services
+    with _services_lock:
+        if _services is None:
+            _services = ServiceContainer()
+        return _services
+
+async def close_services():
+    """Close the shared service container's services, if it was created"""
+    global _services
+    with _services_lock:
+        services, _services = _services, None
+    if services is not None:
+        await services.aclose()
@@ -0,0 +1,139 @@
+import os
+import re
+import json
+import time
+import shutil
+import logging
+import secrets
+import tempfile
+import threading
+from typing import Dict, Any, Optional, Union, BinaryIO
+
+logger = logging.getLogger(__name__)
+
+XLSX_MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+# Handles are secrets.token_urlsafe output; anything else is not looked up on disk
+DOWNLOAD_ID_PATTERN = re.compile(r"[A-Za-z0-9_-]+")
+
+class DownloadStore:
+    """
+    Short-lived files behind unguessable download handles
+    
+    Generated files are written to disk and served from there, so large
+    outputs are not held in memory or embedded in JSON responses. Each file
+    has a JSON sidecar with its name, media type and expiry, and handles are
+    resolved from disk, so a download can be fetched from any worker
+    sharing the directory. Files are deleted once their TTL has passed.
+    """
+    
+    def __init__(self, directory: str = None, ttl_seconds: float = None):
+        # Workers on one host share the default directory
+        self.directory = directory or os.getenv("DOWNLOAD_DIR") or os.path.join(tempfile.gettempdir(), "ampere-downloads")
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else float(os.getenv("DOWNLOAD_TTL", "900"))
+        os.makedirs(self.directory, exist_ok=True)
+    
+    def _path(self, download_id: str) -> str:
+        return os.path.join(self.directory, download_id)
+    
+    def put(self, data: Union[bytes, BinaryIO], filename: str, media_type: str) -> Dict[str, Any]:
+        """
+        Store a file for download
+        
+        Args:
+            data: File bytes, or a readable binary file object
+            filename: Name offered to the client
+            media_type: MIME type of the file
+        
+        Returns:
+            Dictionary with the download id and expiry time
+        """
+        self._purge()
+        download_id = secrets.token_urlsafe(24)
+        path = self._path(download_id)
+        with open(path, "wb") as output:
+            if isinstance(data, (bytes, bytearray)):
+                output.write(data)
+            else:
+                shutil.copyfileobj(data, output)
+        
+        entry = {
+            "filename": filename,
+            "media_type": media_type,
+            "size": os.path.getsize(path),
+            "expires_at": time.time() + self.ttl_seconds
+        }
+        # The sidecar is written last, so a handle never resolves to a partial file
+        with open(path + ".json.tmp", "w", encoding="utf-8") as f:
+            json.dump(entry, f)
+        os.replace(path + ".json.tmp", path + ".json")
+        return {"download_id": download_id, "expires_at": entry["expires_at"]}
+    
+    def get(self, download_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Look up a stored file
+        
+        Args:
+            download_id: Download handle
+        
+        Returns:
+            Dictionary with path, filename, media_type and size, or None if
+            the handle is unknown or expired
+        """
+        if not DOWNLOAD_ID_PATTERN.fullmatch(download_id):
+            return None
+        path = self._path(download_id)
+        try:
+            with open(path + ".json", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if entry["expires_at"] <= time.time():
+            self._remove(path)
+            self._remove(path + ".json")
+            return None
+        if not os.path.exists(path):
+            return None
+        return {"path": path, **entry}
+    
+    def _purge(self):
+        """Delete files, sidecars and leftover temp files older than the TTL"""
+        cutoff = time.time() - self.ttl_seconds
+        try:
+            names = os.listdir(self.directory)
+        except OSError as e:
+            logger.warning(f"Could not list downloads in {self.directory}: {str(e)}")
+            return
+        for name in names:
+            path = os.path.join(self.directory, name)
+            try:
+                expired = os.path.getmtime(path) <= cutoff
+            except OSError:
+                continue
+            if expired:
+                self._remove(path)
+    
+    @staticmethod
+    def _remove(path: str):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning(f"Could not delete expired download {path}: {str(e)}")
+
+_download_store: Optional[DownloadStore] = None
+_download_store_lock = threading.Lock()
+
+def get_download_store() -> DownloadStore:
+    """
+    Get the download store shared by the routers
+    
+    Returns:
+        Shared DownloadStore
+    """
+    global _download_store
+    with _download_store_lock:
+        if _download_store is None:
+            _download_store = DownloadStore()
+        return _download_store
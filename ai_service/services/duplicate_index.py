@@ -0,0 +1,386 @@
+import os
+import re
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from typing import Dict, Any, Optional, List
+import numpy as np
+
+from ai_service.services.number_text import parse_number_text
+
+logger = logging.getLogger(__name__)
+
+# Characters per text shingle; short enough that one OCR misread changes few shingles
+SHINGLE_SIZE = 5
+
+# Seed of the MinHash permutations. Signatures are only comparable when made
+# with the same seed and number of permutations, so neither may change for an
+# existing index.
+MINHASH_SEED = 20240601
+
+# Shingles hashed per block, bounding memory for very long documents
+SHINGLE_BLOCK = 8192
+
+# Most matches reported for one invoice
+MAX_MATCHES = 10
+
+class DuplicateIndex:
+    """
+    Index of processed invoices for duplicate and near-duplicate detection
+    
+    Every invoice is indexed twice in SQLite: by an exact key of its
+    normalized vendor, invoice number and total, and by the locality
+    sensitive hash (LSH) bands of a MinHash signature of its text. A new
+    invoice is looked up through those keys only, with a bounded number
+    of candidates per key, so a lookup costs the same few indexed reads
+    however many invoices are stored. Candidates found through LSH are
+    confirmed by the similarity their signatures estimate.
+    """
+    
+    def __init__(self, path: str = None, num_perm: int = None, bands: int = None,
+                 threshold: float = None, max_candidates: int = None):
+        self.path = path or os.getenv("DUPLICATE_INDEX_PATH", "data/duplicates.sqlite3")
+        self.num_perm = num_perm if num_perm is not None else int(os.getenv("DUPLICATE_MINHASH_PERMUTATIONS", "128"))
+        self.bands = bands if bands is not None else int(os.getenv("DUPLICATE_LSH_BANDS", "16"))
+        self.threshold = threshold if threshold is not None else float(os.getenv("DUPLICATE_SIMILARITY_THRESHOLD", "0.8"))
+        self.max_candidates = max_candidates if max_candidates is not None else int(os.getenv("DUPLICATE_MAX_CANDIDATES", "20"))
+        if self.num_perm % self.bands:
+            raise ValueError(f"MinHash permutations ({self.num_perm}) must be a multiple of LSH bands ({self.bands})")
+        self.rows_per_band = self.num_perm // self.bands
+        
+        # Multiply-add-shift hash functions standing in for random permutations
+        rng = np.random.default_rng(MINHASH_SEED)
+        self._mul = rng.integers(1, 2 ** 63, size=(self.num_perm, 1), dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+        self._add = rng.integers(0, 2 ** 63, size=(self.num_perm, 1), dtype=np.uint64)
+        
+        self.lookups = 0
+        self.flagged = 0
+        self.candidates = 0
+        self.lookup_seconds = 0.0
+        self._lock = threading.Lock()
+        
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS duplicate_settings (name TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS indexed_invoices ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, document_sha256 TEXT, exact_key TEXT, file_name TEXT, "
+            "vendor_name TEXT, invoice_number TEXT, total_amount TEXT, signature BLOB, indexed_at REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_indexed_invoices_document ON indexed_invoices (document_sha256)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_indexed_invoices_exact ON indexed_invoices (exact_key)"
+        )
+        # Clustered on the band hash, so the invoices sharing a band are one range read
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS invoice_bands ("
+            "band_hash INTEGER NOT NULL, invoice_id INTEGER NOT NULL, "
+            "PRIMARY KEY (band_hash, invoice_id)) WITHOUT ROWID"
+        )
+        self._check_settings()
+        self._conn.commit()
+        logger.info(f"Duplicate index opened at {self.path}")
+    
+    def _check_settings(self):
+        """Record the signature settings of a new index, and refuse to open one made with others"""
+        settings = {"num_perm": str(self.num_perm), "bands": str(self.bands), "seed": str(MINHASH_SEED), "shingle_size": str(SHINGLE_SIZE)}
+        stored = dict(self._conn.execute("SELECT name, value FROM duplicate_settings").fetchall())
+        if not stored:
+            self._conn.executemany("INSERT INTO duplicate_settings (name, value) VALUES (?, ?)", settings.items())
+        elif stored != settings:
+            self._conn.close()
+            raise ValueError(
+                f"Duplicate index {self.path} was built with {stored}, not {settings}; "
+                "use a new DUPLICATE_INDEX_PATH to change signature settings"
+            )
+    
+    @staticmethod
+    def normalize_text(text: Any) -> str:
+        """Normalize invoice text for shingling, e.g. 'Total:  $1,200' to 'total 1 200'"""
+        return " ".join(re.findall(r"\w+", str(text or "").casefold()))
+    
+    @staticmethod
+    def exact_key(vendor_name: Any, invoice_number: Any, total_amount: Any) -> Optional[str]:
+        """
+        Build the exact key of an invoice
+        
+        Vendor names are compared ignoring case and punctuation, invoice
+        numbers ignoring case, spaces and separators, and totals to the cent.
+        
+        Args:
+            vendor_name: Extracted vendor name
+            invoice_number: Extracted invoice number
+            total_amount: Extracted total, as a number or text such as '$1,250.00'
+        
+        Returns:
+            Hex digest of the key, or None without an invoice number and
+            either a vendor or a total
+        """
+        vendor = " ".join(re.findall(r"[0-9a-z]+", str(vendor_name or "").casefold()))
+        number = re.sub(r"[^0-9A-Za-z]", "", str(invoice_number or "")).upper()
+        total = DuplicateIndex.normalize_total(total_amount)
+        if not number or not (vendor or total):
+            return None
+        return hashlib.blake2b(f"{vendor}\x1f{number}\x1f{total or ''}".encode("utf-8"), digest_size=16).hexdigest()
+    
+    @staticmethod
+    def normalize_total(total_amount: Any) -> Optional[str]:
+        """
+        Render a total as a string of cents, e.g. '$1,250.5' as '125050'
+        
+        Text is read with parse_number_text, so a total with trailing text
+        such as '1,250.00 (GST 8%)' is not a number rather than 1250.008.
+        
+        Returns:
+            Cents as a string, or None if the total is not one unambiguous number
+        """
+        if total_amount is None or isinstance(total_amount, bool):
+            return None
+        if not isinstance(total_amount, (int, float)):
+            total_amount = parse_number_text(str(total_amount))
+        if not np.isfinite(total_amount):
+            return None
+        return str(int(round(total_amount * 100)))
+    
+    def signature(self, text: Any) -> Optional[np.ndarray]:
+        """
+        Compute the MinHash signature of an invoice's text
+        
+        The text is normalized and cut into overlapping character shingles.
+        Shingles are hashed and passed through every hash function in a few
+        vectorized passes; the signature keeps each function's minimum.
+        
+        Args:
+            text: Raw invoice text
+        
+        Returns:
+            uint32 array of num_perm minimums, or None if the text is empty
+        """
+        data = np.frombuffer(self.normalize_text(text).encode("utf-8"), dtype=np.uint8)
+        if data.size == 0:
+            return None
+        # Short texts are one shingle
+        count = max(data.size - SHINGLE_SIZE + 1, 1)
+        shingles = np.zeros(count, dtype=np.uint64)
+        for offset in range(min(SHINGLE_SIZE, data.size)):
+            # Polynomial hash of each shingle; uint64 arithmetic wraps around
+            shingles = shingles * np.uint64(1099511628211) + data[offset:offset + count].astype(np.uint64)
+        shingles = np.unique(shingles)
+        
+        minimums = np.full(self.num_perm, np.iinfo(np.uint32).max, dtype=np.uint32)
+        for start in range(0, shingles.size, SHINGLE_BLOCK):
+            block = shingles[start:start + SHINGLE_BLOCK][np.newaxis, :]
+            hashed = ((self._mul * block + self._add) >> np.uint64(32)).astype(np.uint32)
+            np.minimum(minimums, hashed.min(axis=1), out=minimums)
+        return minimums
+    
+    def band_hashes(self, signature: np.ndarray) -> List[int]:
+        """Hash each LSH band of a signature to a signed 64-bit key"""
+        hashes = []
+        for band in range(self.bands):
+            rows = signature[band * self.rows_per_band:(band + 1) * self.rows_per_band]
+            digest = hashlib.blake2b(bytes([band]) + rows.tobytes(), digest_size=8).digest()
+            hashes.append(int.from_bytes(digest, "big", signed=True))
+        return hashes
+    
+    def check_and_add(self, text: Any, invoice: Dict[str, Any], document_sha256: str = None,
+                      file_name: str = None) -> Dict[str, Any]:
+        """
+        Look up probable duplicates of an invoice, then index it
+        
+        Matches are earlier uploads of the same file, invoices with the same
+        exact key, and invoices whose text is at least threshold similar.
+        An upload is a probable duplicate if it matches a file or an exact
+        key, or a similar text whose invoice number and total do not
+        conflict with its own. A file already indexed is not indexed again.
+        
+        Args:
+            text: Raw invoice text
+            invoice: Extracted invoice data with vendor_name, invoice_number
+                and total_amount
+            document_sha256: SHA-256 of the uploaded file, if known
+            file_name: Uploaded file name, reported with later matches
+        
+        Returns:
+            Dictionary with probable_duplicate, the invoice's index id and
+            the matches, strongest first
+        """
+        start = time.perf_counter()
+        vendor_name = invoice.get("vendor_name")
+        invoice_number = invoice.get("invoice_number")
+        total = self.normalize_total(invoice.get("total_amount"))
+        exact_key = self.exact_key(vendor_name, invoice_number, invoice.get("total_amount"))
+        signature = self.signature(text)
+        band_hashes = self.band_hashes(signature) if signature is not None else []
+        
+        with self._lock:
+            found: Dict[int, tuple] = {}
+            if document_sha256:
+                for row in self._conn.execute(
+                    "SELECT id, file_name, vendor_name, invoice_number, total_amount, signature, indexed_at "
+                    "FROM indexed_invoices WHERE document_sha256 = ? ORDER BY id DESC LIMIT ?",
+                    (document_sha256, self.max_candidates)
+                ):
+                    found.setdefault(row[0], ("file", row))
+            if exact_key:
+                for row in self._conn.execute(
+                    "SELECT id, file_name, vendor_name, invoice_number, total_amount, signature, indexed_at "
+                    "FROM indexed_invoices WHERE exact_key = ? ORDER BY id DESC LIMIT ?",
+                    (exact_key, self.max_candidates)
+                ):
+                    found.setdefault(row[0], ("exact", row))
+            
+            # Invoices sharing any band, newest first and bounded per band
+            candidate_ids = set()
+            for band_hash in band_hashes:
+                candidate_ids.update(invoice_id for (invoice_id,) in self._conn.execute(
+                    "SELECT invoice_id FROM invoice_bands WHERE band_hash = ? ORDER BY invoice_id DESC LIMIT ?",
+                    (band_hash, self.max_candidates)
+                ))
+            candidate_ids.difference_update(found)
+            if candidate_ids:
+                placeholders = ",".join("?" * len(candidate_ids))
+                for row in self._conn.execute(
+                    "SELECT id, file_name, vendor_name, invoice_number, total_amount, signature, indexed_at "
+                    f"FROM indexed_invoices WHERE id IN ({placeholders})",
+                    tuple(candidate_ids)
+                ):
+                    found[row[0]] = ("near", row)
+            
+            invoice_id = next((row[0] for kind, row in found.values() if kind == "file"), None)
+            if invoice_id is None:
+                invoice_id = self._insert(
+                    document_sha256, exact_key, file_name, vendor_name, invoice_number, total, signature, band_hashes
+                )
+        
+        matches = []
+        for kind, row in found.values():
+            match = self._match(kind, row, signature, invoice_number, total)
+            if match is not None:
+                matches.append(match)
+        order = {"file": 0, "exact": 1, "near": 2}
+        matches.sort(key=lambda match: (order[match["match"]], -(match["similarity"] or 0.0), -match["invoice_id"]))
+        matches = matches[:MAX_MATCHES]
+        probable_duplicate = any(match["match"] != "near" or not match["conflicts"] for match in matches)
+        
+        self.lookups += 1
+        self.candidates += len(found)
+        self.flagged += probable_duplicate
+        self.lookup_seconds += time.perf_counter() - start
+        if probable_duplicate:
+            logger.info(f"Invoice {invoice_number} ({file_name}) is a probable duplicate of invoice {matches[0]['invoice_id']}")
+        return {"probable_duplicate": probable_duplicate, "invoice_id": invoice_id, "matches": matches}
+    
+    def _insert(self, document_sha256: Optional[str], exact_key: Optional[str], file_name: Optional[str],
+                vendor_name: Any, invoice_number: Any, total: Optional[str], signature: Optional[np.ndarray],
+                band_hashes: List[int]) -> int:
+        """Index one invoice and its LSH bands"""
+        with self._conn:
+            cursor = self._conn.execute(
+                "INSERT INTO indexed_invoices (document_sha256, exact_key, file_name, vendor_name, invoice_number, "
+                "total_amount, signature, indexed_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    document_sha256,
+                    exact_key,
+                    file_name,
+                    str(vendor_name) if vendor_name is not None else None,
+                    str(invoice_number) if invoice_number is not None else None,
+                    total,
+                    signature.tobytes() if signature is not None else None,
+                    time.time()
+                )
+            )
+            invoice_id = cursor.lastrowid
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO invoice_bands (band_hash, invoice_id) VALUES (?, ?)",
+                [(band_hash, invoice_id) for band_hash in band_hashes]
+            )
+        return invoice_id
+    
+    def _match(self, kind: str, row: tuple, signature: Optional[np.ndarray], invoice_number: Any,
+               total: Optional[str]) -> Optional[Dict[str, Any]]:
+        """Describe a matching invoice, or None if a near match is below the threshold"""
+        invoice_id, file_name, vendor_name, other_number, other_total, other_signature, indexed_at = row
+        similarity = None
+        if signature is not None and other_signature is not None:
+            similarity = float(np.mean(signature == np.frombuffer(other_signature, dtype=np.uint32)))
+        if kind == "near" and (similarity is None or similarity < self.threshold):
+            return None
+        
+        conflicts = []
+        number = re.sub(r"[^0-9A-Za-z]", "", str(invoice_number or "")).upper()
+        other = re.sub(r"[^0-9A-Za-z]", "", str(other_number or "")).upper()
+        if number and other and number != other:
+            conflicts.append("invoice_number")
+        if total is not None and other_total is not None and total != other_total:
+            conflicts.append("total_amount")
+        return {
+            "invoice_id": invoice_id,
+            "match": kind,
+            "similarity": round(similarity, 3) if similarity is not None else None,
+            "conflicts": conflicts,
+            "file_name": file_name,
+            "vendor_name": vendor_name,
+            "invoice_number": other_number,
+            "total_amount": int(other_total) / 100 if other_total is not None else None,
+            "indexed_at": indexed_at
+        }
+    
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get lookup metrics
+        
+        Returns:
+            Dictionary with indexed invoices, lookups, flagged duplicates
+            and mean lookup time and candidates
+        """
+        with self._lock:
+            (invoices,) = self._conn.execute("SELECT COUNT(*) FROM indexed_invoices").fetchone()
+        return {
+            "enabled": True,
+            "path": self.path,
+            "invoices": invoices,
+            "lookups": self.lookups,
+            "probable_duplicates": self.flagged,
+            "mean_candidates": self.candidates / self.lookups if self.lookups else 0.0,
+            "mean_lookup_ms": self.lookup_seconds / self.lookups * 1000 if self.lookups else 0.0,
+            "num_perm": self.num_perm,
+            "bands": self.bands,
+            "threshold": self.threshold
+        }
+    
+    def close(self):
+        """Close the underlying database connection"""
+        with self._lock:
+            self._conn.close()
+
+_indexes: Dict[str, DuplicateIndex] = {}
+_indexes_lock = threading.Lock()
+
+def get_duplicate_index(path: str = None) -> Optional[DuplicateIndex]:
+    """
+    Get the shared duplicate index for a database path
+    
+    Args:
+        path: Index database path, defaults to DUPLICATE_INDEX_PATH
+    
+    Returns:
+        Shared DuplicateIndex, or None if duplicate detection is disabled
+    """
+    if os.getenv("DUPLICATE_INDEX_ENABLED", "true").lower() != "true":
+        return None
+    
+    path = path or os.getenv("DUPLICATE_INDEX_PATH", "data/duplicates.sqlite3")
+    with _indexes_lock:
+        if path not in _indexes:
+            _indexes[path] = DuplicateIndex(path)
+        return _indexes[path]
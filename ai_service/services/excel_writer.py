@@ -1,38 +1,184 @@
 import io
+import os
+import pickle
 import logging
-from typing import List, Dict, Any
-import pandas as pd
+import tempfile
+from typing import List, Dict, Any, Iterable, Optional, BinaryIO
 from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
 from openpyxl.styles import Font, PatternFill, Alignment
-from openpyxl.utils.dataframe import dataframe_to_rows
+from openpyxl.utils import get_column_letter
 
 logger = logging.getLogger(__name__)
 
+SOR_HEADERS = ["Item No.", "Description", "Unit", "Quantity", "Rate", "Amount", "Category", "Notes"]
+SOR_SUMMARY_HEADERS = ["Group", "Name", "Items", "Priced Items", "Amount"]
+INVOICE_ITEM_HEADERS = ["Description", "Quantity", "Unit Price", "Total"]
+MAX_COLUMN_WIDTH = 50
+
+class SpooledSheet:
+    """
+    Rows for a write-only worksheet, buffered while column widths are tracked
+    
+    Write-only worksheets must have their column widths set before the
+    first row is written, but the widths depend on every row. Rows are
+    therefore appended to a spooled temp file (in memory while small, on
+    disk beyond the spool limit) with widths updated per row, then replayed
+    into the sheet once the widths are known.
+    """
+    
+    def __init__(self, title: str, header: List[str], spool_max_bytes: int):
+        self.title = title
+        self.header = header
+        self.widths = [len(str(value)) for value in header]
+        self.rows = 0
+        self._spool = tempfile.SpooledTemporaryFile(max_size=spool_max_bytes)
+    
+    def append(self, row: List[Any]):
+        """Buffer a row and widen its columns as needed"""
+        for index, value in enumerate(row):
+            if value is None:
+                continue
+            length = len(str(value))
+            if index >= len(self.widths):
+                self.widths.append(length)
+            elif length > self.widths[index]:
+                self.widths[index] = length
+        pickle.dump(row, self._spool, protocol=pickle.HIGHEST_PROTOCOL)
+        self.rows += 1
+    
+    def write_to(self, workbook: Workbook, header_style: Dict[str, Any]):
+        """
+        Add the sheet to a write-only workbook
+        
+        Args:
+            workbook: Write-only workbook
+            header_style: Font, fill and alignment for header cells
+        """
+        ws = workbook.create_sheet(self.title)
+        for index, width in enumerate(self.widths, start=1):
+            ws.column_dimensions[get_column_letter(index)].width = min(width + 2, MAX_COLUMN_WIDTH)
+        
+        header_cells = []
+        for value in self.header:
+            cell = WriteOnlyCell(ws, value=value)
+            for attribute, style in header_style.items():
+                setattr(cell, attribute, style)
+            header_cells.append(cell)
+        ws.append(header_cells)
+        
+        self._spool.seek(0)
+        for _ in range(self.rows):
+            ws.append(pickle.load(self._spool))
+        self._spool.close()
+
 class ExcelWriter:
     """Service for writing data to Excel files"""
     
-    def __init__(self):
-        pass
+    def __init__(self, streaming: bool = None, spool_max_bytes: int = None):
+        self.streaming = streaming if streaming is not None else os.getenv("EXCEL_STREAMING", "true").lower() == "true"
+        self.spool_max_bytes = spool_max_bytes if spool_max_bytes is not None else int(os.getenv("EXCEL_SPOOL_MAX_BYTES", str(16 * 1024 * 1024)))
+    
+    def _header_style(self) -> Dict[str, Any]:
+        return {
+            "font": Font(bold=True),
+            "fill": PatternFill(start_color="CCCCCC", end_color="CCCCCC", fill_type="solid"),
+            "alignment": Alignment(horizontal="center")
+        }
+    
+    def _new_output(self) -> BinaryIO:
+        """Spooled temp file for a generated workbook"""
+        return tempfile.SpooledTemporaryFile(max_size=self.spool_max_bytes)
+    
+    def _sor_row(self, index: int, item: Dict) -> List[Any]:
+        return [
+            index,  # Item No.
+            item.get("description", ""),
+            item.get("unit", ""),
+            item.get("quantity", ""),
+            item.get("suggested_rate", "") or item.get("rate", ""),
+            item.get("amount", ""),
+            item.get("suggested_category", "") or item.get("category", ""),
+            item.get("notes", "")
+        ]
+    
+    def _sor_summary_rows(self, rollup: Dict[str, Any]) -> List[List[Any]]:
+        rows = []
+        for group, key in (("Category", "category"), ("Section", "section")):
+            for subtotal in rollup.get(f"{key}s", []):
+                rows.append([group, subtotal[key] or "", subtotal["items"], subtotal["priced_items"], subtotal["amount"]])
+        rows.append(["Grand Total", "", rollup["total_items"], rollup["priced_items"], rollup["grand_total"]])
+        return rows
+    
+    def write_sor_excel(self, items: Iterable[Dict], output: Optional[BinaryIO] = None,
+                        rollup: Optional[Dict[str, Any]] = None) -> BinaryIO:
+        """
+        Write SOR/BOQ data to an Excel file using a write-only workbook
+        
+        Memory use stays roughly constant in the number of items: rows are
+        spooled to a temp file while column widths are tracked, and the
+        workbook streams its rows to disk as they are written.
+        
+        Args:
+            items: SOR/BOQ items; any iterable, so a generator can be used
+            output: Binary file object to write to; a spooled temp file is
+                created if omitted
+            rollup: Subtotals and grand total from BOQPricer, written to a
+                Summary sheet if given
+            
+        Returns:
+            The output file, positioned at the start
+        """
+        try:
+            sheet = SpooledSheet("SOR-BOQ", SOR_HEADERS, self.spool_max_bytes)
+            for i, item in enumerate(items, start=1):
+                sheet.append(self._sor_row(i, item))
+            
+            wb = Workbook(write_only=True)
+            sheet.write_to(wb, self._header_style())
+            if rollup:
+                summary = SpooledSheet("Summary", SOR_SUMMARY_HEADERS, self.spool_max_bytes)
+                for row in self._sor_summary_rows(rollup):
+                    summary.append(row)
+                summary.write_to(wb, self._header_style())
+            
+            output = output if output is not None else self._new_output()
+            wb.save(output)
+            output.seek(0)
+            
+            logger.info(f"Created SOR Excel file with {sheet.rows} items")
+            return output
+            
+        except Exception as e:
+            logger.error(f"Error creating SOR Excel file: {str(e)}")
+            raise
     
-    def create_sor_excel(self, items: List[Dict], filename: str = "sor_output.xlsx") -> bytes:
+    def create_sor_excel(self, items: List[Dict], filename: str = "sor_output.xlsx",
+                         rollup: Optional[Dict[str, Any]] = None) -> bytes:
         """
         Create an Excel file with SOR/BOQ data
         
         Args:
             items: List of SOR/BOQ items
             filename: Output filename
+            rollup: Subtotals and grand total from BOQPricer, written to a
+                Summary sheet if given
             
         Returns:
             Excel file bytes
         """
+        if self.streaming:
+            with self.write_sor_excel(items, rollup=rollup) as output:
+                return output.read()
+        
         try:
             # Create a new workbook
             wb = Workbook()
             ws = wb.active
-            ws.title = "SOR/BOQ"
+            ws.title = "SOR-BOQ"  # "/" is not allowed in sheet titles
             
             # Add headers
-            headers = ["Item No.", "Description", "Unit", "Quantity", "Rate", "Amount", "Category", "Notes"]
+            headers = SOR_HEADERS
             ws.append(headers)
             
             # Style headers
@@ -46,17 +192,7 @@ class ExcelWriter:
             
             # Add data rows
             for i, item in enumerate(items, start=1):
-                row = [
-                    i,  # Item No.
-                    item.get("description", ""),
-                    item.get("unit", ""),
-                    item.get("quantity", ""),
-                    item.get("suggested_rate", "") or item.get("rate", ""),
-                    item.get("amount", ""),
-                    item.get("suggested_category", "") or item.get("category", ""),
-                    item.get("notes", "")
-                ]
-                ws.append(row)
+                ws.append(self._sor_row(i, item))
             
             # Auto-adjust column widths
             for column in ws.columns:
@@ -71,6 +207,20 @@ class ExcelWriter:
                 adjusted_width = min(max_length + 2, 50)
                 ws.column_dimensions[column_letter].width = adjusted_width
             
+            # Add subtotals and the grand total
+            if rollup:
+                ws_summary = wb.create_sheet("Summary")
+                ws_summary.append(SOR_SUMMARY_HEADERS)
+                for cell in ws_summary[1]:
+                    cell.font = header_font
+                    cell.fill = header_fill
+                    cell.alignment = Alignment(horizontal="center")
+                for row in self._sor_summary_rows(rollup):
+                    ws_summary.append(row)
+                for column in ws_summary.columns:
+                    max_length = max(len(str(cell.value)) for cell in column if cell.value is not None)
+                    ws_summary.column_dimensions[column[0].column_letter].width = min(max_length + 2, 50)
+            
             # Save to bytes
             excel_buffer = io.BytesIO()
             wb.save(excel_buffer)
@@ -83,6 +233,62 @@ class ExcelWriter:
             logger.error(f"Error creating SOR Excel file: {str(e)}")
             raise
     
+    def _invoice_summary_rows(self, invoice_data: Dict[str, Any]) -> List[List[Any]]:
+        return [
+            [""],
+            ["Invoice Number", invoice_data.get("invoice_number", "")],
+            ["Vendor Name", invoice_data.get("vendor_name", "")],
+            ["Issue Date", invoice_data.get("issue_date", "")],
+            ["Due Date", invoice_data.get("due_date", "")],
+            ["Total Amount", invoice_data.get("total_amount", "")],
+            ["GST Amount", invoice_data.get("gst_amount", "")],
+            ["Subtotal", invoice_data.get("subtotal", "")]
+        ]
+    
+    def _invoice_item_row(self, item: Dict) -> List[Any]:
+        return [
+            item.get("description", ""),
+            item.get("quantity", ""),
+            item.get("unit_price", ""),
+            item.get("total", "")
+        ]
+    
+    def write_invoice_excel(self, invoice_data: Dict[str, Any], output: Optional[BinaryIO] = None) -> BinaryIO:
+        """
+        Write invoice data to an Excel file using a write-only workbook
+        
+        Args:
+            invoice_data: Invoice data dictionary
+            output: Binary file object to write to; a spooled temp file is
+                created if omitted
+            
+        Returns:
+            The output file, positioned at the start
+        """
+        try:
+            summary = SpooledSheet("Invoice Summary", ["Invoice Summary"], self.spool_max_bytes)
+            for row in self._invoice_summary_rows(invoice_data):
+                summary.append(row)
+            
+            items = SpooledSheet("Line Items", INVOICE_ITEM_HEADERS, self.spool_max_bytes)
+            for item in invoice_data.get("line_items", []):
+                items.append(self._invoice_item_row(item))
+            
+            wb = Workbook(write_only=True)
+            summary.write_to(wb, {"font": Font(bold=True, size=14)})
+            items.write_to(wb, self._header_style())
+            
+            output = output if output is not None else self._new_output()
+            wb.save(output)
+            output.seek(0)
+            
+            logger.info("Created invoice Excel file")
+            return output
+            
+        except Exception as e:
+            logger.error(f"Error creating invoice Excel file: {str(e)}")
+            raise
+    
     def create_invoice_excel(self, invoice_data: Dict[str, Any], filename: str = "invoice_output.xlsx") -> bytes:
         """
         Create an Excel file with invoice data
@@ -94,6 +300,10 @@ class ExcelWriter:
         Returns:
             Excel file bytes
         """
+        if self.streaming:
+            with self.write_invoice_excel(invoice_data) as output:
+                return output.read()
+        
         try:
             # Create a new workbook
             wb = Workbook()
@@ -104,14 +314,8 @@ class ExcelWriter:
             
             # Add summary data
             ws_summary.append(["Invoice Summary"])
-            ws_summary.append([""])
-            ws_summary.append(["Invoice Number", invoice_data.get("invoice_number", "")])
-            ws_summary.append(["Vendor Name", invoice_data.get("vendor_name", "")])
-            ws_summary.append(["Issue Date", invoice_data.get("issue_date", "")])
-            ws_summary.append(["Due Date", invoice_data.get("due_date", "")])
-            ws_summary.append(["Total Amount", invoice_data.get("total_amount", "")])
-            ws_summary.append(["GST Amount", invoice_data.get("gst_amount", "")])
-            ws_summary.append(["Subtotal", invoice_data.get("subtotal", "")])
+            for row in self._invoice_summary_rows(invoice_data):
+                ws_summary.append(row)
             
             # Style summary title
             ws_summary.cell(row=1, column=1).font = Font(bold=True, size=14)
@@ -120,7 +324,7 @@ class ExcelWriter:
             ws_items = wb.create_sheet("Line Items")
             
             # Add items headers
-            item_headers = ["Description", "Quantity", "Unit Price", "Total"]
+            item_headers = INVOICE_ITEM_HEADERS
             ws_items.append(item_headers)
             
             # Style item headers
@@ -135,13 +339,7 @@ class ExcelWriter:
             # Add item data
             line_items = invoice_data.get("line_items", [])
             for item in line_items:
-                row = [
-                    item.get("description", ""),
-                    item.get("quantity", ""),
-                    item.get("unit_price", ""),
-                    item.get("total", "")
-                ]
-                ws_items.append(row)
+                ws_items.append(self._invoice_item_row(item))
             
             # Auto-adjust column widths
             for ws in [ws_summary, ws_items]:
@@ -0,0 +1,255 @@
+import os
+import time
+import asyncio
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Any, Callable, Optional, TypeVar
+
+from ai_service.services.metrics import REGISTRY, STEP_SECONDS
+from ai_service.services.tracing import current_trace, traced_call
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Default concurrency per processing stage within one worker
+DEFAULT_STAGE_LIMITS = {
+    "parse": 2,
+    "ocr": 2,
+    "match": 4,
+    "excel": 2,
+    "export": 2,
+    "upload": 4,
+    "review": 4,
+    "dedupe": 2,
+    "cache": 2,
+    "trace": 2
+}
+
+class ExecutionLayer:
+    """
+    Runs blocking document work off the event loop
+    
+    Blocking I/O and work that releases the GIL go to a thread pool.
+    CPU-bound parsing and OCR go to a process pool. Each stage has its own
+    concurrency limit, so one kind of work cannot take every worker.
+    """
+    
+    def __init__(self, thread_workers: int = None, process_workers: int = None,
+                 stage_limits: Dict[str, int] = None, start_method: str = None):
+        self.thread_workers = thread_workers if thread_workers is not None else int(os.getenv("EXECUTOR_THREAD_WORKERS", "8"))
+        self.process_workers = process_workers if process_workers is not None else int(
+            os.getenv("EXECUTOR_PROCESS_WORKERS", str(min(4, os.cpu_count() or 1)))
+        )
+        self.start_method = start_method or os.getenv("EXECUTOR_START_METHOD", "spawn")
+        self.stage_limits = dict(DEFAULT_STAGE_LIMITS)
+        self.stage_limits.update(self._parse_stage_limits(os.getenv("EXECUTOR_STAGE_LIMITS", "")))
+        if stage_limits:
+            self.stage_limits.update(stage_limits)
+        
+        self._thread_pool: Optional[ThreadPoolExecutor] = None
+        self._process_pool: Optional[ProcessPoolExecutor] = None
+        self._pool_lock = threading.Lock()
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.active: Dict[str, int] = {}
+        self.completed: Dict[str, int] = {}
+    
+    def _parse_stage_limits(self, spec: str) -> Dict[str, int]:
+        """
+        Parse stage limits from "stage=limit,stage=limit" text
+        
+        Args:
+            spec: Limits specification
+        
+        Returns:
+            Mapping of stage name to concurrency limit
+        """
+        limits = {}
+        for part in spec.split(","):
+            if "=" not in part:
+                continue
+            stage, limit = part.split("=", 1)
+            try:
+                limits[stage.strip()] = int(limit)
+            except ValueError:
+                logger.warning(f"Ignoring invalid stage limit: {part}")
+        return limits
+    
+    def _get_thread_pool(self) -> ThreadPoolExecutor:
+        with self._pool_lock:
+            if self._thread_pool is None:
+                self._thread_pool = ThreadPoolExecutor(
+                    max_workers=self.thread_workers, thread_name_prefix="ai-service"
+                )
+            return self._thread_pool
+    
+    def _get_process_pool(self) -> ProcessPoolExecutor:
+        with self._pool_lock:
+            if self._process_pool is None:
+                self._process_pool = ProcessPoolExecutor(
+                    max_workers=self.process_workers,
+                    mp_context=multiprocessing.get_context(self.start_method)
+                )
+            return self._process_pool
+    
+    def _stage_semaphore(self, stage: str) -> asyncio.Semaphore:
+        """Get the concurrency limit for a stage on the running loop"""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # Semaphores belong to one event loop
+            self._semaphores = {}
+            self._loop = loop
+        if stage not in self._semaphores:
+            limit = self.stage_limits.get(stage, self.thread_workers)
+            self._semaphores[stage] = asyncio.Semaphore(max(1, limit))
+        return self._semaphores[stage]
+    
+    async def run_in_thread(self, stage: str, fn: Callable[..., T], *args: Any, step: str = None) -> T:
+        """
+        Run a blocking function in the thread pool
+        
+        Args:
+            stage: Processing stage, used for the concurrency limit
+            fn: Function to run
+            *args: Arguments for fn
+            step: Name the run is timed under in the step duration metric,
+                defaults to the stage
+        
+        Returns:
+            Result of fn
+        """
+        trace = current_trace()
+        if trace is not None and trace.profiling:
+            fn = trace.bind(fn)
+        async with self._stage_semaphore(stage):
+            loop = asyncio.get_running_loop()
+            return await self._track(stage, step, loop.run_in_executor(self._get_thread_pool(), fn, *args))
+    
+    async def run_in_process(self, stage: str, fn: Callable[..., T], *args: Any, step: str = None) -> T:
+        """
+        Run a CPU-bound function in the process pool
+        
+        fn and its arguments must be picklable, e.g. a module-level function
+        or a method of a stateless service. Falls back to the thread pool when
+        the process pool is disabled (EXECUTOR_PROCESS_WORKERS=0).
+        
+        Args:
+            stage: Processing stage, used for the concurrency limit
+            fn: Function to run
+            *args: Arguments for fn
+            step: Name the run is timed under in the step duration metric,
+                defaults to the stage
+        
+        Returns:
+            Result of fn
+        """
+        if self.process_workers <= 0:
+            return await self.run_in_thread(stage, fn, *args, step=step)
+        
+        trace = current_trace()
+        profiled = trace is not None and (trace.profiling or trace.trace_memory)
+        if profiled:
+            # Profile the call inside the pool process, where the work happens
+            fn, args = traced_call, (fn, args, trace.profile_interval, trace.trace_memory)
+        
+        async with self._stage_semaphore(stage):
+            loop = asyncio.get_running_loop()
+            try:
+                result = await self._track(stage, step, loop.run_in_executor(self._get_process_pool(), fn, *args))
+            except BrokenProcessPool:
+                # A worker died (e.g. out of memory); start a fresh pool for later calls
+                logger.error(f"Process pool broke during {stage} stage; restarting it")
+                self._reset_process_pool()
+                raise
+        
+        if profiled:
+            result, samples, peak = result
+            trace.merge_child(samples, peak)
+        return result
+    
+    async def _track(self, stage: str, step: Optional[str], future: "asyncio.Future[T]") -> T:
+        self.active[stage] = self.active.get(stage, 0) + 1
+        start = time.perf_counter()
+        try:
+            return await future
+        finally:
+            end = time.perf_counter()
+            STEP_SECONDS.labels(step or stage).observe(end - start)
+            trace = current_trace()
+            if trace is not None:
+                trace.add_span(step or stage, start, end, stage=stage)
+            self.active[stage] -= 1
+            self.completed[stage] = self.completed.get(stage, 0) + 1
+    
+    def _reset_process_pool(self):
+        with self._pool_lock:
+            pool, self._process_pool = self._process_pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+    
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get executor settings and per-stage activity
+        
+        Returns:
+            Dictionary with pool sizes, stage limits and task counts
+        """
+        return {
+            "thread_workers": self.thread_workers,
+            "process_workers": self.process_workers,
+            "stage_limits": dict(self.stage_limits),
+            "active": dict(self.active),
+            "completed": dict(self.completed)
+        }
+    
+    def shutdown(self):
+        """Stop the worker pools"""
+        with self._pool_lock:
+            thread_pool, self._thread_pool = self._thread_pool, None
+            process_pool, self._process_pool = self._process_pool, None
+        if thread_pool is not None:
+            thread_pool.shutdown(wait=False, cancel_futures=True)
+        if process_pool is not None:
+            process_pool.shutdown(wait=False, cancel_futures=True)
+
+_execution_layer: Optional[ExecutionLayer] = None
+_execution_layer_lock = threading.Lock()
+
+def _collect_metrics():
+    """Executor activity per stage, read when metrics are scraped"""
+    layer = _execution_layer
+    if layer is None:
+        return []
+    return [
+        ("ampere_executor_active_tasks", "gauge", "Tasks running in the executor pools by stage",
+         [({"stage": stage}, count) for stage, count in sorted(layer.active.items())]),
+        ("ampere_executor_completed_tasks_total", "counter", "Tasks finished in the executor pools by stage",
+         [({"stage": stage}, count) for stage, count in sorted(layer.completed.items())])
+    ]
+
+REGISTRY.register_collector(_collect_metrics)
+
+def get_execution_layer() -> ExecutionLayer:
+    """
+    Get the execution layer shared by the service
+    
+    Returns:
+        Shared ExecutionLayer
+    """
+    global _execution_layer
+    with _execution_layer_lock:
+        if _execution_layer is None:
+            _execution_layer = ExecutionLayer()
+        return _execution_layer
+
+def shutdown_execution_layer():
+    """Stop the shared execution layer's pools"""
+    global _execution_layer
+    with _execution_layer_lock:
+        layer, _execution_layer = _execution_layer, None
+    if layer is not None:
+        layer.shutdown()
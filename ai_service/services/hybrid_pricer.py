@@ -0,0 +1,176 @@
+import os
+import logging
+import threading
+from typing import List, Dict, Any, Optional, Tuple
+
+from ai_service.services.sor_matcher import SORMatcher
+from ai_service.services.llm import LLMService
+from ai_service.services.vector_db import VectorDB
+from ai_service.services.executors import get_execution_layer
+
+logger = logging.getLogger(__name__)
+
+class HybridPricer:
+    """
+    Retrieval-first SOR/BOQ pricing
+    
+    Items are matched against the rate book and the history of previously
+    priced items first. Only items below the confidence threshold are sent
+    to the LLM, together with their nearest rate-book rows as context.
+    """
+    
+    def __init__(self, sor_matcher: SORMatcher, llm_service: LLMService,
+                 history_db: Optional[VectorDB] = None, confidence_threshold: float = None,
+                 context_rows: int = None):
+        self.sor_matcher = sor_matcher
+        self.llm_service = llm_service
+        self.history_db = history_db
+        self.confidence_threshold = confidence_threshold if confidence_threshold is not None else float(os.getenv("HYBRID_CONFIDENCE_THRESHOLD", "0.8"))
+        self.context_rows = context_rows if context_rows is not None else int(os.getenv("HYBRID_CONTEXT_ROWS", "3"))
+        # Recording refits the history index and saves it; one at a time
+        self._record_lock = threading.Lock()
+    
+    async def price_items(self, items: List[Dict]) -> Tuple[List[Dict], Dict[str, Any]]:
+        """
+        Price SOR/BOQ items, using the LLM only for low-confidence items
+        
+        Args:
+            items: List of item dictionaries with description and unit
+        
+        Returns:
+            Tuple of (priced items in input order, pricing statistics)
+        """
+        # Rate-book and history lookups are CPU-bound; keep them off the event loop
+        matched_items, residual, references, sources = await get_execution_layer().run_in_thread(
+            "match", self._price_from_retrieval, items, step="matching"
+        )
+        
+        if residual:
+            residual_items = [items[index] for index in residual]
+            suggestions = await self.llm_service.suggest_sor_rates(residual_items, references=references)
+            for index, suggestion in zip(residual, suggestions):
+                suggestion["pricing_source"] = "llm"
+                suggestion.setdefault("confidence", None)
+                matched_items[index] = suggestion
+            sources["llm"] = len(residual)
+        
+        stats = {
+            "total_items": len(items),
+            "confidence_threshold": self.confidence_threshold,
+            **sources
+        }
+        logger.info(f"Hybrid pricing: {stats}")
+        return matched_items, stats
+    
+    def _price_from_retrieval(self, items: List[Dict]) -> Tuple[List[Dict], List[int], List[List[Dict]], Dict[str, int]]:
+        """
+        Price items from the rate book and history where confident enough
+        
+        Args:
+            items: List of item dictionaries with description and unit
+        
+        Returns:
+            Tuple of (matched items, indices left for the LLM, rate-book
+            context rows for those items, count of items per source)
+        """
+        matched_items = self.sor_matcher.match_items(items)
+        
+        residual: List[int] = []
+        sources = {"rate_book": 0, "history": 0, "llm": 0}
+        for index, matched_item in enumerate(matched_items):
+            if (matched_item.get("confidence") or 0.0) >= self.confidence_threshold:
+                matched_item["pricing_source"] = "rate_book"
+                sources["rate_book"] += 1
+                continue
+            
+            history_match = self._find_history_match(matched_item)
+            if history_match:
+                matched_item.update(history_match)
+                matched_item["pricing_source"] = "history"
+                sources["history"] += 1
+                continue
+            
+            residual.append(index)
+        
+        references = [
+            self.sor_matcher.top_matches(items[index], k=self.context_rows)
+            for index in residual
+        ]
+        return matched_items, residual, references, sources
+    
+    def _find_history_match(self, item: Dict) -> Optional[Dict]:
+        """
+        Find a previously priced item similar enough to reuse its rate
+        
+        Args:
+            item: Item dictionary with description and unit
+        
+        Returns:
+            Suggestion fields from the past item, or None
+        """
+        if self.history_db is None:
+            return None
+        
+        results = self.history_db.search(self._history_text(item), k=1)
+        if not results:
+            return None
+        
+        _, score, metadata = results[0]
+        item_unit = (item.get("unit") or "").lower()
+        history_unit = (metadata.get("unit") or "").lower()
+        if score < self.confidence_threshold or metadata.get("rate") in (None, ""):
+            return None
+        if item_unit and history_unit and item_unit != history_unit:
+            return None
+        
+        return {
+            "suggested_rate": metadata.get("rate"),
+            "suggested_unit": metadata.get("unit"),
+            "suggested_category": metadata.get("category"),
+            "confidence": score
+        }
+    
+    def version(self) -> str:
+        """Identify the rate book and history index that retrieval prices come from"""
+        history = self.history_db.version() if self.history_db is not None else None
+        return f"{self.sor_matcher.version()}|history:{history}"
+    
+    def record_priced_items(self, items: List[Dict]) -> int:
+        """
+        Add reviewed priced items to the history index
+        
+        Refits the index over the whole history and saves it, so async
+        callers run this in the thread pool.
+        
+        Args:
+            items: Items with description, unit, rate and category
+        
+        Returns:
+            Number of items recorded
+        """
+        if self.history_db is None:
+            return 0
+        
+        priced = [item for item in items if item.get("description") and item.get("rate") not in (None, "")]
+        if not priced:
+            return 0
+        
+        with self._record_lock:
+            self.history_db.add_documents(
+                [self._history_text(item) for item in priced],
+                [
+                    {
+                        "description": item.get("description"),
+                        "unit": item.get("unit", ""),
+                        "rate": item.get("rate"),
+                        "category": item.get("category", "")
+                    }
+                    for item in priced
+                ]
+            )
+            self.history_db.save_index()
+        return len(priced)
+    
+    def _history_text(self, item: Dict) -> str:
+        """Text used to index and search past priced items"""
+        return f"{item.get('description', '')} {item.get('unit', '')}".strip()
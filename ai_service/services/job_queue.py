@@ -0,0 +1,417 @@
+import os
+import time
+import uuid
+import asyncio
+import logging
+import threading
+import socket
+import ipaddress
+from urllib.parse import urlsplit
+from typing import Dict, Any, Optional, Callable, Awaitable, List, Iterable
+from starlette.responses import JSONResponse
+
+from ai_service.services.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+class QueueFullError(Exception):
+    """Raised when a job is submitted while the queue is at capacity"""
+    pass
+
+class QueueClosedError(Exception):
+    """Raised when a job is submitted while the queue is shutting down"""
+    pass
+
+class CallbackURLError(ValueError):
+    """Raised when a callback URL is not allowed"""
+    pass
+
+def _is_public_address(host: str) -> bool:
+    """Whether an IP address is routable on the internet, i.e. not loopback, private or link-local"""
+    address = ipaddress.ip_address(host.split("%", 1)[0])
+    return address.is_global and not address.is_multicast
+
+class Job:
+    """A unit of background document processing"""
+    
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+    
+    def __init__(self, kind: str, work: Callable[["Job"], Awaitable[Any]], callback_url: Optional[str] = None,
+                 cleanup: Optional[Callable[[], None]] = None):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.work = work
+        self.callback_url = callback_url
+        self.cleanup = cleanup
+        self.status = self.QUEUED
+        self.stage: Optional[str] = None
+        self.progress = 0.0
+        self.result: Any = None
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+    
+    def set_stage(self, stage: str, progress: float):
+        """
+        Record the job's current processing stage
+        
+        Args:
+            stage: Stage name
+            progress: Fraction of the work done, between 0 and 1
+        """
+        self.stage = stage
+        self.progress = max(self.progress, min(1.0, progress))
+    
+    @property
+    def finished(self) -> bool:
+        return self.status in (self.SUCCEEDED, self.FAILED)
+    
+    def to_dict(self, include_result: bool = True) -> Dict[str, Any]:
+        """
+        Serialize the job for API responses and callbacks
+        
+        Args:
+            include_result: Whether to include the job result
+        
+        Returns:
+            Job status dictionary
+        """
+        data = {
+            "job_id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "stage": self.stage,
+            "progress": round(self.progress, 3),
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at
+        }
+        if include_result:
+            data["result"] = self.result
+        return data
+
+class JobQueue:
+    """
+    Bounded in-process job queue with a fixed pool of async workers
+    
+    Submissions beyond the queue size are rejected at once rather than
+    buffered, so a burst of large uploads cannot exhaust memory. Finished
+    jobs are kept for polling until their result TTL expires, and at most
+    max_finished of them are kept, the oldest being forgotten first.
+    
+    Callbacks go only to public addresses, checked when the callback host
+    is resolved, unless the host is listed in callback_hosts.
+    """
+    
+    def __init__(self, max_size: int = None, workers: int = None, result_ttl: float = None,
+                 callback_timeout: float = None, max_finished: int = None,
+                 callback_hosts: Iterable[str] = None):
+        self.max_size = max_size if max_size is not None else int(os.getenv("JOB_QUEUE_MAX_SIZE", "20"))
+        self.workers = workers if workers is not None else int(os.getenv("JOB_WORKERS", "2"))
+        self.result_ttl = result_ttl if result_ttl is not None else float(os.getenv("JOB_RESULT_TTL", "3600"))
+        self.max_finished = max_finished if max_finished is not None else int(os.getenv("JOB_MAX_FINISHED", "100"))
+        self.callback_timeout = callback_timeout if callback_timeout is not None else float(os.getenv("JOB_CALLBACK_TIMEOUT", "10"))
+        if callback_hosts is None:
+            callback_hosts = os.getenv("JOB_CALLBACK_HOSTS", "").split(",")
+        self.callback_hosts = {host.strip().lower() for host in callback_hosts if host.strip()}
+        self.retry_after = int(os.getenv("JOB_RETRY_AFTER", "5"))
+        self.jobs: Dict[str, Job] = {}
+        self.rejected = 0
+        self.closed = False
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker_tasks: List[asyncio.Task] = []
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+    
+    def _ensure_workers(self):
+        """Start the queue and workers on the running loop"""
+        loop = asyncio.get_running_loop()
+        if self._loop is loop:
+            return
+        # Queues and tasks belong to one event loop
+        self._loop = loop
+        self._queue = asyncio.Queue(maxsize=self.max_size)
+        self._worker_tasks = [
+            loop.create_task(self._worker(number)) for number in range(self.workers)
+        ]
+    
+    def check_capacity(self):
+        """
+        Check a job could be queued now, before its upload is read
+        
+        Raises:
+            QueueFullError: If the queue is at capacity
+            QueueClosedError: If the queue is shutting down
+        """
+        if self.closed:
+            raise QueueClosedError("Job queue is shutting down")
+        if self._queue is not None and self._loop is asyncio.get_running_loop() and self._queue.full():
+            self.rejected += 1
+            raise QueueFullError(f"Job queue is full ({self.max_size} jobs waiting)")
+    
+    def submit(self, kind: str, work: Callable[[Job], Awaitable[Any]],
+               callback_url: Optional[str] = None, cleanup: Optional[Callable[[], None]] = None) -> Job:
+        """
+        Queue a job
+        
+        Args:
+            kind: Kind of work, e.g. "invoice" or "sor"
+            work: Coroutine function run with the job; its return value
+                becomes the job result
+            callback_url: Optional URL that receives the finished job as JSON
+            cleanup: Optional function releasing the job's input, called if
+                the job is dropped before it runs
+        
+        Returns:
+            The queued job
+        
+        Raises:
+            QueueFullError: If the queue is at capacity
+            QueueClosedError: If the queue is shutting down
+        """
+        if self.closed:
+            raise QueueClosedError("Job queue is shutting down")
+        self._ensure_workers()
+        self._prune()
+        
+        job = Job(kind, work, callback_url, cleanup)
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            self.rejected += 1
+            raise QueueFullError(f"Job queue is full ({self.max_size} jobs waiting)")
+        self.jobs[job.id] = job
+        return job
+    
+    def check_callback_url(self, callback_url: str):
+        """
+        Check a callback URL before accepting a job
+        
+        Host names are resolved and checked again when the callback is sent.
+        
+        Args:
+            callback_url: URL that would receive the finished job
+        
+        Raises:
+            CallbackURLError: If the URL is not http(s), or its host is not
+                allowed
+        """
+        parts = urlsplit(callback_url)
+        host = (parts.hostname or "").lower()
+        if parts.scheme not in ("http", "https") or not host:
+            raise CallbackURLError("callback_url must be an http or https URL")
+        if host in self.callback_hosts:
+            return
+        if self.callback_hosts:
+            raise CallbackURLError(f"callback_url host {host} is not allowed")
+        if host == "localhost" or host.endswith(".localhost"):
+            raise CallbackURLError("callback_url must not point at a private or loopback address")
+        try:
+            public = _is_public_address(host)
+        except ValueError:
+            # A host name; checked when it is resolved
+            return
+        if not public:
+            raise CallbackURLError("callback_url must not point at a private or loopback address")
+    
+    def get(self, job_id: str, kind: Optional[str] = None) -> Optional[Job]:
+        """
+        Look up a job
+        
+        Args:
+            job_id: Job identifier
+            kind: Only return the job if it is of this kind
+        
+        Returns:
+            Job, or None if unknown or expired
+        """
+        self._prune()
+        job = self.jobs.get(job_id)
+        if job is None or (kind is not None and job.kind != kind):
+            return None
+        return job
+    
+    def _prune(self):
+        """Forget finished jobs whose results have expired, and the oldest beyond max_finished"""
+        cutoff = time.time() - self.result_ttl
+        finished = sorted(
+            (job for job in self.jobs.values() if job.finished),
+            key=lambda job: job.finished_at
+        )
+        overflow = max(0, len(finished) - self.max_finished)
+        for position, job in enumerate(finished):
+            if position < overflow or job.finished_at < cutoff:
+                del self.jobs[job.id]
+    
+    async def _worker(self, number: int):
+        while True:
+            job = await self._queue.get()
+            try:
+                await self._run(job)
+            finally:
+                self._queue.task_done()
+    
+    async def _run(self, job: Job):
+        job.status = Job.RUNNING
+        job.started_at = time.time()
+        try:
+            job.result = await job.work(job)
+            job.status = Job.SUCCEEDED
+            job.set_stage("done", 1.0)
+        except Exception as e:
+            logger.error(f"Job {job.id} ({job.kind}) failed: {str(e)}")
+            job.error = str(e)
+            job.status = Job.FAILED
+        finally:
+            job.finished_at = time.time()
+            # Drop the uploaded document once the job no longer needs it
+            job.work = None
+            job.cleanup = None
+            self._prune()
+        
+        if job.callback_url:
+            await self._send_callback(job)
+    
+    async def _send_callback(self, job: Job):
+        """POST the finished job to its callback URL"""
+        # Imported on first use; most workers never send a callback
+        import aiohttp
+        try:
+            self.check_callback_url(job.callback_url)
+            timeout = aiohttp.ClientTimeout(total=self.callback_timeout)
+            connector = aiohttp.TCPConnector(resolver=_callback_resolver(self.callback_hosts))
+            async with aiohttp.ClientSession(timeout=timeout, connector=connector) as session:
+                async with session.post(job.callback_url, json=job.to_dict()) as response:
+                    response.raise_for_status()
+        except Exception as e:
+            logger.warning(f"Callback for job {job.id} to {job.callback_url} failed: {str(e)}")
+    
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get queue depth and job counts
+        
+        Returns:
+            Dictionary with queue settings and counts per job status
+        """
+        counts = {status: 0 for status in (Job.QUEUED, Job.RUNNING, Job.SUCCEEDED, Job.FAILED)}
+        for job in self.jobs.values():
+            counts[job.status] += 1
+        return {
+            "max_size": self.max_size,
+            "workers": self.workers,
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "rejected": self.rejected,
+            "jobs": counts
+        }
+    
+    async def aclose(self):
+        """Stop accepting jobs, cancel the workers and release the inputs of jobs still queued"""
+        self.closed = True
+        tasks, self._worker_tasks = self._worker_tasks, []
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        
+        while self._queue is not None and not self._queue.empty():
+            job = self._queue.get_nowait()
+            job.status = Job.FAILED
+            job.error = "Job queue shut down before the job ran"
+            job.finished_at = time.time()
+            cleanup, job.work, job.cleanup = job.cleanup, None, None
+            if cleanup is not None:
+                try:
+                    cleanup()
+                except Exception as e:
+                    logger.warning(f"Could not release input of job {job.id}: {str(e)}")
+        self._loop = None
+
+class JobAdmissionMiddleware:
+    """
+    Rejects job submissions while the queue is full or closing
+    
+    Runs before the multipart body is read, so a rejected upload is not
+    received at all. Handlers check again before spooling, since the queue
+    can fill while a body is being read.
+    """
+    
+    def __init__(self, app, paths: Iterable[str]):
+        self.app = app
+        self.paths = set(paths)
+    
+    async def __call__(self, scope: Dict[str, Any], receive, send):
+        if scope["type"] == "http" and scope["method"] == "POST" and scope["path"] in self.paths:
+            job_queue = get_job_queue()
+            try:
+                job_queue.check_capacity()
+            except (QueueFullError, QueueClosedError) as e:
+                response = JSONResponse(
+                    {"detail": str(e)},
+                    status_code=429 if isinstance(e, QueueFullError) else 503,
+                    headers={"Retry-After": str(job_queue.retry_after)}
+                )
+                await response(scope, receive, send)
+                return
+        await self.app(scope, receive, send)
+
+def _callback_resolver(allowed_hosts: Iterable[str]):
+    """
+    Build a resolver refusing callback hosts that resolve to non-public addresses
+    
+    Checking at connection time also covers host names that resolve to a
+    public address when the job is submitted and a private one later.
+    """
+    from aiohttp.resolver import ThreadedResolver
+    
+    class CallbackResolver(ThreadedResolver):
+        async def resolve(self, host: str, port: int = 0, family: int = socket.AF_INET):
+            addresses = await super().resolve(host, port, family)
+            if host.lower() not in allowed_hosts:
+                for address in addresses:
+                    if not _is_public_address(address["host"]):
+                        raise CallbackURLError(f"Callback host {host} resolves to non-public address {address['host']}")
+            return addresses
+    
+    return CallbackResolver()
+
+_job_queue: Optional[JobQueue] = None
+_job_queue_lock = threading.Lock()
+
+def _collect_metrics():
+    """Job queue depth and job counts, read when metrics are scraped"""
+    queue = _job_queue
+    if queue is None:
+        return []
+    stats = queue.stats()
+    return [
+        ("ampere_job_queue_depth", "gauge", "Background jobs waiting for a queue worker", [({}, stats["queued"])]),
+        ("ampere_job_queue_rejected_total", "counter", "Background jobs rejected because the queue was full", [({}, stats["rejected"])]),
+        ("ampere_jobs", "gauge", "Background jobs held by the queue by status",
+         [({"status": status}, count) for status, count in stats["jobs"].items()])
+    ]
+
+REGISTRY.register_collector(_collect_metrics)
+
+def get_job_queue() -> JobQueue:
+    """
+    Get the job queue shared by the routers
+    
+    Returns:
+        Shared JobQueue
+    """
+    global _job_queue
+    with _job_queue_lock:
+        if _job_queue is None:
+            _job_queue = JobQueue()
+        return _job_queue
+
+async def close_job_queue():
+    """Shut down the shared job queue"""
+    global _job_queue
+    with _job_queue_lock:
+        queue, _job_queue = _job_queue, None
+    if queue is not None:
+        await queue.aclose()
@@ -1,12 +1,30 @@
 import os
+import time
+import asyncio
 import logging
 import json
-import requests
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Optional, List, Callable, Tuple, AsyncIterator
+import aiohttp
 import openai
 
+from ai_service.services.llm_cache import LLMCache, get_llm_cache
+from ai_service.services.streaming import IncrementalJSONParser
+from ai_service.services.prompt_compactor import PromptCompactor, estimate_tokens
+from ai_service.services.provider_health import get_provider_health
+from ai_service.services.metrics import LLM_CALL_SECONDS
+from ai_service.services.tracing import current_trace
+from ai_service.services.executors import get_execution_layer
+from ai_service.services.single_flight import get_single_flight, content_key
+
 logger = logging.getLogger(__name__)
 
+class ProviderUnavailableError(Exception):
+    """Raised when every LLM provider is skipped by its circuit breaker"""
+    pass
+
+# Approximate completion tokens spent on the JSON fields of one SOR suggestion
+ITEM_RESPONSE_OVERHEAD_TOKENS = 40
+
 class LLMService:
     """Service for interacting with Large Language Models"""
     
@@ -14,22 +32,92 @@ class LLMService:
         self.ollama_base_url = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
         self.ollama_model = os.getenv("OLLAMA_MODEL", "llama2")
         self.openai_api_key = os.getenv("OPENAI_API_KEY")
+        self.openai_model = os.getenv("OPENAI_MODEL", "gpt-3.5-turbo")
+        self.openai_api_base = os.getenv("OPENAI_API_BASE")
+        self.temperature = float(os.getenv("LLM_TEMPERATURE", "0.3"))
+        
+        # HTTP client configuration
+        self.request_timeout = float(os.getenv("LLM_TIMEOUT", "120"))
+        self.connect_timeout = float(os.getenv("LLM_CONNECT_TIMEOUT", "10"))
+        self.max_connections = int(os.getenv("LLM_MAX_CONNECTIONS", "20"))
+        self.keepalive_timeout = float(os.getenv("LLM_KEEPALIVE_TIMEOUT", "60"))
+        self.max_output_tokens = int(os.getenv("LLM_MAX_OUTPUT_TOKENS", "2000"))
+        self.max_concurrency = {
+            "openai": int(os.getenv("OPENAI_MAX_CONCURRENCY", "8")),
+            "ollama": int(os.getenv("OLLAMA_MAX_CONCURRENCY", "4")),
+        }
+        
+        # Hedged requests across providers
+        self.hedging_enabled = os.getenv("LLM_HEDGING", "false").lower() == "true"
+        self.hedge_percentile = float(os.getenv("LLM_HEDGE_PERCENTILE", "95"))
+        self.hedge_delay = float(os.getenv("LLM_HEDGE_DELAY", "5"))
+        
+        # SOR rate batching configuration
+        self.batch_token_budget = int(os.getenv("LLM_BATCH_TOKEN_BUDGET", str(self.max_output_tokens * 3 // 4)))
+        self.batch_max_items = int(os.getenv("LLM_BATCH_MAX_ITEMS", "25"))
+        self.batch_concurrency = int(os.getenv("LLM_BATCH_CONCURRENCY", "4"))
+        self.batch_retries = int(os.getenv("LLM_BATCH_RETRIES", "2"))
+        
+        # Invoice text compaction before prompting
+        self.compaction_enabled = os.getenv("PROMPT_COMPACTION_ENABLED", "true").lower() == "true"
+        self.compactor = PromptCompactor()
+        
+        # Persistent prompt/response cache shared by all services using the same file
+        self.cache: Optional[LLMCache] = get_llm_cache()
+        
+        # Pooled session and per-provider semaphores, bound to the running event loop
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
         
         # Configure OpenAI if API key is provided
         if self.openai_api_key:
             openai.api_key = self.openai_api_key
     
-    def extract_invoice_data(self, text: str) -> Dict[str, Any]:
+    async def _get_session(self) -> aiohttp.ClientSession:
         """
-        Extract structured invoice data from text using LLM
+        Get the pooled keep-alive HTTP session, creating it on first use
+        
+        The session and semaphores belong to the event loop that created them,
+        so they are rebuilt if the service is used from a different loop.
         
-        Args:
-            text: Raw text from invoice document
-            
         Returns:
-            Dictionary with extracted invoice data
+            Shared aiohttp client session
         """
-        prompt = f"""
+        loop = asyncio.get_running_loop()
+        if self._session is None or self._session.closed or self._loop is not loop:
+            connector = aiohttp.TCPConnector(
+                limit=self.max_connections,
+                keepalive_timeout=self.keepalive_timeout
+            )
+            timeout = aiohttp.ClientTimeout(
+                total=self.request_timeout,
+                connect=self.connect_timeout
+            )
+            self._session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+            self._semaphores = {
+                provider: asyncio.Semaphore(limit)
+                for provider, limit in self.max_concurrency.items()
+            }
+            self._loop = loop
+        return self._session
+    
+    async def _acquire(self, provider: str) -> asyncio.Semaphore:
+        """Get the concurrency limiter for a provider"""
+        await self._get_session()
+        return self._semaphores[provider]
+    
+    async def aclose(self):
+        """Close the pooled HTTP session"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+        self._semaphores = {}
+        self._loop = None
+    
+    def _build_invoice_prompt(self, text: str) -> str:
+        """Build the invoice extraction prompt"""
+        return f"""
         Extract the following information from the invoice text below:
         - Invoice number
         - Vendor name
@@ -69,11 +157,43 @@ class LLMService:
         If any information is not found, leave the field as null or empty array.
         Only return the JSON object, nothing else.
         """
+    
+    def _compact_invoice_text(self, text: str) -> Tuple[str, Dict[str, Any]]:
+        """
+        Compact invoice text before it is interpolated into the prompt
+        
+        Args:
+            text: Raw text from invoice document
+            
+        Returns:
+            Tuple of (text to prompt with, prompt size statistics)
+        """
+        if not self.compaction_enabled:
+            tokens = estimate_tokens(text) if text else 0
+            return text, {"original_tokens": tokens, "compacted_tokens": tokens}
+        
+        compacted, stats = self.compactor.compact(text)
+        logger.info(f"Compacted invoice text from {stats['original_tokens']} to {stats['compacted_tokens']} tokens")
+        return compacted, stats
+    
+    async def extract_invoice_data(self, text: str) -> Dict[str, Any]:
+        """
+        Extract structured invoice data from text using LLM
+        
+        Args:
+            text: Raw text from invoice document
+            
+        Returns:
+            Dictionary with extracted invoice data
+        """
+        text, prompt_stats = self._compact_invoice_text(text)
+        prompt = self._build_invoice_prompt(text)
         
         try:
-            response = self._call_llm(prompt)
+            response = await self._call_llm(prompt, validate=json.loads)
             # Parse JSON response
             extracted_data = json.loads(response)
+            extracted_data["prompt_stats"] = prompt_stats
             return extracted_data
         except json.JSONDecodeError as e:
             logger.error(f"Error parsing LLM response as JSON: {str(e)}")
@@ -82,28 +202,199 @@ class LLMService:
             logger.error(f"Error extracting invoice data with LLM: {str(e)}")
             return {}
     
-    def suggest_sor_rates(self, items: List[Dict]) -> List[Dict]:
+    async def suggest_sor_rates(self, items: List[Dict],
+                                references: Optional[List[List[Dict]]] = None) -> List[Dict]:
         """
         Suggest rates for SOR/BOQ items using LLM
         
+        Items are split into token-budgeted batches that are priced
+        concurrently, so large BOQs are not truncated by the completion
+        limit and latency follows the slowest batch rather than the total.
+        
+        Args:
+            items: List of SOR/BOQ items
+            references: Optional nearest rate-book rows for each item,
+                included in the prompt as pricing context
+            
+        Returns:
+            List of items with suggested rates, in input order
+        """
+        if not items:
+            return []
+        
+        # Serve unchanged lines from the per-item cache
+        suggestions = await self._cached_sor_suggestions(items, references)
+        
+        misses = [index for index in range(len(items)) if index not in suggestions]
+        batches = self._batch_items(items, misses, references)
+        semaphore = asyncio.Semaphore(self.batch_concurrency)
+        
+        async def run_batch(batch: List[int]) -> Dict[int, Dict]:
+            async with semaphore:
+                result, provider, model = await self._suggest_batch(items, batch, references)
+            await self._cache_sor_suggestions(items, result, references, provider, model)
+            return result
+        
+        pending = batches
+        for attempt in range(self.batch_retries + 1):
+            results = await asyncio.gather(
+                *[run_batch(batch) for batch in pending],
+                return_exceptions=True
+            )
+            failed = []
+            for batch, result in zip(pending, results):
+                if isinstance(result, Exception):
+                    logger.warning(f"SOR rate batch of {len(batch)} items failed (attempt {attempt + 1}): {str(result)}")
+                    failed.append(batch)
+                else:
+                    suggestions.update(result)
+            pending = failed
+            if not pending:
+                break
+        
+        if pending:
+            logger.error(f"Error suggesting SOR rates with LLM: {len(pending)} of {len(batches)} batches failed")
+        
+        # Reassemble in input order
+        suggested_items = []
+        for index, item in enumerate(items):
+            suggested_item = item.copy()
+            suggestion = suggestions.get(index)
+            if suggestion:
+                suggested_item.update(suggestion)
+            else:
+                suggested_item.update({
+                    "suggested_rate": None,
+                    "suggested_category": None
+                })
+            suggested_items.append(suggested_item)
+        
+        return suggested_items
+    
+    def _batch_items(self, items: List[Dict], indices: Optional[List[int]] = None,
+                     references: Optional[List[List[Dict]]] = None) -> List[List[int]]:
+        """
+        Split items into batches whose estimated output fits the token budget
+        
         Args:
             items: List of SOR/BOQ items
+            indices: Indices of the items to batch, defaults to all items
+            references: Optional nearest rate-book rows for each item
             
         Returns:
-            List of items with suggested rates
+            List of batches, each a list of item indices
+        """
+        batches = []
+        current: List[int] = []
+        current_tokens = 0
+        
+        if indices is None:
+            indices = list(range(len(items)))
+        
+        for index in indices:
+            item = items[index]
+            # Each answer echoes the description plus a fixed set of JSON fields
+            item_tokens = estimate_tokens(self._format_sor_item(index, item, references)) + ITEM_RESPONSE_OVERHEAD_TOKENS
+            if current and (current_tokens + item_tokens > self.batch_token_budget or len(current) >= self.batch_max_items):
+                batches.append(current)
+                current = []
+                current_tokens = 0
+            current.append(index)
+            current_tokens += item_tokens
+        
+        if current:
+            batches.append(current)
+        return batches
+    
+    def _format_sor_item(self, index: int, item: Dict, references: Optional[List[List[Dict]]] = None) -> str:
+        """Format a single SOR/BOQ item as a prompt line, with compact rate-book context"""
+        return f"{index}. {self._sor_item_text(item, references[index] if references else None)}"
+    
+    def _sor_item_text(self, item: Dict, rows: Optional[List[Dict]] = None) -> str:
+        """An item's description and unit, with its rate-book context rows if any"""
+        text = f"{item.get('description', '')} (Unit: {item.get('unit', '')})"
+        if rows:
+            rates = "; ".join(
+                f"{row.get('item', '')}/{row.get('unit', '')}/{row.get('rate', '')}"
+                for row in rows
+            )
+            text += f" [similar rates: {rates}]"
+        return text
+    
+    def _sor_item_cache_key(self, item: Dict, provider: str, model: str, rows: Optional[List[Dict]] = None) -> str:
+        """
+        Build the per-item cache key for a SOR rate suggestion
+    
+        The key covers the provider and model that answered and the
+        rate-book rows sent with the item, so a suggestion is not served
+        after a failover or once the reference rates change.
+        """
+        return LLMCache.make_key(f"sor_item:{provider}", model, self.temperature, self._sor_item_text(item, rows).lower())
+    
+    async def _cached_sor_suggestions(self, items: List[Dict],
+                                      references: Optional[List[List[Dict]]] = None) -> Dict[int, Dict]:
+        """
+        Look up cached SOR rate suggestions for every item in one query
+        
+        An item's suggestion from any configured provider is used, the
+        preferred provider's first.
+        
+        Args:
+            items: List of SOR/BOQ items
+            references: Optional nearest rate-book rows for each item
+        
+        Returns:
+            Mapping of item index to cached suggestion
         """
+        if self.cache is None:
+            return {}
+        providers = self._providers()
+        candidates = [
+            [
+                self._sor_item_cache_key(item, provider, model, references[index] if references else None)
+                for provider, model in providers
+            ]
+            for index, item in enumerate(items)
+        ]
+        try:
+            cached = await get_execution_layer().run_in_thread(
+                "cache", self.cache.get_first_many, candidates, step="llm_cache_lookup"
+            )
+        except Exception as e:
+            logger.warning(f"Could not read SOR rate suggestions from cache: {str(e)}")
+            return {}
+        return {index: json.loads(hit[1]) for index, hit in enumerate(cached) if hit is not None}
+    
+    async def _cache_sor_suggestions(self, items: List[Dict], suggestions: Dict[int, Dict],
+                                     references: Optional[List[List[Dict]]], provider: Optional[str], model: Optional[str]):
+        """Store per-item SOR rate suggestions from one provider in the cache, in one transaction"""
+        if self.cache is None or not suggestions or provider is None:
+            return
+        values = {
+            self._sor_item_cache_key(items[index], provider, model, references[index] if references else None): suggestion
+            for index, suggestion in suggestions.items()
+        }
+        try:
+            await get_execution_layer().run_in_thread("cache", self.cache.set_json_many, values, step="llm_cache_write")
+        except Exception as e:
+            logger.warning(f"Could not cache SOR rate suggestions: {str(e)}")
+    
+    def _build_sor_prompt(self, items: List[Dict], batch: List[int],
+                          references: Optional[List[List[Dict]]] = None) -> str:
+        """Build the SOR rate suggestion prompt for one batch"""
         items_text = "\n".join([
-            f"- {item.get('description', '')} (Unit: {item.get('unit', '')})"
-            for item in items
+            self._format_sor_item(index, items[index], references)
+            for index in batch
         ])
         
-        prompt = f"""
+        return f"""
         For each of the following construction items, suggest appropriate rates in SGD:
         
         {items_text}
         
         Return the results as a JSON array with the following structure for each item:
         {{
+            "index": number (the item number above),
             "description": "string",
             "unit": "string",
             "suggested_rate": number,
@@ -111,70 +402,578 @@ class LLMService:
             "notes": "string (optional)"
         }}
         
-        Base your suggestions on typical Singapore construction rates.
+        Base your suggestions on typical Singapore construction rates and on
+        the similar rates (description/unit/rate) listed with an item, if any.
         Only return the JSON array, nothing else.
         """
+    
+    async def _suggest_batch(self, items: List[Dict], batch: List[int],
+                             references: Optional[List[List[Dict]]] = None) -> Tuple[Dict[int, Dict], str, str]:
+        """
+        Suggest rates for one batch of items
+        
+        Args:
+            items: Full list of SOR/BOQ items
+            batch: Indices of the items in this batch
+            references: Optional nearest rate-book rows for each item
+            
+        Returns:
+            Tuple of (mapping of item index to suggestion fields, provider
+            and model that answered)
+            
+        Raises:
+            ValueError: If the response is not a JSON array covering the batch
+        """
+        prompt = self._build_sor_prompt(items, batch, references)
+        
+        # Suggestions are cached per item, so the batch prompt itself is not cached
+        response, provider, model = await self._call_llm_with_source(prompt, use_cache=False)
+        suggested_rates = json.loads(response)
+        if not isinstance(suggested_rates, list):
+            raise ValueError("LLM response is not a JSON array")
+        
+        suggestions = {}
+        for position, suggestion in enumerate(suggested_rates):
+            index = self._resolve_suggestion(suggestion, position, batch)
+            if index is not None:
+                suggestions[index] = suggestion
+        
+        if len(suggestions) < len(batch):
+            raise ValueError(f"LLM response covered {len(suggestions)} of {len(batch)} items")
+        return suggestions, provider, model
+    
+    def _resolve_suggestion(self, suggestion: Any, position: int, batch: List[int]) -> Optional[int]:
+        """
+        Work out which item a suggestion belongs to and strip echoed fields
+        
+        Args:
+            suggestion: One element of the LLM response array
+            position: Position of the element in the response
+            batch: Indices of the items in the batch
+            
+        Returns:
+            Item index, or None if the suggestion cannot be placed
+        """
+        if not isinstance(suggestion, dict):
+            return None
+        index = suggestion.pop("index", None)
+        if index not in batch:
+            # Fall back to positional matching when the index is missing
+            index = batch[position] if position < len(batch) else None
+        if index is not None:
+            suggestion.pop("description", None)
+            suggestion.pop("unit", None)
+        return index
+    
+    async def stream_invoice_data(self, text: str) -> AsyncIterator[Tuple[str, Any]]:
+        """
+        Stream invoice fields from the LLM as each one is generated
+        
+        Args:
+            text: Raw text from invoice document
+            
+        Yields:
+            (field, value) pairs in generation order
+        """
+        text, _ = self._compact_invoice_text(text)
+        prompt = self._build_invoice_prompt(text)
+        
+        if self.cache is not None:
+            keys = [LLMCache.make_key(provider, model, self.temperature, prompt) for provider, model in self._providers()]
+            cached = await get_execution_layer().run_in_thread(
+                "cache", self.cache.get_first, keys, step="llm_cache_lookup"
+            )
+            if cached is not None:
+                for field, value in json.loads(cached[1]).items():
+                    yield field, value
+                return
+        
+        parser = IncrementalJSONParser()
+        chunks = []
+        answered: List[Tuple[str, str]] = []
+        async for chunk in self._stream_llm(prompt, answered):
+            chunks.append(chunk)
+            for field, value in parser.feed(chunk):
+                yield field, value
+        
+        if self.cache is not None and answered and parser.done:
+            response = "".join(chunks)
+            provider, model = answered[0]
+            try:
+                # Cache only the JSON object, without any model preamble
+                await get_execution_layer().run_in_thread(
+                    "cache", self.cache.set, LLMCache.make_key(provider, model, self.temperature, prompt),
+                    json.dumps(json.loads(response[response.index("{"):response.rindex("}") + 1])),
+                    step="llm_cache_write"
+                )
+            except Exception as e:
+                logger.warning(f"Could not cache streamed invoice response: {str(e)}")
+    
+    async def stream_sor_rates(self, items: List[Dict],
+                               references: Optional[List[List[Dict]]] = None) -> AsyncIterator[Dict]:
+        """
+        Stream rate suggestions for SOR/BOQ items as each one is generated
+        
+        Cached items are returned first, then batches are streamed
+        concurrently and items are yielded in completion order. Each item
+        carries its input position in "index".
+        
+        Args:
+            items: List of SOR/BOQ items
+            references: Optional nearest rate-book rows for each item
+            
+        Yields:
+            Items with suggested rates
+        """
+        cached = await self._cached_sor_suggestions(items, references)
+        pending = []
+        for index, item in enumerate(items):
+            if index in cached:
+                yield {**item, **cached[index], "index": index}
+            else:
+                pending.append(index)
+        
+        if not pending:
+            return
+        
+        queue: asyncio.Queue = asyncio.Queue()
+        semaphore = asyncio.Semaphore(self.batch_concurrency)
         
+        async def run_batch(batch: List[int]):
+            delivered: Dict[int, Dict] = {}
+            answered: List[Tuple[str, str]] = []
+            try:
+                async with semaphore:
+                    parser = IncrementalJSONParser()
+                    position = 0
+                    async for chunk in self._stream_llm(self._build_sor_prompt(items, batch, references), answered):
+                        for suggestion in parser.feed(chunk):
+                            index = self._resolve_suggestion(suggestion, position, batch)
+                            position += 1
+                            if index is not None and index not in delivered:
+                                delivered[index] = suggestion
+                                await queue.put((index, suggestion))
+            except Exception as e:
+                logger.warning(f"Streaming SOR rate batch of {len(batch)} items failed: {str(e)}")
+            
+            if answered:
+                await self._cache_sor_suggestions(items, delivered, references, *answered[0])
+            
+            # Price anything the stream missed with the regular batch path
+            missing = [index for index in batch if index not in delivered]
+            for attempt in range(self.batch_retries):
+                if not missing:
+                    break
+                try:
+                    async with semaphore:
+                        result, provider, model = await self._suggest_batch(items, missing, references)
+                    await self._cache_sor_suggestions(items, result, references, provider, model)
+                    for index, suggestion in result.items():
+                        await queue.put((index, suggestion))
+                    missing = []
+                except Exception as e:
+                    logger.warning(f"SOR rate retry of {len(missing)} items failed (attempt {attempt + 1}): {str(e)}")
+            
+            for index in missing:
+                await queue.put((index, {"suggested_rate": None, "suggested_category": None}))
+        
+        batches = self._batch_items(items, pending, references)
+        tasks = [asyncio.create_task(run_batch(batch)) for batch in batches]
         try:
-            response = self._call_llm(prompt)
-            # Parse JSON response
-            suggested_rates = json.loads(response)
-            return suggested_rates
-        except json.JSONDecodeError as e:
-            logger.error(f"Error parsing LLM response as JSON: {str(e)}")
-            return []
-        except Exception as e:
-            logger.error(f"Error suggesting SOR rates with LLM: {str(e)}")
-            return []
+            for _ in range(len(pending)):
+                index, suggestion = await queue.get()
+                yield {**items[index], **suggestion, "index": index}
+        finally:
+            for task in tasks:
+                task.cancel()
     
-    def _call_llm(self, prompt: str) -> str:
+    def version(self) -> str:
+        """Identify the providers and models that rate suggestions come from"""
+        return "llm:" + ",".join(f"{provider}/{model}" for provider, model in self._providers())
+    
+    def _providers(self) -> List[Tuple[str, str]]:
+        """
+        Get the configured providers in order of preference
+        
+        Returns:
+            List of (provider, model) tuples
+        """
+        providers = []
+        # Try OpenAI first if API key is available
+        if self.openai_api_key:
+            providers.append(("openai", self.openai_model))
+        # Fall back to Ollama
+        providers.append(("ollama", self.ollama_model))
+        return providers
+    
+    async def _call_llm(self, prompt: str, validate: Optional[Callable[[str], Any]] = None,
+                        use_cache: bool = True) -> str:
         """
         Call the LLM with the given prompt
         
         Args:
             prompt: Prompt to send to the LLM
+            validate: Optional check run on the response before it is cached;
+                it should raise if the response is unusable
+            use_cache: Whether to read and write the response cache
             
         Returns:
             LLM response text
         """
-        # Try OpenAI first if API key is available
-        if self.openai_api_key:
+        response, _, _ = await self._call_llm_with_source(prompt, validate, use_cache)
+        return response
+    
+    async def _call_llm_with_source(self, prompt: str, validate: Optional[Callable[[str], Any]] = None,
+                                    use_cache: bool = True) -> Tuple[str, str, str]:
+        """
+        Call the LLM with the given prompt, reporting which provider answered
+        
+        Args:
+            prompt: Prompt to send to the LLM
+            validate: Optional check run on the response before it is cached
+            use_cache: Whether to read and write the response cache
+            
+        Returns:
+            Tuple of (response text, provider, model); for a cached response,
+            the provider and model it was cached from
+        """
+        providers = self._providers()
+        cache = self.cache if use_cache else None
+        
+        if cache is not None:
+            sources = {
+                LLMCache.make_key(provider, model, self.temperature, prompt): (provider, model)
+                for provider, model in providers
+            }
+            cached = await get_execution_layer().run_in_thread(
+                "cache", cache.get_first, list(sources), step="llm_cache_lookup"
+            )
+            if cached is not None:
+                key, response = cached
+                return (response, *sources[key])
+        
+        # Concurrent identical prompts share one provider call
+        key = content_key(
+            prompt.encode("utf-8"),
+            providers=providers,
+            temperature=self.temperature,
+            max_output_tokens=self.max_output_tokens,
+            endpoints=[self.ollama_base_url, self.openai_api_base]
+        )
+        return await get_single_flight("llm_call").do(
+            key, lambda: self._call_uncached(prompt, validate, cache)
+        )
+    
+    async def _call_uncached(self, prompt: str, validate: Optional[Callable[[str], Any]],
+                             cache: Optional[LLMCache]) -> Tuple[str, str, str]:
+        """
+        Call the providers for a prompt that missed the cache
+        
+        Args:
+            prompt: Prompt to send to the LLM
+            validate: Optional check run on the response before it is cached
+            cache: Cache to store the response in, or None
+            
+        Returns:
+            Tuple of (response text, provider, model)
+        """
+        available = self._available_providers()
+        if self.hedging_enabled and len(available) > 1:
+            response, provider, model = await self._call_hedged(prompt, available)
+        else:
+            response, provider, model = await self._call_in_order(prompt, available)
+        
+        if validate is not None:
+            validate(response)
+        
+        if cache is not None:
             try:
-                return self._call_openai(prompt)
+                await get_execution_layer().run_in_thread(
+                    "cache", cache.set, LLMCache.make_key(provider, model, self.temperature, prompt), response,
+                    step="llm_cache_write"
+                )
             except Exception as e:
-                logger.warning(f"OpenAI call failed: {str(e)}")
+                logger.warning(f"Could not cache LLM response: {str(e)}")
         
-        # Fall back to Ollama
+        return response, provider, model
+    
+    def _available_providers(self) -> List[Tuple[str, str]]:
+        """
+        Get the providers whose circuit currently allows calls
+        
+        Returns:
+            List of (provider, model) tuples in order of preference
+            
+        Raises:
+            ProviderUnavailableError: If every provider's circuit is open
+        """
+        available = [
+            (provider, model) for provider, model in self._providers()
+            if get_provider_health(provider).breaker.allow_request()
+        ]
+        if not available:
+            raise ProviderUnavailableError("All LLM providers are unavailable (circuit open)")
+        return available
+    
+    async def _call_provider(self, provider: str, prompt: str) -> str:
+        """
+        Call one provider, recording its latency and outcome
+        
+        Args:
+            provider: Provider name
+            prompt: Prompt to send to the LLM
+            
+        Returns:
+            LLM response text
+        """
+        calls = {"openai": self._call_openai, "ollama": self._call_ollama}
+        models = {"openai": self.openai_model, "ollama": self.ollama_model}
+        health = get_provider_health(provider)
+        start = time.perf_counter()
         try:
-            return self._call_ollama(prompt)
-        except Exception as e:
-            logger.error(f"Ollama call failed: {str(e)}")
+            response = await calls[provider](prompt)
+        except asyncio.CancelledError:
+            # A losing hedged call is not a provider failure
+            self._record_call(provider, models[provider], "cancelled", start)
+            raise
+        except Exception:
+            self._record_call(provider, models[provider], "error", start)
+            health.record_failure()
             raise
+        health.record_success(self._record_call(provider, models[provider], "success", start))
+        return response
+    
+    def _record_call(self, provider: str, model: str, outcome: str, start: float) -> float:
+        """
+        Record a finished provider call in the latency metric and the request trace
+        
+        Args:
+            provider: Provider name
+            model: Model name
+            outcome: success, error or cancelled
+            start: time.perf_counter() when the call started
+        
+        Returns:
+            Seconds the call took
+        """
+        end = time.perf_counter()
+        LLM_CALL_SECONDS.labels(provider, model, outcome).observe(end - start)
+        trace = current_trace()
+        if trace is not None:
+            trace.add_span("llm_call", start, end, provider=provider, model=model, outcome=outcome)
+        return end - start
+    
+    async def _call_in_order(self, prompt: str, providers: List[Tuple[str, str]]) -> Tuple[str, str, str]:
+        """
+        Try providers one after another until one succeeds
+        
+        Args:
+            prompt: Prompt to send to the LLM
+            providers: (provider, model) tuples in order of preference
+            
+        Returns:
+            Tuple of (response text, provider, model)
+        """
+        for provider, model in providers:
+            try:
+                return await self._call_provider(provider, prompt), provider, model
+            except Exception as e:
+                if provider == providers[-1][0]:
+                    logger.error(f"{provider} call failed: {str(e)}")
+                    raise
+                logger.warning(f"{provider} call failed: {str(e)}")
+    
+    async def _call_hedged(self, prompt: str, providers: List[Tuple[str, str]]) -> Tuple[str, str, str]:
+        """
+        Call the primary provider and hedge with the backup if it is slow
+        
+        The backup is started once the primary has run longer than its p95
+        latency (or LLM_HEDGE_DELAY until enough samples exist), or as soon
+        as the primary fails. Whichever answers first wins and the other
+        call is cancelled.
+        
+        Args:
+            prompt: Prompt to send to the LLM
+            providers: (provider, model) tuples in order of preference
+            
+        Returns:
+            Tuple of (response text, provider, model)
+        """
+        (primary, primary_model), (backup, backup_model) = providers[0], providers[1]
+        hedge_delay = get_provider_health(primary).latency.percentile(self.hedge_percentile)
+        if hedge_delay is None:
+            hedge_delay = self.hedge_delay
+        
+        tasks = {asyncio.create_task(self._call_provider(primary, prompt)): (primary, primary_model)}
+        done, _ = await asyncio.wait(tasks.keys(), timeout=hedge_delay)
+        
+        try:
+            for task in done:
+                if task.exception() is None:
+                    return task.result(), primary, primary_model
+                logger.warning(f"{primary} call failed: {str(task.exception())}")
+                tasks.pop(task)
+            
+            logger.info(f"Hedging {primary} with {backup} after {hedge_delay:.2f}s")
+            tasks[asyncio.create_task(self._call_provider(backup, prompt))] = (backup, backup_model)
+            
+            last_error: Optional[BaseException] = None
+            pending = set(tasks.keys())
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    provider, model = tasks[task]
+                    if task.exception() is None:
+                        if provider == backup:
+                            get_provider_health(backup).hedges_won += 1
+                        return task.result(), provider, model
+                    logger.warning(f"{provider} call failed: {str(task.exception())}")
+                    last_error = task.exception()
+            raise last_error
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+    
+    def provider_stats(self) -> Dict[str, Any]:
+        """
+        Get latency and circuit state for each configured provider
+        
+        Returns:
+            Mapping of provider name to health metrics
+        """
+        return {
+            provider: {"model": model, **get_provider_health(provider).stats()}
+            for provider, model in self._providers()
+        }
+    
+    async def _stream_llm(self, prompt: str, answered: Optional[List[Tuple[str, str]]] = None) -> AsyncIterator[str]:
+        """
+        Stream LLM output for the given prompt
+        
+        Falls back to the next provider only if the previous one failed
+        before producing any output.
+        
+        Args:
+            prompt: Prompt to send to the LLM
+            answered: Optional list the (provider, model) producing the
+                output is appended to once it starts
+            
+        Yields:
+            Generated text chunks
+        """
+        streams = {"openai": self._stream_openai, "ollama": self._stream_ollama}
+        providers = self._available_providers()
+        for provider, model in providers:
+            health = get_provider_health(provider)
+            started = False
+            start = time.perf_counter()
+            try:
+                async for chunk in streams[provider](prompt):
+                    if not started and answered is not None:
+                        answered.append((provider, model))
+                    started = True
+                    yield chunk
+                health.record_success(self._record_call(provider, model, "success", start))
+                return
+            except Exception as e:
+                self._record_call(provider, model, "error", start)
+                health.record_failure()
+                if started or provider == providers[-1][0]:
+                    logger.error(f"{provider} stream failed: {str(e)}")
+                    raise
+                logger.warning(f"{provider} stream failed: {str(e)}")
     
-    def _call_openai(self, prompt: str) -> str:
+    async def _call_openai(self, prompt: str) -> str:
         """Call OpenAI API"""
-        response = openai.ChatCompletion.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {"role": "system", "content": "You are a helpful assistant that extracts structured data from documents."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.3,
-            max_tokens=2000
-        )
+        session = await self._get_session()
+        async with await self._acquire("openai"):
+            # Route the OpenAI client through the pooled session
+            token = openai.aiosession.set(session)
+            try:
+                response = await openai.ChatCompletion.acreate(
+                    model=self.openai_model,
+                    messages=[
+                        {"role": "system", "content": "You are a helpful assistant that extracts structured data from documents."},
+                        {"role": "user", "content": prompt}
+                    ],
+                    temperature=self.temperature,
+                    max_tokens=self.max_output_tokens,
+                    request_timeout=self.request_timeout,
+                    api_base=self.openai_api_base
+                )
+            finally:
+                openai.aiosession.reset(token)
         return response.choices[0].message.content.strip()
     
-    def _call_ollama(self, prompt: str) -> str:
+    async def _call_ollama(self, prompt: str) -> str:
         """Call Ollama API"""
         url = f"{self.ollama_base_url}/api/generate"
         payload = {
             "model": self.ollama_model,
             "prompt": prompt,
-            "stream": False
+            "stream": False,
+            "options": {
+                "num_predict": self.max_output_tokens,
+                "temperature": self.temperature
+            }
         }
         
-        response = requests.post(url, json=payload)
-        response.raise_for_status()
+        session = await self._get_session()
+        async with await self._acquire("ollama"):
+            async with session.post(url, json=payload) as response:
+                response.raise_for_status()
+                result = await response.json()
+        return result.get("response", "").strip()
+    
+    async def _stream_openai(self, prompt: str) -> AsyncIterator[str]:
+        """Stream tokens from OpenAI API"""
+        session = await self._get_session()
+        async with await self._acquire("openai"):
+            token = openai.aiosession.set(session)
+            try:
+                response = await openai.ChatCompletion.acreate(
+                    model=self.openai_model,
+                    messages=[
+                        {"role": "system", "content": "You are a helpful assistant that extracts structured data from documents."},
+                        {"role": "user", "content": prompt}
+                    ],
+                    temperature=self.temperature,
+                    max_tokens=self.max_output_tokens,
+                    request_timeout=self.request_timeout,
+                    api_base=self.openai_api_base,
+                    stream=True
+                )
+                async for chunk in response:
+                    content = chunk.choices[0].delta.get("content")
+                    if content:
+                        yield content
+            finally:
+                openai.aiosession.reset(token)
+    
+    async def _stream_ollama(self, prompt: str) -> AsyncIterator[str]:
+        """Stream tokens from Ollama API"""
+        url = f"{self.ollama_base_url}/api/generate"
+        payload = {
+            "model": self.ollama_model,
+            "prompt": prompt,
+            "stream": True,
+            "options": {
+                "num_predict": self.max_output_tokens,
+                "temperature": self.temperature
+            }
+        }
         
-        result = response.json()
-        return result.get("response", "").strip()
\ No newline at end of file
+        session = await self._get_session()
+        async with await self._acquire("ollama"):
+            async with session.post(url, json=payload) as response:
+                response.raise_for_status()
+                # Ollama streams one JSON object per line
+                async for line in response.content:
+                    if not line.strip():
+                        continue
+                    chunk = json.loads(line)
+                    if chunk.get("response"):
+                        yield chunk["response"]
+                    if chunk.get("done"):
+                        break
\ No newline at end of file
@@ -0,0 +1,348 @@
+import os
+import time
+import json
+import sqlite3
+import hashlib
+import logging
+import threading
+from typing import Dict, Any, Optional, List, Tuple
+
+from ai_service.services.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+class LLMCache:
+    """Disk-backed cache for LLM responses using SQLite"""
+    
+    # Run size-based eviction after this many writes
+    EVICTION_INTERVAL = 100
+    
+    # Write pending access times once this many hits have accumulated
+    ACCESS_FLUSH_SIZE = 1000
+    
+    # Keys per SELECT, under SQLite's bound parameter limit
+    LOOKUP_CHUNK_SIZE = 500
+    
+    def __init__(self, path: str = None, ttl_seconds: float = None, max_entries: int = None):
+        self.path = path or os.getenv("LLM_CACHE_PATH", "data/llm_cache.sqlite3")
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else float(os.getenv("LLM_CACHE_TTL", str(30 * 24 * 3600)))
+        self.max_entries = max_entries if max_entries is not None else int(os.getenv("LLM_CACHE_MAX_ENTRIES", "100000"))
+        
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._writes_since_eviction = 0
+        # Access times of hits not yet written; the LRU order only matters when evicting
+        self._touched: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS llm_cache ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+            "created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_accessed ON llm_cache (accessed_at)")
+        self._conn.commit()
+        logger.info(f"LLM cache opened at {self.path}")
+    
+    @staticmethod
+    def make_key(provider: str, model: str, temperature: float, prompt: str) -> str:
+        """
+        Build a cache key for an LLM request
+        
+        Args:
+            provider: LLM provider name
+            model: Model name
+            temperature: Sampling temperature
+            prompt: Prompt text, normalized by collapsing whitespace
+        
+        Returns:
+            Hex digest identifying the request
+        """
+        normalized_prompt = " ".join(prompt.split())
+        prompt_hash = hashlib.sha256(normalized_prompt.encode("utf-8")).hexdigest()
+        return f"{provider}:{model}:{temperature:g}:{prompt_hash}"
+    
+    def get(self, key: str, record_miss: bool = True) -> Optional[str]:
+        """
+        Look up a cached response
+        
+        Args:
+            key: Cache key from make_key
+            record_miss: Whether a miss counts towards the hit-rate metrics
+        
+        Returns:
+            Cached response text, or None on a miss or expired entry
+        """
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, created_at FROM llm_cache WHERE key = ?", (key,)
+            ).fetchone()
+            
+            if row is None:
+                if record_miss:
+                    self.misses += 1
+                return None
+            
+            value, created_at = row
+            if now - created_at > self.ttl_seconds:
+                self._conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                self._conn.commit()
+                if record_miss:
+                    self.misses += 1
+                self.evictions += 1
+                return None
+            
+            self._touch(key, now)
+            self.hits += 1
+            return value
+    
+    def get_many(self, keys: List[str]) -> Dict[str, str]:
+        """
+        Look up several cached responses in one query
+        
+        Each key found counts as a hit and each key missing as a miss. This
+        blocks on SQLite, so async callers run it in the thread pool.
+        
+        Args:
+            keys: Cache keys from make_key
+        
+        Returns:
+            Mapping of key to cached response text, for the keys cached
+        """
+        with self._lock:
+            found = self._lookup(keys)
+            self.hits += sum(1 for key in keys if key in found)
+            self.misses += sum(1 for key in keys if key not in found)
+        return found
+    
+    def get_first_many(self, candidates: List[List[str]]) -> List[Optional[Tuple[str, str]]]:
+        """
+        Look up the first cached response of each list of candidate keys in one query
+        
+        Each list counts as a single hit or miss. This blocks on SQLite, so
+        async callers run it in the thread pool.
+        
+        Args:
+            candidates: Cache keys in order of preference, one list per request
+        
+        Returns:
+            (key, cached response text) of the first cached key of each list,
+            or None where no key is cached, in input order
+        """
+        with self._lock:
+            found = self._lookup([key for keys in candidates for key in keys])
+            results = [next(((key, found[key]) for key in keys if key in found), None) for keys in candidates]
+            self.hits += sum(1 for result in results if result is not None)
+            self.misses += sum(1 for result in results if result is None)
+        return results
+    
+    def _lookup(self, keys: List[str]) -> Dict[str, str]:
+        """Read unexpired entries in chunks, deleting expired ones; the caller holds the lock and counts hits"""
+        now = time.time()
+        unique = list(dict.fromkeys(keys))
+        found: Dict[str, str] = {}
+        expired = []
+        for start in range(0, len(unique), self.LOOKUP_CHUNK_SIZE):
+            chunk = unique[start:start + self.LOOKUP_CHUNK_SIZE]
+            rows = self._conn.execute(
+                f"SELECT key, value, created_at FROM llm_cache WHERE key IN ({','.join('?' * len(chunk))})",
+                chunk
+            ).fetchall()
+            for key, value, created_at in rows:
+                if now - created_at > self.ttl_seconds:
+                    expired.append(key)
+                else:
+                    found[key] = value
+                    self._touch(key, now)
+            
+        if expired:
+            self._conn.executemany("DELETE FROM llm_cache WHERE key = ?", [(key,) for key in expired])
+            self._conn.commit()
+            self.evictions += len(expired)
+        return found
+    
+    def _touch(self, key: str, now: float):
+        """Record a hit's access time, writing them in bulk once enough are pending"""
+        self._touched[key] = now
+        if len(self._touched) >= self.ACCESS_FLUSH_SIZE:
+            self._flush_access_times()
+            self._conn.commit()
+    
+    def _flush_access_times(self):
+        """Write pending access times; the caller commits"""
+        if self._touched:
+            self._conn.executemany(
+                "UPDATE llm_cache SET accessed_at = ? WHERE key = ?",
+                [(accessed_at, key) for key, accessed_at in self._touched.items()]
+            )
+            self._touched = {}
+    
+    def get_first(self, keys: List[str]) -> Optional[Tuple[str, str]]:
+        """
+        Look up the first cached response among several candidate keys
+        
+        Counts as a single hit or miss regardless of how many keys are tried.
+        
+        Args:
+            keys: Cache keys in order of preference
+        
+        Returns:
+            (key, cached response text) of the first cached key, or None if
+            no key is cached
+        """
+        return self.get_first_many([keys])[0]
+    
+    def set(self, key: str, value: str):
+        """
+        Store a response in the cache
+        
+        Args:
+            key: Cache key from make_key
+            value: Response text
+        """
+        self.set_many({key: value})
+    
+    def set_many(self, values: Dict[str, str]):
+        """
+        Store several responses in one transaction
+        
+        This blocks on SQLite, so async callers run it in the thread pool.
+        
+        Args:
+            values: Mapping of cache key to response text
+        """
+        if not values:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO llm_cache (key, value, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                [(key, value, now, now) for key, value in values.items()]
+            )
+            for key in values:
+                self._touched.pop(key, None)
+            self._flush_access_times()
+            self._conn.commit()
+            
+            self._writes_since_eviction += len(values)
+            if self._writes_since_eviction >= self.EVICTION_INTERVAL:
+                self._evict(now)
+    
+    def get_json(self, key: str) -> Optional[Any]:
+        """Look up a cached JSON value"""
+        value = self.get(key)
+        return json.loads(value) if value is not None else None
+    
+    def set_json(self, key: str, value: Any):
+        """Store a JSON-serializable value in the cache"""
+        self.set(key, json.dumps(value))
+    
+    def set_json_many(self, values: Dict[str, Any]):
+        """Store several JSON-serializable values in one transaction"""
+        self.set_many({key: json.dumps(value) for key, value in values.items()})
+    
+    def _evict(self, now: float):
+        """Remove expired entries and the least recently used entries over the size limit"""
+        self._writes_since_eviction = 0
+        self._flush_access_times()
+        
+        cursor = self._conn.execute("DELETE FROM llm_cache WHERE created_at < ?", (now - self.ttl_seconds,))
+        evicted = cursor.rowcount
+        
+        (count,) = self._conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()
+        if count > self.max_entries:
+            cursor = self._conn.execute(
+                "DELETE FROM llm_cache WHERE key IN "
+                "(SELECT key FROM llm_cache ORDER BY accessed_at LIMIT ?)",
+                (count - self.max_entries,)
+            )
+            evicted += cursor.rowcount
+        
+        self._conn.commit()
+        self.evictions += evicted
+        if evicted:
+            logger.info(f"Evicted {evicted} entries from LLM cache")
+    
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get cache hit-rate metrics
+        
+        Returns:
+            Dictionary with hits, misses, hit rate, evictions and entry count
+        """
+        with self._lock:
+            (entries,) = self._conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "enabled": True,
+            "path": self.path,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "entries": entries,
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds
+        }
+    
+    def clear(self):
+        """Remove all cached entries"""
+        with self._lock:
+            self._conn.execute("DELETE FROM llm_cache")
+            self._touched = {}
+            self._conn.commit()
+    
+    def close(self):
+        """Close the underlying database connection"""
+        with self._lock:
+            self._flush_access_times()
+            self._conn.commit()
+            self._conn.close()
+
+_caches: Dict[str, LLMCache] = {}
+_caches_lock = threading.Lock()
+
+def _collect_metrics():
+    """LLM cache hit counts, read when metrics are scraped"""
+    with _caches_lock:
+        caches = list(_caches.values())
+    if not caches:
+        return []
+    return [
+        ("ampere_llm_cache_hits_total", "counter", "LLM prompts answered from the response cache", [({}, sum(cache.hits for cache in caches))]),
+        ("ampere_llm_cache_misses_total", "counter", "LLM prompts not found in the response cache", [({}, sum(cache.misses for cache in caches))]),
+        ("ampere_llm_cache_evictions_total", "counter", "LLM cache entries evicted", [({}, sum(cache.evictions for cache in caches))])
+    ]
+
+REGISTRY.register_collector(_collect_metrics)
+
+def get_llm_cache(path: str = None) -> Optional[LLMCache]:
+    """
+    Get the shared LLM cache for a database path
+    
+    Services pointing at the same file share one connection and one set of
+    hit-rate counters.
+    
+    Args:
+        path: Cache database path, defaults to LLM_CACHE_PATH
+    
+    Returns:
+        Shared LLMCache, or None if caching is disabled
+    """
+    if os.getenv("LLM_CACHE_ENABLED", "true").lower() != "true":
+        return None
+    
+    path = path or os.getenv("LLM_CACHE_PATH", "data/llm_cache.sqlite3")
+    with _caches_lock:
+        if path not in _caches:
+            _caches[path] = LLMCache(path)
+        return _caches[path]
@@ -0,0 +1,257 @@
+import math
+import bisect
+import logging
+import threading
+from abc import ABC, abstractmethod
+from typing import Dict, Any, Callable, Iterable, List, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Upper bounds in seconds; document stages run from milliseconds to minutes
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+# A family collected at scrape time: (name, type, help, [(labels, value), ...])
+Family = Tuple[str, str, str, List[Tuple[Dict[str, str], float]]]
+
+class _CounterChild:
+    """Value of a counter for one set of label values"""
+    
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+    
+    def inc(self, amount: float = 1):
+        """Add to the counter"""
+        with self._lock:
+            self.value += amount
+
+class _HistogramChild:
+    """Buckets of a histogram for one set of label values"""
+    
+    def __init__(self, bounds: Tuple[float, ...]):
+        self.bounds = bounds
+        # Per-bucket counts, the last one above every bound; made cumulative when rendered
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+    
+    def observe(self, value: float):
+        """Record one observation"""
+        position = bisect.bisect_left(self.bounds, value)
+        with self._lock:
+            self.counts[position] += 1
+            self.sum += value
+    
+    def snapshot(self) -> Tuple[List[int], float]:
+        with self._lock:
+            return list(self.counts), self.sum
+
+class _Metric(ABC):
+    """A metric with fixed label names and one child per set of label values"""
+    
+    kind = ""
+    
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], Any] = {}
+        self._lock = threading.Lock()
+    
+    def labels(self, *values: Any):
+        """
+        Get the child for a set of label values, creating it on first use
+        
+        Args:
+            *values: One value per label name, in order
+        
+        Returns:
+            Child to record values on
+        """
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} takes labels {self.labelnames}, got {values}")
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+    
+    @abstractmethod
+    def _new_child(self) -> Any:
+        """Create the child for a new set of label values"""
+    
+    @abstractmethod
+    def render(self) -> List[str]:
+        """Render the samples of every child in the text format"""
+    
+    def children(self) -> List[Tuple[Dict[str, str], Any]]:
+        with self._lock:
+            items = list(self._children.items())
+        items.sort(key=lambda item: tuple(str(value) for value in item[0]))
+        return [({name: str(value) for name, value in zip(self.labelnames, key)}, child) for key, child in items]
+
+class Counter(_Metric):
+    """Monotonic total, e.g. pages processed"""
+    
+    kind = "counter"
+    
+    def _new_child(self) -> _CounterChild:
+        return _CounterChild()
+    
+    def inc(self, amount: float = 1):
+        """Add to a counter without labels"""
+        self.labels().inc(amount)
+    
+    def render(self) -> List[str]:
+        return [_sample(self.name, labels, child.value) for labels, child in self.children()]
+
+class Histogram(_Metric):
+    """Distribution of observed values, e.g. stage latencies in seconds"""
+    
+    kind = "histogram"
+    
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+    
+    def _new_child(self) -> _HistogramChild:
+        return _HistogramChild(self.buckets)
+    
+    def observe(self, value: float):
+        """Record an observation on a histogram without labels"""
+        self.labels().observe(value)
+    
+    def render(self) -> List[str]:
+        lines = []
+        for labels, child in self.children():
+            counts, total = child.snapshot()
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                lines.append(_sample(f"{self.name}_bucket", {**labels, "le": _format_value(bound)}, cumulative))
+            lines.append(_sample(f"{self.name}_sum", labels, total))
+            lines.append(_sample(f"{self.name}_count", labels, cumulative))
+        return lines
+
+class MetricsRegistry:
+    """
+    Metrics of one worker, rendered in the Prometheus text format
+    
+    Hot paths record into counters and histograms, which cost a dictionary
+    lookup, a bisect and an uncontended lock per observation. State that
+    services already keep, such as queue depth or cache hit counts, is read
+    by collectors when the metrics are scraped instead of being mirrored.
+    """
+    
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._collectors: List[Callable[[], Iterable[Family]]] = []
+        self._lock = threading.Lock()
+    
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        """Create and register a counter"""
+        return self._register(Counter(name, help, labelnames))
+    
+    def histogram(self, name: str, help: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        """Create and register a histogram"""
+        return self._register(Histogram(name, help, labelnames, buckets))
+    
+    def _register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} is already registered")
+            self._metrics[metric.name] = metric
+        return metric
+    
+    def register_collector(self, collector: Callable[[], Iterable[Family]]):
+        """
+        Add a function called on every scrape
+        
+        Args:
+            collector: Function returning (name, type, help, samples) families,
+                where samples are (labels, value) pairs
+        """
+        with self._lock:
+            self._collectors.append(collector)
+    
+    def render(self) -> str:
+        """
+        Render every metric in the Prometheus text exposition format
+        
+        Returns:
+            Exposition text
+        """
+        with self._lock:
+            metrics = list(self._metrics.values())
+            collectors = list(self._collectors)
+        
+        lines = []
+        for metric in metrics:
+            lines.extend(_header(metric.name, metric.kind, metric.help))
+            lines.extend(metric.render())
+        for collector in collectors:
+            try:
+                families = list(collector())
+            except Exception as e:
+                logger.error(f"Error collecting metrics: {str(e)}")
+                continue
+            for name, kind, help, samples in families:
+                lines.extend(_header(name, kind, help))
+                lines.extend(_sample(name, labels, value) for labels, value in samples)
+        return "\n".join(lines) + "\n"
+
+def _header(name: str, kind: str, help: str) -> List[str]:
+    escaped = help.replace("\\", "\\\\").replace("\n", "\\n")
+    return [f"# HELP {name} {escaped}", f"# TYPE {name} {kind}"]
+
+def _sample(name: str, labels: Dict[str, str], value: float) -> str:
+    if not labels:
+        return f"{name} {_format_value(value)}"
+    rendered = ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items())
+    return f"{name}{{{rendered}}} {_format_value(value)}"
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+# Shared by the worker; scraped at /metrics
+REGISTRY = MetricsRegistry()
+
+STEP_SECONDS = REGISTRY.histogram(
+    "ampere_step_duration_seconds",
+    "Time spent in each document processing step, once it is running in the executor",
+    ["step"]
+)
+LLM_CALL_SECONDS = REGISTRY.histogram(
+    "ampere_llm_call_duration_seconds",
+    "LLM provider call latency by provider, model and outcome",
+    ["provider", "model", "outcome"],
+    buckets=(0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0, 300.0)
+)
+UPLOAD_BYTES = REGISTRY.counter(
+    "ampere_upload_bytes_total",
+    "Bytes of accepted uploads"
+)
+DOCUMENT_PAGES = REGISTRY.counter(
+    "ampere_document_pages_total",
+    "Pages of accepted uploads: counted PDF pages, and one per image",
+    ["kind"]
+)
+ITEMS_PROCESSED = REGISTRY.counter(
+    "ampere_items_processed_total",
+    "Invoices extracted and SOR/BOQ items priced",
+    ["kind", "mode"]
+)
+
+def render_metrics() -> str:
+    """Render the worker's metrics in the Prometheus text format"""
+    return REGISTRY.render()
@@ -0,0 +1,33 @@
+import re
+
+# A number written with currency, thousands separators, accounting parentheses
+# or a unit, e.g. "$1,250.00", "(5)", "12 m3" or "3.50/m2"
+NUMBER_TEXT_PATTERN = re.compile(
+    r"""^\s*(?P<open>\()?\s*(?P<sign>[-+\u2212])?\s*
+    (?:[a-z]{1,3}\.?\s*)?[$\u20ac\u00a3\u00a5\u20b9]?\s*
+    (?P<number>\d{1,3}(?:,\d{2,3})*,\d{3}(?:\.\d+)?|\d+(?:\.\d+)?|\.\d+)\s*
+    (?P<close>\))?
+    (?P<unit>(?:\s*/?\s*[a-z][a-z0-9\u00b2\u00b3.]*)*)\s*$""",
+    re.IGNORECASE | re.VERBOSE
+)
+
+def parse_number_text(text: str) -> float:
+    """
+    Parse a number written with currency, separators or a unit
+    
+    Only the leading number is read, after removing a currency symbol or
+    code and thousands separators. Accounting parentheses make it negative.
+    Anything that could mean more than one number, such as '12-15', '1.2.3'
+    or '12,5', is not a number.
+    
+    Args:
+        text: Text of a quantity, rate or total, e.g. '(1,250.00)' or '12 m3'
+    
+    Returns:
+        The number, or NaN if the text is not one unambiguous number
+    """
+    match = NUMBER_TEXT_PATTERN.match(text)
+    if match is None or bool(match["open"]) != bool(match["close"]) or (match["open"] and match["sign"]):
+        return float("nan")
+    value = float(match["number"].replace(",", ""))
+    return -value if match["open"] or match["sign"] in ("-", "\u2212") else value
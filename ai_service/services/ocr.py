@@ -1,8 +1,5 @@
 import logging
-from typing import Dict, Any, Optional
-import pytesseract
-from PIL import Image
-import pdfplumber
+from typing import Dict, Any, Optional, Union
 import io
 
 logger = logging.getLogger(__name__)
@@ -13,37 +10,41 @@ class OCRService:
     def __init__(self):
         pass
     
-    def extract_text_from_image(self, image_bytes: bytes) -> str:
+    def extract_text_from_image(self, image_source: Union[bytes, str]) -> str:
         """
-        Extract text from image bytes using OCR
+        Extract text from an image using OCR
         
         Args:
-            image_bytes: Image file bytes
+            image_source: Image file bytes, or a file path to read it from
             
         Returns:
             Extracted text from the image
         """
+        # Imported on first use so pattern matching does not load the OCR stack
+        import pytesseract
+        from PIL import Image
         try:
-            image = Image.open(io.BytesIO(image_bytes))
-            text = pytesseract.image_to_string(image)
-            return text
+            image = Image.open(image_source if isinstance(image_source, str) else io.BytesIO(image_source))
+            with image:
+                return pytesseract.image_to_string(image)
         except Exception as e:
             logger.error(f"Error extracting text from image: {str(e)}")
             raise
     
-    def extract_text_from_pdf(self, pdf_bytes: bytes) -> str:
+    def extract_text_from_pdf(self, pdf_source: Union[bytes, str]) -> str:
         """
-        Extract text from PDF bytes
+        Extract text from a PDF
         
         Args:
-            pdf_bytes: PDF file bytes
+            pdf_source: PDF file bytes or file path
             
         Returns:
             Extracted text from the PDF
         """
+        import pdfplumber
         try:
             text = ""
-            with pdfplumber.open(io.BytesIO(pdf_bytes)) as pdf:
+            with pdfplumber.open(pdf_source if isinstance(pdf_source, str) else io.BytesIO(pdf_source)) as pdf:
                 for page in pdf.pages:
                     text += page.extract_text() or ""
             return text
@@ -1,24 +1,117 @@
 import io
+import time
 import logging
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Union, Iterator, Optional, Tuple
 import pdfplumber
+from pdfplumber.page import Page
+from pdfminer.pdftypes import PDFStream, resolve1
+from pdfminer.psparser import LIT
 import pandas as pd
 from PIL import Image
 
 logger = logging.getLogger(__name__)
 
+LITERAL_IMAGE = LIT("Image")
+
 class PDFUtils:
     """Utility service for processing PDF documents"""
     
     def __init__(self):
         pass
     
-    def extract_tables_from_pdf(self, pdf_bytes: bytes) -> List[List[List[str]]]:
+    def _open(self, pdf_source: Union[bytes, str]) -> pdfplumber.PDF:
+        """Open a PDF from bytes, or from a file path without reading it into memory"""
+        if isinstance(pdf_source, str):
+            return pdfplumber.open(pdf_source)
+        return pdfplumber.open(io.BytesIO(pdf_source))
+    
+    def _iter_pages(self, pdf: pdfplumber.PDF, page_seconds: Optional[List[float]] = None) -> Iterator[Page]:
         """
-        Extract tables from PDF bytes
+        Iterate over pages, releasing each page's parsed objects once done
+        
+        pdfplumber keeps the layout of every page it has parsed, and
+        pdfminer caches every object it resolves, including image streams,
+        so a large or scanned PDF would otherwise stay in memory in full.
+        Fonts and other shared objects stay cached.
         
         Args:
-            pdf_bytes: PDF file bytes
+            pdf: Open PDF
+            page_seconds: List to append the time spent on each page to, if any
+        """
+        for page in pdf.pages:
+            start = time.perf_counter()
+            yield page
+            if page_seconds is not None:
+                page_seconds.append(time.perf_counter() - start)
+            page.flush_cache()
+            # pdfminer's object cache is private; skip dropping images if it changes
+            cache = getattr(pdf.doc, "_cached_objs", None)
+            if not isinstance(cache, dict):
+                continue
+            images = [
+                objid for objid, (obj, _) in cache.items()
+                if isinstance(obj, PDFStream) and obj.get("Subtype") == LITERAL_IMAGE
+            ]
+            for objid in images:
+                del cache[objid]
+    
+    def count_pages(self, pdf_source: Union[bytes, str]) -> int:
+        """
+        Count the pages of a PDF without parsing its pages
+        
+        Args:
+            pdf_source: PDF file bytes or file path
+            
+        Returns:
+            Number of pages
+        """
+        with self._open(pdf_source) as pdf:
+            # The page tree root records the total, so no page is loaded
+            pages = resolve1(pdf.doc.catalog.get("Pages"))
+            if isinstance(pages, dict) and "Count" in pages:
+                return int(resolve1(pages["Count"]))
+            return len(pdf.pages)
+    
+    def extract_text_from_pdf(self, pdf_source: Union[bytes, str], page_seconds: Optional[List[float]] = None) -> str:
+        """
+        Extract text from a PDF
+        
+        Args:
+            pdf_source: PDF file bytes or file path
+            page_seconds: List to append the time spent on each page to, if any
+            
+        Returns:
+            Text of all pages, separated by newlines so the last line of a
+            page does not run into the first line of the next
+        """
+        try:
+            with self._open(pdf_source) as pdf:
+                return "\n".join(page.extract_text() or "" for page in self._iter_pages(pdf, page_seconds))
+        except Exception as e:
+            logger.error(f"Error extracting text from PDF: {str(e)}")
+            raise
+    
+    def extract_text_from_pdf_timed(self, pdf_source: Union[bytes, str]) -> Tuple[str, List[float]]:
+        """
+        Extract text from a PDF, timing each page
+        
+        Args:
+            pdf_source: PDF file bytes or file path
+        
+        Returns:
+            Tuple of (text of all pages, seconds spent on each page)
+        """
+        page_seconds = []
+        return self.extract_text_from_pdf(pdf_source, page_seconds), page_seconds
+    
+    def extract_tables_from_pdf(self, pdf_source: Union[bytes, str],
+                                page_seconds: Optional[List[float]] = None) -> List[List[List[str]]]:
+        """
+        Extract tables from a PDF
+        
+        Args:
+            pdf_source: PDF file bytes or file path
+            page_seconds: List to append the time spent on each page to, if any
             
         Returns:
             List of tables, where each table is a list of rows, 
@@ -26,8 +119,8 @@ class PDFUtils:
         """
         try:
             tables = []
-            with pdfplumber.open(io.BytesIO(pdf_bytes)) as pdf:
-                for page in pdf.pages:
+            with self._open(pdf_source) as pdf:
+                for page in self._iter_pages(pdf, page_seconds):
                     page_tables = page.extract_tables()
                     if page_tables:
                         tables.extend(page_tables)
@@ -36,20 +129,33 @@ class PDFUtils:
             logger.error(f"Error extracting tables from PDF: {str(e)}")
             raise
     
-    def extract_images_from_pdf(self, pdf_bytes: bytes) -> List[bytes]:
+    def extract_tables_from_pdf_timed(self, pdf_source: Union[bytes, str]) -> Tuple[List[List[List[str]]], List[float]]:
+        """
+        Extract tables from a PDF, timing each page
+        
+        Args:
+            pdf_source: PDF file bytes or file path
+        
+        Returns:
+            Tuple of (tables, seconds spent on each page)
+        """
+        page_seconds = []
+        return self.extract_tables_from_pdf(pdf_source, page_seconds), page_seconds
+    
+    def extract_images_from_pdf(self, pdf_source: Union[bytes, str]) -> List[bytes]:
         """
-        Extract images from PDF bytes
+        Extract images from a PDF
         
         Args:
-            pdf_bytes: PDF file bytes
+            pdf_source: PDF file bytes or file path
             
         Returns:
             List of image bytes
         """
         try:
             images = []
-            with pdfplumber.open(io.BytesIO(pdf_bytes)) as pdf:
-                for page in pdf.pages:
+            with self._open(pdf_source) as pdf:
+                for page in self._iter_pages(pdf):
                     for image in page.images:
                         try:
                             # Extract image bytes
@@ -63,19 +169,19 @@ class PDFUtils:
             logger.error(f"Error extracting images from PDF: {str(e)}")
             raise
     
-    def pdf_to_images(self, pdf_bytes: bytes) -> List[Image.Image]:
+    def pdf_to_images(self, pdf_source: Union[bytes, str]) -> List[Image.Image]:
         """
         Convert PDF pages to PIL Images
         
         Args:
-            pdf_bytes: PDF file bytes
+            pdf_source: PDF file bytes or file path
             
         Returns:
             List of PIL Images, one for each page
         """
         try:
             images = []
-            with pdfplumber.open(io.BytesIO(pdf_bytes)) as pdf:
+            with self._open(pdf_source) as pdf:
                 for page in pdf.pages:
                     # Convert page to image
                     image = page.to_image(resolution=150)
@@ -87,18 +193,18 @@ class PDFUtils:
             logger.error(f"Error converting PDF to images: {str(e)}")
             raise
     
-    def extract_metadata(self, pdf_bytes: bytes) -> Dict[str, Any]:
+    def extract_metadata(self, pdf_source: Union[bytes, str]) -> Dict[str, Any]:
         """
         Extract metadata from PDF
         
         Args:
-            pdf_bytes: PDF file bytes
+            pdf_source: PDF file bytes or file path
             
         Returns:
             Dictionary with PDF metadata
         """
         try:
-            with pdfplumber.open(io.BytesIO(pdf_bytes)) as pdf:
+            with self._open(pdf_source) as pdf:
                 metadata = pdf.metadata or {}
                 return {
                     "title": metadata.get("Title", ""),
@@ -0,0 +1,180 @@
+import os
+import re
+import logging
+from typing import Dict, Any, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Word runs and individual punctuation marks roughly track BPE token boundaries
+TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+
+def estimate_tokens(text: str) -> int:
+    """
+    Estimate the number of LLM tokens in a piece of text
+    
+    Takes the larger of the four-characters-per-token rule of thumb and a
+    count of word and punctuation runs, which is closer for the numeric,
+    punctuation-heavy text found on invoices. Good enough for budgeting
+    without loading a tokenizer.
+    
+    Args:
+        text: Text to estimate
+    
+    Returns:
+        Estimated token count
+    """
+    return max(1, len(text) // 4, len(TOKEN_PATTERN.findall(text)))
+
+class PromptCompactor:
+    """Shrinks invoice text to the regions the LLM needs before prompting"""
+    
+    # Headings and lines that carry no extractable invoice data
+    BOILERPLATE_PATTERNS = [
+        r"^terms\s*(and|&)\s*conditions\W*$",
+        r"^page\s*\d+\s*(of|/)\s*\d+$",
+        r"thank\s*you\s*for\s*your\s*(business|order|support)",
+        r"computer[\s-]*generated",
+        r"no\s*signature\s*(is\s*)?required",
+        r"e\s*\.?\s*&\s*o\s*\.?\s*e",
+        r"please\s*detach",
+        r"goods\s*sold\s*are\s*not\s*(returnable|refundable)",
+        r"interest\s*(will|shall)\s*be\s*charged",
+        r"^\W+$",
+    ]
+    
+    # Headings that start a boilerplate section (terms, remittance slips);
+    # a heading with a value, e.g. "Terms and Conditions: Net 30", is a field
+    SECTION_PATTERNS = [
+        r"^terms\s*(and|&)\s*conditions\W*$",
+        r"^remittance\s*(advice|slip)\W*$",
+        r"^payment\s*(instructions|slip)\W*$",
+    ]
+    
+    TOTALS_PATTERN = re.compile(
+        r"\b(sub[\s-]*total|total|gst|vat|tax|amount\s*due|balance\s*due|grand\s*total|discount)\b",
+        re.IGNORECASE
+    )
+    KEY_FIELD_PATTERN = re.compile(
+        r"\b(invoice|inv|tax\s*invoice|bill\s*to|date|due|terms|po|purchase\s*order|"
+        r"tel|phone|fax|email|e-mail|uen|gst\s*reg)\b|@",
+        re.IGNORECASE
+    )
+    AMOUNT_PATTERN = re.compile(r"\d[\d,]*\.\d{2}\b")
+    NUMBER_PATTERN = re.compile(r"\d+(?:[.,]\d+)*")
+    
+    def __init__(self, token_budget: int = None, header_lines: int = None):
+        self.token_budget = token_budget if token_budget is not None else int(os.getenv("PROMPT_TOKEN_BUDGET", "1500"))
+        self.header_lines = header_lines if header_lines is not None else int(os.getenv("PROMPT_HEADER_LINES", "12"))
+        self._boilerplate = [re.compile(pattern, re.IGNORECASE) for pattern in self.BOILERPLATE_PATTERNS]
+        self._sections = [re.compile(pattern, re.IGNORECASE) for pattern in self.SECTION_PATTERNS]
+    
+    def compact(self, text: str) -> Tuple[str, Dict[str, Any]]:
+        """
+        Compact invoice text for an LLM prompt
+        
+        Drops boilerplate and repeated page headers, keeps the header,
+        line-item and totals regions, and trims line items to fit the token
+        budget. A boilerplate section such as the terms runs from its heading
+        to the next line item, totals line or repeated page header. Line items
+        are never deduplicated, since the same item can be billed twice.
+        
+        Args:
+            text: Raw text from invoice document
+        
+        Returns:
+            Tuple of (compacted text, prompt size statistics)
+        """
+        lines = [" ".join(line.split()) for line in text.splitlines()]
+        lines = [line for line in lines if line]
+        
+        kept: List[Tuple[str, str]] = []  # (region, line)
+        seen = set()
+        dropped_boilerplate = 0
+        dropped_duplicates = 0
+        in_boilerplate_section = False
+        
+        for line in lines:
+            in_header = len(kept) < self.header_lines
+            if not in_header and any(pattern.search(line) for pattern in self._sections):
+                in_boilerplate_section = True
+                dropped_boilerplate += 1
+                continue
+            
+            is_totals = bool(self.TOTALS_PATTERN.search(line) and self.AMOUNT_PATTERN.search(line))
+            is_item = not is_totals and bool(self.AMOUNT_PATTERN.search(line))
+            normalized = line.lower()
+            if in_boilerplate_section:
+                if is_totals or is_item or normalized in seen:
+                    in_boilerplate_section = False
+                else:
+                    dropped_boilerplate += 1
+                    continue
+            
+            if any(pattern.search(line) for pattern in self._boilerplate):
+                dropped_boilerplate += 1
+                continue
+            
+            if not is_item:
+                if normalized in seen:
+                    # Repeated page headers, column titles and remittance copies
+                    dropped_duplicates += 1
+                    continue
+                seen.add(normalized)
+            
+            if in_header:
+                region = "header"
+            elif is_totals:
+                region = "totals"
+            elif self.KEY_FIELD_PATTERN.search(line):
+                region = "key_field"
+            elif is_item or len(self.NUMBER_PATTERN.findall(line)) >= 2:
+                region = "line_item"
+            else:
+                dropped_boilerplate += 1
+                continue
+            kept.append((region, line))
+        
+        kept, omitted = self._fit_budget(kept)
+        compacted = "\n".join(line for _, line in kept)
+        
+        stats = {
+            "original_tokens": estimate_tokens(text) if text else 0,
+            "compacted_tokens": estimate_tokens(compacted) if compacted else 0,
+            "original_lines": len(lines),
+            "compacted_lines": len(kept),
+            "dropped_boilerplate": dropped_boilerplate,
+            "dropped_duplicates": dropped_duplicates,
+            "omitted_for_budget": omitted
+        }
+        return compacted, stats
+    
+    def _fit_budget(self, kept: List[Tuple[str, str]]) -> Tuple[List[Tuple[str, str]], int]:
+        """
+        Drop line items from the end until the text fits the token budget
+        
+        Header, key field and totals lines are always kept.
+        
+        Args:
+            kept: (region, line) pairs in document order
+        
+        Returns:
+            Tuple of (lines that fit, number of line items omitted)
+        """
+        total = sum(estimate_tokens(line) for _, line in kept)
+        if total <= self.token_budget:
+            return kept, 0
+        
+        line_item_positions = [i for i, (region, _) in enumerate(kept) if region == "line_item"]
+        dropped = set()
+        for position in reversed(line_item_positions):
+            if total <= self.token_budget:
+                break
+            total -= estimate_tokens(kept[position][1])
+            dropped.add(position)
+        
+        result = [entry for i, entry in enumerate(kept) if i not in dropped]
+        if dropped:
+            logger.info(f"Omitted {len(dropped)} line items to fit prompt budget of {self.token_budget} tokens")
+            # Tell the model the item list is partial, where the omitted items were
+            result.insert(min(dropped), ("marker", f"[... {len(dropped)} more line items omitted ...]"))
+        return result, len(dropped)
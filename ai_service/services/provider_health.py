@@ -0,0 +1,161 @@
+import os
+import time
+import logging
+import threading
+from collections import deque
+from typing import Dict, Any, Optional
+
+logger = logging.getLogger(__name__)
+
+class LatencyTracker:
+    """Rolling window of call latencies for one provider"""
+    
+    def __init__(self, window: int = None, min_samples: int = None):
+        self.window = window if window is not None else int(os.getenv("LLM_LATENCY_WINDOW", "100"))
+        self.min_samples = min_samples if min_samples is not None else int(os.getenv("LLM_LATENCY_MIN_SAMPLES", "20"))
+        self._samples = deque(maxlen=self.window)
+        self._lock = threading.Lock()
+    
+    def record(self, seconds: float):
+        """Record the latency of a successful call"""
+        with self._lock:
+            self._samples.append(seconds)
+    
+    def percentile(self, p: float) -> Optional[float]:
+        """
+        Get a latency percentile over the window
+        
+        Args:
+            p: Percentile between 0 and 100
+        
+        Returns:
+            Latency in seconds, or None until enough samples are collected
+        """
+        with self._lock:
+            if len(self._samples) < self.min_samples:
+                return None
+            ordered = sorted(self._samples)
+        rank = min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))
+        return ordered[rank]
+    
+    def count(self) -> int:
+        """Number of samples in the window"""
+        with self._lock:
+            return len(self._samples)
+
+class CircuitBreaker:
+    """
+    Circuit breaker for one provider
+    
+    Opens after a run of consecutive failures so the provider is skipped,
+    then lets calls through again (half-open) once the reset timeout has
+    passed. A success closes the circuit; a failure while half-open opens
+    it again.
+    """
+    
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+    
+    def __init__(self, failure_threshold: int = None, reset_timeout: float = None):
+        self.failure_threshold = failure_threshold if failure_threshold is not None else int(os.getenv("LLM_CIRCUIT_FAILURE_THRESHOLD", "5"))
+        self.reset_timeout = reset_timeout if reset_timeout is not None else float(os.getenv("LLM_CIRCUIT_RESET_TIMEOUT", "30"))
+        self.consecutive_failures = 0
+        self.opened_at: Optional[float] = None
+        self._lock = threading.Lock()
+    
+    @property
+    def state(self) -> str:
+        """Current circuit state"""
+        with self._lock:
+            return self._state()
+    
+    def _state(self) -> str:
+        if self.opened_at is None:
+            return self.CLOSED
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return self.HALF_OPEN
+        return self.OPEN
+    
+    def allow_request(self) -> bool:
+        """Whether calls to the provider are currently allowed"""
+        return self.state != self.OPEN
+    
+    def record_success(self):
+        """Record a successful call"""
+        with self._lock:
+            if self.opened_at is not None:
+                logger.info("Circuit closed after successful trial call")
+            self.consecutive_failures = 0
+            self.opened_at = None
+    
+    def record_failure(self):
+        """Record a failed call"""
+        with self._lock:
+            self.consecutive_failures += 1
+            if self._state() == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+                if self.opened_at is None:
+                    logger.warning(f"Circuit opened after {self.consecutive_failures} consecutive failures")
+                self.opened_at = time.monotonic()
+
+class ProviderHealth:
+    """Latency and circuit state for one LLM provider"""
+    
+    def __init__(self, name: str):
+        self.name = name
+        self.latency = LatencyTracker()
+        self.breaker = CircuitBreaker()
+        self.calls = 0
+        self.failures = 0
+        self.hedges_won = 0
+    
+    def record_success(self, seconds: float):
+        """Record a successful call and its latency"""
+        self.calls += 1
+        self.latency.record(seconds)
+        self.breaker.record_success()
+    
+    def record_failure(self):
+        """Record a failed call"""
+        self.calls += 1
+        self.failures += 1
+        self.breaker.record_failure()
+    
+    def stats(self) -> Dict[str, Any]:
+        """Snapshot of provider health metrics"""
+        return {
+            "state": self.breaker.state,
+            "calls": self.calls,
+            "failures": self.failures,
+            "consecutive_failures": self.breaker.consecutive_failures,
+            "hedges_won": self.hedges_won,
+            "latency_samples": self.latency.count(),
+            "p50_seconds": self.latency.percentile(50),
+            "p95_seconds": self.latency.percentile(95)
+        }
+
+_providers: Dict[str, ProviderHealth] = {}
+_providers_lock = threading.Lock()
+
+def get_provider_health(name: str) -> ProviderHealth:
+    """
+    Get the shared health record for a provider
+    
+    All services in the process share one record per provider, so a
+    provider that is failing for one router is skipped by the other too.
+    
+    Args:
+        name: Provider name
+    
+    Returns:
+        Shared ProviderHealth
+    """
+    with _providers_lock:
+        if name not in _providers:
+            _providers[name] = ProviderHealth(name)
+        return _providers[name]
+
+def reset_provider_health():
+    """Forget all provider health records"""
+    with _providers_lock:
+        _providers.clear()
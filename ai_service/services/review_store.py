@@ -0,0 +1,336 @@
+import os
+import time
+import json
+import queue
+import sqlite3
+import asyncio
+import logging
+import threading
+import concurrent.futures
+from datetime import datetime
+from typing import Dict, Any, Optional, List
+
+logger = logging.getLogger(__name__)
+
+# Day-first formats accepted for invoice dates besides ISO dates
+DATE_FORMATS = ["%d/%m/%Y", "%d-%m-%Y", "%d.%m.%Y", "%d %b %Y", "%d %B %Y"]
+
+class ReviewStoreBusyError(Exception):
+    """Raised when a review is submitted while the write queue is full"""
+    pass
+
+class ReviewStoreClosedError(Exception):
+    """Raised when a review is submitted after the store has been closed"""
+    pass
+
+class ReviewStore:
+    """
+    Durable store for reviewed invoices using SQLite in WAL mode
+    
+    Reviews are written by one background thread that takes every review
+    queued since its last commit and inserts them in a single transaction
+    (group commit). The WAL is synced on every commit, so a review is
+    acknowledged only once it is on disk, while the cost of the sync is
+    shared by the whole group. Reads use their own connection and do not
+    wait for the writer.
+    """
+    
+    def __init__(self, path: str = None, batch_max: int = None, batch_wait: float = None,
+                 queue_max_size: int = None):
+        self.path = path or os.getenv("REVIEW_STORE_PATH", "data/reviews.sqlite3")
+        self.batch_max = batch_max if batch_max is not None else int(os.getenv("REVIEW_BATCH_MAX", "256"))
+        self.batch_wait = batch_wait if batch_wait is not None else float(os.getenv("REVIEW_BATCH_WAIT", "0"))
+        self.queue_max_size = queue_max_size if queue_max_size is not None else int(os.getenv("REVIEW_QUEUE_MAX_SIZE", "10000"))
+        
+        self.writes = 0
+        self.batches = 0
+        self.max_batch = 0
+        self.failed_writes = 0
+        self.commit_seconds = 0.0
+        self._closed = False
+        self._queue: "queue.Queue" = queue.Queue(maxsize=self.queue_max_size)
+        # Held while checking _closed and queuing, so nothing is queued behind close()'s sentinel
+        self._submit_lock = threading.Lock()
+        self._read_lock = threading.Lock()
+        
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        
+        self._write_conn = self._connect()
+        self._write_conn.execute(
+            "CREATE TABLE IF NOT EXISTS invoice_reviews ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, vendor_name TEXT, vendor_key TEXT, "
+            "invoice_number TEXT, invoice_date TEXT, payload TEXT NOT NULL, reviewed_at REAL NOT NULL)"
+        )
+        self._write_conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_invoice_reviews_vendor ON invoice_reviews (vendor_key, invoice_date)"
+        )
+        self._write_conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_invoice_reviews_number ON invoice_reviews (invoice_number)"
+        )
+        self._write_conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_invoice_reviews_date ON invoice_reviews (invoice_date)"
+        )
+        self._write_conn.commit()
+        self._read_conn = self._connect()
+        
+        self._writer = threading.Thread(target=self._run, name="review-writer", daemon=True)
+        self._writer.start()
+        logger.info(f"Review store opened at {self.path}")
+    
+    def _connect(self) -> sqlite3.Connection:
+        """Open a connection in WAL mode, syncing the WAL on every commit"""
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=FULL")
+        return conn
+    
+    @staticmethod
+    def vendor_key(vendor_name: Any) -> str:
+        """Normalize a vendor name for lookups, e.g. ' ACME  Pte Ltd' to 'acme pte ltd'"""
+        return " ".join(str(vendor_name or "").split()).casefold()
+    
+    @staticmethod
+    def normalize_date(value: Any) -> Optional[str]:
+        """
+        Normalize an invoice date to YYYY-MM-DD
+        
+        Args:
+            value: ISO date or datetime, or a day-first date such as 31/01/2024
+        
+        Returns:
+            ISO date, or None if the value is not a recognized date
+        """
+        text = str(value or "").strip()
+        if not text:
+            return None
+        try:
+            return datetime.fromisoformat(text).date().isoformat()
+        except ValueError:
+            pass
+        for date_format in DATE_FORMATS:
+            try:
+                return datetime.strptime(text, date_format).date().isoformat()
+            except ValueError:
+                continue
+        return None
+    
+    def submit(self, review: Dict[str, Any]) -> concurrent.futures.Future:
+        """
+        Queue a reviewed invoice for the next group commit
+        
+        Args:
+            review: Reviewed invoice data
+        
+        Returns:
+            Future resolving to the stored record's id and reviewed_at time
+            once the commit holding it is durable
+        
+        Raises:
+            ReviewStoreBusyError: If the write queue is full
+            ReviewStoreClosedError: If the store has been closed
+        """
+        row = (
+            str(review["vendor_name"]) if review.get("vendor_name") is not None else None,
+            self.vendor_key(review.get("vendor_name")),
+            str(review["invoice_number"]).strip() if review.get("invoice_number") is not None else None,
+            self.normalize_date(review.get("issue_date")),
+            json.dumps(review)
+        )
+        future: concurrent.futures.Future = concurrent.futures.Future()
+        with self._submit_lock:
+            if self._closed:
+                raise ReviewStoreClosedError("Review store is closed")
+            try:
+                self._queue.put_nowait((row, future))
+            except queue.Full:
+                raise ReviewStoreBusyError(f"Review write queue is full ({self.queue_max_size} pending)")
+        return future
+    
+    async def save(self, review: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Store a reviewed invoice durably
+        
+        Args:
+            review: Reviewed invoice data
+        
+        Returns:
+            Dictionary with the review id and reviewed_at time
+        """
+        return await asyncio.wrap_future(self.submit(review))
+    
+    def _run(self):
+        """Writer loop: commit everything queued since the last commit as one transaction"""
+        stopping = False
+        while not stopping:
+            entry = self._queue.get()
+            if entry is None:
+                break
+            batch = [entry]
+            deadline = time.monotonic() + self.batch_wait
+            while len(batch) < self.batch_max:
+                try:
+                    entry = self._queue.get(timeout=max(0.0, deadline - time.monotonic())) if self.batch_wait else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if entry is None:
+                    stopping = True
+                    break
+                batch.append(entry)
+            self._commit(batch)
+    
+    def _commit(self, batch: List[Any]):
+        """Insert a group of reviews in one transaction and resolve their futures"""
+        start = time.perf_counter()
+        reviewed_at = time.time()
+        try:
+            ids = []
+            with self._write_conn:
+                for row, _ in batch:
+                    cursor = self._write_conn.execute(
+                        "INSERT INTO invoice_reviews (vendor_name, vendor_key, invoice_number, invoice_date, payload, reviewed_at) "
+                        "VALUES (?, ?, ?, ?, ?, ?)",
+                        (*row, reviewed_at)
+                    )
+                    ids.append(cursor.lastrowid)
+        except Exception as e:
+            logger.error(f"Error committing {len(batch)} invoice reviews: {str(e)}")
+            self.failed_writes += len(batch)
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        
+        self.commit_seconds += time.perf_counter() - start
+        self.writes += len(batch)
+        self.batches += 1
+        self.max_batch = max(self.max_batch, len(batch))
+        for review_id, (_, future) in zip(ids, batch):
+            future.set_result({"review_id": review_id, "reviewed_at": reviewed_at})
+    
+    def get(self, review_id: int) -> Optional[Dict[str, Any]]:
+        """
+        Look up a stored review
+        
+        Args:
+            review_id: Review id from save()
+        
+        Returns:
+            Review record, or None if unknown
+        """
+        with self._read_lock:
+            row = self._read_conn.execute(
+                "SELECT id, invoice_number, vendor_name, invoice_date, reviewed_at, payload FROM invoice_reviews WHERE id = ?",
+                (review_id,)
+            ).fetchone()
+        return self._record(row) if row else None
+    
+    def find(self, vendor_name: str = None, invoice_number: str = None, date_from: str = None,
+             date_to: str = None, limit: int = 100) -> List[Dict[str, Any]]:
+        """
+        Find reviews by vendor, invoice number and invoice date
+        
+        Every submission is kept, so an invoice reviewed twice has two
+        records; the latest review comes first.
+        
+        Args:
+            vendor_name: Vendor name, compared case- and whitespace-insensitively
+            invoice_number: Exact invoice number
+            date_from: Earliest invoice date, inclusive
+            date_to: Latest invoice date, inclusive
+            limit: Maximum number of records
+        
+        Returns:
+            Review records, newest invoice date first
+        """
+        clauses = []
+        params: List[Any] = []
+        if vendor_name:
+            clauses.append("vendor_key = ?")
+            params.append(self.vendor_key(vendor_name))
+        if invoice_number:
+            clauses.append("invoice_number = ?")
+            params.append(invoice_number.strip())
+        if date_from:
+            clauses.append("invoice_date >= ?")
+            params.append(self.normalize_date(date_from) or date_from)
+        if date_to:
+            clauses.append("invoice_date <= ?")
+            params.append(self.normalize_date(date_to) or date_to)
+        where = f"WHERE {' AND '.join(clauses)} " if clauses else ""
+        
+        with self._read_lock:
+            rows = self._read_conn.execute(
+                "SELECT id, invoice_number, vendor_name, invoice_date, reviewed_at, payload FROM invoice_reviews "
+                f"{where}ORDER BY invoice_date DESC, id DESC LIMIT ?",
+                (*params, limit)
+            ).fetchall()
+        return [self._record(row) for row in rows]
+    
+    @staticmethod
+    def _record(row: tuple) -> Dict[str, Any]:
+        review_id, invoice_number, vendor_name, invoice_date, reviewed_at, payload = row
+        return {
+            "review_id": review_id,
+            "invoice_number": invoice_number,
+            "vendor_name": vendor_name,
+            "invoice_date": invoice_date,
+            "reviewed_at": reviewed_at,
+            "data": json.loads(payload)
+        }
+    
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get write metrics
+        
+        Returns:
+            Dictionary with committed writes, group commit sizes, pending
+            writes and the writer's throughput while committing
+        """
+        with self._read_lock:
+            (reviews,) = self._read_conn.execute("SELECT COUNT(*) FROM invoice_reviews").fetchone()
+        return {
+            "path": self.path,
+            "reviews": reviews,
+            "writes": self.writes,
+            "failed_writes": self.failed_writes,
+            "batches": self.batches,
+            "mean_batch_size": self.writes / self.batches if self.batches else 0.0,
+            "max_batch_size": self.max_batch,
+            "pending_writes": self._queue.qsize(),
+            "mean_commit_ms": self.commit_seconds / self.batches * 1000 if self.batches else 0.0,
+            # Writes per second of commit time: the rate this worker's writer sustains when saturated
+            "writes_per_second": self.writes / self.commit_seconds if self.commit_seconds else 0.0
+        }
+    
+    def close(self):
+        """Commit queued reviews, stop the writer and close the database"""
+        with self._submit_lock:
+            if self._closed:
+                return
+            self._closed = True
+            # The writer keeps draining the queue, so this waits at most for one commit
+            self._queue.put(None)
+        self._writer.join()
+        self._write_conn.close()
+        with self._read_lock:
+            self._read_conn.close()
+
+_review_store: Optional[ReviewStore] = None
+_review_store_lock = threading.Lock()
+
+def get_review_store() -> ReviewStore:
+    """Get the process-wide review store, opening it on first use"""
+    global _review_store
+    with _review_store_lock:
+        if _review_store is None:
+            _review_store = ReviewStore()
+        return _review_store
+
+def close_review_store():
+    """Flush and close the process-wide review store, if it was opened"""
+    global _review_store
+    with _review_store_lock:
+        store, _review_store = _review_store, None
+    if store is not None:
+        store.close()
@@ -0,0 +1,179 @@
+import os
+import json
+import fcntl
+import shutil
+import logging
+import contextlib
+from collections.abc import Sequence
+from typing import Dict, Any, Optional, List, Tuple, Iterator
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Generations kept on disk: the current one and the one before it, which
+# workers may still be reading until their next generation check
+KEEP_GENERATIONS = 2
+
+# Times attach() re-reads CURRENT when the generation it named was removed meanwhile
+ATTACH_ATTEMPTS = 3
+
+def shared_indexes_enabled() -> bool:
+    """Whether read-only indexes are shared between workers through memory-mapped files"""
+    return os.getenv("SHARED_INDEXES_ENABLED", "false").lower() == "true"
+
+class SharedIndex:
+    """
+    Read-only arrays built once and memory-mapped by every worker
+    
+    Each build of an index is written as a new generation: a directory of
+    .npy files plus a meta.json, published by atomically replacing the
+    CURRENT file with the generation number. Workers map the arrays
+    read-only, so the operating system keeps one copy of their pages in
+    the page cache however many workers use them, and they compare the
+    generation in CURRENT with the one they mapped to pick up rebuilds.
+    Builders take an exclusive file lock, so an index is built once even
+    when several workers find it missing or stale at the same time.
+    """
+    
+    def __init__(self, name: str, directory: str = None):
+        self.name = name
+        self.directory = os.path.join(directory or os.getenv("SHARED_INDEX_DIR", "data/shared_indexes"), name)
+        os.makedirs(self.directory, exist_ok=True)
+    
+    def _generation_path(self, generation: int) -> str:
+        return os.path.join(self.directory, f"gen-{generation:08d}")
+    
+    def current(self) -> Tuple[int, Optional[Dict[str, Any]]]:
+        """
+        Read the published generation
+        
+        Returns:
+            Tuple of (generation, its metadata), or (0, None) if the index
+            has not been built
+        """
+        try:
+            with open(os.path.join(self.directory, "CURRENT")) as f:
+                generation = int(f.read().strip())
+            with open(os.path.join(self._generation_path(generation), "meta.json")) as f:
+                return generation, json.load(f)
+        except (FileNotFoundError, ValueError):
+            return 0, None
+    
+    def attach(self) -> Optional[Tuple[int, Dict[str, Any], Dict[str, np.ndarray]]]:
+        """
+        Map the arrays of the published generation read-only
+        
+        A generation read from CURRENT can be removed before its arrays are
+        mapped, if newer generations are published in between; CURRENT is
+        then read again.
+        
+        Returns:
+            Tuple of (generation, metadata, arrays by name), or None if the
+            index has not been built or kept being replaced while mapping
+        """
+        for _ in range(ATTACH_ATTEMPTS):
+            generation, meta = self.current()
+            if meta is None:
+                return None
+            path = self._generation_path(generation)
+            try:
+                arrays = {
+                    name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r")
+                    for name in meta["arrays"]
+                }
+            except FileNotFoundError:
+                logger.info(f"Shared index {self.name} generation {generation} was removed while mapping it")
+                continue
+            return generation, meta, arrays
+        return None
+    
+    @contextlib.contextmanager
+    def build_lock(self) -> Iterator[None]:
+        """Hold the index's exclusive build lock, shared by every worker on the host"""
+        with open(os.path.join(self.directory, ".lock"), "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+    
+    def publish(self, arrays: Dict[str, np.ndarray], meta: Dict[str, Any] = None) -> int:
+        """
+        Write arrays as the next generation and make it current
+        
+        Call with the build lock held.
+        
+        Args:
+            arrays: Arrays by name
+            meta: JSON-serializable metadata stored with the generation
+        
+        Returns:
+            The new generation number
+        """
+        generation = self.current()[0] + 1
+        staging = os.path.join(self.directory, f".gen-{generation:08d}-{os.getpid()}")
+        shutil.rmtree(staging, ignore_errors=True)
+        os.makedirs(staging)
+        for name, array in arrays.items():
+            np.save(os.path.join(staging, f"{name}.npy"), np.ascontiguousarray(array))
+        with open(os.path.join(staging, "meta.json"), "w") as f:
+            json.dump({**(meta or {}), "arrays": sorted(arrays)}, f)
+        os.replace(staging, self._generation_path(generation))
+        
+        current = os.path.join(self.directory, "CURRENT")
+        with open(current + ".tmp", "w") as f:
+            f.write(str(generation))
+        os.replace(current + ".tmp", current)
+        logger.info(f"Published shared index {self.name} generation {generation}")
+        
+        # Mapped pages of removed files stay valid for workers still using them
+        for stale in range(generation - KEEP_GENERATIONS, 0, -1):
+            path = self._generation_path(stale)
+            if not os.path.exists(path):
+                break
+            shutil.rmtree(path, ignore_errors=True)
+        return generation
+
+class RecordList(Sequence):
+    """
+    Read-only list of JSON records stored in a byte array
+    
+    Records are decoded when they are read, so a list backed by a shared
+    index costs a worker no memory until it is used.
+    """
+    
+    def __init__(self, data: np.ndarray, offsets: np.ndarray):
+        self.data = data
+        self.offsets = offsets
+    
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+    
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[position] for position in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("record index out of range")
+        return json.loads(self.data[self.offsets[index]:self.offsets[index + 1]].tobytes())
+
+def pack_records(records: List[Any], name: str) -> Dict[str, np.ndarray]:
+    """
+    Encode records as JSON into a byte array and offsets for RecordList
+    
+    Args:
+        records: JSON-serializable records
+        name: Array name prefix
+    
+    Returns:
+        Arrays "<name>" (uint8) and "<name>_offsets" (int64)
+    """
+    encoded = [json.dumps(record).encode("utf-8") for record in records]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(record) for record in encoded], out=offsets[1:])
+    return {name: np.frombuffer(b"".join(encoded), dtype=np.uint8), f"{name}_offsets": offsets}
+
+def unpack_records(arrays: Dict[str, np.ndarray], name: str) -> RecordList:
+    """View records packed by pack_records"""
+    return RecordList(arrays[name], arrays[f"{name}_offsets"])
@@ -0,0 +1,147 @@
+import copy
+import json
+import asyncio
+import hashlib
+import logging
+import threading
+from typing import Dict, Any, Callable, Awaitable, Optional, TypeVar
+
+from ai_service.services.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+class SingleFlight:
+    """
+    Coalesces concurrent identical work onto one in-flight computation
+    
+    The first caller for a key starts the work; callers arriving while it
+    is still running wait for the same result instead of repeating it.
+    """
+    
+    def __init__(self, name: str):
+        self.name = name
+        self.calls = 0
+        self.coalesced = 0
+        self._inflight: Dict[str, asyncio.Future] = {}
+    
+    async def do(self, key: str, fn: Callable[[], Awaitable[T]], copy_result: bool = False,
+                 cleanup: Optional[Callable[[], None]] = None) -> T:
+        """
+        Run fn once per key across concurrent callers
+        
+        Args:
+            key: Identity of the work, e.g. from content_key
+            fn: Coroutine function performing the work
+            copy_result: Give each caller its own deep copy of the result,
+                for results that callers go on to modify
+            cleanup: Optional function releasing this caller's input to fn,
+                e.g. closing its spooled upload. The shared work can outlive
+                the caller that started it, so the input is released when the
+                work finishes if this caller started it, and at once otherwise.
+        
+        Returns:
+            Result of the shared computation
+        """
+        self.calls += 1
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+            logger.debug(f"Coalesced {self.name} request onto in-flight work")
+            if cleanup is not None:
+                cleanup()
+        else:
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+            if cleanup is not None:
+                task.add_done_callback(lambda done: cleanup())
+        
+        # Shield so one caller disconnecting does not cancel the others' work
+        result = await asyncio.shield(task)
+        return copy.deepcopy(result) if copy_result else result
+    
+    def _forget(self, key: str, task: asyncio.Future):
+        """Drop a finished computation so later calls start fresh"""
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+    
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get coalescing counters
+        
+        Returns:
+            Dictionary with call, coalesced and in-flight counts
+        """
+        return {
+            "calls": self.calls,
+            "coalesced": self.coalesced,
+            "coalesced_rate": self.coalesced / self.calls if self.calls else 0.0,
+            "in_flight": len(self._inflight)
+        }
+
+def content_key(content: bytes, **options: Any) -> str:
+    """
+    Build a single-flight key from document content and processing options
+    
+    Args:
+        content: Document bytes
+        **options: Options that change the result
+    
+    Returns:
+        Hex digest identifying the work
+    """
+    return digest_key(hashlib.sha256(content).hexdigest(), **options)
+
+def digest_key(digest: str, **options: Any) -> str:
+    """
+    Build a single-flight key from a precomputed content digest, e.g. the
+    SHA-256 of a spooled upload, and processing options
+    
+    Args:
+        digest: Hex digest of the document content
+        **options: Options that change the result
+    
+    Returns:
+        Hex digest identifying the work
+    """
+    key = hashlib.sha256(digest.encode("ascii"))
+    key.update(json.dumps(options, sort_keys=True, default=str).encode("utf-8"))
+    return key.hexdigest()
+
+_groups: Dict[str, SingleFlight] = {}
+_groups_lock = threading.Lock()
+
+def get_single_flight(name: str) -> SingleFlight:
+    """
+    Get the shared single-flight group for a kind of work
+    
+    Args:
+        name: Name of the work, e.g. "llm_call"
+    
+    Returns:
+        Shared SingleFlight
+    """
+    with _groups_lock:
+        if name not in _groups:
+            _groups[name] = SingleFlight(name)
+        return _groups[name]
+
+def single_flight_stats() -> Dict[str, Dict[str, Any]]:
+    """Coalescing counters for every single-flight group"""
+    with _groups_lock:
+        groups = dict(_groups)
+    return {name: group.stats() for name, group in groups.items()}
+
+def _collect_metrics():
+    """Coalescing counters, read when metrics are scraped"""
+    stats = sorted(single_flight_stats().items())
+    return [
+        ("ampere_coalescing_calls_total", "counter", "Calls made through each single-flight group",
+         [({"group": name}, group["calls"]) for name, group in stats]),
+        ("ampere_coalescing_shared_total", "counter", "Calls that shared a computation already in flight",
+         [({"group": name}, group["coalesced"]) for name, group in stats])
+    ]
+
+REGISTRY.register_collector(_collect_metrics)
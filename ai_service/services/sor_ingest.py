@@ -0,0 +1,295 @@
+import io
+import os
+import codecs
+import logging
+import datetime
+from typing import Dict, List, Any, Union, Iterator, Iterable, Optional, Tuple
+import pandas as pd
+from openpyxl import load_workbook
+
+logger = logging.getLogger(__name__)
+
+# Header aliases for the fields matching needs, in order of preference.
+# An alias is used only when the file has no column with the field's name.
+FIELD_ALIASES = {
+    "description": ["item", "work_description", "item_description", "description_of_work", "particulars"],
+    "unit": ["uom", "units", "unit_of_measure", "unit_of_measurement"],
+    "quantity": ["qty", "quantities"]
+}
+
+# Value used when a row has none of a field's aliases filled in
+FIELD_DEFAULTS = {"description": "", "unit": "", "quantity": "1"}
+
+# Header cells that identify the header row of a BOQ sheet
+HEADER_KEYWORDS = (
+    set(FIELD_ALIASES) | {alias for aliases in FIELD_ALIASES.values() for alias in aliases}
+    | {"rate", "amount", "total", "item_no", "no", "no.", "s/no", "sl_no", "ref", "code"}
+)
+
+# Bytes that are undefined in cp1252, so a file holding them is read as latin-1
+CP1252_UNDEFINED = [b"\x81", b"\x8d", b"\x8f", b"\x90", b"\x9d"]
+
+class SORIngest:
+    """
+    Turns SOR/BOQ CSV files and PDF tables into items for matching
+    
+    Headers are normalized and resolved against FIELD_ALIASES once per
+    file or table. CSV files are read in chunks by pandas, so items can be
+    matched as they are parsed instead of after the whole file is loaded.
+    """
+    
+    def __init__(self, chunk_rows: int = None, detect_chunk_bytes: int = 1024 * 1024,
+                 header_scan_rows: int = None):
+        self.chunk_rows = chunk_rows if chunk_rows is not None else int(os.getenv("SOR_CSV_CHUNK_ROWS", "10000"))
+        self.detect_chunk_bytes = detect_chunk_bytes
+        self.header_scan_rows = header_scan_rows if header_scan_rows is not None else int(os.getenv("SOR_XLSX_HEADER_SCAN_ROWS", "30"))
+    
+    def detect_encoding(self, source: Union[bytes, str]) -> str:
+        """
+        Detect the text encoding of a CSV file
+        
+        A byte order mark decides the encoding. Otherwise the file is UTF-8
+        if it all decodes as UTF-8, and cp1252 (the Windows Excel default)
+        or latin-1 if not. The check reads the file in chunks.
+        
+        Args:
+            source: File bytes or file path
+        
+        Returns:
+            Encoding name for pandas
+        """
+        with self._open_binary(source) as stream:
+            head = stream.read(4)
+            if head.startswith(codecs.BOM_UTF8):
+                return "utf-8-sig"
+            if head.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+                return "utf-16"
+            
+            decoder = codecs.getincrementaldecoder("utf-8")()
+            chunk = head
+            utf8 = True
+            cp1252 = True
+            while chunk:
+                if utf8:
+                    try:
+                        decoder.decode(chunk)
+                    except UnicodeDecodeError:
+                        utf8 = False
+                if cp1252 and any(byte in chunk for byte in CP1252_UNDEFINED):
+                    cp1252 = False
+                chunk = stream.read(self.detect_chunk_bytes)
+            if utf8:
+                try:
+                    decoder.decode(b"", final=True)
+                    return "utf-8"
+                except UnicodeDecodeError:
+                    pass
+            return "cp1252" if cp1252 else "latin-1"
+    
+    def iter_csv_items(self, source: Union[bytes, str]) -> Iterator[Dict[str, Any]]:
+        """
+        Parse a CSV file into items, one chunk of rows at a time
+        
+        Parsing stops at the first malformed chunk; the error is logged and
+        the items parsed so far are kept.
+        
+        Args:
+            source: File bytes or file path
+        
+        Yields:
+            Item dictionaries with normalized keys plus description, unit
+            and quantity
+        """
+        try:
+            encoding = self.detect_encoding(source)
+            reader = pd.read_csv(
+                source if isinstance(source, str) else io.BytesIO(source),
+                encoding=encoding,
+                dtype=str,
+                na_filter=False,
+                index_col=False,
+                chunksize=self.chunk_rows
+            )
+            with reader:
+                columns = None
+                for chunk in reader:
+                    if columns is None:
+                        columns = self._resolve_columns(list(chunk.columns))
+                    yield from self._to_items(chunk, columns)
+        except pd.errors.EmptyDataError:
+            return
+        except Exception as e:
+            logger.error(f"Error extracting items from CSV: {str(e)}")
+    
+    def read_csv_items(self, source: Union[bytes, str]) -> List[Dict[str, Any]]:
+        """
+        Parse a whole CSV file into items
+        
+        Args:
+            source: File bytes or file path
+        
+        Returns:
+            List of item dictionaries
+        """
+        return list(self.iter_csv_items(source))
+    
+    def iter_xlsx_items(self, source: Union[bytes, str]) -> Iterator[Dict[str, Any]]:
+        """
+        Parse an XLSX workbook into items, streaming its rows
+        
+        The workbook is opened in read-only mode, so rows are parsed as they
+        are read and memory does not grow with the row count. The header row
+        is the row among the first header_scan_rows of a sheet with the most
+        known BOQ header cells. Items come from the sheet with the best
+        header, and from any other sheet with the same header, e.g. bills
+        split across sheets. Empty rows are skipped.
+        
+        Args:
+            source: File bytes or file path
+        
+        Yields:
+            Item dictionaries with normalized keys plus description, unit
+            and quantity
+        """
+        try:
+            workbook = load_workbook(
+                source if isinstance(source, str) else io.BytesIO(source),
+                read_only=True,
+                data_only=True
+            )
+        except Exception as e:
+            logger.error(f"Error opening XLSX workbook: {str(e)}")
+            return
+        
+        try:
+            sheets = [(sheet, *self._find_header(sheet)) for sheet in workbook.worksheets]
+            # The first sheet with the highest score, preferring non-empty sheets
+            best_sheet, _, best_row, best_header = max(sheets, key=lambda found: (found[1], found[2] is not None))
+            if best_row is None:
+                return
+            
+            for sheet, _, header_row, header in sheets:
+                if sheet is best_sheet or (header_row is not None and header == best_header):
+                    yield from self._iter_sheet_items(sheet, header_row, header)
+        except Exception as e:
+            logger.error(f"Error extracting items from XLSX: {str(e)}")
+        finally:
+            workbook.close()
+    
+    def _find_header(self, sheet) -> Tuple[int, Optional[int], List[str]]:
+        """
+        Find the header row among the first rows of a sheet
+        
+        Returns:
+            (score, row number or None if the sheet is empty, header cells)
+            where score counts the known BOQ header cells
+        """
+        best = (0, None, [])
+        for row_number, row in enumerate(sheet.iter_rows(max_row=self.header_scan_rows, values_only=True), start=1):
+            cells = [self._cell_text(value) for value in row]
+            while cells and not cells[-1]:
+                cells.pop()
+            if not cells:
+                continue
+            score = sum(self.normalize_header(cell) in HEADER_KEYWORDS for cell in cells)
+            if best[1] is None or score > best[0]:
+                best = (score, row_number, cells)
+        return best
+    
+    def _iter_sheet_items(self, sheet, header_row: int, header: List[str]) -> Iterator[Dict[str, Any]]:
+        """Yield the items below a sheet's header row, one chunk of rows at a time"""
+        width = len(header)
+        columns = self._resolve_columns(header)
+        rows = []
+        for row in sheet.iter_rows(min_row=header_row + 1, max_col=width, values_only=True):
+            cells = [self._cell_text(value) for value in row]
+            if not any(cells):
+                continue
+            rows.append(cells + [""] * (width - len(cells)))
+            if len(rows) >= self.chunk_rows:
+                yield from self._to_items(pd.DataFrame(rows, columns=header, dtype=str), columns)
+                rows = []
+        if rows:
+            yield from self._to_items(pd.DataFrame(rows, columns=header, dtype=str), columns)
+    
+    @staticmethod
+    def _cell_text(value: Any) -> str:
+        """Render a cell value as CSV-like text, e.g. 10.0 as '10' and an empty cell as ''"""
+        if value is None:
+            return ""
+        if isinstance(value, str):
+            return value
+        if isinstance(value, float) and value.is_integer():
+            return str(int(value))
+        if isinstance(value, (datetime.datetime, datetime.date, datetime.time)):
+            return value.isoformat()
+        return str(value)
+    
+    def items_from_tables(self, tables: Iterable[List[List[Optional[str]]]]) -> List[Dict[str, Any]]:
+        """
+        Turn tables extracted from a PDF into items
+        
+        The first row of each table is its header. Tables without data rows
+        are skipped, and cells beyond the header are dropped.
+        
+        Args:
+            tables: Tables as lists of rows of cell values
+        
+        Returns:
+            List of item dictionaries
+        """
+        items = []
+        for table in tables:
+            if len(table) < 2:
+                continue
+            width = len(table[0])
+            rows = [[cell or "" for cell in row[:width]] + [""] * (width - len(row)) for row in table[1:]]
+            df = pd.DataFrame(rows, columns=[header or "" for header in table[0]], dtype=str)
+            items.extend(self._to_items(df, self._resolve_columns(list(df.columns))))
+        return items
+    
+    def _resolve_columns(self, headers: List[str]) -> Dict[str, Any]:
+        """
+        Plan the column mapping for one file or table
+        
+        Args:
+            headers: Header cells as read
+        
+        Returns:
+            Normalized names, which columns to keep (the last of any
+            duplicates), and the alias columns filling each missing field
+        """
+        names = [self.normalize_header(header) for header in headers]
+        keep = ~pd.Index(names).duplicated(keep="last")
+        present = set(names)
+        fill = {
+            field: [alias for alias in aliases if alias in present]
+            for field, aliases in FIELD_ALIASES.items()
+            if field not in present
+        }
+        return {"names": names, "keep": keep, "fill": fill}
+    
+    def _to_items(self, df: pd.DataFrame, columns: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Apply a column plan to a chunk of rows and return its items"""
+        df.columns = columns["names"]
+        if not columns["keep"].all():
+            df = df.loc[:, columns["keep"]]
+        for field, aliases in columns["fill"].items():
+            # First non-empty alias per row, as one column operation
+            value = pd.Series("", index=df.index, dtype=object)
+            for alias in reversed(aliases):
+                value = df[alias].where(df[alias] != "", value)
+            df[field] = value.where(value != "", FIELD_DEFAULTS[field])
+        # Zipping whole columns is several times faster than DataFrame.to_dict("records")
+        names = list(df.columns)
+        return [dict(zip(names, row)) for row in zip(*(df[name].tolist() for name in names))]
+    
+    @staticmethod
+    def normalize_header(header: Any) -> str:
+        """Normalize a header cell to an item key, e.g. 'Work Description' to 'work_description'"""
+        return str(header).strip().lower().replace(" ", "_")
+    
+    @staticmethod
+    def _open_binary(source: Union[bytes, str]):
+        """Open file bytes or a file path as a binary stream"""
+        return open(source, "rb") if isinstance(source, str) else io.BytesIO(source)
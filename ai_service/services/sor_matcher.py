@@ -1,34 +1,172 @@
 import os
+import time
 import logging
-import pandas as pd
-from typing import List, Dict, Tuple, Optional
+import threading
+from typing import List, Dict, Tuple, Optional, Any, Sequence
 import csv
+import numpy as np
+
+from ai_service.services.shared_index import SharedIndex, shared_indexes_enabled, pack_records, unpack_records
 
 logger = logging.getLogger(__name__)
 
 class SORMatcher:
-    """Service for matching SOR/BOQ items with rate suggestions"""
+    """
+    Service for matching SOR/BOQ items with rate suggestions
+    
+    The rate book is indexed as arrays: the words of each entry's item as
+    posting lists, and each entry's word count and unit. Scoring an item
+    against every entry is then a few vectorized operations. With shared
+    indexes enabled, the arrays and the entries are built once into a
+    memory-mapped SharedIndex used by every worker, and rebuilt when the
+    rates CSV changes.
+    """
     
-    def __init__(self, rates_csv_path: str = None):
+    def __init__(self, rates_csv_path: str = None, shared: bool = None, check_interval: float = None):
         self.rates_csv_path = rates_csv_path or os.getenv("RATES_CSV", "data/rates.csv")
-        self.rates_data = []
+        self.shared = shared if shared is not None else shared_indexes_enabled()
+        self.check_interval = check_interval if check_interval is not None else float(os.getenv("SHARED_INDEX_CHECK_INTERVAL", "2"))
+        self.rates_data: Sequence[Dict] = []
+        self.generation: Optional[int] = None
+        # Source of the rates loaded in local mode
+        self._loaded_source: Optional[Dict[str, Any]] = None
+        self._index: Optional[Dict[str, Any]] = None
+        self._index_lock = threading.Lock()
+        self._checked_at = 0.0
+        self._shared_index = SharedIndex("rates") if self.shared else None
         self.load_rates()
     
     def load_rates(self):
-        """Load rate data from CSV file"""
+        """Load rate data from CSV file, or map the shared rate book index"""
+        if self.shared:
+            self._refresh_shared(force=True)
+            return
+        self._loaded_source = self._source_stamp()
+        self.rates_data = self._read_rates()
+        self._index = None
+    
+    def _read_rates(self) -> List[Dict]:
+        """Read rate entries from the CSV file, or sample entries if it is missing or unreadable"""
         try:
             if os.path.exists(self.rates_csv_path):
                 with open(self.rates_csv_path, 'r', encoding='utf-8') as f:
                     reader = csv.DictReader(f)
-                    self.rates_data = list(reader)
-                logger.info(f"Loaded {len(self.rates_data)} rate entries from {self.rates_csv_path}")
-            else:
-                logger.warning(f"Rates file not found: {self.rates_csv_path}")
-                # Create sample data
-                self.rates_data = self._create_sample_rates()
+                    rates_data = list(reader)
+                logger.info(f"Loaded {len(rates_data)} rate entries from {self.rates_csv_path}")
+                return rates_data
+            logger.warning(f"Rates file not found: {self.rates_csv_path}")
+            # Create sample data
+            return self._create_sample_rates()
         except Exception as e:
             logger.error(f"Error loading rates data: {str(e)}")
-            self.rates_data = self._create_sample_rates()
+            return self._create_sample_rates()
+    
+    def _source_stamp(self) -> Optional[Dict[str, Any]]:
+        """Identify the current rates CSV by path, size and modification time"""
+        try:
+            stat = os.stat(self.rates_csv_path)
+        except OSError:
+            return None
+        return {"path": os.path.abspath(self.rates_csv_path), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+    
+    def _refresh_shared(self, force: bool = False):
+        """
+        Map the latest shared rate book, building it if it is missing or
+        older than the rates CSV
+        
+        Checks run at most every check_interval seconds unless forced.
+        """
+        now = time.monotonic()
+        if not force and now - self._checked_at < self.check_interval:
+            return
+        self._checked_at = now
+        
+        stamp = self._source_stamp()
+        generation, meta = self._shared_index.current()
+        if meta is None or meta.get("source") != stamp:
+            with self._shared_index.build_lock():
+                # Another worker may have built it while this one waited
+                generation, meta = self._shared_index.current()
+                if meta is None or meta.get("source") != stamp:
+                    rates_data = self._read_rates()
+                    arrays = {**self.build_index(rates_data), **pack_records(rates_data, "rates")}
+                    generation = self._shared_index.publish(arrays, {"source": stamp, "rows": len(rates_data)})
+        
+        if generation != self.generation:
+            attached = self._shared_index.attach()
+            if attached is None:
+                # Keep the generation already mapped and look again on the next call
+                logger.warning("Could not map the shared rate book; keeping the current generation")
+                self._checked_at = 0.0
+                return
+            generation, _, arrays = attached
+            rates_data = unpack_records(arrays, "rates")
+            index = self._lookup_tables(arrays, rates_data)
+            with self._index_lock:
+                self.rates_data = rates_data
+                self._index = index
+                self.generation = generation
+            logger.info(f"Mapped shared rate book generation {generation} with {len(self.rates_data)} entries")
+    
+    @staticmethod
+    def build_index(rates_data: Sequence[Dict]) -> Dict[str, np.ndarray]:
+        """
+        Index rate entries for vectorized scoring
+        
+        Args:
+            rates_data: Rate entries with item and unit
+        
+        Returns:
+            Arrays: posting lists of the entries containing each item word
+            (term_rows, delimited by term_offsets), each entry's distinct
+            word count and unit code, and the packed words and unit names
+        """
+        vocabulary: Dict[str, int] = {}
+        units: Dict[str, int] = {}
+        term_ids: List[int] = []
+        row_ids: List[int] = []
+        word_counts = np.zeros(len(rates_data), dtype=np.int32)
+        unit_codes = np.zeros(len(rates_data), dtype=np.int32)
+        for row, rate_entry in enumerate(rates_data):
+            words = set((rate_entry.get("item") or "").lower().split())
+            word_counts[row] = len(words)
+            for word in words:
+                term_ids.append(vocabulary.setdefault(word, len(vocabulary)))
+                row_ids.append(row)
+            unit_codes[row] = units.setdefault((rate_entry.get("unit") or "").lower(), len(units))
+        
+        term_ids = np.array(term_ids, dtype=np.int64)
+        order = np.argsort(term_ids, kind="stable")
+        term_offsets = np.zeros(len(vocabulary) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(term_ids, minlength=len(vocabulary)), out=term_offsets[1:])
+        return {
+            "term_rows": np.array(row_ids, dtype=np.int32)[order],
+            "term_offsets": term_offsets,
+            "word_counts": word_counts,
+            "unit_codes": unit_codes,
+            **pack_records(list(vocabulary), "terms"),
+            **pack_records(list(units), "unit_names")
+        }
+    
+    def _get_index(self) -> Dict[str, Any]:
+        """Rate book index for scoring, refreshed or built as needed"""
+        if self.shared:
+            self._refresh_shared()
+            return self._index
+        with self._index_lock:
+            if self._index is None:
+                self._index = self._lookup_tables(self.build_index(self.rates_data), self.rates_data)
+            return self._index
+    
+    @staticmethod
+    def _lookup_tables(arrays: Dict[str, np.ndarray], rates_data: Sequence[Dict]) -> Dict[str, Any]:
+        """Add the word and unit lookups and the entries the arrays were built from"""
+        return {
+            **arrays,
+            "vocabulary": {term: position for position, term in enumerate(unpack_records(arrays, "terms"))},
+            "units": {unit: position for position, unit in enumerate(unpack_records(arrays, "unit_names"))},
+            "rates": rates_data
+        }
     
     def _create_sample_rates(self) -> List[Dict]:
         """Create sample rate data for demonstration"""
@@ -51,7 +189,7 @@ class SORMatcher:
         
         Args:
             items: List of item dictionaries with description and unit
-            
+        
         Returns:
             List of items with matched rates and suggestions
         """
@@ -88,61 +226,109 @@ class SORMatcher:
         
         Args:
             item: Item dictionary with description and unit
-            
+        
         Returns:
             Best matching rate entry or None
         """
-        item_description = item.get("description", "").lower()
-        item_unit = item.get("unit", "").lower()
+        matches = self.top_matches(item, k=1)
+        best_match = matches[0] if matches else None
+        return best_match if best_match and best_match["confidence"] > 0.3 else None  # Only return matches with reasonable confidence
+    
+    def top_matches(self, item: Dict, k: int = 3) -> List[Dict]:
+        """
+        Find the k closest rate entries for an item
         
-        best_match = None
-        best_score = 0.0
+        Args:
+            item: Item dictionary with description and unit
+            k: Number of entries to return
         
-        for rate_entry in self.rates_data:
-            rate_description = rate_entry.get("item", "").lower()
-            rate_unit = rate_entry.get("unit", "").lower()
-            
-            # Calculate similarity score
-            score = self._calculate_similarity(item_description, rate_description, item_unit, rate_unit)
-            
-            if score > best_score:
-                best_score = score
-                best_match = rate_entry.copy()
-                best_match["confidence"] = score
+        Returns:
+            Rate entries with a "confidence" score, best first
+        """
+        index = self._get_index()
+        scores = self._score(index, item)
+        
+        # Best first; ties keep rate book order
+        candidates = np.flatnonzero(scores > 0)
+        best = candidates[np.argsort(-scores[candidates], kind="stable")[:k]]
         
-        return best_match if best_score > 0.3 else None  # Only return matches with reasonable confidence
+        matches = []
+        for row in best.tolist():
+            match = dict(index["rates"][row])
+            match["confidence"] = float(scores[row])
+            matches.append(match)
+        return matches
     
-    def _calculate_similarity(self, item_desc: str, rate_desc: str, item_unit: str, rate_unit: str) -> float:
+    def _score(self, index: Dict[str, Any], item: Dict) -> np.ndarray:
         """
-        Calculate similarity between item and rate entry
+        Score an item against every rate entry
+        
+        The description score is the number of words the item and entry
+        share over the larger of their distinct word counts, and the unit
+        score is 1 when the units are equal. Scores weight them 0.8 and 0.2.
         
         Args:
-            item_desc: Item description
-            rate_desc: Rate entry description
-            item_unit: Item unit
-            rate_unit: Rate entry unit
-            
+            index: Rate book index from build_index()
+            item: Item dictionary with description and unit
+        
         Returns:
-            Similarity score between 0 and 1
+            Similarity score between 0 and 1 per rate entry
         """
         # Simple keyword matching approach
         # In a real implementation, this would use more sophisticated NLP techniques
+        item_words = set((item.get("description") or "").lower().split())
+        item_unit = (item.get("unit") or "").lower()
+        word_counts = index["word_counts"]
+        rows = len(word_counts)
         
-        # Description similarity
-        desc_score = 0.0
-        item_words = set(item_desc.split())
-        rate_words = set(rate_desc.split())
-        
-        if item_words and rate_words:
-            common_words = item_words.intersection(rate_words)
-            desc_score = len(common_words) / max(len(item_words), len(rate_words))
+        # Shared words per entry, counted from the posting lists of the item's words
+        term_offsets, term_rows = index["term_offsets"], index["term_rows"]
+        vocabulary = index["vocabulary"]
+        postings = [
+            term_rows[term_offsets[term]:term_offsets[term + 1]]
+            for term in (vocabulary.get(word) for word in item_words) if term is not None
+        ]
+        common = np.bincount(np.concatenate(postings), minlength=rows) if postings else np.zeros(rows, dtype=np.int64)
         
-        # Unit similarity
-        unit_score = 1.0 if item_unit == rate_unit else 0.0
+        desc_score = np.zeros(rows)
+        if item_words:
+            has_words = word_counts > 0
+            desc_score[has_words] = common[has_words] / np.maximum(word_counts[has_words], len(item_words))
+        unit_score = index["unit_codes"] == index["units"].get(item_unit, -1)
         
         # Combined score (weighted)
-        combined_score = 0.8 * desc_score + 0.2 * unit_score
-        return combined_score
+        return 0.8 * desc_score + 0.2 * unit_score
+    
+    def version(self) -> str:
+        """
+        Identify the rate book that prices are currently drawn from
+        
+        Changes when a new shared generation is mapped, when the rates CSV is
+        reloaded after changing, or when a rate is added.
+        
+        Returns:
+            Version text
+        """
+        if self.shared:
+            self._refresh_shared()
+        source = self._loaded_source or {}
+        return f"rates:{self.generation}:{source.get('size')}:{source.get('mtime_ns')}:{len(self.rates_data)}"
+    
+    def index_stats(self) -> Dict[str, Any]:
+        """
+        Get rate book index metrics
+        
+        Returns:
+            Dictionary with the mode, the mapped generation, the entry count
+            and the bytes of index arrays (shared pages in shared mode)
+        """
+        index = self._index
+        return {
+            "shared": self.shared,
+            "generation": self.generation,
+            "entries": len(self.rates_data),
+            "array_bytes": sum(array.nbytes for array in index.values() if isinstance(array, np.ndarray)) if index else 0
+        }
     
     def add_rate(self, item: str, unit: str, rate: str, category: str):
         """
@@ -161,7 +347,13 @@ class SORMatcher:
             "category": category
         }
         
-        self.rates_data.append(new_entry)
+        with self._index_lock:
+            if self.shared:
+                # Entries added at runtime stay local to this worker
+                self.shared = False
+                self.rates_data = list(self.rates_data)
+            self.rates_data.append(new_entry)
+            self._index = None
         logger.info(f"Added new rate entry: {item}")
     
     def save_rates(self):
@@ -0,0 +1,163 @@
+import json
+import logging
+from typing import Any, List, Optional
+
+logger = logging.getLogger(__name__)
+
+class IncrementalJSONParser:
+    """
+    Incremental parser for a JSON array or object arriving in chunks
+
+    Completed top-level values are returned as soon as their closing token
+    is seen: array elements for a top-level array, and (key, value) pairs
+    for a top-level object. Any text before the first bracket, such as a
+    model preamble or a markdown code fence, is ignored.
+    """
+
+    def __init__(self):
+        self.mode: Optional[str] = None  # "array" or "object"
+        self.done = False
+        self._buffer = ""
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._value_start: Optional[int] = None
+        self._key: Optional[str] = None
+        self._key_start: Optional[int] = None
+        self._expect_value = False
+
+    def feed(self, chunk: str) -> List[Any]:
+        """
+        Feed the next chunk of text
+
+        Args:
+            chunk: Next piece of the streamed response
+
+        Returns:
+            List of values completed by this chunk; (key, value) tuples
+            when the top-level value is an object
+        """
+        if self.done or not chunk:
+            return []
+
+        self._buffer += chunk
+        completed = []
+        buffer = self._buffer
+        i = self._pos
+
+        while i < len(buffer) and not self.done:
+            char = buffer[i]
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    if self._depth == 1 and self._key_start is not None:
+                        self._key = json.loads(buffer[self._key_start:i + 1])
+                        self._key_start = None
+                i += 1
+                continue
+
+            if self.mode is None:
+                # Skip anything before the top-level container
+                if char == "[":
+                    self.mode = "array"
+                    self._depth = 1
+                elif char == "{":
+                    self.mode = "object"
+                    self._depth = 1
+                i += 1
+                continue
+
+            if self._depth == 1 and self._value_start is None:
+                # Between top-level members
+                if char in " \t\r\n,":
+                    pass
+                elif char in "]}":
+                    self._depth = 0
+                    self.done = True
+                elif self.mode == "object" and not self._expect_value:
+                    if char == '"':
+                        self._in_string = True
+                        self._key_start = i
+                    elif char == ":":
+                        self._expect_value = True
+                else:
+                    # Start of a member value
+                    self._value_start = i
+                    if char in "[{":
+                        self._depth += 1
+                    elif char == '"':
+                        self._in_string = True
+                i += 1
+                continue
+
+            if char == '"':
+                self._in_string = True
+            elif char in "[{":
+                self._depth += 1
+            elif char in "]}":
+                self._depth -= 1
+                if self._depth == 1:
+                    # A container member just closed
+                    completed.extend(self._complete(buffer[self._value_start:i + 1]))
+                elif self._depth == 0:
+                    # A scalar member ended at the closing bracket
+                    completed.extend(self._complete(buffer[self._value_start:i]))
+                    self.done = True
+            elif char == "," and self._depth == 1:
+                # A scalar member ended at the separator
+                completed.extend(self._complete(buffer[self._value_start:i]))
+            i += 1
+
+        # Drop consumed text so memory stays bounded on long streams
+        keep_from = i
+        if self._value_start is not None:
+            keep_from = min(keep_from, self._value_start)
+        if self._key_start is not None:
+            keep_from = min(keep_from, self._key_start)
+        self._buffer = buffer[keep_from:]
+        self._pos = i - keep_from
+        if self._value_start is not None:
+            self._value_start -= keep_from
+        if self._key_start is not None:
+            self._key_start -= keep_from
+
+        return completed
+
+    def _complete(self, text: str) -> List[Any]:
+        """Parse a completed member and reset member state"""
+        key = self._key
+        self._value_start = None
+        self._key = None
+        self._expect_value = False
+
+        text = text.strip()
+        if not text:
+            return []
+        try:
+            value = json.loads(text)
+        except json.JSONDecodeError as e:
+            logger.warning(f"Skipping unparseable streamed JSON value: {str(e)}")
+            return []
+
+        if self.mode == "object":
+            return [(key, value)]
+        return [value]
+
+def format_sse(event: str, data: Any) -> str:
+    """
+    Format a server-sent event
+
+    Args:
+        event: Event name
+        data: JSON-serializable payload
+
+    Returns:
+        SSE frame text
+    """
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
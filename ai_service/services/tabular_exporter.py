@@ -0,0 +1,116 @@
+import os
+import logging
+import tempfile
+import importlib.util
+from typing import List, Dict, Optional, BinaryIO
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+class ExportFormatUnavailableError(Exception):
+    """Raised when an export format needs a library that is not installed"""
+    pass
+
+class TabularExporter:
+    """
+    Exports priced items as CSV or Parquet for machine consumers
+    
+    Items are turned into one DataFrame and written by pandas in a single
+    vectorized call, without the per-cell styling work of ExcelWriter.
+    """
+    
+    MEDIA_TYPES = {
+        "csv": "text/csv",
+        "parquet": "application/vnd.apache.parquet"
+    }
+    
+    # Leading columns, in order; any other item fields follow
+    PREFERRED_COLUMNS = [
+        "description", "unit", "quantity", "rate", "amount",
+        "suggested_rate", "suggested_unit", "suggested_category",
+        "confidence", "pricing_source", "category", "notes"
+    ]
+    
+    NUMERIC_COLUMNS = ["quantity", "rate", "amount", "suggested_rate", "confidence"]
+    
+    def __init__(self, spool_max_bytes: int = None):
+        self.spool_max_bytes = spool_max_bytes if spool_max_bytes is not None else int(os.getenv("EXCEL_SPOOL_MAX_BYTES", str(16 * 1024 * 1024)))
+    
+    def supports(self, export_format: str) -> bool:
+        """
+        Whether an export format can be produced in this environment
+        
+        Args:
+            export_format: "csv" or "parquet"
+        
+        Returns:
+            True if the format is known and its writer is installed
+        """
+        if export_format == "parquet":
+            return any(importlib.util.find_spec(engine) is not None for engine in ("pyarrow", "fastparquet"))
+        return export_format in self.MEDIA_TYPES
+    
+    def to_dataframe(self, items: List[Dict]) -> pd.DataFrame:
+        """
+        Build a typed DataFrame from priced items
+        
+        Numeric fields become numeric columns when every value parses as a
+        number. Other columns holding mixed types become strings, so the
+        columnar writer gets one type per column.
+        
+        Args:
+            items: Priced SOR/BOQ items
+        
+        Returns:
+            DataFrame with one row per item
+        """
+        df = pd.DataFrame.from_records(items)
+        columns = [column for column in self.PREFERRED_COLUMNS if column in df.columns]
+        columns += [column for column in df.columns if column not in columns]
+        df = df[columns]
+        
+        for column in df.columns:
+            if df[column].dtype != object:
+                continue
+            values = df[column].mask(df[column] == "")
+            if column in self.NUMERIC_COLUMNS:
+                numeric = pd.to_numeric(values, errors="coerce")
+                if numeric.notna().sum() == values.notna().sum():
+                    df[column] = numeric
+                    continue
+            if values.dropna().map(type).nunique() > 1:
+                df[column] = df[column].astype(str).where(df[column].notna(), None)
+        return df
+    
+    def export(self, items: List[Dict], export_format: str, output: Optional[BinaryIO] = None) -> BinaryIO:
+        """
+        Write priced items in a tabular format
+        
+        Args:
+            items: Priced SOR/BOQ items
+            export_format: "csv" or "parquet"
+            output: Binary file object to write to; a spooled temp file is
+                created if omitted
+        
+        Returns:
+            The output file, positioned at the start
+        
+        Raises:
+            ExportFormatUnavailableError: If the format cannot be produced
+        """
+        if not self.supports(export_format):
+            raise ExportFormatUnavailableError(
+                f"{export_format} export is not available; parquet needs pyarrow installed"
+                if export_format == "parquet" else f"Unknown export format: {export_format}"
+            )
+        
+        df = self.to_dataframe(items)
+        output = output if output is not None else tempfile.SpooledTemporaryFile(max_size=self.spool_max_bytes)
+        if export_format == "csv":
+            df.to_csv(output, index=False, encoding="utf-8")
+        else:
+            df.to_parquet(output, index=False)
+        output.seek(0)
+        
+        logger.info(f"Exported {len(df)} items as {export_format}")
+        return output
@@ -0,0 +1,404 @@
+import os
+import sys
+import json
+import time
+import uuid
+import logging
+import threading
+import tracemalloc
+import contextlib
+import contextvars
+from collections import Counter
+from typing import Dict, Any, Optional, List, Callable, Iterator, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Folded stacks kept in a trace's profile, most sampled first
+PROFILE_TOP_STACKS = 200
+PROFILE_MAX_DEPTH = 64
+
+_current_trace: contextvars.ContextVar[Optional["RequestTrace"]] = contextvars.ContextVar("request_trace", default=None)
+
+def current_trace() -> Optional["RequestTrace"]:
+    """The trace of the request being processed, or None if it is not traced"""
+    return _current_trace.get()
+
+def _frame_name(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+class StackSampler:
+    """
+    Sampling CPU profiler for a set of threads
+    
+    A background thread reads the stacks of the target threads every
+    interval and counts them as folded stacks ("outer;inner;leaf"), the
+    input format of flame graph tools. Sampling costs the traced threads
+    nothing between samples, unlike a tracing profiler such as cProfile.
+    """
+    
+    def __init__(self, interval: float, targets: Callable[[], List[int]]):
+        self.interval = interval
+        self.targets = targets
+        self.samples: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+    
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="trace-sampler", daemon=True)
+        self._thread.start()
+    
+    def stop(self) -> Counter:
+        """Stop sampling and return the folded stack counts"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        return self.samples
+    
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            for ident in self.targets():
+                frame = frames.get(ident)
+                if frame is not None:
+                    self.samples[self._fold(frame)] += 1
+    
+    @staticmethod
+    def _fold(frame) -> str:
+        names = []
+        while frame is not None and len(names) < PROFILE_MAX_DEPTH:
+            names.append(_frame_name(frame))
+            frame = frame.f_back
+        return ";".join(reversed(names))
+
+def traced_call(fn: Callable, args: tuple, profile_interval: Optional[float], trace_memory: bool) -> Tuple[Any, Dict[str, int], Optional[int]]:
+    """
+    Run a function in a pool process while profiling it
+    
+    Module-level so the process pool can pickle it.
+    
+    Args:
+        fn: Function to run
+        args: Arguments for fn
+        profile_interval: Seconds between stack samples, or None not to sample
+        trace_memory: Whether to measure the peak of Python allocations
+    
+    Returns:
+        Tuple of (result of fn, folded stack counts, peak allocated bytes or None)
+    """
+    ident = threading.get_ident()
+    sampler = StackSampler(profile_interval, lambda: [ident]) if profile_interval else None
+    started_tracemalloc = trace_memory and not tracemalloc.is_tracing()
+    if started_tracemalloc:
+        tracemalloc.start()
+    if trace_memory:
+        tracemalloc.reset_peak()
+    if sampler is not None:
+        sampler.start()
+    try:
+        result = fn(*args)
+    finally:
+        samples = dict(sampler.stop()) if sampler is not None else {}
+        peak = tracemalloc.get_traced_memory()[1] if trace_memory else None
+        if started_tracemalloc:
+            tracemalloc.stop()
+    return result, samples, peak
+
+class MemoryTraceBusyError(RuntimeError):
+    """Raised when a request asks to trace memory while another request in the worker is"""
+    pass
+
+# tracemalloc's peak is process-wide, so one request traces memory at a time
+_memory_lock = threading.Lock()
+_memory_trace: Optional[str] = None
+
+class RequestTrace:
+    """
+    Timing breakdown of one request
+    
+    Spans are recorded for every executor step and LLM call made while the
+    trace is current, with per-page spans for PDF parsing. Optionally the
+    threads running the request's work are sampled for a CPU profile, and
+    tracemalloc measures peak Python memory, in this worker and in the pool
+    processes the request used.
+    """
+    
+    def __init__(self, endpoint: str, file_name: Optional[str] = None, profile: bool = False,
+                 trace_memory: bool = False, profile_interval: float = None):
+        self.trace_id = uuid.uuid4().hex
+        self.endpoint = endpoint
+        self.file_name = file_name
+        self.profile_interval = (
+            profile_interval if profile_interval is not None else float(os.getenv("TRACE_PROFILE_INTERVAL", "0.005"))
+        ) if profile else None
+        self.trace_memory = trace_memory
+        self.spans: List[Dict[str, Any]] = []
+        self.error: Optional[str] = None
+        self._started_at = time.time()
+        self._start = time.perf_counter()
+        self._threads: Dict[int, int] = {}
+        self._loop_thread = threading.get_ident()
+        self._lock = threading.Lock()
+        self._sampler: Optional[StackSampler] = None
+        self._child_samples: Counter = Counter()
+        self._child_peaks: List[int] = []
+        self._memory_start: Optional[int] = None
+        self._started_tracemalloc = False
+        self.result: Optional[Dict[str, Any]] = None
+    
+    def add_span(self, name: str, start: float, end: float, **attributes: Any) -> Dict[str, Any]:
+        """
+        Record a finished span
+        
+        Args:
+            name: Step name, e.g. "pdf_parse"
+            start: time.perf_counter() when it started
+            end: time.perf_counter() when it ended
+            **attributes: Extra fields, e.g. provider and model
+        
+        Returns:
+            The recorded span
+        """
+        span = {
+            "name": name,
+            "start_ms": round((start - self._start) * 1000, 3),
+            "duration_ms": round((end - start) * 1000, 3),
+            **attributes
+        }
+        with self._lock:
+            self.spans.append(span)
+        return span
+    
+    def add_pages(self, name: str, page_seconds: List[float]):
+        """Attach per-page durations to the latest span with the given name"""
+        with self._lock:
+            span = next((span for span in reversed(self.spans) if span["name"] == name), None)
+        if span is not None:
+            span["pages"] = [
+                {"page": number, "duration_ms": round(seconds * 1000, 3)}
+                for number, seconds in enumerate(page_seconds, start=1)
+            ]
+    
+    @property
+    def profiling(self) -> bool:
+        return self.profile_interval is not None
+    
+    def bind(self, fn: Callable) -> Callable:
+        """Wrap a function run in the thread pool so the profiler samples the thread running it"""
+        def call(*args):
+            ident = threading.get_ident()
+            with self._lock:
+                self._threads[ident] = self._threads.get(ident, 0) + 1
+            try:
+                return fn(*args)
+            finally:
+                with self._lock:
+                    self._threads[ident] -= 1
+                    if not self._threads[ident]:
+                        del self._threads[ident]
+        return call
+    
+    def merge_child(self, samples: Dict[str, int], peak: Optional[int]):
+        """Add the profile and peak memory of work run in a pool process"""
+        with self._lock:
+            self._child_samples.update({f"process_pool;{stack}": count for stack, count in samples.items()})
+            if peak is not None:
+                self._child_peaks.append(peak)
+    
+    def _targets(self) -> List[int]:
+        with self._lock:
+            return [self._loop_thread, *self._threads]
+    
+    def start(self):
+        """
+        Start profiling and memory tracing as requested
+        
+        Raises:
+            MemoryTraceBusyError: If memory is traced and another request is
+                already tracing it, since resetting the peak would lose theirs
+        """
+        global _memory_trace
+        if self.trace_memory:
+            with _memory_lock:
+                if _memory_trace is not None:
+                    raise MemoryTraceBusyError("Another request is tracing memory; retry later or without trace_memory")
+                self._started_tracemalloc = not tracemalloc.is_tracing()
+                if self._started_tracemalloc:
+                    tracemalloc.start()
+                tracemalloc.reset_peak()
+                self._memory_start = tracemalloc.get_traced_memory()[0]
+                _memory_trace = self.trace_id
+        if self.profiling:
+            self._sampler = StackSampler(self.profile_interval, self._targets)
+            self._sampler.start()
+    
+    def finish(self) -> Dict[str, Any]:
+        """
+        Stop profiling and memory tracing and build the trace
+        
+        Returns:
+            Trace dictionary with the spans, a per-step summary and, if
+            requested, the profile and peak memory
+        """
+        global _memory_trace
+        duration = time.perf_counter() - self._start
+        trace = {
+            "trace_id": self.trace_id,
+            "endpoint": self.endpoint,
+            "file_name": self.file_name,
+            "started_at": self._started_at,
+            "duration_ms": round(duration * 1000, 3),
+            "error": self.error,
+            "steps": self._summary(),
+            "spans": sorted(self.spans, key=lambda span: span["start_ms"])
+        }
+        if self._sampler is not None:
+            samples = self._sampler.stop() + self._child_samples
+            trace["profile"] = {
+                "interval_ms": self.profile_interval * 1000,
+                "samples": sum(samples.values()),
+                "stacks": [{"stack": stack, "samples": count} for stack, count in samples.most_common(PROFILE_TOP_STACKS)]
+            }
+        if self.trace_memory:
+            with _memory_lock:
+                current, peak = tracemalloc.get_traced_memory()
+                if self._started_tracemalloc:
+                    tracemalloc.stop()
+                _memory_trace = None
+            trace["memory"] = {
+                "start_bytes": self._memory_start,
+                "end_bytes": current,
+                "peak_bytes": peak,
+                "process_pool_peak_bytes": max(self._child_peaks) if self._child_peaks else None
+            }
+        self.result = trace
+        return trace
+    
+    def _summary(self) -> Dict[str, Dict[str, float]]:
+        """Count and total milliseconds of the spans of each step"""
+        steps: Dict[str, Dict[str, float]] = {}
+        for span in self.spans:
+            step = steps.setdefault(span["name"], {"count": 0, "total_ms": 0.0})
+            step["count"] += 1
+            step["total_ms"] = round(step["total_ms"] + span["duration_ms"], 3)
+        return steps
+
+@contextlib.contextmanager
+def trace_request(endpoint: str, file_name: Optional[str] = None, profile: bool = False,
+                  trace_memory: bool = False) -> Iterator[RequestTrace]:
+    """
+    Trace the enclosed processing
+    
+    The trace is finished even if the processing fails, so a pathological
+    document can be inspected later. Storing it is left to the caller,
+    which writes it from a worker thread rather than the event loop.
+    
+    Args:
+        endpoint: Endpoint being traced
+        file_name: Uploaded file name
+        profile: Whether to sample a CPU profile
+        trace_memory: Whether to measure peak Python memory with tracemalloc
+    
+    Yields:
+        The RequestTrace; its result holds the trace after the block exits
+    
+    Raises:
+        MemoryTraceBusyError: If trace_memory is set while another request
+            is tracing memory
+    """
+    trace = RequestTrace(endpoint, file_name, profile, trace_memory)
+    trace.start()
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    except BaseException as e:
+        trace.error = str(e) or type(e).__name__
+        raise
+    finally:
+        _current_trace.reset(token)
+        trace.finish()
+
+class TraceStore:
+    """Local directory of request traces, one JSON file per trace, oldest removed first"""
+    
+    def __init__(self, directory: str = None, max_traces: int = None):
+        self.directory = directory or os.getenv("TRACE_DIR", "data/traces")
+        self.max_traces = max_traces if max_traces is not None else int(os.getenv("TRACE_MAX_TRACES", "200"))
+        self._lock = threading.Lock()
+    
+    def _path(self, trace_id: str) -> str:
+        return os.path.join(self.directory, f"{trace_id}.json")
+    
+    def save(self, trace: Dict[str, Any]):
+        """Write a trace, removing the oldest traces beyond max_traces"""
+        with self._lock:
+            os.makedirs(self.directory, exist_ok=True)
+            path = self._path(trace["trace_id"])
+            with open(path + ".tmp", "w", encoding="utf-8") as f:
+                json.dump(trace, f)
+            os.replace(path + ".tmp", path)
+            
+            traces = self._files()
+            for stale in traces[:max(0, len(traces) - self.max_traces)]:
+                os.remove(stale)
+    
+    def _files(self) -> List[str]:
+        """Trace files, oldest first"""
+        if not os.path.isdir(self.directory):
+            return []
+        paths = [os.path.join(self.directory, name) for name in os.listdir(self.directory) if name.endswith(".json")]
+        return sorted(paths, key=os.path.getmtime)
+    
+    def get(self, trace_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Read a trace
+        
+        Args:
+            trace_id: Trace id
+        
+        Returns:
+            The trace, or None if it does not exist
+        """
+        if not trace_id.isalnum():
+            return None
+        try:
+            with open(self._path(trace_id), encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+    
+    def list(self, limit: int = 50) -> List[Dict[str, Any]]:
+        """
+        Summaries of the newest traces
+        
+        Args:
+            limit: Most traces to return
+        
+        Returns:
+            Trace id, endpoint, file name, start time, duration and error of each trace, newest first
+        """
+        summaries = []
+        for path in reversed(self._files()[-limit:] if limit > 0 else []):
+            try:
+                with open(path, encoding="utf-8") as f:
+                    trace = json.load(f)
+            except (OSError, ValueError):
+                continue
+            summaries.append({key: trace.get(key) for key in ("trace_id", "endpoint", "file_name", "started_at", "duration_ms", "error")})
+        return summaries
+
+_trace_store: Optional[TraceStore] = None
+_trace_store_lock = threading.Lock()
+
+def get_trace_store() -> TraceStore:
+    """
+    Get the trace store shared by the worker
+    
+    Returns:
+        Shared TraceStore
+    """
+    global _trace_store
+    with _trace_store_lock:
+        if _trace_store is None:
+            _trace_store = TraceStore()
+        return _trace_store
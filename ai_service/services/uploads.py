@@ -0,0 +1,177 @@
+import io
+import os
+import hashlib
+import logging
+import tempfile
+from typing import Dict, Any, Optional, Union, BinaryIO
+from starlette.responses import JSONResponse
+
+from ai_service.services.container import get_services
+from ai_service.services.metrics import UPLOAD_BYTES, DOCUMENT_PAGES
+
+logger = logging.getLogger(__name__)
+
+class UploadLimitError(ValueError):
+    """Raised when an upload exceeds the configured size or page limit"""
+    pass
+
+class SpooledUpload:
+    """
+    An uploaded document, held in memory or in a temp file once it is large
+    
+    Documents are passed to the parsers as `source`: the bytes for small
+    uploads, or the temp file path for large ones, so a large document is
+    opened from disk instead of being copied into every stage.
+    """
+    
+    def __init__(self, filename: str, content_type: str, spool_max_bytes: int, directory: str = None):
+        self.filename = filename
+        self.content_type = content_type
+        self.spool_max_bytes = spool_max_bytes
+        self.directory = directory
+        self.size = 0
+        self.path: Optional[str] = None
+        self.sha256: Optional[str] = None
+        self._buffer = io.BytesIO()
+        self._file: Optional[BinaryIO] = None
+        self._hash = hashlib.sha256()
+    
+    def write(self, chunk: bytes):
+        """Append a chunk, moving the upload to disk once it passes the spool threshold"""
+        self._hash.update(chunk)
+        self.size += len(chunk)
+        if self._file is None and self.size > self.spool_max_bytes:
+            fd, self.path = tempfile.mkstemp(prefix="ampere-upload-", dir=self.directory)
+            self._file = os.fdopen(fd, "wb")
+            self._file.write(self._buffer.getbuffer())
+            self._buffer = None
+        (self._file or self._buffer).write(chunk)
+    
+    def finish(self):
+        """Flush the upload once all chunks have been written"""
+        if self._file is not None:
+            self._file.close()
+        self.sha256 = self._hash.hexdigest()
+    
+    @property
+    def source(self) -> Union[bytes, str]:
+        """The document bytes, or the temp file path for large uploads"""
+        return self.path if self.path else self._buffer.getvalue()
+    
+    def close(self):
+        """Delete the temp file, if any"""
+        if self._file is not None and not self._file.closed:
+            self._file.close()
+        if self.path:
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.warning(f"Could not delete upload {self.path}: {str(e)}")
+            self.path = None
+        self._buffer = None
+    
+    def __enter__(self) -> "SpooledUpload":
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.close()
+
+class UploadSpooler:
+    """
+    Copies uploads into SpooledUploads while enforcing size and page limits
+    
+    The copy is chunked, so an oversized upload is rejected as soon as it
+    passes the limit, and a PDF with too many pages is rejected before any
+    page is parsed.
+    """
+    
+    def __init__(self, max_bytes: int = None, max_pages: int = None,
+                 spool_max_bytes: int = None, directory: str = None, chunk_size: int = 1024 * 1024):
+        self.max_bytes = max_bytes if max_bytes is not None else int(os.getenv("UPLOAD_MAX_BYTES", str(100 * 1024 * 1024)))
+        self.max_pages = max_pages if max_pages is not None else int(os.getenv("UPLOAD_MAX_PAGES", "1000"))
+        self.spool_max_bytes = spool_max_bytes if spool_max_bytes is not None else int(os.getenv("UPLOAD_SPOOL_MAX_BYTES", str(1024 * 1024)))
+        self.directory = directory or os.getenv("UPLOAD_DIR") or None
+        self.chunk_size = chunk_size
+    
+    def spool(self, file: BinaryIO, filename: str, content_type: str, max_bytes: int = None) -> SpooledUpload:
+        """
+        Copy an uploaded file and check it against the limits
+        
+        Blocking; run it off the event loop for large uploads.
+        
+        Args:
+            file: Readable binary file object, e.g. UploadFile.file
+            filename: Uploaded file name
+            content_type: MIME type of the file
+            max_bytes: Size limit for this upload, if lower than max_bytes
+        
+        Returns:
+            The spooled upload; the caller must close it
+        
+        Raises:
+            UploadLimitError: If the upload is too large or has too many pages
+        """
+        limit = min(self.max_bytes, max_bytes) if max_bytes else self.max_bytes
+        upload = SpooledUpload(filename, content_type, self.spool_max_bytes, self.directory)
+        try:
+            while True:
+                chunk = file.read(self.chunk_size)
+                if not chunk:
+                    break
+                if upload.size + len(chunk) > limit:
+                    raise UploadLimitError(f"{filename} exceeds the upload limit of {limit} bytes")
+                upload.write(chunk)
+            upload.finish()
+            
+            pages = None
+            if content_type == "application/pdf" and self.max_pages:
+                pages = self._count_pages(upload)
+                if pages is not None and pages > self.max_pages:
+                    raise UploadLimitError(f"{filename} has {pages} pages; the limit is {self.max_pages}")
+            
+            UPLOAD_BYTES.inc(upload.size)
+            if pages:
+                DOCUMENT_PAGES.labels("pdf").inc(pages)
+            elif (content_type or "").startswith("image/"):
+                DOCUMENT_PAGES.labels("image").inc()
+            return upload
+        except BaseException:
+            upload.close()
+            raise
+    
+    def _count_pages(self, upload: SpooledUpload) -> Optional[int]:
+        """Count PDF pages, leaving unreadable PDFs for the parser to report"""
+        try:
+            return get_services().pdf_utils.count_pages(upload.source)
+        except Exception as e:
+            logger.warning(f"Could not count pages of {upload.filename}: {str(e)}")
+            return None
+
+class UploadLimitMiddleware:
+    """
+    Rejects requests whose declared body size is over the limit
+    
+    The check uses the Content-Length header, so an oversized upload is
+    refused with 413 before its body is read. Bodies without the header
+    are still limited while they are spooled.
+    """
+    
+    def __init__(self, app, max_bytes: int, path_limits: Dict[str, int] = None):
+        self.app = app
+        self.max_bytes = max_bytes
+        self.path_limits = path_limits or {}
+    
+    async def __call__(self, scope: Dict[str, Any], receive, send):
+        if scope["type"] == "http":
+            limit = self.path_limits.get(scope["path"], self.max_bytes)
+            content_length = dict(scope["headers"]).get(b"content-length")
+            if content_length and content_length.isdigit() and int(content_length) > limit:
+                response = JSONResponse(
+                    {"detail": f"Request body exceeds the upload limit of {limit} bytes"},
+                    status_code=413
+                )
+                await response(scope, receive, send)
+                return
+        await self.app(scope, receive, send)
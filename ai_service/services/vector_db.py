@@ -1,27 +1,109 @@
 import os
+import time
 import logging
 import pickle
+import threading
 import numpy as np
-from typing import List, Dict, Tuple, Any
+from scipy import sparse
+from typing import List, Dict, Tuple, Any, Optional
 from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.metrics.pairwise import cosine_similarity
 
+from ai_service.services.shared_index import SharedIndex, shared_indexes_enabled, pack_records, unpack_records
+
 logger = logging.getLogger(__name__)
 
 class VectorDB:
-    """Simple vector database using TF-IDF and cosine similarity"""
+    """
+    Simple vector database using TF-IDF and cosine similarity
+    
+    With shared indexes enabled, the TF-IDF matrix, documents and metadata
+    live in a memory-mapped SharedIndex used by every worker. The pickle at
+    index_path stays the durable copy. Adding documents rebuilds the shared
+    index as a new generation, which other workers map on their next search.
+    """
     
-    def __init__(self, index_path: str = None):
+    def __init__(self, index_path: str = None, shared: bool = None, check_interval: float = None):
         self.index_path = index_path or os.getenv("FAISS_INDEX_PATH", "data/vector_index.pkl")
+        self.shared = shared if shared is not None else shared_indexes_enabled()
+        self.check_interval = check_interval if check_interval is not None else float(os.getenv("SHARED_INDEX_CHECK_INTERVAL", "2"))
         self.vectorizer = TfidfVectorizer()
         self.documents = []
         self.vectors = None
         self.metadata = []
+        self.generation: Optional[int] = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self._shared_index = SharedIndex("vector_index") if self.shared else None
         
+        if self.shared:
+            self._refresh_shared(force=True)
         # Load existing index if it exists
-        if os.path.exists(self.index_path):
+        elif os.path.exists(self.index_path):
             self.load_index()
     
+    def _refresh_shared(self, force: bool = False):
+        """
+        Map the latest shared generation, building the first one from the
+        pickle at index_path if there is none
+        
+        Checks run at most every check_interval seconds unless forced.
+        """
+        now = time.monotonic()
+        if not force and now - self._checked_at < self.check_interval:
+            return
+        self._checked_at = now
+        
+        generation, _ = self._shared_index.current()
+        if generation == 0:
+            if not os.path.exists(self.index_path):
+                return
+            with self._shared_index.build_lock():
+                generation, _ = self._shared_index.current()
+                if generation == 0:
+                    self.load_index()
+                    generation = self._publish()
+        if generation != self.generation:
+            self._attach()
+    
+    def _publish(self) -> int:
+        """Write the documents, metadata, vectors and vectorizer as a new shared generation"""
+        vectors = sparse.csr_matrix(self.vectors) if self.vectors is not None else sparse.csr_matrix((0, 0))
+        arrays = {
+            "vectors_data": vectors.data,
+            "vectors_indices": vectors.indices,
+            "vectors_indptr": vectors.indptr,
+            "vectorizer": np.frombuffer(pickle.dumps(self.vectorizer), dtype=np.uint8),
+            **pack_records(list(self.documents), "documents"),
+            **pack_records(list(self.metadata), "metadata")
+        }
+        return self._shared_index.publish(arrays, {"shape": list(vectors.shape), "has_vectors": self.vectors is not None})
+    
+    def _attach(self):
+        """Map the published generation in place of this worker's copy"""
+        attached = self._shared_index.attach()
+        if attached is None:
+            # Keep the generation already mapped and look again on the next call
+            logger.warning("Could not map the shared vector index; keeping the current generation")
+            self._checked_at = 0.0
+            return
+        generation, meta, arrays = attached
+        vectors = None
+        if meta["has_vectors"]:
+            vectors = sparse.csr_matrix(
+                (arrays["vectors_data"], arrays["vectors_indices"], arrays["vectors_indptr"]),
+                shape=tuple(meta["shape"]),
+                copy=False
+            )
+        vectorizer = pickle.loads(arrays["vectorizer"].tobytes())
+        with self._lock:
+            self.documents = unpack_records(arrays, "documents")
+            self.metadata = unpack_records(arrays, "metadata")
+            self.vectors = vectors
+            self.vectorizer = vectorizer
+            self.generation = generation
+        logger.info(f"Mapped shared vector index generation {generation} with {len(self.documents)} documents")
+    
     def add_documents(self, documents: List[str], metadata: List[Dict] = None):
         """
         Add documents to the vector database
@@ -30,14 +112,28 @@ class VectorDB:
             documents: List of text documents
             metadata: Optional list of metadata for each document
         """
-        self.documents.extend(documents)
-        if metadata:
-            self.metadata.extend(metadata)
-        else:
-            self.metadata.extend([{}] * len(documents))
+        if self.shared:
+            # Rebuild from the latest generation, so documents added by other workers are kept
+            with self._shared_index.build_lock():
+                self._refresh_shared(force=True)
+                self.documents = list(self.documents) + list(documents)
+                self.metadata = list(self.metadata) + (list(metadata) if metadata else [{}] * len(documents))
+                self.vectorizer = TfidfVectorizer()
+                self.vectors = self.vectorizer.fit_transform(self.documents)
+                self._publish()
+                self._attach()
+            logger.info(f"Added {len(documents)} documents to vector database")
+            return
+        
+        all_documents = list(self.documents) + list(documents)
+        all_metadata = list(self.metadata) + (list(metadata) if metadata else [{}] * len(documents))
         
-        # Update vectors
-        self.vectors = self.vectorizer.fit_transform(self.documents)
+        # Refit a new vectorizer and swap it in, so concurrent searches see the old or new index whole
+        vectorizer = TfidfVectorizer()
+        vectors = vectorizer.fit_transform(all_documents)
+        with self._lock:
+            self.documents, self.metadata = all_documents, all_metadata
+            self.vectorizer, self.vectors = vectorizer, vectors
         logger.info(f"Added {len(documents)} documents to vector database")
     
     def search(self, query: str, k: int = 5) -> List[Tuple[int, float, Dict]]:
@@ -47,18 +143,27 @@ class VectorDB:
         Args:
             query: Search query
             k: Number of results to return
-            
+        
         Returns:
             List of (index, similarity_score, metadata) tuples
         """
-        if self.vectors is None or len(self.documents) == 0:
+        if self.shared:
+            self._refresh_shared()
+        with self._lock:
+            vectorizer, vectors, metadata = self.vectorizer, self.vectors, self.metadata
+        if vectors is None or len(metadata) == 0:
             return []
         
         # Vectorize query
-        query_vector = self.vectorizer.transform([query])
+        query_vector = vectorizer.transform([query])
         
         # Calculate similarities
-        similarities = cosine_similarity(query_vector, self.vectors).flatten()
+        if vectorizer.norm == "l2":
+            # Rows and query are unit length, so cosine similarity is their dot
+            # product; cosine_similarity would copy the whole matrix to normalize it
+            similarities = (vectors @ query_vector.T).toarray().ravel()
+        else:
+            similarities = cosine_similarity(query_vector, vectors).flatten()
         
         # Get top k results
         top_indices = np.argsort(similarities)[::-1][:k]
@@ -69,7 +174,7 @@ class VectorDB:
                 results.append((
                     idx,
                     float(similarities[idx]),
-                    self.metadata[idx] if idx < len(self.metadata) else {}
+                    metadata[idx] if idx < len(metadata) else {}
                 ))
         
         return results
@@ -80,7 +185,7 @@ class VectorDB:
         
         Args:
             index: Document index
-            
+        
         Returns:
             Tuple of (document_text, metadata)
         """
@@ -89,6 +194,36 @@ class VectorDB:
         else:
             raise IndexError("Document index out of range")
     
+    def version(self) -> str:
+        """
+        Identify the current contents of the index
+        
+        Documents are only ever added, so the shared generation and the
+        document count change whenever the index does.
+        
+        Returns:
+            Version text
+        """
+        if self.shared:
+            self._refresh_shared()
+        return f"vectors:{self.generation}:{len(self.documents)}"
+    
+    def index_stats(self) -> Dict[str, Any]:
+        """
+        Get vector index metrics
+        
+        Returns:
+            Dictionary with the mode, the mapped generation, the document
+            count and the bytes of the TF-IDF matrix (shared pages in shared mode)
+        """
+        vectors = self.vectors
+        return {
+            "shared": self.shared,
+            "generation": self.generation,
+            "documents": len(self.documents),
+            "matrix_bytes": int(vectors.data.nbytes + vectors.indices.nbytes + vectors.indptr.nbytes) if sparse.issparse(vectors) else 0
+        }
+    
     def save_index(self):
         """Save vector index to disk"""
         try:
@@ -96,8 +231,8 @@ class VectorDB:
             os.makedirs(os.path.dirname(self.index_path), exist_ok=True)
             
             index_data = {
-                'documents': self.documents,
-                'metadata': self.metadata,
+                'documents': list(self.documents),
+                'metadata': list(self.metadata),
                 'vectors': self.vectors,
                 'vectorizer': self.vectorizer
             }
@@ -0,0 +1,18 @@
+import os
+import tempfile
+
+import pytest
+
+# Keep test runs from writing service data files into the working directory
+os.environ.setdefault("LLM_CACHE_ENABLED", "false")
+os.environ.setdefault("BOQ_REVISIONS_ENABLED", "false")
+os.environ.setdefault("DUPLICATE_INDEX_ENABLED", "false")
+os.environ.setdefault("REVIEW_STORE_PATH", os.path.join(tempfile.mkdtemp(prefix="ampere-test-"), "reviews.sqlite3"))
+
+@pytest.fixture(autouse=True)
+def reset_llm_provider_health():
+    """Give every test fresh provider latency and circuit state"""
+    from ai_service.services.provider_health import reset_provider_health
+    reset_provider_health()
+    yield
+    reset_provider_health()
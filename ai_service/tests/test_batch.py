@@ -0,0 +1,82 @@
+import asyncio
+import io
+import json
+import os
+import sys
+import zipfile
+
+from fastapi.testclient import TestClient
+
+# Add the ai_service directory to the path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+def _zip(members):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        for name, content in members.items():
+            archive.writestr(name, content)
+    return buffer.getvalue()
+
+def test_invoice_batch_streams_one_result_per_document(monkeypatch):
+    """Test batch uploads expand zips and report per-document errors"""
+    monkeypatch.setenv("API_KEY", "test-key")
+    from ai_service import main
+    from ai_service.routers import invoice
+
+    running = {"now": 0, "max": 0}
+
+    async def fake_extract_text(content, content_type):
+        running["now"] += 1
+        running["max"] = max(running["max"], running["now"])
+        await asyncio.sleep(0.02)
+        running["now"] -= 1
+        if content == b"corrupt":
+            raise ValueError("cannot read PDF")
+        return content.decode()
+
+    monkeypatch.setattr(main, "API_KEY", "test-key")
+    monkeypatch.setattr(invoice, "_extract_text", fake_extract_text)
+    monkeypatch.setattr(invoice, "BATCH_MAX_CONCURRENCY", 2)
+    archive = _zip({
+        "march/inv-1.pdf": b"Invoice No: INV-001",
+        "march/inv-2.png": b"Invoice No: INV-002",
+        "march/notes.txt": b"not an invoice",
+        "march/": b""
+    })
+
+    client = TestClient(main.app)
+    response = client.post(
+        "/process_invoice/batch",
+        headers={"x-api-key": "test-key"},
+        files=[
+            ("files", ("inv-3.pdf", b"Invoice No: INV-003", "application/pdf")),
+            ("files", ("broken.pdf", b"corrupt", "application/pdf")),
+            ("files", ("march.zip", archive, "application/zip"))
+        ]
+    )
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    results = {line["file_name"]: line for line in map(json.loads, response.text.strip().split("\n"))}
+    assert sorted(results) == ["broken.pdf", "inv-3.pdf", "march/inv-1.pdf", "march/inv-2.png", "march/notes.txt"]
+    assert results["inv-3.pdf"]["status"] == "success"
+    assert results["inv-3.pdf"]["data"]["file_size"] == len(b"Invoice No: INV-003")
+    assert results["march/inv-2.png"]["data"]["content_type"] == "image/png"
+    assert results["broken.pdf"]["status"] == "error"
+    assert results["march/notes.txt"]["status"] == "error"
+    assert running["max"] == 2
+
+def test_invoice_batch_rejects_bad_archive(monkeypatch):
+    """Test an unreadable zip fails the request up front"""
+    monkeypatch.setenv("API_KEY", "test-key")
+    from ai_service import main
+
+    monkeypatch.setattr(main, "API_KEY", "test-key")
+    client = TestClient(main.app)
+    response = client.post(
+        "/process_invoice/batch",
+        headers={"x-api-key": "test-key"},
+        files=[("files", ("batch.zip", b"not a zip", "application/zip"))]
+    )
+
+    assert response.status_code == 400
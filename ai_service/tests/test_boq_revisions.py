@@ -0,0 +1,139 @@
+import os
+import sys
+
+import pytest
+from fastapi.testclient import TestClient
+
+# Add the ai_service directory to the path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from ai_service.services.boq_revisions import BOQRevisionStore, RevisionConflictError
+
+def _price(items):
+    return [{**item, "suggested_rate": f"rate for {item['description']}"} for item in items]
+
+def test_revision_reuses_unchanged_rows_and_reports_diff(tmp_path):
+    """Test only new or changed rows are priced again and the diff is keyed by item reference"""
+    store = BOQRevisionStore(str(tmp_path / "revisions.sqlite3"))
+    first = [
+        {"item_no": "1.1", "description": "Plastering walls", "unit": "m2", "quantity": "10"},
+        {"item_no": "1.2", "description": "Painting walls", "unit": "m2", "quantity": "10"},
+        {"item_no": "1.3", "description": "Door installation", "unit": "no", "quantity": "2"}
+    ]
+    plan = store.plan("tender-7", "match", first)
+    assert plan["previous_revision"] is None and plan["pending"] == [0, 1, 2]
+    summary = store.commit(plan, store.merge(plan, _price(first)))
+    assert summary["revision"] == 1 and summary["counts"]["added"] == 3
+
+    second = [
+        # Same row with different spacing and case
+        {"item_no": "1.1", "description": "plastering  walls ", "unit": "m2", "quantity": "10"},
+        {"item_no": "1.2", "description": "Painting walls", "unit": "m2", "quantity": "12"},
+        {"item_no": "1.4", "description": "Floor screeding", "unit": "m2", "quantity": "5"}
+    ]
+    plan = store.plan("tender-7", "match", second)
+    assert plan["pending"] == [1, 2]
+    priced = store.merge(plan, _price([second[1], second[2]]))
+    assert priced[0]["suggested_rate"] == "rate for Plastering walls"
+    assert priced[0]["description"] == "plastering  walls "
+    assert priced[1]["quantity"] == "12"
+
+    summary = store.commit(plan, priced)
+    assert summary["revision"] == 2 and summary["previous_revision"] == 1
+    assert (summary["reused_rows"], summary["priced_rows"]) == (1, 2)
+    assert summary["diff"]["unchanged"] == [0]
+    assert summary["diff"]["changed"] == [1]
+    assert summary["diff"]["added"] == [2]
+    assert [item["item_no"] for item in summary["diff"]["removed"]] == ["1.3"]
+
+    # Pricing modes and lineages keep separate results
+    assert store.plan("tender-7", "llm", second)["pending"] == [0, 1, 2]
+    assert store.plan("tender-8", "match", second)["previous_revision"] is None
+
+def test_rows_without_references_are_keyed_by_description(tmp_path):
+    """Test repeated descriptions are told apart and moved rows reuse their prices"""
+    store = BOQRevisionStore(str(tmp_path / "revisions.sqlite3"))
+    first = [
+        {"description": "Skirting", "unit": "m", "quantity": "4"},
+        {"description": "Skirting", "unit": "m", "quantity": "6"}
+    ]
+    plan = store.plan("fitout", "match", first)
+    store.commit(plan, store.merge(plan, _price(first)))
+
+    second = list(reversed(first)) + [{"description": "Skirting", "unit": "m", "quantity": "6", "remarks": ""}]
+    plan = store.plan("fitout", "match", second)
+    assert plan["pending"] == []
+    assert plan["diff"]["changed"] == [0, 1] and plan["diff"]["added"] == [2]
+
+def test_renumbered_rows_reuse_prices_until_the_source_changes(tmp_path):
+    """Test renumbered rows keep their price, and a new rate book version prices every row again"""
+    store = BOQRevisionStore(str(tmp_path / "revisions.sqlite3"))
+    first = [
+        {"item_no": "1.1", "description": "Plastering walls", "unit": "m2", "quantity": "10"},
+        {"item_no": "1.2", "description": "Painting walls", "unit": "m2", "quantity": "10"}
+    ]
+    plan = store.plan("tender-7", "match", first, source="rates:1")
+    store.commit(plan, store.merge(plan, _price(first)))
+
+    renumbered = [{**first[0], "item_no": "2.1"}, first[1]]
+    plan = store.plan("tender-7", "match", renumbered, source="rates:1")
+    assert plan["pending"] == []
+    assert plan["reused"][0]["item_no"] == "2.1"
+    assert plan["diff"]["added"] == [0] and [item["item_no"] for item in plan["diff"]["removed"]] == ["1.1"]
+    store.commit(plan, store.merge(plan, []))
+
+    plan = store.plan("tender-7", "match", renumbered, source="rates:2")
+    assert plan["pending"] == [0, 1]
+    assert plan["diff"]["unchanged"] == [0, 1]
+
+def test_concurrent_revisions_of_a_lineage_conflict(tmp_path):
+    """Test a revision planned against an older revision is not committed over a newer one"""
+    store = BOQRevisionStore(str(tmp_path / "revisions.sqlite3"))
+    items = [{"description": "Plastering walls", "unit": "m2", "quantity": "10"}]
+    first = store.plan("tender-7", "match", items)
+    second = store.plan("tender-7", "match", items)
+
+    assert store.commit(first, store.merge(first, _price(items)))["revision"] == 1
+    with pytest.raises(RevisionConflictError):
+        store.commit(second, store.merge(second, _price(items)))
+    assert store.plan("tender-7", "match", items)["previous_revision"] == 1
+
+def test_sor_endpoint_reprices_only_changed_rows(monkeypatch, tmp_path):
+    """Test /fill_sor/process reuses a lineage's previous prices and returns the revision diff"""
+    monkeypatch.setenv("API_KEY", "test-key")
+    monkeypatch.setenv("BOQ_REVISIONS_ENABLED", "true")
+    monkeypatch.setenv("BOQ_REVISIONS_PATH", str(tmp_path / "revisions.sqlite3"))
+    from ai_service import main
+    from ai_service.services.container import get_services
+
+    monkeypatch.setattr(main, "API_KEY", "test-key")
+    matched = []
+    match_items = get_services().sor_matcher.match_items
+
+    def counting_match(items):
+        items = list(items)
+        matched.append(len(items))
+        return match_items(items)
+
+    monkeypatch.setattr(get_services().sor_matcher, "match_items", counting_match)
+    client = TestClient(main.app)
+
+    def submit(csv_bytes, lineage_id="tender-7"):
+        return client.post(
+            "/fill_sor/process",
+            headers={"x-api-key": "test-key"},
+            files={"file": ("boq.csv", csv_bytes, "text/csv")},
+            data={"lineage_id": lineage_id}
+        )
+
+    first = submit(b"No,Description,Unit,Qty\n1,Painting walls,m2,10\n2,Door installation,no,2\n")
+    second = submit(b"No,Description,Unit,Qty\n1,Painting walls,m2,10\n2,Door installation,no,3\n3,Floor screeding,m2,5\n")
+
+    assert first.status_code == 200 and second.status_code == 200
+    assert matched == [2, 2]
+    revision = second.json()["revision"]
+    assert revision["revision"] == 2 and revision["reused_rows"] == 1
+    assert revision["counts"] == {"added": 1, "changed": 1, "removed": 0, "unchanged": 1}
+    assert [item["quantity"] for item in second.json()["data"]] == ["10", "3", "5"]
+
+    assert submit(b"Description\nWall\n", lineage_id="bad lineage").status_code == 400
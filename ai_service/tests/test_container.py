@@ -0,0 +1,67 @@
+import json
+import os
+import subprocess
+import sys
+
+from fastapi.testclient import TestClient
+
+# Add the ai_service directory to the path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from ai_service.services.container import ServiceContainer
+
+PACKAGE_ROOT = os.path.join(os.path.dirname(__file__), '..', '..')
+
+def test_importing_app_defers_heavy_libraries():
+    """Test importing the app loads no document, table or LLM libraries and creates no services"""
+    script = (
+        "import json, sys\n"
+        "import ai_service.main\n"
+        "from ai_service.services.container import get_services\n"
+        "heavy = ['pandas', 'sklearn', 'openpyxl', 'pdfplumber', 'pytesseract', 'openai']\n"
+        "print(json.dumps({'loaded': [name for name in heavy if name in sys.modules], 'created': get_services().stats()['created']}))\n"
+    )
+    env = {**os.environ, "PYTHONPATH": PACKAGE_ROOT}
+    result = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, env=env, check=True)
+    assert json.loads(result.stdout.strip().splitlines()[-1]) == {"loaded": [], "created": []}
+
+def test_container_creates_each_service_once_on_first_use():
+    """Test services are created lazily, shared, and built with the services they use"""
+    created = []
+
+    class Matcher:
+        pass
+
+    class Pricer:
+        def __init__(self, matcher):
+            self.matcher = matcher
+
+    def matcher(services):
+        created.append("matcher")
+        return Matcher()
+
+    services = ServiceContainer({
+        "matcher": matcher,
+        "pricer": lambda services: Pricer(services.matcher)
+    })
+    assert created == []
+    assert services.pricer.matcher is services.matcher
+    assert created == ["matcher"]
+
+    stats = services.stats()
+    assert stats["created"] == ["matcher", "pricer"] and stats["pending"] == []
+    assert set(stats["init_ms"]) == {"matcher", "pricer"}
+    assert services.warm_up() >= 0 and created == ["matcher"]
+
+def test_lifespan_warm_up_creates_services_before_requests(monkeypatch):
+    """Test SERVICES_WARM_UP creates every service at startup and /startup-stats reports it"""
+    monkeypatch.setenv("API_KEY", "test-key")
+    monkeypatch.setenv("SERVICES_WARM_UP", "true")
+    from ai_service import main
+
+    monkeypatch.setattr(main, "API_KEY", "test-key")
+    with TestClient(main.app) as client:
+        stats = client.get("/startup-stats", headers={"x-api-key": "test-key"}).json()["data"]
+    assert stats["pending"] == [] and "sor_matcher" in stats["created"]
+    assert stats["warm_up_ms"] is not None and stats["startup_ms"] >= stats["warm_up_ms"]
+    assert stats["app_import_ms"] > 0
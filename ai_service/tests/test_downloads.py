@@ -0,0 +1,128 @@
+import io
+import os
+import sys
+import time
+
+from fastapi.testclient import TestClient
+from openpyxl import load_workbook
+
+# Add the ai_service directory to the path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from ai_service.services.download_store import DownloadStore
+
+CSV_BYTES = b"Description,Unit,Qty\nPlastering walls,m2,10\nPainting walls,m2,5\n"
+
+def _client(monkeypatch, tmp_path):
+    monkeypatch.setenv("API_KEY", "test-key")
+    from ai_service import main
+    from ai_service.services import download_store
+
+    monkeypatch.setattr(main, "API_KEY", "test-key")
+    monkeypatch.setattr(download_store, "_download_store", DownloadStore(str(tmp_path)))
+    return TestClient(main.app)
+
+def test_sor_xlsx_is_returned_as_binary(monkeypatch, tmp_path):
+    """Test output_format=xlsx returns the spreadsheet itself"""
+    client = _client(monkeypatch, tmp_path)
+    response = client.post(
+        "/fill_sor/process",
+        headers={"x-api-key": "test-key"},
+        data={"output_format": "xlsx"},
+        files={"file": ("boq.csv", CSV_BYTES, "text/csv")}
+    )
+
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+    assert 'filename="sor_output.xlsx"' in response.headers["content-disposition"]
+    sheet = load_workbook(io.BytesIO(response.content)).active
+    assert [row[1] for row in sheet.iter_rows(min_row=2, values_only=True)] == ["Plastering walls", "Painting walls"]
+
+def test_sor_excel_returns_download_link(monkeypatch, tmp_path):
+    """Test output_format=excel returns the items and a download handle"""
+    client = _client(monkeypatch, tmp_path)
+    response = client.post(
+        "/fill_sor/process",
+        headers={"x-api-key": "test-key"},
+        data={"output_format": "excel"},
+        files={"file": ("boq.csv", CSV_BYTES, "text/csv")}
+    )
+
+    body = response.json()
+    assert "excel_data" not in body
+    assert len(body["data"]) == 2
+    download = client.get(body["download_url"], headers={"x-api-key": "test-key"})
+    assert download.status_code == 200
+    assert load_workbook(io.BytesIO(download.content)).active.max_row == 3
+    assert client.get("/fill_sor/downloads/unknown", headers={"x-api-key": "test-key"}).status_code == 404
+
+def test_download_store_expires_files(tmp_path):
+    """Test downloads disappear, with their files, after the TTL"""
+    store = DownloadStore(str(tmp_path), ttl_seconds=0.05)
+    download = store.put(b"data", "out.xlsx", "application/octet-stream")
+    path = store.get(download["download_id"])["path"]
+    assert open(path, "rb").read() == b"data"
+
+    time.sleep(0.1)
+    assert store.get(download["download_id"]) is None
+    assert not os.path.exists(path)
+
+def test_downloads_resolve_from_any_worker(tmp_path):
+    """Test a handle created by one worker's store is served by another's"""
+    first = DownloadStore(str(tmp_path))
+    second = DownloadStore(str(tmp_path))
+    download = first.put(b"data", "out.csv", "text/csv")
+
+    entry = second.get(download["download_id"])
+    assert (entry["filename"], entry["media_type"], entry["size"]) == ("out.csv", "text/csv", 4)
+    assert open(entry["path"], "rb").read() == b"data"
+    assert second.get("../" + download["download_id"]) is None
+
+def test_sor_csv_export(monkeypatch, tmp_path):
+    """Test output_format=csv returns a typed CSV export of the priced items"""
+    import pandas as pd
+
+    client = _client(monkeypatch, tmp_path)
+    response = client.post(
+        "/fill_sor/process",
+        headers={"x-api-key": "test-key"},
+        data={"output_format": "csv"},
+        files={"file": ("boq.csv", CSV_BYTES, "text/csv")}
+    )
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/csv")
+    assert 'filename="sor_output.csv"' in response.headers["content-disposition"]
+    df = pd.read_csv(io.BytesIO(response.content))
+    assert list(df.columns[:3]) == ["description", "unit", "quantity"]
+    assert df["description"].tolist() == ["Plastering walls", "Painting walls"]
+    assert df["quantity"].tolist() == [10, 5]
+
+def test_sor_parquet_needs_pyarrow(monkeypatch, tmp_path):
+    """Test output_format=parquet is rejected when no Parquet engine is installed"""
+    from ai_service.services.container import get_services
+
+    client = _client(monkeypatch, tmp_path)
+    monkeypatch.setattr(get_services().tabular_exporter, "supports", lambda export_format: export_format != "parquet")
+    response = client.post(
+        "/fill_sor/process",
+        headers={"x-api-key": "test-key"},
+        data={"output_format": "parquet"},
+        files={"file": ("boq.csv", CSV_BYTES, "text/csv")}
+    )
+
+    assert response.status_code == 400
+    assert "pyarrow" in response.json()["detail"]
+
+def test_sor_unknown_output_format_is_rejected(monkeypatch, tmp_path):
+    """Test an unknown output_format gets 400 rather than a server error"""
+    client = _client(monkeypatch, tmp_path)
+    response = client.post(
+        "/fill_sor/process",
+        headers={"x-api-key": "test-key"},
+        data={"output_format": "pdf"},
+        files={"file": ("boq.csv", CSV_BYTES, "text/csv")}
+    )
+
+    assert response.status_code == 400
+    assert "json, excel, xlsx, csv, parquet" in response.json()["detail"]
@@ -0,0 +1,102 @@
+import os
+import sys
+
+import pytest
+from fastapi.testclient import TestClient
+
+# Add the ai_service directory to the path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from ai_service.services.duplicate_index import DuplicateIndex
+
+INVOICE_TEXT = "ACME Supplies Pte Ltd\nInvoice #: INV-2024-001\nDate: 12/03/2024\n" + "\n".join(
+    f"Item {line} cement bags grade {line * 7} qty {line} rate {line * 3}.50" for line in range(25)
+) + "\nTotal: $1,234.50"
+
+INVOICE = {"vendor_name": "ACME Supplies Pte Ltd", "invoice_number": "INV-2024-001", "total_amount": "1,234.50"}
+
+def test_duplicate_index_flags_exact_and_near_duplicates(tmp_path):
+    """Test re-uploads, exact keys and rescans with OCR noise are flagged, and other invoices are not"""
+    index = DuplicateIndex(str(tmp_path / "duplicates.sqlite3"))
+    first = index.check_and_add(INVOICE_TEXT, INVOICE, "sha-a", "a.pdf")
+    assert first == {"probable_duplicate": False, "invoice_id": first["invoice_id"], "matches": []}
+
+    # Same file again is matched and not indexed twice
+    again = index.check_and_add(INVOICE_TEXT, INVOICE, "sha-a", "a.pdf")
+    assert again["probable_duplicate"] and again["invoice_id"] == first["invoice_id"]
+    assert again["matches"][0]["match"] == "file"
+
+    # Same vendor, number and total, written differently, with no text
+    exact = index.check_and_add("", {"vendor_name": "acme supplies pte. ltd.", "invoice_number": "inv 2024 001", "total_amount": 1234.5}, "sha-b")
+    assert exact["probable_duplicate"] and exact["matches"][0]["match"] == "exact"
+
+    # A rescan with misread characters and no invoice number found
+    rescan = INVOICE_TEXT.replace("cement", "cernent", 3).replace("INV-2024-001", "1NV-2024-00l")
+    near = index.check_and_add(rescan, {"vendor_name": "ACME Supplies", "invoice_number": None, "total_amount": 1234.5}, "sha-c")
+    assert near["probable_duplicate"]
+    assert near["matches"][0]["match"] == "near" and near["matches"][0]["similarity"] >= 0.8
+    assert near["matches"][0]["invoice_id"] == first["invoice_id"]
+
+    # The next invoice from the same vendor template is not a duplicate
+    other_text = INVOICE_TEXT.replace("INV-2024-001", "INV-2024-002").replace("1,234.50", "2,000.00").replace("qty", "quantity")
+    other = index.check_and_add(other_text, {**INVOICE, "invoice_number": "INV-2024-002", "total_amount": "2,000.00"}, "sha-d")
+    assert not other["probable_duplicate"]
+    assert all(match["conflicts"] for match in other["matches"])
+
+    stats = index.stats()
+    assert stats["invoices"] == 4 and stats["lookups"] == 5 and stats["probable_duplicates"] == 3
+    index.close()
+
+@pytest.mark.parametrize("total, cents", [
+    ("$1,250.5", "125050"),
+    ("SGD 1,250.00", "125000"),
+    ("(1,250.00)", "-125000"),
+    (1250.5, "125050"),
+    ("1,250.00 (GST 8%)", None),
+    ("1,250.00 - 50.00", None),
+    ("TBC", None)
+])
+def test_totals_are_read_as_one_number(total, cents):
+    """Test a total with trailing text is not run together into another number"""
+    assert DuplicateIndex.normalize_total(total) == cents
+
+def test_duplicate_index_rejects_changed_signature_settings(tmp_path):
+    """Test an index cannot be reopened with signatures that would not compare"""
+    path = str(tmp_path / "duplicates.sqlite3")
+    with pytest.raises(ValueError):
+        DuplicateIndex(path, num_perm=100, bands=16)
+    DuplicateIndex(path, num_perm=128, bands=16).close()
+    with pytest.raises(ValueError):
+        DuplicateIndex(path, num_perm=128, bands=32)
+
+def test_invoice_endpoint_reports_duplicate_check(monkeypatch, tmp_path):
+    """Test /process_invoice/process flags a second upload of the same invoice"""
+    monkeypatch.setenv("API_KEY", "test-key")
+    monkeypatch.setenv("DUPLICATE_INDEX_ENABLED", "true")
+    monkeypatch.setenv("DUPLICATE_INDEX_PATH", str(tmp_path / "duplicates.sqlite3"))
+    from ai_service import main
+    from ai_service.routers import invoice
+
+    async def fake_extract_text(content, content_type):
+        return INVOICE_TEXT
+
+    monkeypatch.setattr(main, "API_KEY", "test-key")
+    monkeypatch.setattr(invoice, "_extract_text", fake_extract_text)
+    client = TestClient(main.app)
+
+    def upload(name, content):
+        response = client.post(
+            "/process_invoice/process",
+            headers={"x-api-key": "test-key"},
+            files={"file": (name, content, "application/pdf")}
+        )
+        assert response.status_code == 200
+        return response.json()["data"]["duplicate_check"]
+
+    assert upload("march.pdf", b"scan one")["probable_duplicate"] is False
+    check = upload("march-rescan.pdf", b"scan two")
+    assert check["probable_duplicate"] is True
+    assert check["matches"][0]["file_name"] == "march.pdf"
+
+    stats = client.get("/duplicate-stats", headers={"x-api-key": "test-key"}).json()["data"]
+    assert stats["invoices"] == 2
@@ -0,0 +1,85 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+
+import httpx
+import pytest
+
+# Add the ai_service directory to the path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from ai_service.services.executors import ExecutionLayer
+
+def test_stage_concurrency_is_limited():
+    """Test each stage runs no more tasks at once than its limit"""
+    layer = ExecutionLayer(thread_workers=8, process_workers=0, stage_limits={"parse": 2})
+    lock = threading.Lock()
+    running = {"now": 0, "max": 0}
+
+    def work():
+        with lock:
+            running["now"] += 1
+            running["max"] = max(running["max"], running["now"])
+        time.sleep(0.05)
+        with lock:
+            running["now"] -= 1
+
+    async def scenario():
+        await asyncio.gather(*[layer.run_in_thread("parse", work) for _ in range(6)])
+
+    try:
+        asyncio.run(scenario())
+    finally:
+        layer.shutdown()
+
+    assert running["max"] == 2
+    assert layer.stats()["completed"] == {"parse": 6}
+
+def test_run_in_process_uses_worker_process():
+    """Test CPU-bound work runs in a separate process"""
+    layer = ExecutionLayer(process_workers=1)
+
+    async def scenario():
+        return await layer.run_in_process("parse", os.getpid)
+
+    try:
+        assert asyncio.run(scenario()) != os.getpid()
+    finally:
+        layer.shutdown()
+
+@pytest.mark.parametrize("path, request_kwargs", [
+    ("/fill_sor/process", {"files": {"file": ("boq.csv", b"Description,Unit,Qty\nPlastering walls,m2,10\n", "text/csv")}}),
+    ("/fill_sor/suggest-rates", {"json": [{"description": "Plastering walls", "unit": "m2"}]})
+])
+def test_health_stays_responsive_during_matching(monkeypatch, path, request_kwargs):
+    """Test blocking SOR matching does not stall other requests"""
+    monkeypatch.setenv("API_KEY", "test-key")
+    from ai_service import main
+    from ai_service.services.container import get_services
+
+    def slow_match(items):
+        time.sleep(0.5)
+        return list(items)
+
+    monkeypatch.setattr(main, "API_KEY", "test-key")
+    monkeypatch.setattr(get_services().sor_matcher, "match_items", slow_match)
+
+    async def scenario():
+        async with httpx.AsyncClient(app=main.app, base_url="http://test") as client:
+            process = asyncio.create_task(client.post(path, headers={"x-api-key": "test-key"}, **request_kwargs))
+            await asyncio.sleep(0.1)
+            latencies = []
+            while not process.done():
+                start = time.perf_counter()
+                await client.get("/health")
+                latencies.append(time.perf_counter() - start)
+                await asyncio.sleep(0.02)
+            return await process, latencies
+
+    response, latencies = asyncio.run(scenario())
+
+    assert response.status_code == 200
+    assert len(latencies) >= 5
+    assert max(latencies) < 0.1
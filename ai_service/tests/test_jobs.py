@@ -0,0 +1,204 @@
+import asyncio
+import os
+import sys
+
+import httpx
+import pytest
+from aiohttp import web
+
+# Add the ai_service directory to the path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from ai_service.services.job_queue import Job, JobQueue, QueueFullError, CallbackURLError
+
+def test_job_runs_and_reports_progress():
+    """Test a queued job runs in the background and keeps its result"""
+    queue = JobQueue(max_size=5, workers=1)
+
+    async def work(job):
+        job.set_stage("halfway", 0.5)
+        await asyncio.sleep(0.01)
+        return {"total": 3}
+
+    async def failing(job):
+        raise ValueError("bad document")
+
+    async def scenario():
+        job = queue.submit("sor", work)
+        failed = queue.submit("sor", failing)
+        assert job.status == Job.QUEUED
+        while not (job.finished and failed.finished):
+            await asyncio.sleep(0.01)
+        await queue.aclose()
+        return job, failed
+
+    job, failed = asyncio.run(scenario())
+
+    assert job.to_dict()["status"] == "succeeded"
+    assert job.result == {"total": 3}
+    assert job.progress == 1.0
+    assert failed.status == Job.FAILED
+    assert failed.error == "bad document"
+    assert queue.get(job.id, kind="invoice") is None
+
+def test_full_queue_rejects_immediately():
+    """Test submissions beyond the queue size are rejected, not buffered"""
+    queue = JobQueue(max_size=2, workers=1)
+
+    async def scenario():
+        release = asyncio.Event()
+
+        async def work(job):
+            await release.wait()
+
+        queue.submit("sor", work)
+        await asyncio.sleep(0.01)  # the worker takes the first job
+        queue.submit("sor", work)
+        queue.submit("sor", work)
+        with pytest.raises(QueueFullError):
+            queue.submit("sor", work)
+        release.set()
+        await queue.aclose()
+
+    asyncio.run(scenario())
+
+    assert queue.rejected == 1
+
+def test_callback_receives_finished_job():
+    """Test the completion callback is POSTed the finished job"""
+    received = []
+
+    async def callback(request):
+        received.append(await request.json())
+        return web.json_response({})
+
+    async def scenario():
+        app = web.Application()
+        app.router.add_post("/done", callback)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+
+        queue = JobQueue(workers=1, callback_hosts=["127.0.0.1"])
+
+        async def work(job):
+            return {"ok": True}
+
+        job = queue.submit("invoice", work, callback_url=f"http://127.0.0.1:{port}/done")
+        while not received:
+            await asyncio.sleep(0.01)
+        await queue.aclose()
+        await runner.cleanup()
+        return job
+
+    job = asyncio.run(scenario())
+
+    assert received[0]["job_id"] == job.id
+    assert received[0]["result"] == {"ok": True}
+
+def test_callback_urls_to_private_hosts_are_refused():
+    """Test callbacks to loopback and private hosts are rejected unless allowlisted"""
+    queue = JobQueue()
+    for url in ("ftp://example.com/done", "http://127.0.0.1/done", "http://10.0.0.5/done",
+                "http://[::1]/done", "http://169.254.169.254/latest", "http://localhost:8000/done"):
+        with pytest.raises(CallbackURLError):
+            queue.check_callback_url(url)
+    queue.check_callback_url("https://hooks.example.com/done")
+
+    allowlisted = JobQueue(callback_hosts=["hooks.internal"])
+    allowlisted.check_callback_url("http://hooks.internal/done")
+    with pytest.raises(CallbackURLError):
+        allowlisted.check_callback_url("https://hooks.example.com/done")
+
+    async def resolve():
+        from ai_service.services.job_queue import _callback_resolver
+        return await _callback_resolver(set()).resolve("localhost", 80)
+
+    with pytest.raises(CallbackURLError):
+        asyncio.run(resolve())
+
+def test_finished_jobs_are_bounded_and_queued_inputs_released():
+    """Test only max_finished results are kept and shutdown releases queued uploads"""
+    queue = JobQueue(max_size=5, workers=1, max_finished=2)
+    released = []
+
+    async def work(job):
+        return {"payload": "x" * 1000}
+
+    async def scenario():
+        jobs = [queue.submit("sor", work) for _ in range(4)]
+        while not all(job.finished for job in jobs):
+            await asyncio.sleep(0.01)
+
+        block = asyncio.Event()
+
+        async def blocked(job):
+            await block.wait()
+
+        queue.submit("sor", blocked, cleanup=lambda: released.append("running"))
+        await asyncio.sleep(0.01)  # the worker takes the blocked job
+        waiting = queue.submit("sor", work, cleanup=lambda: released.append("queued"))
+        await queue.aclose()
+        return jobs, waiting
+
+    jobs, waiting = asyncio.run(scenario())
+
+    assert [queue.get(job.id) for job in jobs[:2]] == [None, None]
+    assert queue.get(jobs[3].id) is jobs[3]
+    assert released == ["queued"]
+    assert waiting.status == Job.FAILED
+
+def test_sor_job_endpoints(monkeypatch):
+    """Test submitting a SOR job returns at once and the result can be polled"""
+    monkeypatch.setenv("API_KEY", "test-key")
+    from ai_service import main
+    from ai_service.routers import sor
+    from ai_service.services import job_queue
+
+    monkeypatch.setattr(main, "API_KEY", "test-key")
+    monkeypatch.setattr(job_queue, "_job_queue", JobQueue(max_size=1, workers=1))
+    headers = {"x-api-key": "test-key"}
+    csv_file = ("boq.csv", b"Description,Unit,Qty\nPlastering walls,m2,10\n", "text/csv")
+
+    release = asyncio.Event()
+    original_extract = sor._extract_items
+
+    async def gated_extract(content, content_type):
+        await release.wait()
+        return await original_extract(content, content_type)
+
+    monkeypatch.setattr(sor, "_extract_items", gated_extract)
+
+    async def scenario():
+        async with httpx.AsyncClient(app=main.app, base_url="http://test") as client:
+            private = await client.post(
+                "/fill_sor/jobs", headers=headers, files={"file": csv_file},
+                data={"callback_url": "http://192.168.1.10/done"}
+            )
+            submitted = await client.post("/fill_sor/jobs", headers=headers, files={"file": csv_file})
+            await asyncio.sleep(0.05)  # the worker takes the first job
+            queued = await client.post("/fill_sor/jobs", headers=headers, files={"file": csv_file})
+            # The single queue slot is taken
+            rejected = await client.post("/fill_sor/jobs", headers=headers, files={"file": csv_file})
+            release.set()
+            status_url = submitted.json()["data"]["status_url"]
+            for _ in range(100):
+                polled = await client.get(status_url, headers=headers)
+                if polled.json()["data"]["status"] == "succeeded":
+                    break
+                await asyncio.sleep(0.02)
+            missing = await client.get("/process_invoice/jobs/" + submitted.json()["data"]["job_id"], headers=headers)
+            return submitted, queued, rejected, private, polled, missing
+
+    submitted, queued, rejected, private, polled, missing = asyncio.run(scenario())
+
+    assert submitted.status_code == 202
+    assert submitted.json()["data"]["status"] == "queued"
+    assert queued.status_code == 202
+    assert rejected.status_code == 429
+    assert rejected.headers["retry-after"] == "5"
+    assert private.status_code == 400
+    assert polled.json()["data"]["result"]["data"][0]["description"] == "Plastering walls"
+    assert missing.status_code == 404
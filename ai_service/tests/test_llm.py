@@ -0,0 +1,611 @@
+import asyncio
+import json
+import os
+import re
+import sys
+import time
+
+import pytest
+from aiohttp import web
+
+# Add the ai_service directory to the path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from ai_service.services.llm import LLMService
+from ai_service.services.llm_cache import LLMCache
+
+
+class FakeOllama:
+    """Local stand-in for the Ollama /api/generate endpoint"""
+
+    def __init__(self, delay: float = 0.0, response="{}", chunk_size: int = 8, chunk_delay: float = 0.0):
+        self.delay = delay
+        self.response = response
+        self.chunk_size = chunk_size
+        self.chunk_delay = chunk_delay
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.requests = 0
+        self.peers = set()
+        self.runner = None
+        self.base_url = None
+
+    async def generate(self, request):
+        self.requests += 1
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        self.peers.add(request.transport.get_extra_info("peername"))
+        try:
+            await asyncio.sleep(self.delay)
+            payload = await request.json()
+            response = self.response(payload["prompt"]) if callable(self.response) else self.response
+            if response is None:
+                return web.json_response({"error": "generation failed"}, status=500)
+            if payload.get("stream"):
+                return await self._stream(request, response)
+            return web.json_response({"response": response, "done": True})
+        finally:
+            self.in_flight -= 1
+
+    async def _stream(self, request, response: str):
+        stream = web.StreamResponse(headers={"Content-Type": "application/x-ndjson"})
+        await stream.prepare(request)
+        for i in range(0, len(response), self.chunk_size):
+            await asyncio.sleep(self.chunk_delay)
+            chunk = {"response": response[i:i + self.chunk_size], "done": False}
+            await stream.write((json.dumps(chunk) + "\n").encode())
+        await stream.write((json.dumps({"response": "", "done": True}) + "\n").encode())
+        await stream.write_eof()
+        return stream
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_post("/api/generate", self.generate)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.base_url = f"http://127.0.0.1:{port}"
+
+    async def stop(self):
+        await self.runner.cleanup()
+
+
+class FakeOpenAI:
+    """Local stand-in for the OpenAI chat completions endpoint"""
+
+    def __init__(self, delay: float = 0.0, fail: bool = False, response: str = '{"provider": "openai"}'):
+        self.delay = delay
+        self.fail = fail
+        self.response = response
+        self.requests = 0
+        self.runner = None
+        self.base_url = None
+
+    async def completions(self, request):
+        self.requests += 1
+        await asyncio.sleep(self.delay)
+        if self.fail:
+            return web.json_response({"error": {"message": "overloaded", "type": "server_error"}}, status=503)
+        return web.json_response({
+            "id": "chatcmpl-test",
+            "object": "chat.completion",
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": self.response}, "finish_reason": "stop"}]
+        })
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_post("/v1/chat/completions", self.completions)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.base_url = f"http://127.0.0.1:{port}/v1"
+
+    async def stop(self):
+        await self.runner.cleanup()
+
+
+def _make_service(monkeypatch, base_url: str, **env) -> LLMService:
+    monkeypatch.delenv("OPENAI_API_KEY", raising=False)
+    monkeypatch.setenv("OLLAMA_BASE_URL", base_url)
+    monkeypatch.setenv("LLM_CACHE_ENABLED", "false")
+    for key, value in env.items():
+        monkeypatch.setenv(key, str(value))
+    return LLMService()
+
+
+def test_slow_ollama_does_not_block_event_loop(monkeypatch):
+    """Test concurrent slow generations overlap and leave the loop responsive"""
+    async def scenario():
+        server = FakeOllama(delay=0.3, response='{"invoice_number": "INV-1"}')
+        await server.start()
+        service = _make_service(monkeypatch, server.base_url, OLLAMA_MAX_CONCURRENCY=4)
+
+        max_gap = 0.0
+
+        async def ticker():
+            nonlocal max_gap
+            last = time.perf_counter()
+            while True:
+                await asyncio.sleep(0.01)
+                now = time.perf_counter()
+                max_gap = max(max_gap, now - last)
+                last = now
+
+        tick_task = asyncio.create_task(ticker())
+        try:
+            start = time.perf_counter()
+            results = await asyncio.gather(*[service.extract_invoice_data("text") for _ in range(4)])
+            elapsed = time.perf_counter() - start
+        finally:
+            tick_task.cancel()
+            await service.aclose()
+            await server.stop()
+
+        assert all(result["invoice_number"] == "INV-1" for result in results)
+        assert elapsed < 0.9
+        assert max_gap < 0.2
+
+    asyncio.run(scenario())
+
+
+def test_ollama_concurrency_is_bounded(monkeypatch):
+    """Test per-provider concurrency limit is respected"""
+    async def scenario():
+        server = FakeOllama(delay=0.1)
+        await server.start()
+        service = _make_service(monkeypatch, server.base_url, OLLAMA_MAX_CONCURRENCY=2)
+        try:
+            await asyncio.gather(*[service._call_llm(f"prompt {i}") for i in range(6)])
+        finally:
+            await service.aclose()
+            await server.stop()
+
+        assert server.requests == 6
+        assert server.max_in_flight == 2
+
+    asyncio.run(scenario())
+
+
+def test_ollama_connection_is_reused(monkeypatch):
+    """Test sequential calls share one keep-alive connection"""
+    async def scenario():
+        server = FakeOllama()
+        await server.start()
+        service = _make_service(monkeypatch, server.base_url)
+        try:
+            for _ in range(3):
+                await service._call_llm("prompt")
+        finally:
+            await service.aclose()
+            await server.stop()
+
+        assert server.requests == 3
+        assert len(server.peers) == 1
+
+    asyncio.run(scenario())
+
+
+def test_ollama_timeout(monkeypatch):
+    """Test a hanging generation is cut off by the request timeout"""
+    async def scenario():
+        server = FakeOllama(delay=2.0)
+        await server.start()
+        service = _make_service(monkeypatch, server.base_url, LLM_TIMEOUT=0.2)
+        try:
+            start = time.perf_counter()
+            with pytest.raises(asyncio.TimeoutError):
+                await service._call_llm("prompt")
+            assert time.perf_counter() - start < 1.0
+            assert await service.extract_invoice_data("text") == {}
+        finally:
+            await service.aclose()
+            await server.stop()
+
+    asyncio.run(scenario())
+
+
+def _price_prompt(prompt: str) -> str:
+    """Answer a SOR rate prompt with one suggestion per numbered item"""
+    indices = [int(index) for index in re.findall(r"^\s*(\d+)\. ", prompt, re.MULTILINE)]
+    return json.dumps([
+        {"index": index, "suggested_rate": float(index), "suggested_category": "Test"}
+        for index in reversed(indices)
+    ])
+
+
+def test_suggest_sor_rates_batches_and_preserves_order(monkeypatch):
+    """Test large BOQs are split into concurrent batches and reassembled in order"""
+    async def scenario():
+        server = FakeOllama(delay=0.2, response=_price_prompt)
+        await server.start()
+        service = _make_service(
+            monkeypatch, server.base_url,
+            LLM_BATCH_MAX_ITEMS=10, LLM_BATCH_CONCURRENCY=10, OLLAMA_MAX_CONCURRENCY=10
+        )
+        items = [{"description": f"Item {i}", "unit": "m2", "quantity": str(i)} for i in range(100)]
+        try:
+            start = time.perf_counter()
+            results = await service.suggest_sor_rates(items)
+            elapsed = time.perf_counter() - start
+        finally:
+            await service.aclose()
+            await server.stop()
+
+        assert server.requests == 10
+        assert elapsed < 1.0
+        assert [result["suggested_rate"] for result in results] == [float(i) for i in range(100)]
+        assert [result["quantity"] for result in results] == [str(i) for i in range(100)]
+
+    asyncio.run(scenario())
+
+
+def test_suggest_sor_rates_respects_token_budget(monkeypatch):
+    """Test batches are cut by estimated token budget"""
+    service = _make_service(monkeypatch, "http://127.0.0.1:1", LLM_BATCH_TOKEN_BUDGET=200)
+    items = [{"description": "x" * 400, "unit": "m2"} for _ in range(5)]
+    batches = service._batch_items(items)
+    assert [len(batch) for batch in batches] == [1, 1, 1, 1, 1]
+
+
+def test_suggest_sor_rates_retries_only_failed_batches(monkeypatch):
+    """Test only the failing batch is retried"""
+    failures = {"remaining": 1}
+    prompts = []
+
+    def flaky(prompt):
+        prompts.append(prompt)
+        if "Item 0 " in prompt and failures["remaining"]:
+            failures["remaining"] -= 1
+            return "[{\"index\": 0, \"suggested_rate\""  # truncated JSON
+        return _price_prompt(prompt)
+
+    async def scenario():
+        server = FakeOllama(response=flaky)
+        await server.start()
+        service = _make_service(monkeypatch, server.base_url, LLM_BATCH_MAX_ITEMS=2)
+        items = [{"description": f"Item {i}", "unit": "m2"} for i in range(6)]
+        try:
+            results = await service.suggest_sor_rates(items)
+        finally:
+            await service.aclose()
+            await server.stop()
+
+        assert len(prompts) == 4
+        assert [result["suggested_rate"] for result in results] == [float(i) for i in range(6)]
+
+    asyncio.run(scenario())
+
+
+def test_llm_cache_ttl_and_size_eviction(tmp_path):
+    """Test cache entries expire and the least recently used are evicted"""
+    cache = LLMCache(str(tmp_path / "cache.sqlite3"), ttl_seconds=3600, max_entries=3)
+    cache.EVICTION_INTERVAL = 1
+    key = LLMCache.make_key("ollama", "llama2", 0.3, "  Same   prompt ")
+    assert key == LLMCache.make_key("ollama", "llama2", 0.3, "Same prompt")
+    assert key != LLMCache.make_key("openai", "llama2", 0.3, "Same prompt")
+
+    for i in range(5):
+        cache.set(f"key-{i}", f"value-{i}")
+    assert cache.get("key-0") is None
+    assert cache.get("key-4") == "value-4"
+    assert cache.stats()["entries"] == 3
+
+    cache.ttl_seconds = 0
+    assert cache.get("key-4") is None
+
+    stats = cache.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 2
+    assert stats["hit_rate"] == pytest.approx(1 / 3)
+    cache.close()
+
+
+def test_llm_cache_get_many_reads_in_one_query(tmp_path):
+    """Test batched lookups count hits and misses and keep the LRU order"""
+    cache = LLMCache(str(tmp_path / "cache.sqlite3"), ttl_seconds=3600, max_entries=3)
+    cache.EVICTION_INTERVAL = 1
+    for key in ("a", "b", "c"):
+        cache.set(key, f"value-{key}")
+        time.sleep(0.002)
+
+    assert cache.get_many(["a", "missing", "a"]) == {"a": "value-a"}
+    stats = cache.stats()
+    assert stats["hits"] == 2
+    assert stats["misses"] == 1
+
+    # The hit on "a" is written on the next write, before evicting
+    time.sleep(0.002)
+    cache.set("d", "value-d")
+    assert set(cache.get_many(["a", "b", "c", "d"])) == {"a", "c", "d"}
+    cache.close()
+
+
+def test_llm_cache_writes_many_and_reads_first_of_each(tmp_path):
+    """Test batched writes land in one transaction and each candidate list counts once"""
+    cache = LLMCache(str(tmp_path / "cache.sqlite3"), ttl_seconds=3600, max_entries=10)
+    commits = []
+    cache._conn.set_trace_callback(lambda statement: commits.append(statement) if statement == "COMMIT" else None)
+    cache.set_many({"a": "value-a", "b": "value-b", "c": "value-c"})
+    assert len(commits) == 1
+
+    assert cache.get_first_many([["x", "a"], ["b", "a"], ["x", "y"]]) == [("a", "value-a"), ("b", "value-b"), None]
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"]) == (2, 1)
+    cache.close()
+
+
+def test_sor_item_cache_follows_the_reference_rates(monkeypatch, tmp_path):
+    """Test cached suggestions are keyed by the answering provider and the rate-book rows sent"""
+    prompts = []
+
+    def record(prompt):
+        prompts.append(prompt)
+        return _price_prompt(prompt)
+
+    async def scenario():
+        server = FakeOllama(response=record)
+        await server.start()
+        service = _make_service(
+            monkeypatch, server.base_url,
+            LLM_CACHE_ENABLED="true", LLM_CACHE_PATH=tmp_path / "cache.sqlite3"
+        )
+        items = [{"description": "Glass balustrade", "unit": "m"}]
+        old_rates = [[{"item": "Balustrade", "unit": "m", "rate": "400"}]]
+        new_rates = [[{"item": "Balustrade", "unit": "m", "rate": "450"}]]
+        try:
+            await service.suggest_sor_rates(items, references=old_rates)
+            await service.suggest_sor_rates(items, references=old_rates)
+            await service.suggest_sor_rates(items, references=new_rates)
+        finally:
+            await service.aclose()
+            await server.stop()
+
+        assert len(prompts) == 2 and "450" in prompts[1]
+        key = service._sor_item_cache_key(items[0], "ollama", service.ollama_model, new_rates[0])
+        assert service.cache.get(key) is not None
+        assert service.cache.get(service._sor_item_cache_key(items[0], "openai", "gpt-4", new_rates[0])) is None
+
+    asyncio.run(scenario())
+
+
+def test_call_llm_is_cached_across_services(monkeypatch, tmp_path):
+    """Test identical prompts are answered from the persistent cache"""
+    async def scenario():
+        server = FakeOllama(response='{"invoice_number": "INV-1"}')
+        await server.start()
+        env = {"LLM_CACHE_ENABLED": "true", "LLM_CACHE_PATH": tmp_path / "cache.sqlite3"}
+        first = _make_service(monkeypatch, server.base_url, **env)
+        second = _make_service(monkeypatch, server.base_url, **env)
+        try:
+            assert (await first.extract_invoice_data("Invoice text"))["invoice_number"] == "INV-1"
+            assert (await second.extract_invoice_data("Invoice  text"))["invoice_number"] == "INV-1"
+        finally:
+            await first.aclose()
+            await second.aclose()
+            await server.stop()
+
+        assert server.requests == 1
+        assert second.cache.stats()["hits"] == 1
+
+    asyncio.run(scenario())
+
+
+def test_invalid_llm_response_is_not_cached(monkeypatch, tmp_path):
+    """Test unparseable responses are retried rather than served from cache"""
+    async def scenario():
+        server = FakeOllama(response="not json")
+        await server.start()
+        service = _make_service(
+            monkeypatch, server.base_url,
+            LLM_CACHE_ENABLED="true", LLM_CACHE_PATH=tmp_path / "cache.sqlite3"
+        )
+        try:
+            assert await service.extract_invoice_data("Invoice text") == {}
+            assert await service.extract_invoice_data("Invoice text") == {}
+        finally:
+            await service.aclose()
+            await server.stop()
+
+        assert server.requests == 2
+
+    asyncio.run(scenario())
+
+
+def test_suggest_sor_rates_caches_per_item(monkeypatch, tmp_path):
+    """Test a revised BOQ only sends changed lines to the LLM"""
+    prompts = []
+
+    def record(prompt):
+        prompts.append(prompt)
+        return _price_prompt(prompt)
+
+    async def scenario():
+        server = FakeOllama(response=record)
+        await server.start()
+        service = _make_service(
+            monkeypatch, server.base_url,
+            LLM_CACHE_ENABLED="true", LLM_CACHE_PATH=tmp_path / "cache.sqlite3"
+        )
+        items = [{"description": f"Item {i}", "unit": "m2"} for i in range(4)]
+        revised = items[:3] + [{"description": "Revised item", "unit": "m2"}]
+        try:
+            await service.suggest_sor_rates(items)
+            results = await service.suggest_sor_rates(revised)
+        finally:
+            await service.aclose()
+            await server.stop()
+
+        assert len(prompts) == 2
+        assert "Revised item" in prompts[1]
+        assert "Item 0" not in prompts[1]
+        assert [result["suggested_rate"] for result in results] == [0.0, 1.0, 2.0, 3.0]
+
+    asyncio.run(scenario())
+
+
+def test_stream_invoice_data_yields_fields_incrementally(monkeypatch):
+    """Test invoice fields arrive before the generation finishes"""
+    response = json.dumps({"invoice_number": "INV-1", "vendor_name": "ACME", "total_amount": 12.5})
+
+    async def scenario():
+        server = FakeOllama(response=response, chunk_size=4, chunk_delay=0.02)
+        await server.start()
+        service = _make_service(monkeypatch, server.base_url)
+        arrivals = []
+        try:
+            start = time.perf_counter()
+            async for field, value in service.stream_invoice_data("text"):
+                arrivals.append((field, value, time.perf_counter() - start))
+            total = time.perf_counter() - start
+        finally:
+            await service.aclose()
+            await server.stop()
+
+        assert [(field, value) for field, value, _ in arrivals] == list(json.loads(response).items())
+        assert arrivals[0][2] < total / 2
+
+    asyncio.run(scenario())
+
+
+def test_stream_sor_rates_yields_every_item(monkeypatch):
+    """Test streamed SOR suggestions cover every item with its input index"""
+    async def scenario():
+        server = FakeOllama(response=_price_prompt, chunk_size=16)
+        await server.start()
+        service = _make_service(monkeypatch, server.base_url, LLM_BATCH_MAX_ITEMS=3)
+        items = [{"description": f"Item {i}", "unit": "m2"} for i in range(7)]
+        try:
+            results = [item async for item in service.stream_sor_rates(items)]
+        finally:
+            await service.aclose()
+            await server.stop()
+
+        assert sorted(result["index"] for result in results) == list(range(7))
+        assert all(result["suggested_rate"] == float(result["index"]) for result in results)
+
+    asyncio.run(scenario())
+
+
+def _make_dual_service(monkeypatch, openai_server, ollama_server, **env) -> LLMService:
+    monkeypatch.setenv("OPENAI_API_KEY", "test-key")
+    monkeypatch.setenv("OPENAI_API_BASE", openai_server.base_url)
+    monkeypatch.setenv("OLLAMA_BASE_URL", ollama_server.base_url)
+    monkeypatch.setenv("LLM_CACHE_ENABLED", "false")
+    for key, value in env.items():
+        monkeypatch.setenv(key, str(value))
+    return LLMService()
+
+
+def test_hedging_takes_backup_when_primary_is_slow(monkeypatch):
+    """Test the backup provider answers when the primary exceeds the hedge delay"""
+    async def scenario():
+        openai_server = FakeOpenAI(delay=2.0)
+        ollama_server = FakeOllama(response='{"provider": "ollama"}')
+        await openai_server.start()
+        await ollama_server.start()
+        service = _make_dual_service(monkeypatch, openai_server, ollama_server, LLM_HEDGING="true", LLM_HEDGE_DELAY=0.1)
+        try:
+            start = time.perf_counter()
+            response = await service._call_llm("prompt")
+            elapsed = time.perf_counter() - start
+            stats = service.provider_stats()
+        finally:
+            await service.aclose()
+            await openai_server.stop()
+            await ollama_server.stop()
+
+        assert json.loads(response) == {"provider": "ollama"}
+        assert elapsed < 1.0
+        assert stats["ollama"]["hedges_won"] == 1
+        assert stats["openai"]["failures"] == 0
+
+    asyncio.run(scenario())
+
+
+def test_hedging_keeps_fast_primary(monkeypatch):
+    """Test no backup call is made when the primary answers in time"""
+    async def scenario():
+        openai_server = FakeOpenAI()
+        ollama_server = FakeOllama()
+        await openai_server.start()
+        await ollama_server.start()
+        service = _make_dual_service(monkeypatch, openai_server, ollama_server, LLM_HEDGING="true", LLM_HEDGE_DELAY=1.0)
+        try:
+            response = await service._call_llm("prompt")
+        finally:
+            await service.aclose()
+            await openai_server.stop()
+            await ollama_server.stop()
+
+        assert json.loads(response) == {"provider": "openai"}
+        assert ollama_server.requests == 0
+
+    asyncio.run(scenario())
+
+
+def test_circuit_breaker_skips_failing_provider(monkeypatch):
+    """Test a failing primary is skipped once its circuit opens"""
+    async def scenario():
+        openai_server = FakeOpenAI(fail=True)
+        ollama_server = FakeOllama(response='{"provider": "ollama"}')
+        await openai_server.start()
+        await ollama_server.start()
+        service = _make_dual_service(
+            monkeypatch, openai_server, ollama_server,
+            LLM_CIRCUIT_FAILURE_THRESHOLD=2, LLM_CIRCUIT_RESET_TIMEOUT=60
+        )
+        try:
+            for _ in range(5):
+                assert json.loads(await service._call_llm("prompt")) == {"provider": "ollama"}
+            stats = service.provider_stats()
+        finally:
+            await service.aclose()
+            await openai_server.stop()
+            await ollama_server.stop()
+
+        assert openai_server.requests == 2
+        assert ollama_server.requests == 5
+        assert stats["openai"]["state"] == "open"
+
+    asyncio.run(scenario())
+
+
+def test_circuit_breaker_recovers_flapping_provider(monkeypatch):
+    """Test an open circuit lets a trial call through after the reset timeout"""
+    async def scenario():
+        openai_server = FakeOpenAI(fail=True)
+        ollama_server = FakeOllama(response='{"provider": "ollama"}')
+        await openai_server.start()
+        await ollama_server.start()
+        service = _make_dual_service(
+            monkeypatch, openai_server, ollama_server,
+            LLM_CIRCUIT_FAILURE_THRESHOLD=1, LLM_CIRCUIT_RESET_TIMEOUT=0.2
+        )
+        try:
+            await service._call_llm("prompt")
+            assert service.provider_stats()["openai"]["state"] == "open"
+
+            # Still failing on the half-open trial: the circuit opens again
+            await asyncio.sleep(0.25)
+            await service._call_llm("prompt")
+            assert service.provider_stats()["openai"]["state"] == "open"
+
+            # Recovered: the next trial closes the circuit
+            openai_server.fail = False
+            await asyncio.sleep(0.25)
+            response = await service._call_llm("prompt")
+            stats = service.provider_stats()
+        finally:
+            await service.aclose()
+            await openai_server.stop()
+            await ollama_server.stop()
+
+        assert json.loads(response) == {"provider": "openai"}
+        assert stats["openai"]["state"] == "closed"
+        assert openai_server.requests == 3
+
+    asyncio.run(scenario())
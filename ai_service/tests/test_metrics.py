@@ -0,0 +1,70 @@
+import os
+import re
+import sys
+
+from fastapi.testclient import TestClient
+
+# Add the ai_service directory to the path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from ai_service.services.metrics import MetricsRegistry
+
+def sample(text, name, **labels):
+    """Value of one sample in Prometheus text, or None if it is absent"""
+    rendered = ",".join(f'{key}="{value}"' for key, value in labels.items())
+    pattern = "^" + re.escape(f"{name}{{{rendered}}}" if labels else name) + r" (\S+)$"
+    match = re.search(pattern, text, re.MULTILINE)
+    return float(match.group(1)) if match else None
+
+def test_registry_renders_cumulative_buckets_and_collected_families():
+    """Test histograms render cumulative buckets, sum and count, and collectors are read on scrape"""
+    registry = MetricsRegistry()
+    latency = registry.histogram("stage_seconds", "Stage latency", ["step"], buckets=(0.1, 1.0))
+    pages = registry.counter("pages_total", "Pages", ["kind"])
+    for value in (0.05, 0.1, 0.5, 3.0):
+        latency.labels("parse").observe(value)
+    pages.labels('scan "a"\n').inc(2)
+    depth = {"value": 3}
+    registry.register_collector(lambda: [("queue_depth", "gauge", "Queued jobs", [({}, depth["value"])])])
+
+    text = registry.render()
+    assert "# TYPE stage_seconds histogram" in text
+    assert sample(text, "stage_seconds_bucket", step="parse", le="0.1") == 2
+    assert sample(text, "stage_seconds_bucket", step="parse", le="1") == 3
+    assert sample(text, "stage_seconds_bucket", step="parse", le="+Inf") == 4
+    assert sample(text, "stage_seconds_sum", step="parse") == 3.65
+    assert sample(text, "stage_seconds_count", step="parse") == 4
+    assert 'pages_total{kind="scan \\"a\\"\\n"} 2' in text
+    assert sample(text, "queue_depth") == 3
+
+    depth["value"] = 0
+    assert sample(registry.render(), "queue_depth") == 0
+
+def test_metrics_endpoint_reports_stage_latency_and_throughput(monkeypatch):
+    """Test /metrics exposes the steps, items and upload bytes of a processed SOR"""
+    monkeypatch.setenv("API_KEY", "test-key")
+    from ai_service import main
+
+    monkeypatch.setattr(main, "API_KEY", "test-key")
+    client = TestClient(main.app)
+    headers = {"x-api-key": "test-key"}
+    before = client.get("/metrics", headers=headers).text
+    content = b"Description,Unit,Qty\nCement concrete,cum,4\nBrick masonry,cum,2\n"
+    response = client.post("/fill_sor/process", headers=headers, files={"file": ("boq.csv", content, "text/csv")})
+    assert response.status_code == 200
+
+    metrics = client.get("/metrics", headers=headers)
+    assert metrics.headers["content-type"].startswith("text/plain; version=0.0.4")
+    after = metrics.text
+
+    def grew(name, by=None, **labels):
+        delta = (sample(after, name, **labels) or 0) - (sample(before, name, **labels) or 0)
+        return delta == by if by is not None else delta > 0
+
+    assert grew("ampere_step_duration_seconds_count", by=1, step="upload_read")
+    assert grew("ampere_step_duration_seconds_count", by=1, step="matching")
+    assert grew("ampere_step_duration_seconds_count", by=1, step="rollup")
+    assert grew("ampere_items_processed_total", by=2, kind="sor_item", mode="match")
+    assert grew("ampere_upload_bytes_total", by=len(content))
+    assert grew("ampere_executor_completed_tasks_total", stage="match")
+    assert client.get("/metrics").status_code == 400
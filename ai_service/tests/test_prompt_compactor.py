@@ -0,0 +1,95 @@
+import asyncio
+import glob
+import json
+import os
+import sys
+
+import pytest
+
+# Add the ai_service directory to the path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from ai_service.services.ocr import OCRService
+from ai_service.services.llm import LLMService
+from ai_service.services.prompt_compactor import PromptCompactor, estimate_tokens
+
+FIXTURES = sorted(glob.glob(os.path.join(os.path.dirname(__file__), "fixtures", "invoices", "*.txt")))
+
+@pytest.mark.parametrize("path", FIXTURES, ids=os.path.basename)
+def test_compaction_preserves_extraction(path):
+    """Test compacted text extracts the same fields with fewer tokens"""
+    text = open(path).read()
+    compacted, stats = PromptCompactor().compact(text)
+    
+    ocr_service = OCRService()
+    original = ocr_service.extract_data_from_text(text)
+    reduced = ocr_service.extract_data_from_text(compacted)
+    original.pop("raw_text")
+    reduced.pop("raw_text")
+    
+    assert reduced == original
+    assert stats["compacted_tokens"] < stats["original_tokens"]
+    assert stats["original_tokens"] == estimate_tokens(text)
+    assert "Terms and Conditions" not in compacted.splitlines()
+    assert "computer generated" not in compacted
+
+def test_compaction_drops_repeated_page_headers():
+    """Test repeated headers appear once and every line item is kept"""
+    path = [path for path in FIXTURES if path.endswith("repeated_headers.txt")][0]
+    compacted, stats = PromptCompactor().compact(open(path).read())
+    
+    assert compacted.count("88 Sungei Kadut Street 1") == 1
+    assert "Gate valve 25mm" in compacted
+    assert "Solvent cement 500ml" in compacted
+    assert stats["dropped_duplicates"] >= 6
+
+def test_compaction_keeps_terms_field_and_items_after_terms_section():
+    """Test a terms field in the header is kept and a terms section ends at the next page"""
+    path = [path for path in FIXTURES if path.endswith("terms_in_header.txt")][0]
+    compacted, stats = PromptCompactor().compact(open(path).read())
+    
+    assert "Terms and Conditions: Net 30" in compacted
+    assert "Bill To: Ampere Engineering Pte Ltd" in compacted
+    assert "Prices are subject to change" not in compacted
+    assert "Trunking 100x100 30 22.50 675.00" in compacted
+    assert "Cable ties 300mm 10 4.50 45.00" in compacted
+    assert compacted.count("Seng Huat Engineering Supplies") == 1
+
+def test_compaction_keeps_repeated_line_items():
+    """Test identical line items are all kept while repeated page headers are not"""
+    path = [path for path in FIXTURES if path.endswith("repeated_line_items.txt")][0]
+    compacted, stats = PromptCompactor().compact(open(path).read())
+    
+    assert compacted.count("Concrete pump hire (half day) 1 450.00 450.00") == 4
+    assert compacted.count("Ready-mix concrete grade 30 8 118.00 944.00") == 3
+    assert compacted.count("9 Sungei Kadut Way Singapore 728805") == 1
+    assert compacted.count("Date Description Qty Rate Amount") == 1
+
+def test_compaction_enforces_token_budget():
+    """Test line items are trimmed to fit the budget while totals are kept"""
+    lines = ["ACME Pte Ltd", "Invoice No: INV-1"]
+    lines += [f"Item {i} widget assembly {i} 12.00 {i * 12}.00" for i in range(200)]
+    lines += ["Subtotal 240,000.00", "GST 21,600.00", "Total 261,600.00"]
+    compacted, stats = PromptCompactor(token_budget=300).compact("\n".join(lines))
+    
+    assert stats["compacted_tokens"] <= 320
+    assert stats["omitted_for_budget"] > 0
+    assert "more line items omitted" in compacted
+    assert compacted.endswith("Total 261,600.00")
+
+def test_extract_invoice_data_reports_prompt_size(monkeypatch):
+    """Test the LLM sees compacted text and prompt sizes are reported"""
+    path = [path for path in FIXTURES if path.endswith("multi_page_terms.txt")][0]
+    prompts = []
+    
+    async def fake_call_llm(prompt, validate=None, use_cache=True):
+        prompts.append(prompt)
+        return json.dumps({"invoice_number": "TB-24117"})
+    
+    service = LLMService()
+    monkeypatch.setattr(service, "_call_llm", fake_call_llm)
+    data = asyncio.run(service.extract_invoice_data(open(path).read()))
+    
+    assert data["invoice_number"] == "TB-24117"
+    assert data["prompt_stats"]["compacted_tokens"] < data["prompt_stats"]["original_tokens"]
+    assert "Interest will be charged" not in prompts[0]
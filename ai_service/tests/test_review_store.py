@@ -0,0 +1,113 @@
+import os
+import sys
+import queue
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+
+# Add the ai_service directory to the path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from ai_service.services.review_store import ReviewStore, ReviewStoreBusyError, ReviewStoreClosedError
+
+def _review(number: int, vendor: str = "ACME Pte Ltd", issue_date: str = "2024-01-31"):
+    return {"invoice_number": f"INV-{number}", "vendor_name": vendor, "issue_date": issue_date, "total_amount": number}
+
+def test_concurrent_reviews_share_group_commits(tmp_path):
+    """Test reviews submitted together are committed in groups and survive reopening the store"""
+    path = str(tmp_path / "reviews.sqlite3")
+    store = ReviewStore(path)
+    
+    async def submit_all():
+        return await asyncio.gather(*[store.save(_review(number)) for number in range(200)])
+    
+    results = asyncio.run(submit_all())
+    stats = store.stats()
+    store.close()
+    
+    assert len({result["review_id"] for result in results}) == 200
+    assert stats["writes"] == 200 and stats["batches"] < 200
+    assert stats["writes_per_second"] > 0
+    
+    reopened = ReviewStore(path)
+    try:
+        assert reopened.stats()["reviews"] == 200
+        assert reopened.get(results[7]["review_id"])["data"] == _review(7)
+    finally:
+        reopened.close()
+
+def test_reviews_are_found_by_vendor_number_and_date(tmp_path):
+    """Test lookups normalize vendor names and day-first dates, newest invoice first"""
+    store = ReviewStore(str(tmp_path / "reviews.sqlite3"))
+    try:
+        for review in (
+            _review(1, issue_date="2024-01-05"),
+            _review(2, vendor="  acme  PTE ltd", issue_date="20/02/2024"),
+            _review(3, vendor="Other Co", issue_date="2024-02-21"),
+            _review(2, issue_date="2024-02-20")
+        ):
+            store.submit(review).result(timeout=5)
+        
+        assert [record["invoice_number"] for record in store.find(vendor_name="ACME Pte Ltd")] == ["INV-2", "INV-2", "INV-1"]
+        assert [record["review_id"] for record in store.find(invoice_number="INV-2")] == [4, 2]
+        assert [record["invoice_number"] for record in store.find(date_from="01/02/2024", date_to="2024-02-20")] == ["INV-2", "INV-2"]
+        assert store.find(vendor_name="acme pte ltd", limit=1)[0]["invoice_date"] == "2024-02-20"
+    finally:
+        store.close()
+
+def test_full_or_closed_store_rejects_reviews(tmp_path):
+    """Test submissions fail fast instead of waiting when the store cannot take them"""
+    store = ReviewStore(str(tmp_path / "reviews.sqlite3"))
+    # A full queue the writer is not draining
+    writer_queue, store._queue = store._queue, queue.Queue(maxsize=1)
+    store._queue.put_nowait(None)
+    with pytest.raises(ReviewStoreBusyError):
+        store.submit(_review(1))
+    store._queue = writer_queue
+    store.close()
+    with pytest.raises(ReviewStoreClosedError):
+        store.submit(_review(1))
+
+def test_reviews_submitted_while_closing_are_committed_or_rejected(tmp_path):
+    """Test no review is queued behind the close sentinel, where nothing would resolve it"""
+    import threading
+    
+    store = ReviewStore(str(tmp_path / "reviews.sqlite3"))
+    futures = []
+    
+    def submit_until_closed():
+        for number in range(10000):
+            try:
+                futures.append(store.submit(_review(number)))
+            except ReviewStoreClosedError:
+                return
+    
+    submitters = [threading.Thread(target=submit_until_closed) for _ in range(4)]
+    for submitter in submitters:
+        submitter.start()
+    store.close()
+    for submitter in submitters:
+        submitter.join()
+    
+    assert all(future.done() for future in futures)
+    with pytest.raises(ReviewStoreClosedError):
+        store.submit(_review(0))
+
+def test_review_endpoint_stores_and_looks_up_reviews(monkeypatch):
+    """Test /process_invoice/review acknowledges with a review id that can be looked up"""
+    monkeypatch.setenv("API_KEY", "test-key")
+    from ai_service import main
+    
+    monkeypatch.setattr(main, "API_KEY", "test-key")
+    client = TestClient(main.app)
+    headers = {"x-api-key": "test-key"}
+    
+    response = client.post("/process_invoice/review", headers=headers, json=_review(42, vendor="Endpoint Vendor"))
+    assert response.status_code == 200
+    review_id = response.json()["review_id"]
+    
+    found = client.get("/process_invoice/reviews", headers=headers, params={"vendor_name": "endpoint vendor"}).json()["data"]
+    assert [record["review_id"] for record in found] == [review_id]
+    assert client.get(f"/process_invoice/reviews/{review_id}", headers=headers).json()["data"]["data"]["total_amount"] == 42
+    assert client.get("/process_invoice/reviews/999999", headers=headers).status_code == 404
@@ -1,4 +1,5 @@
 import pytest
+import io
 import os
 import sys
 
@@ -7,6 +8,8 @@ sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
 
 from ai_service.services.ocr import OCRService
 from ai_service.services.sor_matcher import SORMatcher
+from ai_service.services.excel_writer import ExcelWriter
+from ai_service.services.boq_pricer import BOQPricer
 
 def test_ocr_service_initialization():
     """Test OCR service initialization"""
@@ -30,4 +33,175 @@ def test_sor_matcher_sample_data():
     assert matched_item["description"] == sample_item["description"]
     assert matched_item["unit"] == sample_item["unit"]
     assert "suggested_rate" in matched_item
-    assert "suggested_category" in matched_item
\ No newline at end of file
+    assert "suggested_category" in matched_item
+
+class _RecordingLLM:
+    """Stand-in for LLMService that records what it is asked to price"""
+    
+    def __init__(self):
+        self.items = []
+        self.references = []
+    
+    async def suggest_sor_rates(self, items, references=None):
+        self.items.extend(items)
+        self.references.extend(references or [])
+        return [dict(item, suggested_rate=99.0, suggested_category="LLM") for item in items]
+
+def test_hybrid_pricer_sends_only_low_confidence_items_to_llm():
+    """Test rate-book matches are accepted and only the residual reaches the LLM"""
+    import asyncio
+    from ai_service.services.hybrid_pricer import HybridPricer
+    
+    llm = _RecordingLLM()
+    pricer = HybridPricer(SORMatcher(), llm, confidence_threshold=0.8)
+    items = [
+        {"description": "Plastering walls", "unit": "m2"},
+        {"description": "Supply and install glass balustrade", "unit": "m"},
+        {"description": "Painting walls", "unit": "m2"},
+    ]
+    priced, stats = asyncio.run(pricer.price_items(items))
+    
+    assert [item["description"] for item in llm.items] == ["Supply and install glass balustrade"]
+    assert len(llm.references) == 1
+    assert [item["pricing_source"] for item in priced] == ["rate_book", "llm", "rate_book"]
+    assert priced[0]["suggested_rate"] == "18.50"
+    assert priced[1]["suggested_rate"] == 99.0
+    assert stats["rate_book"] == 2 and stats["llm"] == 1
+
+def test_hybrid_pricer_reuses_past_priced_items(tmp_path):
+    """Test items similar to previously priced items skip the LLM"""
+    import asyncio
+    from ai_service.services.hybrid_pricer import HybridPricer
+    from ai_service.services.vector_db import VectorDB
+    
+    llm = _RecordingLLM()
+    pricer = HybridPricer(SORMatcher(), llm, VectorDB(str(tmp_path / "history.pkl")), confidence_threshold=0.8)
+    pricer.record_priced_items([
+        {"description": "Supply and install glass balustrade", "unit": "m", "rate": "420.00", "category": "Metalwork"},
+        {"description": "Waterproofing membrane to roof", "unit": "m2", "rate": "35.00", "category": "Roofing"},
+    ])
+    priced, stats = asyncio.run(pricer.price_items([{"description": "Supply and install glass balustrade", "unit": "m"}]))
+    
+    assert llm.items == []
+    assert priced[0]["pricing_source"] == "history"
+    assert priced[0]["suggested_rate"] == "420.00"
+    assert stats["history"] == 1
+
+def test_hybrid_pricer_records_concurrently(tmp_path):
+    """Test priced items recorded from several threads are all indexed and saved"""
+    from concurrent.futures import ThreadPoolExecutor
+    from ai_service.services.hybrid_pricer import HybridPricer
+    from ai_service.services.vector_db import VectorDB
+    
+    pricer = HybridPricer(SORMatcher(), _RecordingLLM(), VectorDB(str(tmp_path / "history.pkl")))
+    batches = [
+        [{"description": f"Item {batch} {i}", "unit": "m", "rate": "1.00"} for i in range(5)]
+        for batch in range(4)
+    ]
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        assert list(pool.map(pricer.record_priced_items, batches)) == [5] * 4
+    
+    assert len(pricer.history_db.documents) == 20
+    assert pricer.history_db.vectors.shape[0] == 20
+    assert len(VectorDB(str(tmp_path / "history.pkl")).documents) == 20
+
+def _sheet_contents(excel_bytes):
+    from openpyxl import load_workbook
+    workbook = load_workbook(io.BytesIO(excel_bytes))
+    return {
+        ws.title: (
+            [list(row) for row in ws.iter_rows(values_only=True)],
+            {letter: dimension.width for letter, dimension in ws.column_dimensions.items()}
+        )
+        for ws in workbook.worksheets
+    }
+
+def test_streaming_excel_matches_in_memory_workbook():
+    """Test write-only Excel output has the same cells and widths as the in-memory path"""
+    items = [
+        {"description": "Plastering walls" * i, "unit": "m2", "quantity": i, "suggested_rate": 18.5}
+        for i in range(1, 6)
+    ]
+    invoice = {"invoice_number": "INV-1", "line_items": [{"description": "Cement bags", "quantity": 4, "total": 40.0}]}
+    
+    rollup = BOQPricer().price([dict(item) for item in items])[1]
+    
+    for build in (
+        lambda writer: writer.create_sor_excel(items),
+        lambda writer: writer.create_sor_excel(items, rollup=rollup),
+        lambda writer: writer.create_invoice_excel(invoice)
+    ):
+        streamed = _sheet_contents(build(ExcelWriter(streaming=True)))
+        in_memory = _sheet_contents(build(ExcelWriter(streaming=False)))
+        assert streamed.keys() == in_memory.keys()
+        for title, (rows, widths) in streamed.items():
+            assert rows == in_memory[title][0]
+            # Width differences only come from empty cells, which the in-memory path counts as "None"
+            assert widths["B"] == in_memory[title][1]["B"]
+
+def test_streaming_excel_spools_to_disk():
+    """Test large outputs roll over from memory to a temp file"""
+    writer = ExcelWriter(streaming=True, spool_max_bytes=1024)
+    items = ({"description": f"Item {i}", "unit": "nr", "quantity": i} for i in range(2000))
+    
+    with writer.write_sor_excel(items) as output:
+        assert output._rolled
+        rows, widths = _sheet_contents(output.read())["SOR-BOQ"]
+    
+    assert len(rows) == 2001
+    assert rows[-1][:4] == [2000, "Item 1999", "nr", 1999]
+    assert widths["B"] == len("Description") + 2
+
+def test_boq_pricer_amounts_and_rollup():
+    """Test line amounts are rounded half up to cents and subtotals add up the rounded lines"""
+    items = [
+        {"item_no": "1.1", "quantity": "1.005", "suggested_rate": "100", "suggested_category": "Finishes"},
+        {"item_no": "1.2", "quantity": "3", "suggested_rate": "$1,250.005", "suggested_category": "Finishes"},
+        {"item_no": "2.1", "quantity": 2.5, "rate": "0.10", "category": "Electrical"},
+        {"item_no": "2.2", "quantity": "", "suggested_rate": "8.50", "amount": "TBC"},
+        {"section": "Provisional", "quantity": "1", "suggested_rate": None}
+    ]
+    
+    items, rollup = BOQPricer().price(items)
+    
+    # 3 x 1,250.005 is 3,750.015 before rounding; the rate is not rounded first
+    assert [item["amount"] for item in items] == [100.5, 3750.02, 0.25, "TBC", None]
+    assert (rollup["grand_total"], rollup["priced_items"], rollup["unpriced_items"]) == (3850.77, 3, 2)
+    assert rollup["categories"] == [
+        {"category": "Finishes", "items": 2, "priced_items": 2, "amount": 3850.52},
+        {"category": "Electrical", "items": 1, "priced_items": 1, "amount": 0.25},
+        {"category": "Uncategorized", "items": 2, "priced_items": 0, "amount": 0.0}
+    ]
+    assert [(section["section"], section["amount"]) for section in rollup["sections"]] == [
+        ("1", 3850.52), ("2", 0.25), ("Provisional", 0.0)
+    ]
+
+def test_boq_pricer_parses_units_and_accounting_notation():
+    """Test only the leading number is read, parentheses are negative and ambiguous text is unpriced"""
+    items = [
+        {"quantity": "12 m3", "rate": "10"},
+        {"quantity": "2", "rate": "3.50/m2"},
+        {"quantity": "(5)", "rate": "S$ 1,000.00"},
+        {"quantity": "3", "rate": "0.335"},
+        {"quantity": "12-15", "rate": "10"},
+        {"quantity": "1.2.3", "rate": "10"},
+        {"quantity": "12,5", "rate": "10"},
+        {"quantity": "4", "rate": "12 x 3"}
+    ]
+    
+    items, rollup = BOQPricer().price(items)
+    
+    assert [item["amount"] for item in items] == [120.0, 7.0, -5000.0, 1.01, None, None, None, None]
+    assert (rollup["grand_total"], rollup["unpriced_items"]) == (-4871.99, 4)
+
+def test_boq_pricer_prices_large_lines_and_zero_suggested_rates():
+    """Test lines too large for int64 products are still priced and a suggested rate of 0 is kept"""
+    items = [
+        {"quantity": "120000", "rate": "950000.125"},
+        {"quantity": "3", "suggested_rate": 0, "rate": "10"}
+    ]
+    
+    items, rollup = BOQPricer().price(items)
+    
+    assert [item["amount"] for item in items] == [114000015000.0, 0.0]
+    assert (rollup["grand_total"], rollup["unpriced_items"]) == (114000015000.0, 0)
@@ -0,0 +1,109 @@
+import csv
+import os
+import sys
+
+import numpy as np
+
+# Add the ai_service directory to the path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from ai_service.services.shared_index import SharedIndex, pack_records, unpack_records
+from ai_service.services.sor_matcher import SORMatcher
+from ai_service.services.vector_db import VectorDB
+
+def write_rates(path, rows):
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=["item", "unit", "rate", "category"])
+        writer.writeheader()
+        writer.writerows(rows)
+
+def test_shared_index_publishes_generations_mapped_read_only(tmp_path):
+    """Test arrays are mapped read-only and old generations are removed"""
+    index = SharedIndex("test", directory=str(tmp_path))
+    assert index.current() == (0, None) and index.attach() is None
+
+    with index.build_lock():
+        for value in range(3):
+            index.publish({"values": np.arange(4) + value, **pack_records([{"n": value}], "records")}, {"value": value})
+
+    generation, meta, arrays = index.attach()
+    assert generation == 3 and meta["value"] == 2
+    assert isinstance(arrays["values"], np.memmap) and not arrays["values"].flags.writeable
+    assert list(unpack_records(arrays, "records")) == [{"n": 2}]
+    assert sorted(name for name in os.listdir(index.directory) if name.startswith("gen-")) == ["gen-00000002", "gen-00000003"]
+
+def test_attach_rereads_current_when_its_generation_was_removed(tmp_path, monkeypatch):
+    """Test a generation deleted between reading CURRENT and mapping it is skipped for the newest"""
+    index = SharedIndex("test", directory=str(tmp_path))
+    with index.build_lock():
+        for value in range(3):
+            index.publish({"values": np.arange(4) + value})
+
+    read_current = index.current
+    stale = [(1, {"arrays": ["values"]})]
+    monkeypatch.setattr(index, "current", lambda: stale.pop() if stale else read_current())
+    generation, _, arrays = index.attach()
+    assert generation == 3 and list(arrays["values"]) == [2, 3, 4, 5]
+
+    monkeypatch.setattr(index, "current", lambda: (1, {"arrays": ["values"]}))
+    assert index.attach() is None
+
+def test_shared_rate_book_matches_local_and_picks_up_rebuilds(tmp_path, monkeypatch):
+    """Test workers map one rate book index, score like local mode, and see a rebuilt CSV"""
+    monkeypatch.setenv("SHARED_INDEX_DIR", str(tmp_path / "shared"))
+    rates_csv = str(tmp_path / "rates.csv")
+    rows = [
+        {"item": "Excavation in ordinary soil", "unit": "Cum", "rate": "245", "category": "Earthwork"},
+        {"item": "Cement concrete 1:2:4", "unit": "Cum", "rate": "4850", "category": "Concrete"},
+        {"item": "Brick masonry in cement mortar", "unit": "Cum", "rate": "5200", "category": "Masonry"}
+    ]
+    write_rates(rates_csv, rows)
+
+    first = SORMatcher(rates_csv, shared=True, check_interval=0)
+    second = SORMatcher(rates_csv, shared=True, check_interval=0)
+    local = SORMatcher(rates_csv, shared=False)
+    item = {"description": "cement concrete work", "unit": "cum"}
+    assert first.generation == second.generation == 1
+    assert first.top_matches(item) == local.top_matches(item)
+
+    write_rates(rates_csv, rows + [{"item": "Steel reinforcement bars", "unit": "Kg", "rate": "72", "category": "Steel"}])
+    assert second.top_matches({"description": "steel reinforcement", "unit": "kg"})[0]["rate"] == "72"
+    assert first.top_matches({"description": "steel reinforcement", "unit": "kg"})[0]["rate"] == "72"
+    assert first.generation == second.generation == 2
+    assert first.index_stats()["entries"] == 4
+
+def test_shared_vector_index_is_built_once_and_updated_for_all_workers(tmp_path, monkeypatch):
+    """Test workers share the vector index built from the pickle and see added documents"""
+    monkeypatch.setenv("SHARED_INDEX_DIR", str(tmp_path / "shared"))
+    index_path = str(tmp_path / "vector_index.pkl")
+    seed = VectorDB(index_path, shared=False)
+    seed.add_documents(["Excavation in hard rock", "Plastering with cement mortar"], [{"id": 1}, {"id": 2}])
+    seed.save_index()
+
+    first = VectorDB(index_path, shared=True, check_interval=0)
+    second = VectorDB(index_path, shared=True, check_interval=0)
+    assert first.generation == second.generation == 1
+    assert first.search("cement plastering", k=1) == seed.search("cement plastering", k=1)
+
+    first.add_documents(["Painting with enamel paint"], [{"id": 3}])
+    results = second.search("enamel painting", k=1)
+    assert results[0][0] == 2 and results[0][2] == {"id": 3}
+    assert second.generation == 2 and second.index_stats()["documents"] == 3
+
+def test_sample_rates_are_served_from_a_shared_rate_book(tmp_path, monkeypatch):
+    """Test /fill_sor/sample-rates returns the mapped rate book as JSON"""
+    from fastapi.testclient import TestClient
+    from ai_service import main
+    from ai_service.services.container import get_services
+
+    monkeypatch.setenv("SHARED_INDEX_DIR", str(tmp_path / "shared"))
+    monkeypatch.setattr(main, "API_KEY", "test-key")
+    rates_csv = str(tmp_path / "rates.csv")
+    rows = [{"item": "Excavation in ordinary soil", "unit": "Cum", "rate": "245", "category": "Earthwork"}]
+    write_rates(rates_csv, rows)
+    monkeypatch.setitem(get_services()._services, "sor_matcher", SORMatcher(rates_csv, shared=True, check_interval=0))
+
+    response = TestClient(main.app).get("/fill_sor/sample-rates", headers={"x-api-key": "test-key"})
+
+    assert response.status_code == 200
+    assert response.json()["data"] == rows
@@ -0,0 +1,152 @@
+import asyncio
+import os
+import sys
+
+import httpx
+import pytest
+
+# Add the ai_service directory to the path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from ai_service.services.single_flight import SingleFlight, content_key
+from tests.test_llm import FakeOllama, _make_service
+
+def test_concurrent_identical_work_runs_once():
+    """Test concurrent callers with the same key share one computation"""
+    flight = SingleFlight("test")
+    runs = []
+
+    async def work(value):
+        runs.append(value)
+        await asyncio.sleep(0.05)
+        return {"value": value}
+
+    async def scenario():
+        return await asyncio.gather(
+            *[flight.do("a", lambda: work("a"), copy_result=True) for _ in range(5)],
+            flight.do("b", lambda: work("b"))
+        )
+
+    results = asyncio.run(scenario())
+
+    assert sorted(runs) == ["a", "b"]
+    assert [result["value"] for result in results] == ["a"] * 5 + ["b"]
+    # Each caller gets its own copy to modify
+    results[0]["value"] = "changed"
+    assert results[1]["value"] == "a"
+    assert flight.stats() == {"calls": 6, "coalesced": 4, "coalesced_rate": 4 / 6, "in_flight": 0}
+
+def test_failure_is_shared_and_not_remembered():
+    """Test an error reaches every waiting caller and the next call retries"""
+    flight = SingleFlight("test")
+    attempts = []
+
+    async def work():
+        attempts.append(1)
+        await asyncio.sleep(0.02)
+        if len(attempts) == 1:
+            raise ValueError("boom")
+        return "ok"
+
+    async def scenario():
+        results = await asyncio.gather(*[flight.do("k", work) for _ in range(3)], return_exceptions=True)
+        return results, await flight.do("k", work)
+
+    results, retry = asyncio.run(scenario())
+
+    assert all(isinstance(result, ValueError) for result in results)
+    assert retry == "ok"
+    assert len(attempts) == 2
+
+def test_shared_work_owns_the_leaders_input():
+    """Test a cancelled leader's input stays open until the shared work finishes"""
+    flight = SingleFlight("test")
+    closed = []
+
+    async def work():
+        await asyncio.sleep(0.05)
+        return "ok" if "leader" not in closed else "input closed"
+
+    async def scenario():
+        leader = asyncio.ensure_future(flight.do("k", work, cleanup=lambda: closed.append("leader")))
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(flight.do("k", work, cleanup=lambda: closed.append("follower")))
+        await asyncio.sleep(0.01)
+        # The follower's own input is not needed
+        assert closed == ["follower"]
+        leader.cancel()
+        result = await follower
+        await asyncio.sleep(0)
+        return result
+
+    assert asyncio.run(scenario()) == "ok"
+    assert closed == ["follower", "leader"]
+
+def test_content_key_depends_on_options():
+    """Test keys differ by content and by processing options"""
+    assert content_key(b"boq", use_llm=True) == content_key(b"boq", use_llm=True)
+    assert content_key(b"boq", use_llm=True) != content_key(b"boq", use_llm=False)
+    assert content_key(b"boq", use_llm=True) != content_key(b"boq2", use_llm=True)
+
+def test_call_llm_coalesces_identical_prompts(monkeypatch):
+    """Test identical in-flight prompts make one provider request"""
+    server = FakeOllama(delay=0.1, response='{"ok": true}')
+
+    async def scenario():
+        await server.start()
+        try:
+            service = _make_service(monkeypatch, server.base_url)
+            results = await asyncio.gather(
+                *[service._call_llm("same prompt") for _ in range(4)],
+                service._call_llm("other prompt")
+            )
+            await service.aclose()
+            return results
+        finally:
+            await server.stop()
+
+    results = asyncio.run(scenario())
+
+    assert results == ['{"ok": true}'] * 5
+    assert server.requests == 2
+
+def test_sor_process_coalesces_identical_uploads(monkeypatch):
+    """Test concurrent identical uploads are parsed and priced once"""
+    monkeypatch.setenv("API_KEY", "test-key")
+    from ai_service import main
+    from ai_service.routers import sor
+    from ai_service.services.container import get_services
+
+    extractions = []
+    original_extract = sor._extract_items
+
+    async def slow_extract(content, content_type):
+        extractions.append(content_type)
+        return await original_extract(content, content_type)
+
+    async def slow_match(items):
+        await asyncio.sleep(0.05)
+        return [{**item, "suggested_rate": 10.0} for item in items]
+
+    monkeypatch.setattr(main, "API_KEY", "test-key")
+    monkeypatch.setattr(sor, "_extract_items", slow_extract)
+    monkeypatch.setattr(get_services().llm_service, "suggest_sor_rates", slow_match)
+    csv_bytes = b"Description,Unit,Qty\nPlastering walls,m2,10\n"
+
+    async def scenario():
+        async with httpx.AsyncClient(app=main.app, base_url="http://test") as client:
+            return await asyncio.gather(*[
+                client.post(
+                    "/fill_sor/process",
+                    headers={"x-api-key": "test-key"},
+                    data={"use_llm": "true"},
+                    files={"file": ("boq.csv", csv_bytes, "text/csv")}
+                )
+                for _ in range(3)
+            ])
+
+    responses = asyncio.run(scenario())
+
+    assert [response.status_code for response in responses] == [200, 200, 200]
+    assert all(response.json()["data"][0]["suggested_rate"] == 10.0 for response in responses)
+    assert len(extractions) == 1
@@ -0,0 +1,115 @@
+import os
+import sys
+
+from fastapi.testclient import TestClient
+
+# Add the ai_service directory to the path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from ai_service.services.sor_ingest import SORIngest
+
+def test_csv_aliases_are_resolved_per_file():
+    """Test header aliases fill description, unit and quantity, first non-empty alias first"""
+    csv_bytes = b"Item,Work Description,UOM,Qty,Notes\nWall,,m2,,a\n,Door frame,nr,3,b\n,,,,c\n"
+    items = SORIngest(chunk_rows=1).read_csv_items(csv_bytes)
+
+    assert [(item["description"], item["unit"], item["quantity"]) for item in items] == [
+        ("Wall", "m2", "1"), ("Door frame", "nr", "3"), ("", "", "1")
+    ]
+    assert items[0]["notes"] == "a" and items[0]["work_description"] == ""
+    assert list(items[0])[:5] == ["item", "work_description", "uom", "qty", "notes"]
+
+def test_csv_named_columns_win_over_aliases():
+    """Test a column named after a field is used as-is, without alias fallback"""
+    items = SORIngest().read_csv_items(b"Description,Item,Unit,Quantity\n,Wall,m2,\n")
+    assert (items[0]["description"], items[0]["quantity"]) == ("", "")
+
+def test_csv_encoding_detection():
+    """Test Excel cp1252 exports, BOMs and UTF-16 are decoded"""
+    ingest = SORIngest(detect_chunk_bytes=4)
+    cp1252 = "Description,Unit\nCafé counter – oak,m\n".encode("cp1252")
+    utf8 = "Description,Unit\nCafé counter – oak,m\n".encode("utf-8")
+
+    assert ingest.detect_encoding(cp1252) == "cp1252"
+    assert ingest.detect_encoding(utf8) == "utf-8"
+    for encoded in (cp1252, utf8, b"\xef\xbb\xbf" + utf8, "Description,Unit\nCafé counter – oak,m\n".encode("utf-16")):
+        assert ingest.read_csv_items(encoded) == [{"description": "Café counter – oak", "unit": "m", "quantity": "1"}]
+
+def test_pdf_tables_use_the_same_mapping():
+    """Test PDF tables are mapped like CSV files, one header per table"""
+    tables = [
+        [["Item", "UOM", None], ["Wall", "m2", "x", "dropped"], ["Door"]],
+        [["Header only"]],
+        [["Description", "Qty"], ["Tiles", None]]
+    ]
+    items = SORIngest().items_from_tables(tables)
+
+    assert [(item["description"], item["unit"], item["quantity"]) for item in items] == [
+        ("Wall", "m2", "1"), ("Door", "", "1"), ("Tiles", "", "1")
+    ]
+    assert "dropped" not in items[0].values()
+
+def test_sor_endpoint_reads_cp1252_csv(monkeypatch):
+    """Test /fill_sor/process accepts a Windows Excel CSV export"""
+    monkeypatch.setenv("API_KEY", "test-key")
+    from ai_service import main
+
+    monkeypatch.setattr(main, "API_KEY", "test-key")
+    response = TestClient(main.app).post(
+        "/fill_sor/process",
+        headers={"x-api-key": "test-key"},
+        files={"file": ("boq.csv", "Description,UOM,Qty\nPlastering walls – 15mm,m2,10\n".encode("cp1252"), "text/csv")}
+    )
+
+    assert response.status_code == 200
+    item = response.json()["data"][0]
+    assert (item["description"], item["unit"], item["quantity"]) == ("Plastering walls – 15mm", "m2", "10")
+
+def _boq_workbook():
+    import io
+    from openpyxl import Workbook
+    workbook = Workbook()
+    summary = workbook.active
+    summary.title = "Summary"
+    summary.append(["Bill", "Amount"])
+    summary.append(["Bill 1", 1200])
+    for title in ("Bill 1", "Bill 2"):
+        sheet = workbook.create_sheet(title)
+        sheet.append(["Project BOQ"])
+        sheet.append([])
+        sheet.append(["Item No", "Description", "UOM", "Qty", "Rate"])
+        sheet.append([1, f"Plastering walls ({title})", "m2", 10.0, None])
+        sheet.append([])
+        sheet.append([2, "Painting walls", "m2", 2.5])
+    output = io.BytesIO()
+    workbook.save(output)
+    return output.getvalue()
+
+def test_xlsx_header_row_and_sheets_are_detected():
+    """Test the BOQ header is found below title rows and summary sheets are skipped"""
+    items = list(SORIngest(chunk_rows=1).iter_xlsx_items(_boq_workbook()))
+    
+    assert [(item["description"], item["unit"], item["quantity"]) for item in items] == [
+        ("Plastering walls (Bill 1)", "m2", "10"), ("Painting walls", "m2", "2.5"),
+        ("Plastering walls (Bill 2)", "m2", "10"), ("Painting walls", "m2", "2.5")
+    ]
+    assert items[0]["item_no"] == "1" and items[0]["rate"] == ""
+    assert list(SORIngest().iter_xlsx_items(b"not a workbook")) == []
+
+def test_sor_endpoint_accepts_xlsx(monkeypatch):
+    """Test /fill_sor/process prices XLSX BOQs, including ones sent as octet-stream"""
+    monkeypatch.setenv("API_KEY", "test-key")
+    from ai_service import main
+    
+    monkeypatch.setattr(main, "API_KEY", "test-key")
+    response = TestClient(main.app).post(
+        "/fill_sor/process",
+        headers={"x-api-key": "test-key"},
+        files={"file": ("boq.xlsx", _boq_workbook(), "application/octet-stream")}
+    )
+    
+    assert response.status_code == 200
+    items = response.json()["data"]
+    assert len(items) == 4
+    assert "suggested_rate" in items[0]
+    assert response.json()["rollup"]["total_items"] == 4
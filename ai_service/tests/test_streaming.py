@@ -0,0 +1,62 @@
+import os
+import sys
+
+from fastapi.testclient import TestClient
+
+# Add the ai_service directory to the path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from ai_service.services.streaming import IncrementalJSONParser, format_sse
+
+def _feed_all(text, chunk_size):
+    parser = IncrementalJSONParser()
+    values = []
+    for i in range(0, len(text), chunk_size):
+        values.extend(parser.feed(text[i:i + chunk_size]))
+    return parser, values
+
+def test_parser_yields_array_elements_as_they_close():
+    """Test array elements are emitted incrementally regardless of chunking"""
+    text = 'Sure:\n```json\n[{"a": "x}]\\"", "b": [1, 2]}, 3, "s,t", {"c": {}}, null]\n```'
+    for chunk_size in (1, 3, 7, len(text)):
+        parser, values = _feed_all(text, chunk_size)
+        assert values == [{"a": 'x}]"', "b": [1, 2]}, 3, "s,t", {"c": {}}, None]
+        assert parser.done
+
+    parser = IncrementalJSONParser()
+    assert parser.feed('[{"a": 1}, {"b"') == [{"a": 1}]
+    assert parser.feed(': 2}') == [{"b": 2}]
+
+def test_parser_yields_object_fields():
+    """Test top-level object members are emitted as (key, value) pairs"""
+    text = '{"invoice_number": "INV-1", "total": 12.5, "line_items": [{"d": 1}], "due_date": null}'
+    parser, values = _feed_all(text, 2)
+    assert values == [("invoice_number", "INV-1"), ("total", 12.5), ("line_items", [{"d": 1}]), ("due_date", None)]
+
+def test_format_sse():
+    """Test server-sent event framing"""
+    assert format_sse("item", {"a": 1}) == 'event: item\ndata: {"a": 1}\n\n'
+
+def test_sor_stream_endpoint(monkeypatch):
+    """Test the SOR stream endpoint forwards items as server-sent events"""
+    monkeypatch.setenv("API_KEY", "test-key")
+    from ai_service import main
+    from ai_service.services.container import get_services
+
+    async def fake_stream(items):
+        for index, item in enumerate(items):
+            yield {**item, "suggested_rate": 10.0, "index": index}
+
+    monkeypatch.setattr(main, "API_KEY", "test-key")
+    monkeypatch.setattr(get_services().llm_service, "stream_sor_rates", fake_stream)
+    client = TestClient(main.app)
+    response = client.post(
+        "/fill_sor/process/stream",
+        headers={"x-api-key": "test-key"},
+        files={"file": ("boq.csv", b"Description,Unit,Qty\nPlastering walls,m2,10\nPainting walls,m2,5\n", "text/csv")}
+    )
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = [frame.split("\n")[0] for frame in response.text.strip().split("\n\n")]
+    assert events == ["event: item", "event: item", "event: done"]
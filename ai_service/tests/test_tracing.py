@@ -0,0 +1,133 @@
+import os
+import sys
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+# Add the ai_service directory to the path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from ai_service.services import tracing
+from ai_service.services.tracing import TraceStore, StackSampler
+from tests.test_uploads import _pdf
+
+BOQ_CSV = b"Description,Unit,Qty\nCement concrete,cum,4\nBrick masonry,cum,2\n"
+
+def _client(monkeypatch, tmp_path, admin_key="admin-key"):
+    monkeypatch.setenv("API_KEY", "test-key")
+    if admin_key:
+        monkeypatch.setenv("ADMIN_API_KEY", admin_key)
+    else:
+        monkeypatch.delenv("ADMIN_API_KEY", raising=False)
+    monkeypatch.setattr(tracing, "_trace_store", TraceStore(str(tmp_path / "traces"), max_traces=2))
+    from ai_service import main
+
+    monkeypatch.setattr(main, "API_KEY", "test-key")
+    return TestClient(main.app)
+
+def test_tracing_requires_the_admin_key(monkeypatch, tmp_path):
+    """Test trace options are refused without a configured and matching admin key"""
+    client = _client(monkeypatch, tmp_path, admin_key=None)
+    files = {"file": ("boq.csv", BOQ_CSV, "text/csv")}
+    response = client.post("/fill_sor/process", headers={"x-api-key": "test-key", "x-admin-key": "guess"},
+                           data={"trace": "true"}, files=files)
+    assert response.status_code == 403
+
+    client = _client(monkeypatch, tmp_path)
+    response = client.post("/fill_sor/process", headers={"x-api-key": "test-key", "x-admin-key": "wrong"},
+                           data={"trace_profile": "true"}, files=files)
+    assert response.status_code == 403
+    assert client.get("/traces", headers={"x-api-key": "test-key"}).status_code == 403
+
+    response = client.post("/fill_sor/process", headers={"x-api-key": "test-key"}, files=files)
+    assert response.status_code == 200 and "trace" not in response.json()
+
+def test_sor_trace_is_returned_and_stored(monkeypatch, tmp_path):
+    """Test a traced SOR request returns its step spans, profile and memory and can be read back"""
+    client = _client(monkeypatch, tmp_path)
+    headers = {"x-api-key": "test-key", "x-admin-key": "admin-key"}
+    response = client.post(
+        "/fill_sor/process",
+        headers=headers,
+        data={"trace": "true", "trace_profile": "true", "trace_memory": "true"},
+        files={"file": ("boq.csv", BOQ_CSV, "text/csv")}
+    )
+    assert response.status_code == 200
+    body = response.json()
+    assert len(body["data"]) == 2
+    trace = body["trace"]
+    assert trace["endpoint"] == "/fill_sor/process" and trace["file_name"] == "boq.csv"
+    assert {"upload_read", "matching", "rollup"} <= set(trace["steps"])
+    assert all(span["duration_ms"] <= trace["duration_ms"] for span in trace["spans"])
+    assert trace["profile"]["interval_ms"] > 0 and "stacks" in trace["profile"]
+    assert trace["memory"]["peak_bytes"] >= trace["memory"]["start_bytes"]
+
+    stored = client.get(f"/traces/{trace['trace_id']}", headers=headers).json()["data"]
+    assert stored == trace
+    assert client.get("/traces", headers=headers).json()["data"][0]["trace_id"] == trace["trace_id"]
+    assert client.get("/traces/missing", headers=headers).status_code == 404
+
+def test_invoice_trace_times_each_pdf_page(monkeypatch, tmp_path):
+    """Test a traced invoice PDF reports per-page parse spans and the pool process peak memory"""
+    client = _client(monkeypatch, tmp_path)
+    response = client.post(
+        "/process_invoice/process",
+        headers={"x-api-key": "test-key", "x-admin-key": "admin-key"},
+        data={"trace": "true", "trace_memory": "true"},
+        files={"file": ("invoice.pdf", _pdf(3), "application/pdf")}
+    )
+    assert response.status_code == 200
+    trace = response.json()["trace"]
+    parse = next(span for span in trace["spans"] if span["name"] == "pdf_parse")
+    assert [page["page"] for page in parse["pages"]] == [1, 2, 3]
+    assert trace["memory"]["process_pool_peak_bytes"] > 0
+
+def test_one_request_traces_memory_at_a_time(monkeypatch, tmp_path):
+    """Test a second memory trace is refused while one is running, since the peak is process-wide"""
+    first = tracing.RequestTrace("/fill_sor/process", trace_memory=True)
+    first.start()
+    try:
+        with pytest.raises(tracing.MemoryTraceBusyError):
+            tracing.RequestTrace("/fill_sor/process", trace_memory=True).start()
+
+        client = _client(monkeypatch, tmp_path)
+        response = client.post(
+            "/fill_sor/process",
+            headers={"x-api-key": "test-key", "x-admin-key": "admin-key"},
+            data={"trace_memory": "true"},
+            files={"file": ("boq.csv", BOQ_CSV, "text/csv")}
+        )
+        assert response.status_code == 409
+    finally:
+        first.finish()
+
+    second = tracing.RequestTrace("/fill_sor/process", trace_memory=True)
+    second.start()
+    assert second.finish()["memory"]["peak_bytes"] > 0
+    assert not tracing.tracemalloc.is_tracing()
+
+def test_trace_store_keeps_the_newest_traces(tmp_path):
+    """Test the trace store removes the oldest traces beyond its limit"""
+    store = TraceStore(str(tmp_path), max_traces=2)
+    for number in range(3):
+        store.save({"trace_id": f"t{number}", "endpoint": "/fill_sor/process", "duration_ms": number})
+        time.sleep(0.01)
+    assert [trace["trace_id"] for trace in store.list()] == ["t2", "t1"]
+    assert store.get("t0") is None and store.get("../t1") is None
+
+def test_stack_sampler_counts_folded_stacks():
+    """Test the sampler attributes samples to the target thread's stack"""
+    import threading
+
+    def busy_loop(until):
+        while time.perf_counter() < until:
+            pass
+
+    worker = threading.Thread(target=busy_loop, args=(time.perf_counter() + 0.2,))
+    worker.start()
+    sampler = StackSampler(0.005, lambda: [worker.ident])
+    sampler.start()
+    worker.join()
+    samples = sampler.stop()
+    assert max(samples, key=samples.get).split(";")[-1].startswith("busy_loop")
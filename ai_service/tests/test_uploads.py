@@ -0,0 +1,137 @@
+import io
+import os
+import sys
+
+from fastapi import FastAPI, File, UploadFile
+from fastapi.testclient import TestClient
+
+# Add the ai_service directory to the path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from ai_service.services.uploads import UploadSpooler, UploadLimitError, UploadLimitMiddleware
+
+def _pdf(pages):
+    """Build a minimal PDF with empty pages"""
+    kids = " ".join(f"{3 + page} 0 R" for page in range(pages))
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", f"<< /Type /Pages /Kids [{kids}] /Count {pages} >>".encode()]
+    objects += [b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] >>"] * pages
+    output = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(output))
+        output += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(output)
+    output += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    output += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    output += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return bytes(output)
+
+def _text_pdf(texts):
+    """Build a minimal PDF with one line of text per page"""
+    count = len(texts)
+    font = 3 + 2 * count
+    kids = " ".join(f"{3 + page} 0 R" for page in range(count))
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", f"<< /Type /Pages /Kids [{kids}] /Count {count} >>".encode()]
+    objects += [
+        f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] /Contents {3 + count + page} 0 R "
+        f"/Resources << /Font << /F1 {font} 0 R >> >> >>".encode()
+        for page in range(count)
+    ]
+    for text in texts:
+        stream = f"BT /F1 12 Tf 72 720 Td ({text}) Tj ET".encode()
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+    objects.append(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+    output = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(output))
+        output += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(output)
+    output += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    output += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    output += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return bytes(output)
+
+def test_pdf_pages_are_joined_on_separate_lines():
+    """Test the last line of a page does not run into the first line of the next"""
+    from ai_service.services.pdf_utils import PDFUtils
+    
+    text = PDFUtils().extract_text_from_pdf(_text_pdf(["Total 120.00", "Invoice INV-2"]))
+    assert text == "Total 120.00\nInvoice INV-2"
+
+def test_spooler_moves_large_uploads_to_disk(tmp_path):
+    """Test small uploads stay in memory and large ones are parsed from a temp file"""
+    import hashlib
+    spooler = UploadSpooler(max_bytes=10000, spool_max_bytes=100, directory=str(tmp_path), chunk_size=64)
+    
+    with spooler.spool(io.BytesIO(b"small"), "a.png", "image/png") as small:
+        assert small.source == b"small" and small.path is None
+    
+    large = spooler.spool(io.BytesIO(b"x" * 1000), "b.png", "image/png")
+    assert large.source == large.path and open(large.path, "rb").read() == b"x" * 1000
+    assert large.size == 1000 and large.sha256 == hashlib.sha256(b"x" * 1000).hexdigest()
+    large.close()
+    assert os.listdir(tmp_path) == []
+
+def test_spooler_enforces_size_and_page_limits(tmp_path):
+    """Test oversized uploads and PDFs with too many pages are rejected without leaving files"""
+    spooler = UploadSpooler(max_bytes=1000, max_pages=2, spool_max_bytes=100, directory=str(tmp_path), chunk_size=64)
+    
+    for content, content_type in ((b"x" * 1001, "image/png"), (_pdf(3), "application/pdf")):
+        try:
+            spooler.spool(io.BytesIO(content), "doc", content_type)
+            assert False, "expected UploadLimitError"
+        except UploadLimitError:
+            pass
+    assert os.listdir(tmp_path) == []
+    
+    with spooler.spool(io.BytesIO(_pdf(2)), "ok.pdf", "application/pdf") as upload:
+        assert upload.size == len(_pdf(2))
+
+def test_sor_csv_is_parsed_from_spooled_file(tmp_path):
+    """Test CSV items are read from the spooled file of a large upload"""
+    from ai_service.services.sor_ingest import SORIngest
+    spooler = UploadSpooler(spool_max_bytes=10, directory=str(tmp_path))
+    
+    with spooler.spool(io.BytesIO(b"Description,Unit,Qty\nPlastering walls,m2,10\n"), "boq.csv", "text/csv") as upload:
+        items = SORIngest().read_csv_items(upload.source)
+    
+    assert items == [{"description": "Plastering walls", "unit": "m2", "qty": "10", "quantity": "10"}]
+
+def test_invoice_upload_over_page_limit_returns_413(monkeypatch):
+    """Test endpoints reject documents over the limits before processing them"""
+    monkeypatch.setenv("API_KEY", "test-key")
+    from ai_service import main
+    from ai_service.routers import invoice, uploads
+    
+    async def unexpected_extract(source, content_type):
+        raise AssertionError("document should not be processed")
+    
+    monkeypatch.setattr(main, "API_KEY", "test-key")
+    monkeypatch.setattr(invoice, "_extract_text", unexpected_extract)
+    monkeypatch.setattr(uploads.upload_spooler, "max_pages", 2)
+    response = TestClient(main.app).post(
+        "/process_invoice/process",
+        headers={"x-api-key": "test-key"},
+        files={"file": ("long.pdf", _pdf(3), "application/pdf")}
+    )
+    
+    assert response.status_code == 413
+    assert "3 pages" in response.json()["detail"]
+
+def test_middleware_rejects_declared_oversized_body():
+    """Test requests over the limit are refused from Content-Length before the body is read"""
+    app = FastAPI()
+    calls = []
+    
+    @app.post("/upload")
+    async def upload(file: UploadFile = File(...)):
+        calls.append(file.filename)
+        return {"ok": True}
+    
+    app.add_middleware(UploadLimitMiddleware, max_bytes=500)
+    client = TestClient(app)
+    
+    assert client.post("/upload", files={"file": ("a.bin", b"x" * 1000)}).status_code == 413
+    assert client.post("/upload", files={"file": ("a.bin", b"x" * 100)}).status_code == 200
+    assert calls == ["a.bin"]